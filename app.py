@@ -1,30 +1,66 @@
 from flask import Flask
-from flask_migrate import Migrate
 from models import db
 from config import Config
+from utils.storage import configure_storage
+from utils.search import register_search_index
+from utils.data_version import register_data_versions
+from utils.scheduler import register_claim_counts
+from utils.schema import ensure_schema
+from utils.metrics import STARTUP_DURATION
 import os
+import time
 
 def create_app(config_class=Config):
     """Flask application factory"""
+    start = time.perf_counter()
     app = Flask(__name__)
     app.config.from_object(config_class)
 
     # Ensure instance folder exists
     os.makedirs(os.path.join(app.instance_path), exist_ok=True)
 
-    # Initialize extensions
+    # Initialize extensions (the `flask db` commands are not needed by server workers)
     db.init_app(app)
-    migrate = Migrate(app, db)
+    if app.config.get('MIGRATE_CLI'):
+        from flask_migrate import Migrate
+        Migrate(app, db)
 
-    # Enable SQLite WAL mode for better concurrency and initialize database
+    # Request latency and throughput metrics
+    if app.config.get('METRICS_ENABLED'):
+        from utils import metrics
+        metrics.init_app(app)
+
+    # Apply SQLite pragmas (WAL, busy timeout, cache) to every connection,
+    # split reads onto their own engine, and initialize database
     with app.app_context():
-        if app.config['SQLALCHEMY_DATABASE_URI'].startswith('sqlite'):
-            with db.engine.connect() as conn:
-                conn.execute(db.text('PRAGMA journal_mode=WAL'))
-                conn.commit()
+        configure_storage(app, db)
+
+        # Initialize the tables of a new database (plus the full-text search
+        # index, data version counters and note claim counts). An existing
+        # database below the migration head is left for `flask db upgrade`
+        register_search_index(db.metadata)
+        register_data_versions(db.metadata)
+        register_claim_counts(db.metadata)
+        phase = time.perf_counter()
+        schema = ensure_schema(db)
+        STARTUP_DURATION.set(time.perf_counter() - phase, phase='schema')
+        if schema == 'outdated':
+            message = 'Database schema is older than the migrations; run `flask db upgrade`'
+            if not app.config.get('MIGRATE_CLI'):
+                raise RuntimeError(message)
+            # Still start, so the `flask db` commands can run against it
+            app.logger.error(message)
 
-        # Initialize database tables if they don't exist
-        db.create_all()
+        # Single-writer group commit for votes
+        from utils import vote_writer
+        vote_writer.init_app(app)
+
+        # In-memory vote counts served to read endpoints (built here, so a
+        # server preloading the app shares them with its forked workers)
+        from utils import vote_store
+        phase = time.perf_counter()
+        vote_store.init_app(app, preload=schema != 'outdated')
+        STARTUP_DURATION.set(time.perf_counter() - phase, phase='vote_store')
 
     # Register blueprints
     from auth import auth_bp
@@ -32,13 +68,22 @@ def create_app(config_class=Config):
     from routes.voting import voting_bp
     from routes.filters import filters_bp
     from routes.admin import admin_bp
+    from routes.api import api_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(main_bp)
     app.register_blueprint(voting_bp)
     app.register_blueprint(filters_bp)
     app.register_blueprint(admin_bp, url_prefix='/admin')
+    app.register_blueprint(api_bp, url_prefix='/api')
+
+    if app.config.get('METRICS_ENABLED'):
+        from routes.metrics import metrics_bp
+        app.register_blueprint(metrics_bp)
 
+    elapsed = time.perf_counter() - start
+    STARTUP_DURATION.set(elapsed, phase='total')
+    app.logger.info('App started in %.3fs (schema %s)', elapsed, schema)
     return app
 
 
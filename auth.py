@@ -1,6 +1,7 @@
 from flask import Blueprint, render_template, request, redirect, url_for, session, flash
 from models import db, User
 from functools import wraps
+from utils.storage import run_in_transaction
 
 auth_bp = Blueprint('auth', __name__)
 
@@ -54,9 +55,12 @@ def login():
         is_admin_username = username.lower() == 'admin'
 
         if not user:
-            user = User(username=username, is_admin=is_admin_username)
-            db.session.add(user)
-            db.session.commit()
+            def create_user():
+                new_user = User(username=username, is_admin=is_admin_username)
+                db.session.add(new_user)
+                return new_user
+
+            user = run_in_transaction('login', create_user)
             if is_admin_username:
                 flash(f'Welcome, {username}! Your account has been created with admin privileges.', 'success')
             else:
@@ -64,8 +68,10 @@ def login():
         else:
             # Update existing Admin user to have admin privileges if not already set
             if is_admin_username and not user.is_admin:
-                user.is_admin = True
-                db.session.commit()
+                def grant_admin():
+                    user.is_admin = True
+
+                run_in_transaction('login', grant_admin)
                 flash(f'Welcome back, {username}! Admin privileges have been granted.', 'success')
             else:
                 flash(f'Welcome back, {username}!', 'success')
@@ -0,0 +1,99 @@
+"""
+Read API: paging through every record and fetching notes with distributions.
+
+Imports synthetic catalogs and bulk-loads --votes random votes, then walks
+/api/records page by page (timing the first and the last page) and compares
+the keyset lookup with an OFFSET query at the same depth. Finally it fetches
+the notes of --samples random records through
+/api/records/<bib>/notes?fields=index,text,distribution and through the
+HTML record page.
+
+    python benchmarks/bench_api.py [--records 20000] [--notes 5] [--votes 500000] [--limit 1000] [--samples 200]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from sqlalchemy import text
+
+from bench_vote_store import load_votes
+from common import Timer, make_app, summarize, write_catalog
+from models import db, User
+from utils.bulk_import import import_xml_files
+from utils.vote_store import get_vote_store
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--votes', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--limit', type=int, default=1000)
+    parser.add_argument('--samples', type=int, default=200)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    catalog = write_catalog(os.path.join(directory, 'catalog.xml'), args.records, args.notes)
+    app = make_app(os.path.join(directory, 'bench.db'), IMPORT_BATCH_PAUSE=0, VOTE_WRITER_ENABLED=False)
+    rng = np.random.default_rng(0)
+
+    with app.app_context():
+        # The record pages list voters by name, so the voting users must exist
+        db.session.add_all([User(username=f'user{i}') for i in range(1, args.users + 1)])
+        db.session.commit()
+        import_xml_files([catalog], workers=1)
+        load_votes(args.votes, args.records * args.notes, args.users, rng)
+        get_vote_store().rebuild()
+    print(f'{args.records} records x {args.notes} notes, {args.votes} votes')
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'reader'})
+
+    page_times, pages, lines, size = [], 0, 0, 0
+    after = ''
+    with Timer() as walk_timer:
+        while after is not None:
+            with Timer() as page_timer:
+                response = client.get('/api/records', query_string={'after': after, 'limit': args.limit,
+                                                                     'fields': 'bib,title,note_count'})
+                body = response.get_data()
+            page_times.append(page_timer.seconds)
+            pages += 1
+            lines += body.count(b'\n')
+            size += len(body)
+            after = response.headers.get('X-Next-After')
+    print(f'all records in {pages} pages of {args.limit}: {walk_timer.seconds:.2f}s, {lines} lines, '
+          f'{size / 2**20:.1f} MiB; first page {page_times[0] * 1000:.0f}ms, last {page_times[-1] * 1000:.0f}ms')
+
+    with app.app_context():
+        depth = args.records - args.limit
+        deep = db.session.execute(text('SELECT bib_id FROM records ORDER BY bib_id LIMIT 1 OFFSET :n'),
+                                  {'n': depth - 1}).scalar()
+        with Timer() as offset_timer:
+            for _ in range(20):
+                db.session.execute(text('SELECT id, bib_id, title FROM records ORDER BY bib_id LIMIT :limit OFFSET :n'),
+                                   {'limit': args.limit, 'n': depth}).all()
+        with Timer() as keyset_timer:
+            for _ in range(20):
+                db.session.execute(text('SELECT id, bib_id, title FROM records WHERE bib_id > :after '
+                                        'ORDER BY bib_id LIMIT :limit'), {'limit': args.limit, 'after': deep}).all()
+    print(f'page at record {depth}: keyset {keyset_timer.seconds / 20 * 1000:.1f}ms, '
+          f'OFFSET {offset_timer.seconds / 20 * 1000:.1f}ms')
+
+    bibs = [f'B{i:08d}' for i in rng.choice(args.records, args.samples, replace=False)]
+    api_latencies, page_latencies = [], []
+    for bib in bibs:
+        with Timer() as timer:
+            client.get(f'/api/records/{bib}/notes', query_string={'fields': 'index,text,distribution'}).get_data()
+        api_latencies.append(timer.seconds)
+        with Timer() as timer:
+            client.get(f'/record/{bib}').get_data()
+        page_latencies.append(timer.seconds)
+    print(f'notes with distributions of {args.samples} records: API {summarize(api_latencies)}')
+    print(f'same records as HTML record pages: {summarize(page_latencies)}')
+
+
+if __name__ == '__main__':
+    main()
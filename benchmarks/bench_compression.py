@@ -0,0 +1,80 @@
+"""
+Compressed catalogs: file sizes, import and export times, and read memory.
+
+Writes one synthetic catalog, compresses it with gzip (and zstd when the
+zstandard package is installed), imports each version into its own empty
+database and exports the result plain and compressed. Peak Python memory
+of reading the file as a stream is compared with building the whole
+document tree (ElementTree.parse, how files were read before).
+
+    python benchmarks/bench_compression.py [--records 10000] [--notes 5]
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import tracemalloc
+import xml.etree.ElementTree as ET
+
+from common import Timer, make_app, write_catalog
+from utils.compression import SUFFIXES, available_compressions, open_output
+from utils.xml_exporter import export_to_file
+from utils.xml_parser import import_xml_file, iter_catalog
+
+
+def compress(path, compression):
+    target = path + SUFFIXES[compression]
+    with open(path, 'rb') as source, open_output(target, compression) as f:
+        shutil.copyfileobj(source, f)
+    return target
+
+
+def peak_memory(work):
+    tracemalloc.start()
+    try:
+        work()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=10000)
+    parser.add_argument('--notes', type=int, default=5)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    plain = write_catalog(os.path.join(directory, 'catalog.xml'), args.records, args.notes)
+    catalogs = {'plain': plain}
+    for compression in available_compressions():
+        catalogs[compression] = compress(plain, compression)
+    size = os.path.getsize(plain)
+    print(f'{args.records} records x {args.notes} notes: ' + ', '.join(
+        f'{name} {os.path.getsize(path) / 2**20:.1f} MiB ({size / os.path.getsize(path):.0f}:1)'
+        for name, path in catalogs.items()))
+
+    for name, path in catalogs.items():
+        app = make_app(os.path.join(directory, f'{name}.db'), IMPORT_BATCH_PAUSE=0, VOTE_STORE_PRELOAD=False)
+        with app.app_context():
+            with Timer() as timer:
+                stats = import_xml_file(path, admin_user_id=1)
+        print(f'import {name}: {timer.seconds:.2f}s, {stats["records_created"]} records')
+
+    # Memory of reading the file only, without database work
+    tree_peak = peak_memory(lambda: ET.parse(plain))
+    stream_peak = peak_memory(lambda: sum(len(batch) for _, batch in iter_catalog(catalogs['gzip'], 500)))
+    print(f'peak memory reading the catalog: whole tree {tree_peak / 2**20:.1f} MiB, '
+          f'gzip stream in batches of 500 {stream_peak / 2**20:.1f} MiB')
+
+    app = make_app(os.path.join(directory, 'plain.db'), VOTE_STORE_PRELOAD=True)
+    with app.app_context():
+        for compression in [None, *available_compressions()]:
+            output = os.path.join(directory, 'export.xml' + (SUFFIXES[compression] if compression else ''))
+            with Timer() as timer:
+                export_to_file(output, 0.0, compression=compression)
+            print(f'export {compression or "plain"}: {timer.seconds:.2f}s, {os.path.getsize(output) / 2**20:.2f} MiB')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Dawid-Skene convergence time on a synthetic million-vote corpus.
+
+Simulates classifiers of varying reliability (including a few who vote at
+random) and reports the cold fit, then a warm-started refit after a batch of
+new votes, plus how often majority vote and Dawid-Skene recover the true
+class.
+
+    python benchmarks/bench_dawid_skene.py [--votes 1000000] [--users 500] [--new-votes 20000]
+"""
+import argparse
+
+import numpy as np
+
+from common import Timer
+from utils.dawid_skene import NUM_CLASSES, fit_dawid_skene
+
+
+def simulate(rng, num_notes, num_users, num_votes):
+    truth = rng.choice(NUM_CLASSES, size=num_notes, p=[0.3, 0.3, 0.2, 0.08, 0.05, 0.04, 0.03])
+    accuracy = rng.beta(8, 2, size=num_users)
+    accuracy[rng.random(num_users) < 0.05] = 1.0 / NUM_CLASSES  # random voters
+
+    # Every note gets at least one vote; the rest are spread at random
+    note = np.concatenate([np.arange(num_notes), rng.integers(0, num_notes, num_votes - num_notes)])
+    user = rng.integers(0, num_users, num_votes)
+    correct = rng.random(num_votes) < accuracy[user]
+    label = np.where(correct, truth[note], rng.integers(0, NUM_CLASSES, num_votes))
+    return truth, note, user, label
+
+
+def majority_accuracy(truth, note, label):
+    counts = np.bincount(note * NUM_CLASSES + label, minlength=len(truth) * NUM_CLASSES)
+    return (counts.reshape(len(truth), NUM_CLASSES).argmax(axis=1) == truth).mean()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--new-votes', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_notes = args.votes // 5
+    truth, note, user, label = simulate(rng, num_notes, args.users, args.votes)
+
+    with Timer() as cold_timer:
+        cold = fit_dawid_skene(note, user, label, num_notes, args.users)
+    print(f'cold fit: {args.votes} votes, {num_notes} notes, {args.users} users: '
+          f'{cold_timer.seconds:.2f}s, {cold["iterations"]} iterations, converged={cold["converged"]}')
+
+    # A batch of new votes on existing notes, then a warm-started refit
+    extra = args.new_votes
+    new_note = rng.integers(0, num_notes, extra)
+    new_user = rng.integers(0, args.users, extra)
+    new_label = np.where(rng.random(extra) < 0.8, truth[new_note], rng.integers(0, NUM_CLASSES, extra))
+    note = np.concatenate([note, new_note])
+    user = np.concatenate([user, new_user])
+    label = np.concatenate([label, new_label])
+
+    with Timer() as warm_timer:
+        warm = fit_dawid_skene(note, user, label, num_notes, args.users,
+                               confusion=cold['confusion'], priors=cold['priors'])
+    print(f'warm refit after {extra} new votes: {warm_timer.seconds:.2f}s, '
+          f'{warm["iterations"]} iterations, converged={warm["converged"]}')
+
+    with Timer() as rerun_timer:
+        rerun = fit_dawid_skene(note, user, label, num_notes, args.users)
+    print(f'cold refit of the same votes: {rerun_timer.seconds:.2f}s, {rerun["iterations"]} iterations')
+
+    print(f'accuracy vs truth: majority {majority_accuracy(truth, note, label):.4f}, '
+          f'dawid_skene {(warm["posteriors"].argmax(axis=1) == truth).mean():.4f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+"""
+Delta export after a voting session versus a full re-export.
+
+Imports synthetic catalogs, bulk-loads --votes random votes, takes a full
+export with a checkpoint, then casts --session-votes new votes through
+write_votes and exports the changes since the checkpoint.
+
+    python benchmarks/bench_delta_export.py [--records 20000] [--notes 5] [--votes 500000] [--session-votes 500]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from sqlalchemy import text
+
+from bench_vote_store import load_votes
+from common import Timer, make_app, write_catalog
+from models import db
+from utils.bulk_import import import_xml_files
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import run_in_connection
+from utils.vote_store import get_vote_store
+from utils.vote_writer import write_votes
+from utils.xml_exporter import export_to_file, get_checkpoint
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--votes', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--session-votes', type=int, default=500)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    catalog = write_catalog(os.path.join(directory, 'catalog.xml'), args.records, args.notes)
+    app = make_app(os.path.join(directory, 'bench.db'), IMPORT_BATCH_PAUSE=0, VOTE_WRITER_ENABLED=False)
+    num_notes = args.records * args.notes
+    rng = np.random.default_rng(0)
+
+    with app.app_context():
+        import_xml_files([catalog], workers=1)
+        load_votes(args.votes, num_notes, args.users, rng)
+        get_vote_store().rebuild()
+        print(f'{args.records} records x {args.notes} notes, {args.votes} votes')
+
+        full = os.path.join(directory, 'full.xml')
+        with Timer() as full_timer:
+            export_to_file(full, 0.5, checkpoint=True)
+        print(f'full export + checkpoint: {full_timer.seconds:.2f}s, {os.path.getsize(full) / 2**20:.2f} MiB')
+
+        # A voting session: one new user votes on random notes
+        user_id = args.users + 1
+        notes = rng.choice(num_notes, args.session_votes, replace=False) + 1
+        votes = [(int(note_id), CLASSIFICATION_TYPES[int(rng.integers(0, 3))]) for note_id in notes]
+        run_in_connection('bench', lambda connection: write_votes(connection, [(user_id, votes)]))
+
+        plan = db.session.execute(text(
+            'EXPLAIN QUERY PLAN SELECT note_id FROM votes WHERE voted_at >= :since'
+        ), {'since': get_checkpoint().voted_before}).all()
+        print('voted_at lookup:', '; '.join(row[-1] for row in plan))
+
+        delta = os.path.join(directory, 'delta.xml')
+        with Timer() as delta_timer:
+            export_to_file(delta, 0.5, since=get_checkpoint().id, checkpoint=True)
+        checkpoint = get_checkpoint()
+        print(f'delta after {args.session_votes} votes: {delta_timer.seconds:.2f}s, '
+              f'{os.path.getsize(delta) / 2**10:.0f} KiB, {checkpoint.records_written} records, '
+              f'{checkpoint.notes_removed} removals ({full_timer.seconds / delta_timer.seconds:.0f}x faster)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Merge re-import of a mostly unchanged catalog dump.
+
+Loads a synthetic catalog into an empty database, then re-imports the same
+catalog with --changed of the records edited (one note text changed each)
+in merge mode, and once more unchanged.
+
+    python benchmarks/bench_merge_import.py [--records 20000] [--notes 5] [--changed 0.05]
+"""
+import argparse
+import os
+import re
+import tempfile
+
+from common import Timer, make_app, write_catalog
+from utils.xml_parser import import_xml_file
+
+_NOTE_ZERO = re.compile(r'(<note type="w">Ms\. note 0 on p\. \d+ of record (\d+))(</note>)')
+
+
+def write_changed_catalog(source, path, every):
+    """Copy a catalog, editing the first note of every `every`-th record"""
+    with open(source, encoding='utf-8') as f, open(path, 'w', encoding='utf-8') as out:
+        for line in f:
+            match = _NOTE_ZERO.search(line)
+            if match and int(match.group(2)) % every == 0:
+                line = _NOTE_ZERO.sub(r'\1 (corrected)\3', line)
+            out.write(line)
+    return path
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--changed', type=float, default=0.05)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    catalog = write_catalog(os.path.join(directory, 'catalog.xml'), args.records, args.notes)
+    changed = write_changed_catalog(catalog, os.path.join(directory, 'changed.xml'), round(1 / args.changed))
+    app = make_app(os.path.join(directory, 'bench.db'), IMPORT_BATCH_PAUSE=0, VOTE_STORE_PRELOAD=False)
+
+    with app.app_context():
+        with Timer() as full_timer:
+            stats = import_xml_file(catalog, admin_user_id=1)
+        print(f'full load: {args.records} records, {stats["notes_created"]} notes: {full_timer.seconds:.2f}s')
+
+        with Timer() as merge_timer:
+            stats = import_xml_file(changed, admin_user_id=1, merge=True)
+        print(f'merge with {args.changed:.0%} changed: {merge_timer.seconds:.2f}s '
+              f'({merge_timer.seconds / full_timer.seconds:.0%} of full load), '
+              f'{stats["records_updated"]} records / {stats["notes_updated"]} notes updated, '
+              f'{stats["records_unchanged"]} unchanged, {stats["votes_removed"]} votes removed')
+
+        with Timer() as noop_timer:
+            stats = import_xml_file(changed, admin_user_id=1, merge=True)
+        print(f'merge with nothing changed: {noop_timer.seconds:.2f}s '
+              f'({noop_timer.seconds / full_timer.seconds:.0%} of full load), {stats["records_unchanged"]} unchanged')
+
+
+if __name__ == '__main__':
+    main()
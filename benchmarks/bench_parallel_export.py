@@ -0,0 +1,65 @@
+"""
+Sharded XML export: one pass in the app process versus bib ID range shards
+generated by a process pool, plus the export of a single source file.
+
+Imports --files synthetic catalogs and bulk-loads --votes random votes on
+their notes, then times each export to a temporary file.
+
+    python benchmarks/bench_parallel_export.py [--files 8] [--records 2500] [--notes 5] [--votes 500000] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from bench_vote_store import load_votes
+from common import Timer, make_app, write_catalog
+from utils.bulk_import import import_xml_files
+from utils.vote_store import get_vote_store
+from utils.xml_exporter import export_shards, export_to_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=8)
+    parser.add_argument('--records', type=int, default=2500, help='Records per file')
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--votes', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    files = [write_catalog(os.path.join(directory, f'part{i:03d}.xml'), args.records, args.notes,
+                           start=i * args.records)
+             for i in range(args.files)]
+    app = make_app(os.path.join(directory, 'bench.db'), IMPORT_BATCH_PAUSE=0, VOTE_WRITER_ENABLED=False)
+
+    with app.app_context():
+        import_xml_files(files, workers=1)
+        load_votes(args.votes, args.files * args.records * args.notes, args.users, np.random.default_rng(0))
+        get_vote_store().rebuild()
+        print(f'{args.files} files x {args.records} records x {args.notes} notes, {args.votes} votes, '
+              f'{os.cpu_count()} CPUs')
+
+        output = os.path.join(directory, 'export.xml')
+        with Timer() as single_timer:
+            export_to_file(output, 0.3)
+        size = os.path.getsize(output)
+        print(f'single pass: {single_timer.seconds:.2f}s ({size / 2**20:.1f} MiB)')
+
+        shards = len(export_shards('bib_id'))
+        for workers in sorted({1, args.workers}):
+            with Timer() as sharded_timer:
+                export_to_file(output, 0.3, shard_by='bib_id', workers=workers)
+            print(f'{shards} bib ID shards, {workers} worker(s): {sharded_timer.seconds:.2f}s '
+                  f'({single_timer.seconds / sharded_timer.seconds:.1f}x)')
+
+        with Timer() as file_timer:
+            export_to_file(output, 0.3, shard={'source_filename': 'part000.xml'})
+        print(f'one source file: {file_timer.seconds:.2f}s ({os.path.getsize(output) / 2**20:.1f} MiB)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+"""
+Multi-file catalog import: one file at a time through import_xml_file
+versus import_xml_files (parallel parsing, single bulk writer).
+
+Each mode loads the same synthetic shards into its own empty database.
+
+    python benchmarks/bench_parallel_import.py [--shards 8] [--records 1000] [--notes 5] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+
+from common import Timer, make_app, write_catalog
+from utils.bulk_import import import_xml_files
+from utils.xml_parser import import_xml_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--shards', type=int, default=8)
+    parser.add_argument('--records', type=int, default=1000, help='Records per shard')
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    shards = [write_catalog(os.path.join(directory, f'shard{i:03d}.xml'), args.records, args.notes,
+                            start=i * args.records)
+              for i in range(args.shards)]
+    total = args.shards * args.records
+    print(f'{args.shards} shards of {args.records} records x {args.notes} notes, {os.cpu_count()} CPUs')
+
+    app = make_app(os.path.join(directory, 'serial.db'), IMPORT_BATCH_PAUSE=0, VOTE_STORE_PRELOAD=False)
+    with app.app_context():
+        with Timer() as serial_timer:
+            created = sum(import_xml_file(path, admin_user_id=1)['records_created'] for path in shards)
+    print(f'import_xml_file per shard: {serial_timer.seconds:.2f}s, {created} records '
+          f'({total / serial_timer.seconds:.0f} records/s)')
+
+    for workers in sorted({1, args.workers}):
+        app = make_app(os.path.join(directory, f'bulk{workers}.db'), IMPORT_BATCH_PAUSE=0, VOTE_STORE_PRELOAD=False)
+        with app.app_context():
+            with Timer() as bulk_timer:
+                stats = import_xml_files(shards, admin_user_id=1, workers=workers)
+        print(f'import_xml_files, {workers} worker(s): {bulk_timer.seconds:.2f}s, {stats["records_created"]} records '
+              f'({total / bulk_timer.seconds:.0f} records/s, {serial_timer.seconds / bulk_timer.seconds:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""
+Review queue pages, bulk review and approval-filtered exports.
+
+Imports synthetic catalogs and bulk-loads --votes random votes, then times
+the first and a deep page of the review queue against building the same
+page from per-note distributions, approving one page and --reviewed notes
+in bulk, the queue again with those reviews on file, and a full export
+with and without the approval filter.
+
+    python benchmarks/bench_review_queue.py [--records 20000] [--notes 5] [--votes 500000] [--reviewed 20000]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+
+from bench_vote_store import load_votes
+from common import Timer, make_app, write_catalog
+from models import db, Note, User
+from utils.bulk_import import import_xml_files
+from utils.probability import calculate_vote_distributions
+from utils.review import review_queue, save_reviews
+from utils.vote_store import get_vote_store
+from utils.xml_exporter import export_to_file
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=20000)
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--votes', type=int, default=500000)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--reviewed', type=int, default=20000)
+    parser.add_argument('--threshold', type=float, default=0.4)
+    parser.add_argument('--per-page', type=int, default=50)
+    args = parser.parse_args()
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    catalog = write_catalog(os.path.join(directory, 'catalog.xml'), args.records, args.notes)
+    app = make_app(os.path.join(directory, 'bench.db'), IMPORT_BATCH_PAUSE=0, VOTE_WRITER_ENABLED=False)
+    num_notes = args.records * args.notes
+    rng = np.random.default_rng(0)
+
+    with app.app_context():
+        import_xml_files([catalog], workers=1)
+        load_votes(args.votes, num_notes, args.users, rng)
+        get_vote_store().rebuild()
+        reviewer = User(username='reviewer', is_admin=True)
+        db.session.add(reviewer)
+        db.session.commit()
+        print(f'{args.records} records x {args.notes} notes, {args.votes} votes')
+
+        with Timer() as first_timer:
+            first = review_queue(args.threshold, per_page=args.per_page)
+        deep_after = num_notes * 3 // 4
+        with Timer() as deep_timer:
+            review_queue(args.threshold, after=deep_after, per_page=args.per_page)
+        print(f'queue of {first["total"]} notes at {args.threshold:.0%}: first page {first_timer.seconds * 1000:.0f}ms, '
+              f'page after note {deep_after} {deep_timer.seconds * 1000:.0f}ms')
+
+        # The same page from per-note distributions, as the Search and
+        # Contentious views compute them
+        with Timer() as baseline_timer:
+            note_ids = [note_id for (note_id,) in db.session.query(Note.id).order_by(Note.id)]
+            distributions = calculate_vote_distributions(note_ids)
+            [note_id for note_id in note_ids if distributions[note_id]['consensus'] and
+             distributions[note_id]['confidence'] >= args.threshold][:args.per_page]
+        print(f'same page from per-note distributions: {baseline_timer.seconds * 1000:.0f}ms '
+              f'({baseline_timer.seconds / first_timer.seconds:.0f}x slower)')
+
+        page = [(note['id'], note['distribution']['consensus']) for note in first['notes']]
+        with Timer() as page_timer:
+            save_reviews(reviewer.id, page, 'approve')
+        queue = review_queue(args.threshold, per_page=args.reviewed)
+        bulk = [(note['id'], note['distribution']['consensus']) for note in queue['notes']]
+        with Timer() as bulk_timer:
+            save_reviews(reviewer.id, bulk, 'approve')
+        print(f'approve one page ({len(page)} notes): {page_timer.seconds * 1000:.0f}ms; '
+              f'{len(bulk)} notes in one call: {bulk_timer.seconds * 1000:.0f}ms')
+
+        with Timer() as reviewed_timer:
+            after = review_queue(args.threshold, per_page=args.per_page)
+        print(f'first page with {len(page) + len(bulk)} reviews on file: {reviewed_timer.seconds * 1000:.0f}ms '
+              f'({after["total"]} notes left)')
+
+        for approval in (None, 'approved', 'not_rejected'):
+            path = os.path.join(directory, f'export_{approval}.xml')
+            with Timer() as export_timer:
+                export_to_file(path, args.threshold, approval=approval)
+            with open(path, 'rb') as f:
+                notes = f.read().count(b'<note ')
+            print(f'export, approval {approval or "none"}: {export_timer.seconds:.2f}s, {notes} notes')
+
+
+if __name__ == '__main__':
+    main()
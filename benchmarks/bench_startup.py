@@ -0,0 +1,109 @@
+"""
+Worker cold-start time.
+
+Each measurement runs in a fresh interpreter, timing imports, create_app()
+and the first request, on a database holding --votes synthetic votes:
+
+- unstamped: a database created by create_all() before startup stamped
+  it, so every start runs create_all() (the previous behaviour)
+- at head: the database is stamped with the migration head, create_all()
+  is skipped; with and without the `flask db` commands (MIGRATE_CLI)
+- preloaded worker: the app is created once in a parent, which then
+  forks; only the child's first request is timed, as for
+  `gunicorn --preload`
+
+    python benchmarks/bench_startup.py [--votes 1000000] [--runs 5]
+"""
+import argparse
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import numpy as np
+
+from bench_vote_store import load_votes
+from common import make_app, summarize
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Run in a fresh interpreter; prints timings as JSON
+STARTUP_SCRIPT = """
+import json, os, sys, time
+start = time.perf_counter()
+sys.path.insert(0, {root!r})
+from app import create_app
+imported = time.perf_counter()
+app = create_app()
+created = time.perf_counter()
+if os.environ.get('BENCH_FORK'):
+    read, write = os.pipe()
+    pid = os.fork()
+    if pid:
+        os.close(write)
+        print(os.read(read, 4096).decode())
+        os.waitpid(pid, 0)
+        sys.exit(0)
+    forked = time.perf_counter()
+    app.test_client().get('/login')
+    os.write(write, json.dumps({{'first_request': time.perf_counter() - forked}}).encode())
+    os._exit(0)
+app.test_client().get('/login')
+done = time.perf_counter()
+from utils.metrics import STARTUP_DURATION
+phases = {{phase: seconds for (phase,), seconds in STARTUP_DURATION._values.items()}}
+print(json.dumps({{'imports': imported - start, 'create_app': created - imported,
+                  'first_request': done - created,
+                  'schema': phases['schema'], 'vote_store': phases['vote_store']}}))
+"""
+
+
+def run(db_path, **env):
+    environment = dict(os.environ, DATABASE_URL='sqlite:///' + db_path, **env)
+    output = subprocess.run([sys.executable, '-c', STARTUP_SCRIPT.format(root=ROOT)],
+                            env=environment, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+# Parts of create_app reported separately, not added to the total
+DETAIL = ('schema', 'vote_store')
+
+
+def report(label, db_path, runs, **env):
+    samples = [run(db_path, **env) for _ in range(runs)]
+    phases = {key: summarize([sample[key] for sample in samples])['p50_ms'] for key in samples[0]}
+    total = sum(value for key, value in phases.items() if key not in DETAIL)
+    print(f'{label:<36} total {total:7.1f}ms  ' + '  '.join(f'{key} {value:.1f}' for key, value in phases.items()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=1000000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(prefix='classification-bench-'), 'bench.db')
+    app = make_app(db_path)
+    with app.app_context():
+        load_votes(args.votes, args.votes // 5, args.users, np.random.default_rng(0))
+    print(f'{args.votes} votes, median of {args.runs} runs')
+
+    unstamped = db_path + '.unstamped'
+    connection = sqlite3.connect(unstamped)
+    sqlite3.connect(db_path).backup(connection)
+    connection.execute('DROP TABLE alembic_version')
+    connection.commit()
+    connection.close()
+
+    report('unstamped (create_all every start)', unstamped, args.runs, MIGRATE_CLI='1')
+    report('at head, with flask db commands', db_path, args.runs, MIGRATE_CLI='1')
+    report('at head, wsgi (no flask db)', db_path, args.runs, MIGRATE_CLI='0')
+    report('at head, no vote store preload', db_path, args.runs, MIGRATE_CLI='0', VOTE_STORE_PRELOAD='0')
+    report('preloaded worker after fork', db_path, args.runs, MIGRATE_CLI='0', BENCH_FORK='1')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Reader latency while a large import runs, per storage profile.
+
+Compares the previous setup (WAL only, one engine) with the tuned pragma
+profile and read/write engine split. Readers request record pages in
+threads while another thread imports a large catalog.
+
+    python benchmarks/bench_storage.py [--records 30000] [--readers 4]
+"""
+import argparse
+import os
+import random
+import tempfile
+import threading
+
+from common import make_app, write_catalog, summarize, Timer
+
+SCENARIOS = [
+    ('legacy, single engine', {'STORAGE_PROFILE': 'legacy', 'STORAGE_READ_WRITE_SPLIT': False}),
+    ('balanced, read/write split', {'STORAGE_PROFILE': 'balanced', 'STORAGE_READ_WRITE_SPLIT': True}),
+]
+
+
+def run_scenario(name, overrides, import_path, seed_path, readers):
+    from utils.xml_parser import import_xml_file
+
+    app = make_app(METRICS_ENABLED=False, **overrides)
+    with app.app_context():
+        import_xml_file(seed_path)
+    bibs = [f'S{i:08d}' for i in range(500)]
+
+    done = threading.Event()
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def reader():
+        client = app.test_client()
+        client.post('/login', data={'username': f'reader{threading.get_ident()}'})
+        local = []
+        while not done.is_set():
+            with Timer() as t:
+                response = client.get(f'/record/{random.choice(bibs)}')
+            if response.status_code != 200:
+                with lock:
+                    errors.append(response.status_code)
+            local.append(t.seconds)
+        with lock:
+            latencies.extend(local)
+
+    def importer():
+        with app.app_context():
+            with Timer() as t:
+                stats = import_xml_file(import_path)
+            importer.seconds = t.seconds
+            importer.stats = stats
+        done.set()
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    import_thread = threading.Thread(target=importer)
+    import_thread.start()
+    import_thread.join()
+    for thread in threads:
+        thread.join()
+
+    summary = summarize(latencies)
+    print(f'{name}: import {importer.seconds:.1f}s ({importer.stats["notes_created"]} notes), '
+          f'reader requests {summary["count"]} ({summary["count"] / importer.seconds:.0f}/s), '
+          f'p50 {summary["p50_ms"]} ms, p95 {summary["p95_ms"]} ms, p99 {summary["p99_ms"]} ms, '
+          f'max {summary["max_ms"]} ms, errors {len(errors)}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--records', type=int, default=30000)
+    parser.add_argument('--notes', type=int, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='classification-bench-')
+    seed_path = write_catalog(os.path.join(workdir, 'seed.xml'), 500, 10, prefix='S')
+    import_path = write_catalog(os.path.join(workdir, 'import.xml'), args.records, args.notes)
+
+    for name, overrides in SCENARIOS:
+        run_scenario(name, overrides, import_path, seed_path, args.readers)
+
+
+if __name__ == '__main__':
+    main()
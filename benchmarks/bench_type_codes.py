@@ -0,0 +1,104 @@
+"""
+Classifications stored as letter strings versus integer codes.
+
+Writes the same --votes random votes into two SQLite files: one with the
+old VARCHAR(3) letters and one with the SMALLINT codes of
+config/type_codes.yaml, both with the indexes of the votes table. It
+compares the file sizes after VACUUM, a GROUP BY note and classification
+over every vote (the shape of the per-note count queries), and the full
+scan the vote store and the agreement report run: a CASE over the letters
+against reading the codes directly.
+
+    python benchmarks/bench_type_codes.py [--votes 5000000] [--users 500]
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+from itertools import chain
+
+import numpy as np
+
+from common import Timer
+from utils.type_codes import LETTERS
+
+_SCHEMA = """
+CREATE TABLE votes (
+    id INTEGER PRIMARY KEY,
+    note_id INTEGER NOT NULL,
+    user_id INTEGER NOT NULL,
+    classification {type} NOT NULL,
+    voted_at DATETIME,
+    UNIQUE (note_id, user_id)
+);
+CREATE INDEX idx_vote_note_user ON votes (note_id, user_id);
+CREATE INDEX idx_vote_voted_at ON votes (voted_at);
+CREATE INDEX ix_votes_note_id ON votes (note_id);
+CREATE INDEX ix_votes_user_id ON votes (user_id);
+"""
+
+
+def build(path, column_type, rows):
+    connection = sqlite3.connect(path)
+    connection.executescript(_SCHEMA.format(type=column_type))
+    connection.executemany('INSERT INTO votes (note_id, user_id, classification, voted_at) VALUES (?, ?, ?, ?)', rows)
+    connection.commit()
+    connection.execute('VACUUM')
+    return connection
+
+
+def scan(connection, sql):
+    cursor = connection.execute(sql)
+    chunks = []
+    while True:
+        rows = cursor.fetchmany(100000)
+        if not rows:
+            break
+        chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.int32, count=3 * len(rows)))
+    return np.concatenate(chunks)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=5000000)
+    parser.add_argument('--users', type=int, default=500)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_notes = args.votes // 5
+    k = np.arange(args.votes)
+    note = (k % num_notes + 1).tolist()
+    user = ((k // num_notes + (k % num_notes + 1) * 7) % args.users + 1).tolist()
+    codes = rng.integers(0, len(LETTERS), args.votes).tolist()
+    voted_at = '2026-10-20 12:00:00.000000'
+
+    directory = tempfile.mkdtemp(prefix='classification-bench-')
+    letters = build(os.path.join(directory, 'letters.db'), 'VARCHAR(3)',
+                    zip(note, user, (LETTERS[code] for code in codes), [voted_at] * args.votes))
+    integers = build(os.path.join(directory, 'codes.db'), 'SMALLINT', zip(note, user, codes, [voted_at] * args.votes))
+    print(f'{args.votes} votes on {num_notes} notes from {args.users} users')
+
+    sizes = [os.path.getsize(os.path.join(directory, name)) for name in ('letters.db', 'codes.db')]
+    print(f'file size: letters {sizes[0] / 2**20:.1f} MiB, codes {sizes[1] / 2**20:.1f} MiB '
+          f'({1 - sizes[1] / sizes[0]:.0%} smaller)')
+
+    group_by = 'SELECT note_id, classification, count(*) FROM votes GROUP BY note_id, classification'
+    timings = []
+    for connection in (letters, integers):
+        with Timer() as timer:
+            connection.execute(group_by).fetchall()
+        timings.append(timer.seconds)
+    print(f'GROUP BY note, classification: letters {timings[0]:.2f}s, codes {timings[1]:.2f}s')
+
+    case = ' '.join(f"WHEN '{letter}' THEN {code}" for code, letter in enumerate(LETTERS))
+    with Timer() as case_timer:
+        from_letters = scan(letters, f'SELECT note_id, user_id, CASE classification {case} ELSE -1 END FROM votes')
+    with Timer() as direct_timer:
+        from_codes = scan(integers, "SELECT note_id, user_id, CASE typeof(classification) WHEN 'integer' "
+                                    "THEN classification ELSE -1 END FROM votes")
+    assert np.array_equal(np.sort(from_letters), np.sort(from_codes)), 'scans differ'
+    print(f'vote store scan: CASE over letters {case_timer.seconds:.2f}s, codes read directly {direct_timer.seconds:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,91 @@
+"""
+Vote store rebuild from a snapshot plus the vote log versus a full scan,
+and point-in-time consensus queries.
+
+Bulk-loads --votes random votes, rebuilds the store with a full scan of
+the votes table and saves a snapshot, then writes --new-votes votes (new
+and changed) through write_votes in batches. A fresh store is then rebuilt
+both ways: from the snapshot plus the log entries after it, and by a full
+scan. Finally it times consensus queries at a time in the middle of the
+new votes, and compaction after a second snapshot.
+
+    python benchmarks/bench_vote_log.py [--votes 5000000] [--users 500] [--new-votes 20000]
+"""
+import argparse
+import os
+import tempfile
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import text
+
+from bench_vote_store import load_votes
+from common import Timer, make_app
+from models import db, VoteSnapshot
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import run_in_connection
+from utils.vote_log import compact_vote_log, consensus_at
+from utils.vote_store import VoteStore
+from utils.vote_writer import write_votes
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=5000000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--new-votes', type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_notes = args.votes // 5
+    db_path = os.path.join(tempfile.mkdtemp(prefix='classification-bench-'), 'bench.db')
+    app = make_app(db_path, VOTE_STORE_PRELOAD=False, VOTE_WRITER_ENABLED=False, VOTE_SNAPSHOT_INTERVAL=0)
+
+    with app.app_context():
+        load_votes(args.votes, num_notes, args.users, rng)
+        print(f'{args.votes} votes on {num_notes} notes from {args.users} users')
+
+        store = VoteStore()
+        with Timer() as scan_timer:
+            store.rebuild()
+        with Timer() as save_timer:
+            store.snapshot()
+        size = db.session.execute(text('SELECT length(data) FROM vote_snapshots')).scalar()
+        print(f'full scan: {scan_timer.seconds:.2f}s; saving the snapshot: {save_timer.seconds:.2f}s '
+              f'({size / 2**20:.1f} MiB)')
+
+        # New votes and changed votes from every user, in batches of 100
+        middle = None
+        for start in range(0, args.new_votes, 100):
+            if start >= args.new_votes // 2 and middle is None:
+                middle = datetime.utcnow()
+            user_id = int(rng.integers(1, args.users + 1))
+            notes = rng.choice(num_notes, 100, replace=False) + 1
+            votes = [(int(note_id), CLASSIFICATION_TYPES[int(rng.integers(0, 3))]) for note_id in notes]
+            run_in_connection('bench', lambda connection: write_votes(connection, [(user_id, votes)]))
+
+        replayed = VoteStore()
+        with Timer() as replay_timer:
+            replayed.rebuild()
+        scanned = VoteStore()
+        with Timer() as rescan_timer:
+            scanned._scan(db.session.connection())
+        size = min(len(replayed.counts), len(scanned.counts))
+        assert np.array_equal(replayed.counts[:size], scanned.counts[:size]), 'replay differs from scan'
+        print(f'rebuild after {args.new_votes} log entries: snapshot + replay {replay_timer.seconds:.2f}s, '
+              f'full scan {rescan_timer.seconds:.2f}s ({rescan_timer.seconds / replay_timer.seconds:.1f}x)')
+
+        sample = [int(note_id) for note_id in rng.choice(num_notes, 1000, replace=False) + 1]
+        with Timer() as at_timer:
+            consensus_at(sample, middle)
+        print(f'consensus of 1000 notes at a past time: {at_timer.seconds * 1000:.0f}ms')
+
+        replayed.snapshot()
+        with Timer() as compact_timer:
+            snapshots, entries = run_in_connection('bench', lambda connection: compact_vote_log(connection, 1))
+        print(f'compaction to 1 snapshot: {compact_timer.seconds * 1000:.0f}ms, removed {snapshots} snapshot(s) '
+              f'and {entries} log entries; {VoteSnapshot.query.count()} snapshot(s) left')
+
+
+if __name__ == '__main__':
+    main()
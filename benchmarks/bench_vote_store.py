@@ -0,0 +1,101 @@
+"""
+In-memory vote store rebuild time and memory on a synthetic vote table.
+
+Bulk-loads a votes table straight into SQLite (notes and records are not
+needed by the store), then times a full rebuild, an incremental sync after
+a batch of votes written through write_votes, and the lookups served from
+the store.
+
+    python benchmarks/bench_vote_store.py [--votes 10000000] [--users 500] [--new-votes 1000]
+"""
+import argparse
+import os
+import tempfile
+
+import numpy as np
+from sqlalchemy import text
+
+from common import Timer, make_app
+from models import db
+from utils.data_version import ensure_data_versions
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import run_in_connection
+from utils.vote_store import VoteStore
+from utils.vote_writer import write_votes
+
+_VOTE_TRIGGERS = ('votes_version_ai', 'votes_version_au', 'votes_version_ad',
+                  'votes_changes_ai', 'votes_changes_au', 'votes_changes_ad')
+
+
+def load_votes(num_votes, num_notes, num_users, rng):
+    """Bulk insert votes with at most one vote per (note, user)"""
+    connection = db.session.connection().connection
+    for name in _VOTE_TRIGGERS:
+        connection.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+    chunk = 500000
+    for start in range(0, num_votes, chunk):
+        k = np.arange(start, min(start + chunk, num_votes))
+        note = k % num_notes + 1
+        user = (k // num_notes + note * 7) % num_users + 1
+        label = rng.integers(0, len(CLASSIFICATION_TYPES), len(k))
+        connection.executemany(
+            'INSERT INTO votes (note_id, user_id, classification) VALUES (?, ?, ?)',
+            zip(note.tolist(), user.tolist(), label.tolist())  # Stored classification codes
+        )
+        connection.commit()
+
+    # Triggers back in place for the incremental part
+    ensure_data_versions(db.session.connection())
+    db.session.commit()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--votes', type=int, default=10000000)
+    parser.add_argument('--users', type=int, default=500)
+    parser.add_argument('--new-votes', type=int, default=1000)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    num_notes = args.votes // 5
+    db_path = os.path.join(tempfile.mkdtemp(prefix='classification-bench-'), 'bench.db')
+    app = make_app(db_path, VOTE_STORE_PRELOAD=False, VOTE_WRITER_ENABLED=False)
+
+    with app.app_context():
+        with Timer() as load_timer:
+            load_votes(args.votes, num_notes, args.users, rng)
+        print(f'loaded {args.votes} votes on {num_notes} notes from {args.users} users: {load_timer.seconds:.1f}s '
+              f'({os.path.getsize(db_path) / 2**20:.0f} MiB database)')
+
+        store = VoteStore()
+        with Timer() as rebuild_timer:
+            store.rebuild()
+        print(f'rebuild: {rebuild_timer.seconds:.2f}s, {store.nbytes() / 2**20:.1f} MiB in memory '
+              f'(counts {store.counts.nbytes / 2**20:.1f} MiB)')
+
+        # A batch of new and changed votes from one user, then catch up
+        new_notes = rng.choice(num_notes, args.new_votes, replace=False) + 1
+        votes = [(int(note_id), CLASSIFICATION_TYPES[0]) for note_id in new_notes]
+        run_in_connection('bench', lambda connection: write_votes(connection, [(1, votes)]))
+        with Timer() as sync_timer:
+            store.sync()
+        print(f'sync after {args.new_votes} votes: {sync_timer.seconds * 1000:.1f}ms')
+
+        with Timer() as noop_timer:
+            store.sync()
+        print(f'sync with nothing new: {noop_timer.seconds * 1000:.2f}ms')
+
+        sample = rng.integers(1, num_notes + 1, 100000)
+        with Timer() as lookup_timer:
+            for note_id in sample.tolist():
+                store.vote_counts(note_id)
+                store.has_voted(1, note_id)
+        print(f'lookups: {lookup_timer.seconds / len(sample) * 1e6:.1f}us per vote_counts + has_voted')
+
+        expected = db.session.execute(text('SELECT count(*) FROM votes')).scalar()
+        assert int(store.counts.sum()) == expected, 'store out of sync with votes table'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+"""
+Sustained vote throughput with and without the write-behind vote writer.
+
+Several worker processes (like pre-forked server workers) each run many
+client threads posting /vote as fast as they can against one database.
+Reports committed votes per second and "database is locked" failures.
+
+    python benchmarks/bench_vote_writer.py [--processes 4] [--threads 8] [--seconds 10] [--profile durable]
+"""
+import argparse
+import multiprocessing
+import os
+import random
+import tempfile
+import threading
+import time
+
+from common import make_app, write_catalog
+
+RECORDS = 200
+NOTES = 10
+
+
+def worker(db_path, overrides, threads, seconds, results):
+    app = make_app(db_path, METRICS_ENABLED=False, **overrides)
+    stop_at = time.monotonic() + seconds
+    counts = {'ok': 0, 'locked': 0, 'other': 0}
+    lock = threading.Lock()
+
+    def client_loop(n):
+        client = app.test_client()
+        client.post('/login', data={'username': f'user{os.getpid()}-{n}'})
+        local = {'ok': 0, 'locked': 0, 'other': 0}
+        while time.monotonic() < stop_at:
+            response = client.post('/vote', json={
+                'bib_id': f'B{random.randrange(RECORDS):08d}',
+                'note_index': random.randrange(NOTES),
+                'classification': random.choice(['w', 'o', 'a']),
+            })
+            if response.status_code == 200:
+                local['ok'] += 1
+            elif b'locked' in response.data:
+                local['locked'] += 1
+            else:
+                local['other'] += 1
+        with lock:
+            for key, value in local.items():
+                counts[key] += value
+
+    pool = [threading.Thread(target=client_loop, args=(n,)) for n in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    writer = app.extensions.get('vote_writer')
+    if writer is not None:
+        writer.stop()
+    results.put(counts)
+
+
+def run(name, overrides, args):
+    workdir = tempfile.mkdtemp(prefix='classification-bench-')
+    db_path = os.path.join(workdir, 'bench.db')
+    app = make_app(db_path, METRICS_ENABLED=False, **overrides)
+    with app.app_context():
+        from utils.xml_parser import import_xml_file
+        import_xml_file(write_catalog(os.path.join(workdir, 'seed.xml'), RECORDS, NOTES))
+    del app
+
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(db_path, overrides, args.threads, args.seconds, results))
+                 for _ in range(args.processes)]
+    for process in processes:
+        process.start()
+    totals = {'ok': 0, 'locked': 0, 'other': 0}
+    for _ in processes:
+        for key, value in results.get().items():
+            totals[key] += value
+    for process in processes:
+        process.join()
+
+    print(f'{name}: {totals["ok"] / args.seconds:.0f} votes/s committed, '
+          f'{totals["locked"]} locked errors, {totals["other"]} other errors '
+          f'({args.processes} processes x {args.threads} threads, {args.seconds}s)')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--seconds', type=int, default=10)
+    parser.add_argument('--profile', default='balanced', help='storage profile (durable = fsync per commit)')
+    args = parser.parse_args()
+
+    run('inline commit per request', {'VOTE_WRITER_ENABLED': False, 'STORAGE_PROFILE': args.profile}, args)
+    run('group-commit vote writer', {'VOTE_WRITER_ENABLED': True, 'STORAGE_PROFILE': args.profile}, args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+"""Shared helpers for benchmark scripts: throwaway apps, synthetic data, timing summaries."""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+
+def make_config(db_path, **overrides):
+    """Build a Config subclass pointing at db_path with the given overrides"""
+    attrs = {'SQLALCHEMY_DATABASE_URI': 'sqlite:///' + db_path, 'TESTING': True}
+    attrs.update(overrides)
+    return type('BenchmarkConfig', (Config,), attrs)
+
+
+def make_app(db_path=None, **overrides):
+    """Create an app on a fresh temporary database (or db_path)"""
+    from app import create_app
+    if db_path is None:
+        db_path = os.path.join(tempfile.mkdtemp(prefix='classification-bench-'), 'bench.db')
+    return create_app(make_config(db_path, **overrides))
+
+
+def write_catalog(path, records, notes_per_record, start=0, prefix='B'):
+    """Write a synthetic catalog XML file in the import format"""
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write("<?xml version='1.0' encoding='utf-8'?>\n<records>\n")
+        for i in range(start, start + records):
+            f.write(f'  <record bib="{prefix}{i:08d}">\n    <title>Synthetic record {i}</title>\n')
+            for j in range(notes_per_record):
+                f.write(f'    <note type="w">Ms. note {j} on p. {i % 97} of record {i}</note>\n')
+            f.write('  </record>\n')
+        f.write('</records>\n')
+    return path
+
+
+def summarize(latencies):
+    """Return count, p50, p95, p99 and max (milliseconds) for a list of seconds"""
+    if not latencies:
+        return {'count': 0, 'p50_ms': 0.0, 'p95_ms': 0.0, 'p99_ms': 0.0, 'max_ms': 0.0}
+    ordered = sorted(latencies)
+
+    def pct(p):
+        return ordered[min(len(ordered) - 1, int(p * len(ordered)))] * 1000
+
+    return {
+        'count': len(ordered),
+        'p50_ms': round(pct(0.50), 2),
+        'p95_ms': round(pct(0.95), 2),
+        'p99_ms': round(pct(0.99), 2),
+        'max_ms': round(ordered[-1] * 1000, 2),
+    }
+
+
+class Timer:
+    """Context manager measuring wall-clock seconds"""
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.start
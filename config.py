@@ -16,6 +16,18 @@ class Config:
         'pool_pre_ping': True,
     }
 
+    # SQLite storage profile: pragmas applied to every pooled connection
+    # ('legacy' = WAL only, 'balanced' = tuned for concurrent readers, 'durable' = synchronous FULL)
+    STORAGE_PROFILE = os.environ.get('STORAGE_PROFILE') or 'balanced'
+    SQLITE_PRAGMAS = {}  # Per-pragma overrides, e.g. {'busy_timeout': 10000}
+    # Run SELECTs from GET requests on a separate read-only engine
+    STORAGE_READ_WRITE_SPLIT = os.environ.get('STORAGE_READ_WRITE_SPLIT', '1') != '0'
+
+    # Retry writes that hit SQLITE_BUSY with jittered exponential backoff
+    WRITE_RETRY_TIMEOUT = 30  # Seconds before a write gives up
+    WRITE_RETRY_BASE_DELAY = 0.02
+    WRITE_RETRY_MAX_DELAY = 1.0
+
     # Session
     SESSION_COOKIE_HTTPONLY = True
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
@@ -29,9 +41,67 @@ class Config:
     DEFAULT_CONTENTIOUS_THRESHOLD = 0.70  # 70% agreement required
     MIN_VOTES_FOR_CONTENTIOUS = 3  # Minimum votes before marking contentious
 
+    # Dawid-Skene consensus (used when the consensus_strategy setting is dawid_skene)
+    DAWID_SKENE_REFIT_INTERVAL = 600  # Seconds before a fit is re-estimated after votes change
+    # Re-estimate stale fits in a background thread of the app; with 0, only
+    # `python -m utils.dawid_skene` (e.g. from cron) refits
+    DAWID_SKENE_BACKGROUND_REFIT = os.environ.get('DAWID_SKENE_BACKGROUND_REFIT', '1') != '0'
+    DAWID_SKENE_MAX_ITER = 100
+    DAWID_SKENE_TOLERANCE = 1e-6  # Stop when log-likelihood per vote improves by less
+
+    # Dirichlet-multinomial credible bounds (used when the confidence_measure setting is lower_bound)
+    DIRICHLET_PRIOR = 1.0  # Total prior pseudo-votes, spread evenly over the classifications
+    DIRICHLET_LOWER_QUANTILE = 0.05  # Lower bound = 5% quantile (one-sided 95% credible bound)
+
+    # Assignment scheduler ("Start Unclassified" leases batches of notes to each classifier)
+    TARGET_VOTES_PER_NOTE = 3  # Stop leasing a note once votes plus active leases reach this
+    LEASE_BATCH_SIZE = 20  # Notes leased per batch
+    LEASE_TTL = 600  # Seconds before an unused lease expires
+
     # XML export settings
     DEFAULT_EXPORT_CONFIDENCE = 0.60  # Only export notes with 60%+ confidence
+    EXPORT_SHARD_SIZE = 5000  # Records per bib ID range in a sharded export
+    EXPORT_WORKERS = None  # Processes generating export shards (None = one per CPU)
+    EXPORT_COMPRESSION_LEVELS = {'gzip': 6, 'zstd': 3}  # Levels for compressed downloads
+    REVIEW_PAGE_SIZE = 50  # Notes per page of the admin review queue
+
+    # Read API (routes/api.py)
+    API_PAGE_SIZE = 1000  # Records per /api/records page without limit=
+    API_MAX_PAGE_SIZE = 10000  # Largest limit= accepted
 
     # Upload settings
     MAX_CONTENT_LENGTH = 50 * 1024 * 1024  # 50 MB max upload size
-    ALLOWED_EXTENSIONS = {'xml'}
+    ALLOWED_EXTENSIONS = {'xml', 'xml.gz', 'xml.zst'}  # .zst needs the optional zstandard package
+    IMPORT_BATCH_SIZE = 500  # Records per import transaction
+    IMPORT_BATCH_PAUSE = 0.05  # Seconds between batches so votes can take the write lock
+    IMPORT_WORKERS = None  # Parser processes for multi-file imports (None = one per CPU)
+
+    # Write-behind vote buffer: one writer thread group-commits votes from all requests
+    VOTE_WRITER_ENABLED = os.environ.get('VOTE_WRITER_ENABLED', '1') != '0'
+    VOTE_WRITER_BATCH_WINDOW = 0.005  # Seconds to gather votes into one commit
+    VOTE_WRITER_MAX_BATCH = 500  # Maximum votes per commit
+    VOTE_WRITER_TIMEOUT = 30  # Seconds a request waits for its votes to commit
+
+    # Register the `flask db` migration commands (wsgi.py turns this off for server workers)
+    MIGRATE_CLI = os.environ.get('MIGRATE_CLI', '1') != '0'
+
+    # In-memory vote counts (utils/vote_store.py), built at startup from the latest snapshot
+    VOTE_STORE_PRELOAD = os.environ.get('VOTE_STORE_PRELOAD', '1') != '0'
+    VOTE_SNAPSHOT_INTERVAL = 50000  # Vote log entries between snapshots (0 = only `python -m utils.vote_log snapshot`)
+    VOTE_SNAPSHOT_KEEP = 3  # Snapshots kept; older log entries are compacted away
+
+    # Batch voting
+    VOTE_BATCH_MAX_ITEMS = 500  # Maximum votes accepted by /vote-batch
+
+    # Near-duplicate clustering (MinHash/LSH estimated Jaccard similarity, 0-1)
+    SIMILARITY_CLUSTER_THRESHOLD = 0.7  # Minimum similarity to join a cluster
+    SIMILARITY_DEFAULT_CUTOFF = 0.8  # Default cutoff for "vote on similar notes"
+
+    # Live vote updates (Server-Sent Events keep-alive interval in seconds)
+    EVENT_STREAM_HEARTBEAT = 15
+    # Seconds before the server ends a stream and the browser reconnects, so
+    # an open record page never holds a worker thread for good
+    EVENT_STREAM_MAX_AGE = 300
+
+    # Metrics (Prometheus text format at /metrics, unauthenticated for local scrapers)
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') != '0'
@@ -0,0 +1,20 @@
+"""
+Gunicorn settings, read automatically when gunicorn is started from this
+directory:
+
+    gunicorn wsgi:app
+
+Workers are threaded (gthread): every open record page holds a
+Server-Sent Events stream, and with the default sync workers each stream
+would hold a whole worker, so a handful of open tabs would block the
+server. Each stream takes one thread for at most EVENT_STREAM_MAX_AGE
+seconds before the browser reconnects.
+"""
+import os
+
+# Load the app (schema check, vote counts) once in the master, then fork
+preload_app = True
+
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 32))
@@ -0,0 +1,52 @@
+"""Add note_search FTS5 index over note text and record titles
+
+Revision ID: 36041385eac8
+Revises: 483f3c9c5048
+Create Date: 2026-10-19 09:12:41.503217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '36041385eac8'
+down_revision = '483f3c9c5048'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE VIRTUAL TABLE IF NOT EXISTS note_search USING fts5(
+        text, title, tokenize = 'unicode61 remove_diacritics 2'
+    )""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS note_search_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO note_search (rowid, text, title)
+        SELECT new.id, new.text, records.title FROM records WHERE records.id = new.record_id;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS note_search_au AFTER UPDATE OF text, record_id ON notes BEGIN
+        DELETE FROM note_search WHERE rowid = old.id;
+        INSERT INTO note_search (rowid, text, title)
+        SELECT new.id, new.text, records.title FROM records WHERE records.id = new.record_id;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS note_search_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_search WHERE rowid = old.id;
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS note_search_title_au AFTER UPDATE OF title ON records BEGIN
+        UPDATE note_search SET title = new.title
+        WHERE rowid IN (SELECT id FROM notes WHERE record_id = new.id);
+    END""")
+
+    # Index existing notes
+    op.execute("DELETE FROM note_search")
+    op.execute("""INSERT INTO note_search (rowid, text, title)
+        SELECT notes.id, notes.text, records.title
+        FROM notes JOIN records ON records.id = notes.record_id""")
+
+
+def downgrade():
+    op.execute("DROP TRIGGER IF EXISTS note_search_title_au")
+    op.execute("DROP TRIGGER IF EXISTS note_search_ad")
+    op.execute("DROP TRIGGER IF EXISTS note_search_au")
+    op.execute("DROP TRIGGER IF EXISTS note_search_ai")
+    op.execute("DROP TABLE IF EXISTS note_search")
@@ -0,0 +1,56 @@
+"""Add MinHash signatures, cluster ids and LSH band buckets for near-duplicate notes
+
+Revision ID: 7c1e5a9d2b40
+Revises: 36041385eac8
+Create Date: 2026-10-19 11:02:17.840311
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c1e5a9d2b40'
+down_revision = '36041385eac8'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    # Startup used to run create_all() on any database below the migration
+    # head, creating the tables of later revisions (in their newest form)
+    # before `flask db upgrade` got to them
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    with op.batch_alter_table('notes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('minhash', sa.LargeBinary(), nullable=True))
+        batch_op.add_column(sa.Column('cluster_id', sa.Integer(), nullable=True))
+        batch_op.create_index(batch_op.f('ix_notes_cluster_id'), ['cluster_id'], unique=False)
+
+    if not _has_table('note_lsh_bands'):
+        op.create_table('note_lsh_bands',
+            sa.Column('note_id', sa.Integer(), nullable=False),
+            sa.Column('band', sa.Integer(), nullable=False),
+            sa.Column('bucket', sa.BigInteger(), nullable=False),
+            sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ),
+            sa.PrimaryKeyConstraint('note_id', 'band')
+        )
+        with op.batch_alter_table('note_lsh_bands', schema=None) as batch_op:
+            batch_op.create_index('idx_note_lsh_band_bucket', ['band', 'bucket'], unique=False)
+
+    # Existing notes are clustered by running: python -m utils.similarity
+
+
+def downgrade():
+    with op.batch_alter_table('note_lsh_bands', schema=None) as batch_op:
+        batch_op.drop_index('idx_note_lsh_band_bucket')
+
+    op.drop_table('note_lsh_bands')
+
+    # Native DROP COLUMN (SQLite 3.35+): a batch table rebuild would break
+    # the note_search triggers that reference notes
+    op.drop_index('ix_notes_cluster_id', table_name='notes')
+    op.execute('ALTER TABLE notes DROP COLUMN cluster_id')
+    op.execute('ALTER TABLE notes DROP COLUMN minhash')
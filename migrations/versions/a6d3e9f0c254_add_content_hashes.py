@@ -0,0 +1,29 @@
+"""Add content hashes to records and notes for merge imports
+
+Revision ID: a6d3e9f0c254
+Revises: f2c95d7a1b48
+Create Date: 2026-10-19 19:11:37.604218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a6d3e9f0c254'
+down_revision = 'f2c95d7a1b48'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Native ADD COLUMN: a batch table rebuild would break the note_search triggers
+    op.add_column('records', sa.Column('content_hash', sa.String(length=32), nullable=True))
+    op.add_column('notes', sa.Column('content_hash', sa.String(length=32), nullable=True))
+
+    # Existing rows are hashed by the first merge import that sees them
+
+
+def downgrade():
+    op.execute('ALTER TABLE notes DROP COLUMN content_hash')
+    op.execute('ALTER TABLE records DROP COLUMN content_hash')
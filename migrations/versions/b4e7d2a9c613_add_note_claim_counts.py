@@ -0,0 +1,56 @@
+"""Add notes.claims (votes plus leases) kept by triggers, for indexed lease grants
+
+Revision ID: b4e7d2a9c613
+Revises: f5a2c9e7d314
+Create Date: 2026-10-20 09:12:47.306512
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4e7d2a9c613'
+down_revision = 'f5a2c9e7d314'
+branch_labels = None
+depends_on = None
+
+_TRIGGERS = {
+    'votes_claims_ai': """CREATE TRIGGER IF NOT EXISTS votes_claims_ai AFTER INSERT ON votes BEGIN
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    'votes_claims_au': """CREATE TRIGGER IF NOT EXISTS votes_claims_au AFTER UPDATE OF note_id ON votes
+    WHEN old.note_id != new.note_id BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    'votes_claims_ad': """CREATE TRIGGER IF NOT EXISTS votes_claims_ad AFTER DELETE ON votes BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+    END""",
+    'note_leases_claims_ai': """CREATE TRIGGER IF NOT EXISTS note_leases_claims_ai AFTER INSERT ON note_leases BEGIN
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    'note_leases_claims_ad': """CREATE TRIGGER IF NOT EXISTS note_leases_claims_ad AFTER DELETE ON note_leases BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+    END""",
+}
+
+
+def upgrade():
+    with op.batch_alter_table('notes', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('claims', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.create_index('idx_note_claims', ['claims', sa.text('priority DESC'), 'id'], unique=False)
+
+    op.execute("""UPDATE notes SET claims =
+        (SELECT count(*) FROM votes WHERE votes.note_id = notes.id) +
+        (SELECT count(*) FROM note_leases WHERE note_leases.note_id = notes.id)""")
+    for statement in _TRIGGERS.values():
+        op.execute(statement)
+
+
+def downgrade():
+    for name in _TRIGGERS:
+        op.execute(f"DROP TRIGGER IF EXISTS {name}")
+    with op.batch_alter_table('notes', schema=None) as batch_op:
+        batch_op.drop_index('idx_note_claims')
+        batch_op.drop_column('claims')
@@ -0,0 +1,34 @@
+"""Add data_versions counters bumped by triggers on votes
+
+Revision ID: b93f0d2c6e11
+Revises: 7c1e5a9d2b40
+Create Date: 2026-10-19 13:26:05.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b93f0d2c6e11'
+down_revision = '7c1e5a9d2b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE TABLE IF NOT EXISTS data_versions (
+        name VARCHAR(50) PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )""")
+    op.execute("INSERT OR IGNORE INTO data_versions (name, version) VALUES ('votes', 0)")
+    for event, name in (('INSERT', 'ai'), ('UPDATE', 'au'), ('DELETE', 'ad')):
+        op.execute(f"""CREATE TRIGGER IF NOT EXISTS votes_version_{name} AFTER {event} ON votes BEGIN
+            UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+        END""")
+
+
+def downgrade():
+    for name in ('ai', 'au', 'ad'):
+        op.execute(f"DROP TRIGGER IF EXISTS votes_version_{name}")
+    op.execute("DROP TABLE IF EXISTS data_versions")
@@ -0,0 +1,45 @@
+"""Add export checkpoints and an index on votes.voted_at for delta exports
+
+Revision ID: c7e4a1d9b362
+Revises: a6d3e9f0c254
+Create Date: 2026-10-19 21:40:12.318204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e4a1d9b362'
+down_revision = 'a6d3e9f0c254'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    # May already exist from create_all() (see 7c1e5a9d2b40)
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if not _has_table('export_checkpoints'):
+        op.create_table('export_checkpoints',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('voted_before', sa.DateTime(), nullable=False),
+            sa.Column('vote_seq', sa.Integer(), nullable=False),
+            sa.Column('confidence_threshold', sa.Float(), nullable=False),
+            sa.Column('strategy', sa.String(length=20), nullable=False),
+            sa.Column('delta', sa.Boolean(), nullable=False),
+            sa.Column('records_written', sa.Integer(), nullable=False),
+            sa.Column('notes_written', sa.Integer(), nullable=False),
+            sa.Column('notes_removed', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('id')
+        )
+    # Plain CREATE INDEX: votes keeps its triggers (no batch table rebuild)
+    op.create_index('idx_vote_voted_at', 'votes', ['voted_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('idx_vote_voted_at', table_name='votes')
+    op.drop_table('export_checkpoints')
@@ -0,0 +1,30 @@
+"""Add classification queue priority to notes
+
+Revision ID: d41a6c8e3f27
+Revises: b93f0d2c6e11
+Create Date: 2026-10-19 15:12:44.503918
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd41a6c8e3f27'
+down_revision = 'b93f0d2c6e11'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Native ADD COLUMN: a batch table rebuild would break the note_search triggers
+    op.add_column('notes', sa.Column('priority', sa.Float(), nullable=True))
+    op.create_index('idx_note_priority', 'notes', [sa.text('priority DESC'), 'id'], unique=False)
+
+    # Existing notes get priorities on first use of the queue, or by running:
+    # python -m utils.priority
+
+
+def downgrade():
+    op.drop_index('idx_note_priority', table_name='notes')
+    op.execute('ALTER TABLE notes DROP COLUMN priority')
@@ -0,0 +1,94 @@
+"""Record classifications in vote_changes and add vote snapshots
+
+Revision ID: d8f3b6a2e915
+Revises: c7e4a1d9b362
+Create Date: 2026-10-19 23:05:37.842196
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd8f3b6a2e915'
+down_revision = 'c7e4a1d9b362'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    # vote_snapshots, and the newest vote_changes columns, may already exist
+    # from create_all() (see 7c1e5a9d2b40)
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def _has_column(table, column):
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+
+def _drop_triggers():
+    for name in ('ai', 'au', 'ad'):
+        op.execute(f"DROP TRIGGER IF EXISTS votes_changes_{name}")
+
+
+def upgrade():
+    # Plain ADD COLUMN: the table is only written by triggers on votes
+    for column in (sa.Column('classification', sa.String(length=3), nullable=True),
+                   sa.Column('previous', sa.String(length=3), nullable=True),
+                   sa.Column('changed_at', sa.DateTime(), nullable=True)):
+        if not _has_column('vote_changes', column.name):
+            op.add_column('vote_changes', column)
+
+    _drop_triggers()
+    op.execute(f"""CREATE TRIGGER votes_changes_ai AFTER INSERT ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, classification, changed_at)
+        VALUES (new.note_id, new.user_id, new.classification, {_NOW});
+    END""")
+    op.execute(f"""CREATE TRIGGER votes_changes_au AFTER UPDATE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        SELECT old.note_id, old.user_id, 1, old.classification, {_NOW}
+        WHERE old.note_id != new.note_id OR old.user_id != new.user_id;
+        INSERT INTO vote_changes (note_id, user_id, classification, previous, changed_at)
+        SELECT new.note_id, new.user_id, new.classification,
+               CASE WHEN old.note_id = new.note_id AND old.user_id = new.user_id THEN old.classification END, {_NOW};
+    END""")
+    op.execute(f"""CREATE TRIGGER votes_changes_ad AFTER DELETE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        VALUES (old.note_id, old.user_id, 1, old.classification, {_NOW});
+    END""")
+
+    if not _has_table('vote_snapshots'):
+        op.create_table('vote_snapshots',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('seq', sa.Integer(), nullable=False),
+            sa.Column('as_of', sa.DateTime(), nullable=False),
+            sa.Column('votes', sa.Integer(), nullable=False),
+            sa.Column('notes', sa.Integer(), nullable=False),
+            sa.Column('data', sa.LargeBinary(), nullable=False),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('seq')
+        )
+
+
+def downgrade():
+    op.drop_table('vote_snapshots')
+
+    _drop_triggers()
+    op.drop_column('vote_changes', 'changed_at')
+    op.drop_column('vote_changes', 'previous')
+    op.drop_column('vote_changes', 'classification')
+    op.execute("""CREATE TRIGGER votes_changes_ai AFTER INSERT ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id) VALUES (new.note_id, new.user_id);
+    END""")
+    op.execute("""CREATE TRIGGER votes_changes_au AFTER UPDATE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted)
+        SELECT old.note_id, old.user_id, 1 WHERE old.note_id != new.note_id OR old.user_id != new.user_id;
+        INSERT INTO vote_changes (note_id, user_id) VALUES (new.note_id, new.user_id);
+    END""")
+    op.execute("""CREATE TRIGGER votes_changes_ad AFTER DELETE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted) VALUES (old.note_id, old.user_id, 1);
+    END""")
@@ -0,0 +1,33 @@
+"""Record the reviewed consensus on reviews and the approval filter on export checkpoints
+
+Revision ID: e3b9a5c71f08
+Revises: d8f3b6a2e915
+Create Date: 2026-10-20 00:12:48.205361
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3b9a5c71f08'
+down_revision = 'd8f3b6a2e915'
+branch_labels = None
+depends_on = None
+
+
+def _has_column(table, column):
+    # export_checkpoints may have been created with this column by create_all()
+    # (see 7c1e5a9d2b40)
+    return column in {c['name'] for c in sa.inspect(op.get_bind()).get_columns(table)}
+
+
+def upgrade():
+    op.add_column('reviews', sa.Column('classification', sa.String(length=3), nullable=True))
+    if not _has_column('export_checkpoints', 'approval'):
+        op.add_column('export_checkpoints', sa.Column('approval', sa.String(length=20), nullable=True))
+
+
+def downgrade():
+    op.drop_column('export_checkpoints', 'approval')
+    op.drop_column('reviews', 'classification')
@@ -0,0 +1,45 @@
+"""Add note_leases for the classifier assignment scheduler
+
+Revision ID: e8b27f4a9c13
+Revises: d41a6c8e3f27
+Create Date: 2026-10-19 16:40:09.271845
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b27f4a9c13'
+down_revision = 'd41a6c8e3f27'
+branch_labels = None
+depends_on = None
+
+
+def _has_table(name):
+    # May already exist from create_all() (see 7c1e5a9d2b40)
+    return sa.inspect(op.get_bind()).has_table(name)
+
+
+def upgrade():
+    if _has_table('note_leases'):
+        return
+    op.create_table('note_leases',
+        sa.Column('note_id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('expires_at', sa.DateTime(), nullable=False),
+        sa.ForeignKeyConstraint(['note_id'], ['notes.id'], ),
+        sa.ForeignKeyConstraint(['user_id'], ['users.id'], ),
+        sa.PrimaryKeyConstraint('note_id', 'user_id')
+    )
+    with op.batch_alter_table('note_leases', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_note_leases_expires_at'), ['expires_at'], unique=False)
+        batch_op.create_index('idx_note_lease_user', ['user_id', 'expires_at'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('note_leases', schema=None) as batch_op:
+        batch_op.drop_index('idx_note_lease_user')
+        batch_op.drop_index(batch_op.f('ix_note_leases_expires_at'))
+
+    op.drop_table('note_leases')
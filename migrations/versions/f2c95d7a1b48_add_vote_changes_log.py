@@ -0,0 +1,42 @@
+"""Add vote_changes log fed by triggers on votes
+
+Revision ID: f2c95d7a1b48
+Revises: e8b27f4a9c13
+Create Date: 2026-10-19 18:02:44.530917
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2c95d7a1b48'
+down_revision = 'e8b27f4a9c13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.execute("""CREATE TABLE IF NOT EXISTS vote_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT 0
+    )""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS votes_changes_ai AFTER INSERT ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id) VALUES (new.note_id, new.user_id);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS votes_changes_au AFTER UPDATE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted)
+        SELECT old.note_id, old.user_id, 1 WHERE old.note_id != new.note_id OR old.user_id != new.user_id;
+        INSERT INTO vote_changes (note_id, user_id) VALUES (new.note_id, new.user_id);
+    END""")
+    op.execute("""CREATE TRIGGER IF NOT EXISTS votes_changes_ad AFTER DELETE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted) VALUES (old.note_id, old.user_id, 1);
+    END""")
+
+
+def downgrade():
+    for name in ('ai', 'au', 'ad'):
+        op.execute(f"DROP TRIGGER IF EXISTS votes_changes_{name}")
+    op.execute("DROP TABLE IF EXISTS vote_changes")
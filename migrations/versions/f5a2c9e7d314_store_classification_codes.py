@@ -0,0 +1,130 @@
+"""Store classifications as integer codes in votes, reviews and vote_changes
+
+Revision ID: f5a2c9e7d314
+Revises: e3b9a5c71f08
+Create Date: 2026-10-20 01:37:21.518830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f5a2c9e7d314'
+down_revision = 'e3b9a5c71f08'
+branch_labels = None
+depends_on = None
+
+# Codes as of this revision (config/type_codes.yaml)
+_LETTERS = ['w', 'o', 'a', 'ow', 'aw', 'ao', '?']
+
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+_TRIGGERS = {
+    'votes_version_ai': """CREATE TRIGGER votes_version_ai AFTER INSERT ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    'votes_version_au': """CREATE TRIGGER votes_version_au AFTER UPDATE ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    'votes_version_ad': """CREATE TRIGGER votes_version_ad AFTER DELETE ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    'votes_changes_ai': f"""CREATE TRIGGER votes_changes_ai AFTER INSERT ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, classification, changed_at)
+        VALUES (new.note_id, new.user_id, new.classification, {_NOW});
+    END""",
+    'votes_changes_au': f"""CREATE TRIGGER votes_changes_au AFTER UPDATE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        SELECT old.note_id, old.user_id, 1, old.classification, {_NOW}
+        WHERE old.note_id != new.note_id OR old.user_id != new.user_id;
+        INSERT INTO vote_changes (note_id, user_id, classification, previous, changed_at)
+        SELECT new.note_id, new.user_id, new.classification,
+               CASE WHEN old.note_id = new.note_id AND old.user_id = new.user_id THEN old.classification END, {_NOW};
+    END""",
+    'votes_changes_ad': f"""CREATE TRIGGER votes_changes_ad AFTER DELETE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        VALUES (old.note_id, old.user_id, 1, old.classification, {_NOW});
+    END""",
+}
+
+
+def _to_code(column, default='NULL'):
+    cases = ' '.join(f"WHEN '{letter}' THEN {code}" for code, letter in enumerate(_LETTERS))
+    return f'CASE {column} {cases} ELSE {default} END'
+
+
+def _to_letter(column):
+    cases = ' '.join(f"WHEN {code} THEN '{letter}'" for code, letter in enumerate(_LETTERS))
+    return f'CASE CAST({column} AS INTEGER) {cases} ELSE {column} END'
+
+
+def _rebuild_vote_changes(column_type, convert):
+    # Not a model table: copy it by hand, keeping its AUTOINCREMENT position
+    # (the vote store and snapshots count on it, even for an empty log)
+    connection = op.get_bind()
+    position = connection.execute(sa.text("SELECT seq FROM sqlite_sequence WHERE name = 'vote_changes'")).scalar()
+    op.execute(f"""CREATE TABLE vote_changes_new (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT 0,
+        classification {column_type},
+        previous {column_type},
+        changed_at DATETIME
+    )""")
+    op.execute(f"""INSERT INTO vote_changes_new (seq, note_id, user_id, deleted, classification, previous, changed_at)
+        SELECT seq, note_id, user_id, deleted, {convert('classification')}, {convert('previous')}, changed_at
+        FROM vote_changes""")
+    op.execute('DROP TABLE vote_changes')
+    op.execute('ALTER TABLE vote_changes_new RENAME TO vote_changes')
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'vote_changes'")
+    if position:
+        connection.execute(sa.text("INSERT INTO sqlite_sequence (name, seq) VALUES ('vote_changes', :seq)"),
+                           {'seq': position})
+
+
+def _drop_triggers():
+    for name in _TRIGGERS:
+        op.execute(f'DROP TRIGGER IF EXISTS {name}')
+
+
+def _create_triggers():
+    for statement in _TRIGGERS.values():
+        op.execute(statement)
+
+
+def upgrade():
+    # Triggers on votes go while the table is rebuilt and its values rewritten
+    _drop_triggers()
+
+    # Letters become code strings first; the batch copy casts them to integers
+    op.execute(f"UPDATE votes SET classification = {_to_code('classification', default='-1')}")
+    with op.batch_alter_table('votes', recreate='always') as batch_op:
+        batch_op.alter_column('classification', existing_type=sa.String(length=3), type_=sa.SmallInteger(),
+                              existing_nullable=False)
+
+    op.execute(f"UPDATE reviews SET classification = {_to_code('classification')}")
+    with op.batch_alter_table('reviews', recreate='always') as batch_op:
+        batch_op.alter_column('classification', existing_type=sa.String(length=3), type_=sa.SmallInteger(),
+                              existing_nullable=True)
+
+    _rebuild_vote_changes('SMALLINT', _to_code)
+    _create_triggers()
+
+
+def downgrade():
+    _drop_triggers()
+
+    with op.batch_alter_table('votes', recreate='always') as batch_op:
+        batch_op.alter_column('classification', existing_type=sa.SmallInteger(), type_=sa.String(length=3),
+                              existing_nullable=False)
+    op.execute(f"UPDATE votes SET classification = {_to_letter('classification')}")
+
+    with op.batch_alter_table('reviews', recreate='always') as batch_op:
+        batch_op.alter_column('classification', existing_type=sa.SmallInteger(), type_=sa.String(length=3),
+                              existing_nullable=True)
+    op.execute(f"UPDATE reviews SET classification = {_to_letter('classification')}")
+
+    _rebuild_vote_changes('VARCHAR(3)', _to_letter)
+    _create_triggers()
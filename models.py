@@ -1,7 +1,9 @@
 from flask_sqlalchemy import SQLAlchemy
 from datetime import datetime
+from utils.storage import RoutingSession
+from utils.type_codes import ClassificationCode
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class User(db.Model):
     """User model for tracking classifiers and reviewers"""
@@ -33,6 +35,9 @@ class Record(db.Model):
     source_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True, index=True)
     source_filename = db.Column(db.String(255), nullable=True, index=True)
 
+    # Hash of the title and note texts as last imported (see utils/xml_parser.py); NULL before merge imports existed
+    content_hash = db.Column(db.String(32), nullable=True)
+
     # Relationships
     notes = db.relationship('Note', backref='record', lazy='select',
                            cascade='all, delete-orphan', order_by='Note.note_index')
@@ -52,6 +57,19 @@ class Note(db.Model):
     text = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+    # Near-duplicate clustering (see utils/similarity.py); NULL until clustered
+    minhash = db.Column(db.LargeBinary, nullable=True)
+    cluster_id = db.Column(db.Integer, nullable=True, index=True)  # Smallest note id in the cluster
+
+    # Classification queue priority (see utils/priority.py); NULL until computed
+    priority = db.Column(db.Float, nullable=True)
+
+    # Votes plus leases on the note, kept by triggers (see utils/scheduler.py)
+    claims = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Hash of the text as last imported (see utils/xml_parser.py); NULL before merge imports existed
+    content_hash = db.Column(db.String(32), nullable=True)
+
     # Relationships
     votes = db.relationship('Vote', backref='note', lazy='select', cascade='all, delete-orphan')
     reviews = db.relationship('Review', backref='note', lazy='select', cascade='all, delete-orphan')
@@ -60,12 +78,46 @@ class Note(db.Model):
     __table_args__ = (
         db.UniqueConstraint('record_id', 'note_index', name='unique_record_note_index'),
         db.Index('idx_note_record_index', 'record_id', 'note_index'),
+        db.Index('idx_note_priority', priority.desc(), id),
+        db.Index('idx_note_claims', claims, priority.desc(), id),  # Lease grants: open notes, best first
     )
 
     def __repr__(self):
         return f'<Note {self.id} for Record {self.record_id}>'
 
 
+class NoteBand(db.Model):
+    """LSH band bucket of a note's MinHash signature, used to find near-duplicates"""
+    __tablename__ = 'note_lsh_bands'
+
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), primary_key=True)
+    band = db.Column(db.Integer, primary_key=True)
+    bucket = db.Column(db.BigInteger, nullable=False)
+
+    __table_args__ = (
+        db.Index('idx_note_lsh_band_bucket', 'band', 'bucket'),
+    )
+
+    def __repr__(self):
+        return f'<NoteBand {self.band}:{self.bucket} for Note {self.note_id}>'
+
+
+class NoteLease(db.Model):
+    """Short-lived assignment of a note to a classifier (see utils/scheduler.py)"""
+    __tablename__ = 'note_leases'
+
+    note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    __table_args__ = (
+        db.Index('idx_note_lease_user', 'user_id', 'expires_at'),
+    )
+
+    def __repr__(self):
+        return f'<NoteLease Note {self.note_id} to User {self.user_id}>'
+
+
 class Vote(db.Model):
     """Vote model for user classifications of notes"""
     __tablename__ = 'votes'
@@ -73,13 +125,14 @@ class Vote(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    classification = db.Column(db.String(3), nullable=False)  # w, o, a, ow, aw, ao, ?
+    classification = db.Column(ClassificationCode, nullable=False)  # w, o, a, ow, aw, ao, ? (stored as codes)
     voted_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Composite unique constraint (one vote per user per note)
     __table_args__ = (
         db.UniqueConstraint('note_id', 'user_id', name='unique_user_note_vote'),
         db.Index('idx_vote_note_user', 'note_id', 'user_id'),
+        db.Index('idx_vote_voted_at', 'voted_at'),  # Delta exports: votes cast since a checkpoint
     )
 
     def __repr__(self):
@@ -94,6 +147,7 @@ class Review(db.Model):
     note_id = db.Column(db.Integer, db.ForeignKey('notes.id'), nullable=False, index=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     approval = db.Column(db.String(1), nullable=False)  # y, n, ?
+    classification = db.Column(ClassificationCode)  # Consensus the review was of
     reviewed_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Composite unique constraint (one review per user per note)
@@ -118,3 +172,41 @@ class Setting(db.Model):
 
     def __repr__(self):
         return f'<Setting {self.key}={self.value}>'
+
+
+class ExportCheckpoint(db.Model):
+    """A completed export that later delta exports can start from"""
+    __tablename__ = 'export_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Votes cast before this time, and vote_changes entries up to vote_seq, are covered
+    voted_before = db.Column(db.DateTime, nullable=False)
+    vote_seq = db.Column(db.Integer, nullable=False, default=0)
+    confidence_threshold = db.Column(db.Float, nullable=False)
+    strategy = db.Column(db.String(20), nullable=False)
+    approval = db.Column(db.String(20))  # Approval filter (see utils/review.py), None = every note
+    delta = db.Column(db.Boolean, nullable=False, default=False)
+    records_written = db.Column(db.Integer, nullable=False, default=0)
+    notes_written = db.Column(db.Integer, nullable=False, default=0)
+    notes_removed = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<ExportCheckpoint {self.id} at {self.created_at}>'
+
+
+class VoteSnapshot(db.Model):
+    """Vote counts per note and voted notes per user at one position of the vote_changes log"""
+    __tablename__ = 'vote_snapshots'
+
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Covers vote_changes entries up to seq, the last of them written at as_of
+    seq = db.Column(db.Integer, nullable=False, unique=True)
+    as_of = db.Column(db.DateTime, nullable=False)
+    votes = db.Column(db.Integer, nullable=False)
+    notes = db.Column(db.Integer, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)  # npz arrays, see utils/vote_log.py
+
+    def __repr__(self):
+        return f'<VoteSnapshot {self.id} at seq {self.seq}>'
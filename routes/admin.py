@@ -1,10 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session
+from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file, session, current_app
 from werkzeug.utils import secure_filename
 from sqlalchemy import func
 from auth import admin_required
-from models import db, Record, Note, Vote, User, Setting
-from utils.probability import get_contentious_threshold, update_contentious_threshold, update_min_votes_for_contentious
+from models import db, Record, Note, Vote, User, Setting, ExportCheckpoint
+from utils.probability import get_contentious_threshold, update_contentious_threshold, update_min_votes_for_contentious, \
+    get_consensus_strategy, update_consensus_strategy, get_confidence_measure, update_confidence_measure
 import os
+import shutil
 import tempfile
 from datetime import datetime
 
@@ -68,74 +70,145 @@ def dashboard():
             'voted_at': vote.voted_at
         })
 
+    from utils.scheduler import get_lease_stats
+
     return render_template('admin/dashboard.html',
                          stats=stats,
+                         lease_stats=get_lease_stats(),
                          top_contributors=top_contributors,
                          classification_dist=classification_dist,
                          recent_activity=recent_activity)
 
 
-@admin_bp.route('/upload', methods=['GET', 'POST'])
+@admin_bp.route('/agreement')
 @admin_required
-def upload_xml():
-    """Upload and import XML file"""
+def agreement():
+    """Inter-annotator agreement: Fleiss' kappa, per-user and pairwise agreement"""
+    from utils.agreement import get_agreement_report
+
+    return render_template('admin/agreement.html', report=get_agreement_report())
+
+
+@admin_bp.route('/review', methods=['GET', 'POST'])
+@admin_required
+def review():
+    """Review queue: approve or reject a page of consensus classifications at once"""
+    from utils.review import APPROVALS, review_queue, save_reviews
+
+    try:
+        threshold = float(request.values.get('threshold', current_app.config['DEFAULT_EXPORT_CONFIDENCE']))
+        after = int(request.values.get('after', 0))
+    except ValueError:
+        flash('Invalid review queue position', 'danger')
+        return redirect(url_for('admin.review'))
 
     if request.method == 'POST':
-        # Check if file was uploaded
-        if 'xml_file' not in request.files:
-            flash('No file uploaded', 'danger')
-            return redirect(request.url)
+        action = request.form.get('action')
+        if action not in APPROVALS:
+            flash(f'Unknown review action: {action}', 'danger')
+            return redirect(url_for('admin.review', threshold=threshold, after=after))
+        # Each checked note is reviewed as the consensus shown on the page,
+        # so a consensus that changed meanwhile goes back into the queue
+        reviews = [(int(note_id), request.form.get(f'classification_{note_id}'))
+                   for note_id in request.form.getlist('note_ids') if note_id.isdigit()]
+        reviewed = save_reviews(session['user_id'], reviews, action)
+        flash(f'{"Approved" if action == "approve" else "Rejected"} {reviewed} note{"s" if reviewed != 1 else ""}',
+              'success')
+        return redirect(url_for('admin.review', threshold=threshold, after=after))
+
+    queue = review_queue(threshold, after, current_app.config['REVIEW_PAGE_SIZE'])
+    return render_template('admin/review.html', queue=queue, threshold=threshold, after=after)
 
-        file = request.files['xml_file']
 
-        if file.filename == '':
+@admin_bp.route('/upload', methods=['GET', 'POST'])
+@admin_required
+def upload_xml():
+    """Upload and import one or more XML files"""
+
+    if request.method == 'POST':
+        # Check if files were uploaded
+        files = [file for file in request.files.getlist('xml_file') if file.filename]
+        if not files:
             flash('No file selected', 'danger')
             return redirect(request.url)
 
-        if not file.filename.endswith('.xml'):
-            flash('Only XML files are allowed', 'danger')
+        # Plain or compressed XML (compressed files are decompressed while importing)
+        from utils.compression import available_compressions, compression_for_name
+        extensions = tuple('.' + extension for extension in current_app.config['ALLOWED_EXTENSIONS'])
+        if not all(file.filename.endswith(extensions) for file in files):
+            flash('Only XML files (.xml, .xml.gz, .xml.zst) are allowed', 'danger')
+            return redirect(request.url)
+        unsupported = {compression_for_name(file.filename) for file in files} - {None, *available_compressions()}
+        if unsupported:
+            flash(f"Cannot read {', '.join(sorted(unsupported))} files: install the zstandard package", 'danger')
             return redirect(request.url)
 
         # Save temporarily
-        temp_path = os.path.join(tempfile.gettempdir(), secure_filename(file.filename))
+        temp_dir = tempfile.mkdtemp(prefix='classification-upload-')
+        temp_paths = []
         try:
-            file.save(temp_path)
+            for file in files:
+                temp_path = os.path.join(temp_dir, secure_filename(file.filename))
+                file.save(temp_path)
+                temp_paths.append(temp_path)
         except Exception as e:
+            shutil.rmtree(temp_dir, ignore_errors=True)
             flash(f'Error saving file: {str(e)}', 'danger')
             return redirect(request.url)
 
         # Import with optional initial votes
         create_initial_votes = request.form.get('create_votes') == 'on'
+        merge = request.form.get('merge') == 'on'
         admin_user = User.query.filter_by(username=session['username']).first()
-
-        # Import using xml_parser utility
-        from utils.xml_parser import import_xml_file
+        admin_user_id = admin_user.id if create_initial_votes else None
 
         try:
-            stats = import_xml_file(
-                temp_path,
-                admin_user_id=admin_user.id if create_initial_votes else None
-            )
-
-            # Clean up temp file
-            os.remove(temp_path)
+            if len(temp_paths) > 1 and not merge:
+                # Several shards: parsed in parallel, written by this request
+                from utils.bulk_import import import_xml_files
+                stats = import_xml_files(temp_paths, admin_user_id=admin_user_id)
+            else:
+                # Import using xml_parser utility, one file at a time
+                from utils.xml_parser import STAT_KEYS, import_xml_file
+                stats = None
+                for temp_path in temp_paths:
+                    file_stats = import_xml_file(temp_path, admin_user_id=admin_user_id, merge=merge)
+                    if stats is None:
+                        stats = file_stats
+                        continue
+                    for key in STAT_KEYS:
+                        stats[key] += file_stats[key]
+                    stats['errors'].extend(file_stats['errors'])
+
+            # Cluster the new and changed notes with their near-duplicates, then
+            # queue them (cluster sizes and imported votes change priorities)
+            from utils.similarity import refresh_clusters
+            from utils.priority import refresh_priorities
+            refresh_clusters()
+            refresh_priorities()
 
             # Show results
+            files_note = f' from {len(temp_paths)} files' if len(temp_paths) > 1 else ''
+            merged = (f" Updated: {stats['records_updated']} records ({stats['notes_updated']} notes changed, "
+                      f"{stats['notes_deleted']} removed, {stats['votes_removed']} votes on them removed); "
+                      f"{stats['records_unchanged']} unchanged." if merge else '')
             if stats['errors']:
                 flash(f"Import completed with {len(stats['errors'])} errors. "
-                      f"Created: {stats['records_created']} records, {stats['notes_created']} notes, "
-                      f"{stats['votes_created']} votes.", 'warning')
+                      f"Created{files_note}: {stats['records_created']} records, {stats['notes_created']} notes, "
+                      f"{stats['votes_created']} votes.{merged}", 'warning')
                 for error in stats['errors'][:10]:  # Show first 10 errors
                     flash(error, 'warning')
             else:
                 flash(f"Successfully imported {stats['records_created']} records, "
-                      f"{stats['notes_created']} notes, {stats['votes_created']} votes", 'success')
+                      f"{stats['notes_created']} notes, {stats['votes_created']} votes{files_note}.{merged}", 'success')
 
         except Exception as e:
-            if os.path.exists(temp_path):
-                os.remove(temp_path)
             flash(f'Import error: {str(e)}', 'danger')
 
+        finally:
+            # Clean up temp files
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
         return redirect(url_for('admin.dashboard'))
 
     return render_template('admin/upload.html')
@@ -156,23 +229,75 @@ def export_xml():
                 flash('Confidence threshold must be between 0 and 1', 'danger')
                 return redirect(request.url)
 
-            # Generate filename with timestamp
+            # Export using xml_exporter utility
+            from utils.xml_exporter import SHARD_KINDS, export_to_file, get_checkpoint
+
+            # Only reviewed notes, if asked for
+            from utils.review import APPROVAL_FILTERS
+            approval = request.form.get('approval') or None
+            if approval is not None and approval not in APPROVAL_FILTERS:
+                flash(f'Unknown approval filter: {approval}', 'danger')
+                return redirect(request.url)
+
+            # Delta since a checkpoint (at the checkpoint's threshold and
+            # approval filter), and whether this export becomes the next checkpoint
+            since = None
+            if request.form.get('since_checkpoint'):
+                start = get_checkpoint(int(request.form['since_checkpoint']))
+                if start is None:
+                    flash('Unknown export checkpoint', 'danger')
+                    return redirect(request.url)
+                since, confidence, approval = start.id, start.confidence_threshold, start.approval
+            save_checkpoint = request.form.get('save_checkpoint') == 'on'
+
+            # Split into shards generated in parallel, or export one source file
+            shard_by = request.form.get('shard_by') or None
+            if shard_by is not None and shard_by not in SHARD_KINDS:
+                flash(f'Unknown shard option: {shard_by}', 'danger')
+                return redirect(request.url)
+            source_filename = request.form.get('source_filename') or None
+            shard = {'source_filename': source_filename} if source_filename else None
+
+            # A compressed file if asked for; otherwise plain XML, compressed
+            # in transit when the client accepts it
+            from utils.compression import SUFFIXES, available_compressions
+            compression = request.form.get('compression') or None
+            if compression is not None and compression not in available_compressions():
+                flash(f'Compression not available: {compression}', 'danger')
+                return redirect(request.url)
+            content_encoding = None
+            if compression is None:
+                content_encoding = request.accept_encodings.best_match(
+                    [name for name in ('zstd', 'gzip') if name in available_compressions()])
+
+            # Generate filename with timestamp (and the source file, if only one)
             timestamp = datetime.now().strftime('%Y%m%d_%H%M%S')
-            filename = f'classification_export_{timestamp}.xml'
+            if since is not None:
+                filename = f'classification_delta_{since}_{timestamp}.xml'
+            elif source_filename:
+                stem = secure_filename(os.path.splitext(source_filename)[0]) or 'source'
+                filename = f'classification_export_{stem}_{timestamp}.xml'
+            else:
+                filename = f'classification_export_{timestamp}.xml'
+            if compression:
+                filename += SUFFIXES[compression]
             filepath = os.path.join(tempfile.gettempdir(), filename)
 
-            # Export using xml_exporter utility
-            from utils.xml_exporter import export_to_file
-
-            export_to_file(filepath, confidence, include_stats)
+            export_to_file(filepath, confidence, include_stats, shard_by=shard_by, shard=shard,
+                           compression=compression or content_encoding, since=since, checkpoint=save_checkpoint,
+                           approval=approval)
 
             # Send file
-            return send_file(
+            response = send_file(
                 filepath,
                 as_attachment=True,
                 download_name=filename,
-                mimetype='application/xml'
+                mimetype=f'application/{compression}' if compression else 'application/xml'
             )
+            if content_encoding:
+                response.headers['Content-Encoding'] = content_encoding
+            response.vary.add('Accept-Encoding')
+            return response
 
         except Exception as e:
             flash(f'Export error: {str(e)}', 'danger')
@@ -181,8 +306,22 @@ def export_xml():
     # Get current threshold for default
     current_threshold = get_contentious_threshold()
 
+    # Source files that can be exported on their own
+    source_files = [name for (name,) in db.session.query(Record.source_filename)
+                    .filter(Record.source_filename.isnot(None))
+                    .distinct().order_by(Record.source_filename)]
+
+    # Recent checkpoints a delta export can start from
+    checkpoints = ExportCheckpoint.query.order_by(ExportCheckpoint.id.desc()).limit(10).all()
+
+    from utils.compression import available_compressions
+
     return render_template('admin/export.html',
-                         default_threshold=current_threshold)
+                         default_threshold=current_threshold,
+                         confidence_measure=get_confidence_measure(),
+                         source_files=source_files,
+                         compressions=available_compressions(),
+                         checkpoints=checkpoints)
 
 
 @admin_bp.route('/settings', methods=['GET', 'POST'])
@@ -205,7 +344,14 @@ def settings():
 
             update_contentious_threshold(threshold)
             update_min_votes_for_contentious(min_votes)
-            flash(f'Settings updated: Contentious threshold {threshold:.0%}, Minimum votes {min_votes}', 'success')
+            strategy = request.form.get('consensus_strategy')
+            if strategy:
+                update_consensus_strategy(strategy)
+            measure = request.form.get('confidence_measure')
+            if measure:
+                update_confidence_measure(measure)
+            flash(f'Settings updated: Contentious threshold {threshold:.0%}, Minimum votes {min_votes}, '
+                  f'Consensus {get_consensus_strategy()}, Confidence {get_confidence_measure()}', 'success')
 
         except ValueError as e:
             flash(f'Invalid value: {str(e)}', 'danger')
@@ -220,4 +366,6 @@ def settings():
 
     return render_template('admin/settings.html',
                          contentious_threshold=current_threshold,
-                         min_votes_contentious=current_min_votes)
+                         min_votes_contentious=current_min_votes,
+                         consensus_strategy=get_consensus_strategy(),
+                         confidence_measure=get_confidence_measure())
@@ -0,0 +1,154 @@
+"""
+Read-only JSON API over records and notes.
+
+Responses are newline-delimited JSON, one object per line, streamed in
+batches so a page of any size is never held in memory. Record pages are
+keyed on bib_id: the X-Next-After header (and a Link rel="next" header)
+carries the cursor of the next page and is absent on the last one. fields=
+picks the keys of each object; only the columns behind them are queried.
+
+    GET /api/records?after=<bib_id>&limit=1000&fields=bib,title,note_count
+    GET /api/records/<bib_id>/notes?fields=index,text,distribution
+"""
+import json
+from datetime import datetime
+
+from flask import Blueprint, Response, current_app, jsonify, request, stream_with_context, url_for
+from sqlalchemy import func, select
+
+from auth import login_required
+from models import db, Note, Record
+from utils.probability import calculate_vote_distributions, get_consensus_strategy
+
+api_bp = Blueprint('api', __name__)
+
+# Fields each endpoint can return: the column behind each, None for computed ones
+RECORD_FIELDS = {
+    'bib': Record.bib_id,
+    'title': Record.title,
+    'source_filename': Record.source_filename,
+    'created_at': Record.created_at,
+    'note_count': None,
+}
+NOTE_FIELDS = {
+    'id': Note.id,
+    'index': Note.note_index,
+    'text': Note.text,
+    'cluster_id': Note.cluster_id,
+    'created_at': Note.created_at,
+    'distribution': None,
+}
+
+# Fields returned without fields=
+DEFAULT_RECORD_FIELDS = ['bib', 'title']
+DEFAULT_NOTE_FIELDS = ['index', 'text']
+
+# Records per query while streaming a page
+_BATCH = 500
+
+
+def _requested_fields(allowed, default):
+    """Fields named in fields= (comma-separated), in order, or the default"""
+    names = [name.strip() for name in request.args.get('fields', '').split(',') if name.strip()]
+    for name in names:
+        if name not in allowed:
+            raise ValueError(f'Unknown field: {name} (one of {", ".join(allowed)})')
+    return list(dict.fromkeys(names)) or default
+
+
+def _line(item):
+    return json.dumps(item, ensure_ascii=False, separators=(',', ':'),
+                      default=lambda value: value.isoformat() if isinstance(value, datetime) else str(value)) + '\n'
+
+
+def _ndjson(lines, headers=None):
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=headers)
+
+
+@api_bp.route('/records')
+@login_required
+def records():
+    """One page of records in bib_id order, as ndjson"""
+    try:
+        fields = _requested_fields(RECORD_FIELDS, DEFAULT_RECORD_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    try:
+        limit = int(request.args.get('limit', current_app.config['API_PAGE_SIZE']))
+    except ValueError:
+        return jsonify({'error': 'limit must be an integer'}), 400
+    max_limit = current_app.config['API_MAX_PAGE_SIZE']
+    if not 1 <= limit <= max_limit:
+        return jsonify({'error': f'limit must be between 1 and {max_limit}'}), 400
+    after = request.args.get('after', '')
+
+    # Last bib ID of this page and whether another page follows, from the
+    # bib_id index before anything is streamed
+    ends = db.session.execute(
+        select(Record.bib_id).where(Record.bib_id > after).order_by(Record.bib_id).offset(limit - 1).limit(2)
+    ).scalars().all()
+    last = ends[0] if ends else None
+    headers = {}
+    if len(ends) == 2:
+        args = dict(request.args, after=last, limit=limit)
+        headers['X-Next-After'] = last
+        headers['Link'] = f'<{url_for("api.records", **args)}>; rel="next"'
+
+    columns = [RECORD_FIELDS[name].label(name) for name in fields if RECORD_FIELDS[name] is not None]
+
+    def generate():
+        cursor = after
+        while True:
+            query = select(Record.id, Record.bib_id.label('_bib'), *columns).where(Record.bib_id > cursor)
+            if last is not None:
+                query = query.where(Record.bib_id <= last)
+            rows = db.session.execute(query.order_by(Record.bib_id).limit(_BATCH)).all()
+            if not rows:
+                return
+
+            note_counts = {}
+            if 'note_count' in fields:
+                note_counts = dict(db.session.execute(
+                    select(Note.record_id, func.count()).where(Note.record_id.in_([row.id for row in rows]))
+                    .group_by(Note.record_id)
+                ).all())
+
+            for row in rows:
+                mapping = row._mapping
+                yield _line({name: note_counts.get(row.id, 0) if name == 'note_count' else mapping[name]
+                             for name in fields})
+            if len(rows) < _BATCH:
+                return
+            cursor = rows[-1]._bib
+
+    return _ndjson(generate(), headers)
+
+
+@api_bp.route('/records/<bib_id>/notes')
+@login_required
+def record_notes(bib_id):
+    """Notes of one record in note order, as ndjson (distribution embeds the vote distribution)"""
+    try:
+        fields = _requested_fields(NOTE_FIELDS, DEFAULT_NOTE_FIELDS)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    record_id = db.session.execute(select(Record.id).where(Record.bib_id == bib_id)).scalar()
+    if record_id is None:
+        return jsonify({'error': 'Record not found'}), 404
+
+    columns = [NOTE_FIELDS[name].label(name) for name in fields if NOTE_FIELDS[name] is not None]
+    rows = db.session.execute(
+        select(Note.id.label('_id'), *columns).where(Note.record_id == record_id).order_by(Note.note_index)
+    ).all()
+    # Every note's distribution in one batch, not one lookup per note
+    distributions = (calculate_vote_distributions([row._id for row in rows], get_consensus_strategy())
+                     if 'distribution' in fields and rows else {})
+
+    def generate():
+        for row in rows:
+            mapping = row._mapping
+            yield _line({name: distributions[row._id] if name == 'distribution' else mapping[name]
+                         for name in fields})
+
+    return _ndjson(generate())
@@ -1,7 +1,9 @@
-from flask import Blueprint, render_template, session
+from flask import Blueprint, render_template, request, session
 from models import Record, Note, Vote
 from auth import login_required
-from utils.probability import calculate_vote_distribution
+from utils.probability import calculate_vote_distribution, calculate_vote_distributions, get_consensus_strategy, \
+    get_confidence_measure
+from utils.vote_store import get_vote_store
 
 filters_bp = Blueprint('filters', __name__)
 
@@ -11,6 +13,7 @@ filters_bp = Blueprint('filters', __name__)
 def unknown_records():
     """Show records with notes where consensus is '?'"""
 
+    strategy = get_consensus_strategy()
     unknown_records = []
     records = Record.query.order_by(Record.bib_id).all()
 
@@ -19,7 +22,7 @@ def unknown_records():
         unknown_notes = []
 
         for note in notes:
-            distribution = calculate_vote_distribution(note.id)
+            distribution = calculate_vote_distribution(note.id, strategy)
             if distribution['consensus'] == '?':
                 unknown_notes.append({
                     'text': note.text[:150] + ('...' if len(note.text) > 150 else ''),
@@ -47,6 +50,8 @@ def unknown_records():
 def pending_review():
     """Show notes where current user hasn't voted yet"""
     user_id = session.get('user_id')
+    strategy = get_consensus_strategy()
+    store = get_vote_store()
 
     pending_records = []
     records = Record.query.order_by(Record.bib_id).all()
@@ -57,10 +62,8 @@ def pending_review():
 
         for note in notes:
             # User hasn't voted on this note yet
-            user_vote = Vote.query.filter_by(note_id=note.id, user_id=user_id).first()
-
-            if not user_vote:
-                distribution = calculate_vote_distribution(note.id)
+            if not store.has_voted(user_id, note.id):
+                distribution = calculate_vote_distribution(note.id, strategy)
                 pending_notes.append({
                     'text': note.text[:150] + ('...' if len(note.text) > 150 else ''),
                     'text_full': note.text,
@@ -87,15 +90,17 @@ def pending_review():
 def contentious_records():
     """Show notes where consensus is below threshold with sufficient votes"""
 
+    strategy = get_consensus_strategy()
     contentious_records = []
     records = Record.query.order_by(Record.bib_id).all()
 
     for record in records:
         notes = Note.query.filter_by(record_id=record.id).order_by(Note.note_index).all()
+        distributions = calculate_vote_distributions([note.id for note in notes], strategy)
         contentious_notes = []
 
         for note in notes:
-            distribution = calculate_vote_distribution(note.id)
+            distribution = distributions[note.id]
             if distribution['is_contentious']:
                 contentious_notes.append({
                     'text': note.text[:150] + ('...' if len(note.text) > 150 else ''),
@@ -115,4 +120,28 @@ def contentious_records():
 
     return render_template('contentious.html',
                          contentious_records=contentious_records,
-                         total_contentious_records=len(contentious_records))
+                         total_contentious_records=len(contentious_records),
+                         confidence_measure=get_confidence_measure())
+
+
+@filters_bp.route('/search')
+@login_required
+def search():
+    """Full-text search over notes and titles, filterable by consensus and contentious status"""
+    from utils.search import search_notes
+
+    query = request.args.get('q', '').strip()
+    consensus = request.args.get('consensus') or None
+    contentious = {'yes': True, 'no': False}.get(request.args.get('contentious'))
+    page = request.args.get('page', 1, type=int)
+
+    results = None
+    if query:
+        results = search_notes(query, page=page, consensus=consensus, contentious=contentious,
+                               strategy=get_consensus_strategy())
+
+    return render_template('search.html',
+                         query=query,
+                         consensus=consensus,
+                         contentious=request.args.get('contentious', ''),
+                         results=results)
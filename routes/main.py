@@ -1,8 +1,12 @@
-from flask import Blueprint, render_template, redirect, url_for, session
+from flask import Blueprint, current_app, render_template, redirect, url_for, session
 from sqlalchemy.orm import joinedload
 from models import db, Record, Note, Vote
 from auth import login_required
-from utils.probability import calculate_vote_distribution, get_user_vote_for_note, count_identical_notes
+from utils.probability import calculate_vote_distribution, get_user_vote_for_note, count_identical_notes, get_note_voters
+from utils.similarity import count_similar_notes
+from utils.priority import next_record_for_user
+from utils.scheduler import next_leased_record
+from utils.vote_store import get_vote_store
 
 main_bp = Blueprint('main', __name__)
 
@@ -40,6 +44,9 @@ def record_detail(bib_id):
 
     user_id = session.get('user_id')
 
+    # Near-duplicate cluster sizes for every note on the page
+    similar_counts = count_similar_notes([note.id for note in notes])
+
     # Build notes data with distributions
     notes_data = []
     for note in notes:
@@ -47,12 +54,7 @@ def record_detail(bib_id):
         user_vote = get_user_vote_for_note(user_id, note.id)
 
         # Get voters grouped by classification
-        votes = Vote.query.filter_by(note_id=note.id).all()
-        voters = {}
-        for vote in votes:
-            if vote.classification not in voters:
-                voters[vote.classification] = []
-            voters[vote.classification].append(vote.user.username)
+        voters = get_note_voters(note.id)
 
         # Count identical notes
         identical_count = count_identical_notes(note.text)
@@ -63,7 +65,8 @@ def record_detail(bib_id):
             'distribution': distribution,
             'user_vote': user_vote,
             'voters': voters,
-            'identical_count': identical_count
+            'identical_count': identical_count,
+            'similar_count': similar_counts[note.id]
         })
 
     # Find navigation (prev/next records)
@@ -78,24 +81,20 @@ def record_detail(bib_id):
                          prev_record={'bib': prev_record.bib_id} if prev_record else None,
                          next_record={'bib': next_record.bib_id} if next_record else None,
                          current_index=current_index if current_index is not None else 0,
-                         total_records=len(records))
+                         total_records=len(records),
+                         similarity_cutoff=current_app.config.get('SIMILARITY_DEFAULT_CUTOFF', 0.8))
 
 
 @main_bp.route('/start-unclassified')
 @login_required
 def start_unclassified():
-    """Redirect to first record with unclassified notes (no votes)"""
-    # Find first note with no votes
-    note = db.session.query(Note)\
-                     .outerjoin(Vote)\
-                     .filter(Vote.id == None)\
-                     .first()
-
-    if note:
-        record = Record.query.get(note.record_id)
-        return redirect(url_for('main.record_detail', bib_id=record.bib_id))
-
-    # No unclassified notes, go to first record
+    """Redirect to the record with the user's best leased note (or best unvoted note)"""
+    user_id = session.get('user_id')
+    bib_id = next_leased_record(user_id) or next_record_for_user(user_id)
+    if bib_id:
+        return redirect(url_for('main.record_detail', bib_id=bib_id))
+
+    # Nothing left to vote on, go to first record
     first_record = Record.query.order_by(Record.bib_id).first()
     if first_record:
         return redirect(url_for('main.record_detail', bib_id=first_record.bib_id))
@@ -106,36 +105,16 @@ def start_unclassified():
 @main_bp.route('/next-unclassified/<current_bib>')
 @login_required
 def next_unclassified(current_bib):
-    """Navigate to next record with unclassified notes"""
+    """Navigate to the record with the user's next leased note (or next best unvoted note)"""
     current_record = Record.query.filter_by(bib_id=current_bib).first_or_404()
 
-    # Find next note without votes after current record
-    note = db.session.query(Note)\
-                     .join(Record)\
-                     .outerjoin(Vote)\
-                     .filter(Vote.id == None)\
-                     .filter(Record.bib_id > current_bib)\
-                     .order_by(Record.bib_id, Note.note_index)\
-                     .first()
-
-    if note:
-        record = Record.query.get(note.record_id)
-        return redirect(url_for('main.record_detail', bib_id=record.bib_id))
-
-    # Wrap around to beginning
-    note = db.session.query(Note)\
-                     .join(Record)\
-                     .outerjoin(Vote)\
-                     .filter(Vote.id == None)\
-                     .filter(Record.bib_id < current_bib)\
-                     .order_by(Record.bib_id, Note.note_index)\
-                     .first()
-
-    if note:
-        record = Record.query.get(note.record_id)
-        return redirect(url_for('main.record_detail', bib_id=record.bib_id))
-
-    # No more unclassified records, stay on current
+    user_id = session.get('user_id')
+    bib_id = next_leased_record(user_id, exclude_record_id=current_record.id) or \
+        next_record_for_user(user_id, exclude_record_id=current_record.id)
+    if bib_id:
+        return redirect(url_for('main.record_detail', bib_id=bib_id))
+
+    # Nothing left to vote on elsewhere, stay on current
     return redirect(url_for('main.record_detail', bib_id=current_bib))
 
 
@@ -178,6 +157,7 @@ def next_pending_review(current_bib):
     """Navigate to next record with notes pending review by current user"""
     current_record = Record.query.filter_by(bib_id=current_bib).first_or_404()
     user_id = session.get('user_id')
+    store = get_vote_store()
 
     # Find notes where current user hasn't voted yet
     records = Record.query.filter(Record.bib_id > current_bib)\
@@ -186,8 +166,7 @@ def next_pending_review(current_bib):
     for record in records:
         notes = Note.query.filter_by(record_id=record.id).all()
         for note in notes:
-            user_vote = Vote.query.filter_by(note_id=note.id, user_id=user_id).first()
-            if not user_vote:
+            if not store.has_voted(user_id, note.id):
                 return redirect(url_for('main.record_detail', bib_id=record.bib_id))
 
     # Wrap around
@@ -197,8 +176,7 @@ def next_pending_review(current_bib):
     for record in records:
         notes = Note.query.filter_by(record_id=record.id).all()
         for note in notes:
-            user_vote = Vote.query.filter_by(note_id=note.id, user_id=user_id).first()
-            if not user_vote:
+            if not store.has_voted(user_id, note.id):
                 return redirect(url_for('main.record_detail', bib_id=record.bib_id))
 
     # No more unvoted notes
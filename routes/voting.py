@@ -1,12 +1,41 @@
-from flask import Blueprint, request, jsonify, session
-from datetime import datetime
-from models import db, Record, Note, Vote
+from flask import Blueprint, Response, current_app, request, jsonify, session
+from sqlalchemy import tuple_
+from models import db, Record, Note
 from auth import login_required
-from utils.probability import calculate_vote_distribution, get_identical_note_ids
+from utils.probability import (calculate_vote_distribution, calculate_vote_distributions, get_identical_note_ids,
+                               get_note_voters, get_notes_voters)
+from utils.metrics import VOTES_TOTAL
+from utils.events import broker, stream_channel
+from utils.vote_writer import save_votes
+from utils.similarity import get_similar_note_ids
+from utils.type_codes import is_classification
 
 voting_bp = Blueprint('voting', __name__)
 
 
+def publish_note_update(bib_id, note_index, distribution, voters):
+    """Push a note's committed distribution and voters to live record page streams"""
+    broker.publish(bib_id, 'vote', {
+        'note_index': note_index,
+        'distribution': distribution,
+        'voters': voters
+    })
+
+
+def publish_note_updates(note_ids):
+    """Publish updates for notes (possibly across records) that have live subscribers"""
+    rows = db.session.query(Note.id, Note.note_index, Record.bib_id)\
+                     .join(Record)\
+                     .filter(Note.id.in_(note_ids))\
+                     .all()
+
+    for note_id, note_index, bib_id in rows:
+        if broker.has_subscribers(bib_id):
+            publish_note_update(bib_id, note_index,
+                                calculate_vote_distribution(note_id),
+                                get_note_voters(note_id))
+
+
 @voting_bp.route('/vote', methods=['POST'])
 @login_required
 def vote():
@@ -20,7 +49,7 @@ def vote():
     classification = data.get('classification')
 
     # Validate classification
-    if classification not in ['w', 'o', 'a', 'ow', 'aw', 'ao', '?']:
+    if not is_classification(classification):
         return jsonify({'error': 'Invalid classification'}), 400
 
     # Validate note_index
@@ -41,38 +70,22 @@ def vote():
 
     user_id = session.get('user_id')
 
-    # Check if user already voted - update or create
-    existing_vote = Vote.query.filter_by(note_id=note.id, user_id=user_id).first()
-
-    if existing_vote:
-        # Update existing vote
-        existing_vote.classification = classification
-        existing_vote.voted_at = datetime.utcnow()
-    else:
-        # Create new vote
-        new_vote = Vote(
-            note_id=note.id,
-            user_id=user_id,
-            classification=classification
-        )
-        db.session.add(new_vote)
-
+    # Create or update the user's vote (group-committed by the vote writer)
     try:
-        db.session.commit()
+        result = save_votes(user_id, [(note.id, classification)])
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
+    VOTES_TOTAL.inc(path='single', action='updated' if result['updated'] else 'created')
+
     # Calculate new distribution
     distribution = calculate_vote_distribution(note.id)
 
     # Get voters grouped by classification
-    votes = Vote.query.filter_by(note_id=note.id).all()
-    voters = {}
-    for vote in votes:
-        if vote.classification not in voters:
-            voters[vote.classification] = []
-        voters[vote.classification].append(vote.user.username)
+    voters = get_note_voters(note.id)
+
+    publish_note_update(bib_id, note_index, distribution, voters)
 
     return jsonify({
         'success': True,
@@ -97,47 +110,78 @@ def vote_identical():
     classification = data.get('classification')
 
     # Validate classification
-    if classification not in ['w', 'o', 'a', 'ow', 'aw', 'ao', '?']:
+    if not is_classification(classification):
         return jsonify({'error': 'Invalid classification'}), 400
 
     if not note_text:
         return jsonify({'error': 'Note text required'}), 400
 
-    user_id = session.get('user_id')
-
     # Get all notes with matching text
     note_ids = get_identical_note_ids(note_text)
 
     if not note_ids:
         return jsonify({'error': 'No matching notes found'}), 404
 
-    votes_created = 0
-    votes_updated = 0
+    return save_bulk_vote(note_ids, classification, path='identical')
+
+
+@voting_bp.route('/vote-similar', methods=['POST'])
+@login_required
+def vote_similar():
+    """
+    Handle bulk classification vote for a note and its near-duplicates.
+    Applies the same classification to every note in the note's cluster whose
+    estimated similarity is at least min_similarity (0-1).
+    """
+    data = request.json
+    bib_id = data.get('bib_id')
+    classification = data.get('classification')
+
+    # Validate classification
+    if not is_classification(classification):
+        return jsonify({'error': 'Invalid classification'}), 400
+
+    try:
+        note_index = int(data.get('note_index'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid note index'}), 400
 
     try:
-        for note_id in note_ids:
-            # Check if user already voted - update or create
-            existing_vote = Vote.query.filter_by(note_id=note_id, user_id=user_id).first()
-
-            if existing_vote:
-                existing_vote.classification = classification
-                existing_vote.voted_at = datetime.utcnow()
-                votes_updated += 1
-            else:
-                new_vote = Vote(
-                    note_id=note_id,
-                    user_id=user_id,
-                    classification=classification
-                )
-                db.session.add(new_vote)
-                votes_created += 1
-
-        db.session.commit()
+        min_similarity = float(data.get('min_similarity', current_app.config.get('SIMILARITY_DEFAULT_CUTOFF', 0.8)))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid similarity cutoff'}), 400
+
+    if not 0 < min_similarity <= 1:
+        return jsonify({'error': 'Similarity cutoff must be between 0 and 1'}), 400
+
+    note = db.session.query(Note).join(Record)\
+                     .filter(Record.bib_id == bib_id, Note.note_index == note_index)\
+                     .first()
+    if not note:
+        return jsonify({'error': 'Note not found'}), 404
+
+    note_ids = get_similar_note_ids(note.id, min_similarity)
+
+    return save_bulk_vote(note_ids, classification, path='similar')
+
+
+def save_bulk_vote(note_ids, classification, path):
+    """Save one classification for many notes and build the JSON response"""
+    user_id = session.get('user_id')
 
+    try:
+        result = save_votes(user_id, [(note_id, classification) for note_id in note_ids])
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': f'Database error: {str(e)}'}), 500
 
+    votes_created = result['created']
+    votes_updated = result['updated']
+    VOTES_TOTAL.inc(votes_created, path=path, action='created')
+    VOTES_TOTAL.inc(votes_updated, path=path, action='updated')
+
+    publish_note_updates(note_ids)
+
     return jsonify({
         'success': True,
         'classification': classification,
@@ -147,3 +191,125 @@ def vote_identical():
     })
 
 
+@voting_bp.route('/vote-batch', methods=['POST'])
+@login_required
+def vote_batch():
+    """
+    Handle a batch of classification votes in a single transaction.
+    Expects {"votes": [{"bib_id", "note_index", "classification"}, ...]}.
+    Invalid items are reported individually; valid items are still saved.
+    """
+    data = request.json
+    items = data.get('votes') if isinstance(data, dict) else None
+
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': 'votes must be a non-empty list'}), 400
+
+    max_items = current_app.config.get('VOTE_BATCH_MAX_ITEMS', 500)
+    if len(items) > max_items:
+        return jsonify({'error': f'At most {max_items} votes per batch'}), 400
+
+    errors = []
+    wanted = {}  # (bib_id, note_index) -> (item position, classification); later items win
+
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            errors.append({'index': position, 'error': 'Invalid vote'})
+            continue
+
+        bib_id = item.get('bib_id')
+        classification = item.get('classification')
+
+        if not is_classification(classification):
+            errors.append({'index': position, 'error': 'Invalid classification'})
+            continue
+
+        try:
+            note_index = int(item.get('note_index'))
+        except (TypeError, ValueError):
+            errors.append({'index': position, 'error': 'Invalid note index'})
+            continue
+
+        if not bib_id:
+            errors.append({'index': position, 'error': 'Record not found'})
+            continue
+
+        wanted[(str(bib_id), note_index)] = (position, classification)
+
+    # Resolve all notes in one query
+    notes = {}
+    if wanted:
+        rows = db.session.query(Note.id, Record.bib_id, Note.note_index)\
+                         .join(Record)\
+                         .filter(tuple_(Record.bib_id, Note.note_index).in_(list(wanted)))\
+                         .all()
+        notes = {(bib_id, note_index): note_id for note_id, bib_id, note_index in rows}
+
+    for key, (position, classification) in list(wanted.items()):
+        if key not in notes:
+            errors.append({'index': position, 'error': 'Note not found'})
+            del wanted[key]
+
+    user_id = session.get('user_id')
+    note_ids = [notes[key] for key in wanted]
+
+    # Upsert all votes in one transaction
+    result = {'created': 0, 'updated': 0}
+    if note_ids:
+        try:
+            result = save_votes(user_id, [(notes[key], classification)
+                                          for key, (position, classification) in wanted.items()])
+        except Exception as e:
+            db.session.rollback()
+            return jsonify({'error': f'Database error: {str(e)}'}), 500
+
+    votes_created = result['created']
+    votes_updated = result['updated']
+
+    VOTES_TOTAL.inc(votes_created, path='batch', action='created')
+    VOTES_TOTAL.inc(votes_updated, path='batch', action='updated')
+
+    # Updated distributions and voters for every affected note
+    distributions = calculate_vote_distributions(note_ids)
+    voters = get_notes_voters(note_ids)
+    results = [
+        {
+            'bib_id': bib_id,
+            'note_index': note_index,
+            'classification': classification,
+            'distribution': distributions[notes[(bib_id, note_index)]],
+            'voters': voters[notes[(bib_id, note_index)]]
+        }
+        for (bib_id, note_index), (position, classification) in wanted.items()
+    ]
+
+    publish_note_updates(note_ids)
+
+    return jsonify({
+        'success': True,
+        'saved': len(results),
+        'votes_created': votes_created,
+        'votes_updated': votes_updated,
+        'results': results,
+        'errors': sorted(errors, key=lambda error: error['index'])
+    })
+
+
+@voting_bp.route('/record/<bib_id>/events')
+@login_required
+def record_events(bib_id):
+    """
+    Server-Sent Events stream of vote updates for a record.
+    Emits a 'vote' event with the note's distribution and voters after each commit.
+    The stream ends after EVENT_STREAM_MAX_AGE seconds and the browser reconnects.
+    """
+    Record.query.filter_by(bib_id=bib_id).first_or_404()
+
+    # Release the pooled connection before holding the stream open
+    db.session.remove()
+
+    heartbeat = current_app.config.get('EVENT_STREAM_HEARTBEAT', 15)
+    max_age = current_app.config.get('EVENT_STREAM_MAX_AGE')
+    return Response(stream_channel(bib_id, heartbeat=heartbeat, max_age=max_age),
+                    mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
@@ -7,89 +7,81 @@ document.addEventListener('DOMContentLoaded', function() {
             const noteIndex = noteCard.dataset.noteIndex;
             const classification = this.dataset.classification;
             const voteStatus = noteCard.querySelector('.vote-status');
-            const currentType = noteCard.querySelector('.current-type');
 
-            // Check if user wants to vote on all identical notes
+            // Check if user wants to vote on all identical or similar notes
             const voteAllCheckbox = noteCard.querySelector('.vote-all-identical');
-            const voteAll = voteAllCheckbox && voteAllCheckbox.checked;
+            const voteSimilarCheckbox = noteCard.querySelector('.vote-all-similar');
+            const voteSimilar = voteSimilarCheckbox && voteSimilarCheckbox.checked;
+            const voteAll = voteSimilar || (voteAllCheckbox && voteAllCheckbox.checked);
+
+            if (!voteAll) {
+                // Optimistic update; the queue saves the vote in the background
+                noteCard.dataset.userVote = classification;
+                highlightVoteButtons(noteCard, classification);
+                voteStatus.style.display = 'block';
+                VoteQueue.enqueue(BIB_ID, parseInt(noteIndex), classification);
+                return;
+            }
 
             // Show loading spinner
             voteStatus.style.display = 'block';
             this.disabled = true;
 
-            const endpoint = voteAll ? '/vote-identical' : '/vote';
-            const requestBody = voteAll ?
-                {
-                    note_text: voteAllCheckbox.dataset.noteText,
-                    classification: classification
-                } :
-                {
-                    bib_id: BIB_ID,
-                    note_index: parseInt(noteIndex),
-                    classification: classification
+            const request = voteSimilar
+                ? {
+                    url: '/vote-similar',
+                    label: 'similar',
+                    body: {
+                        bib_id: BIB_ID,
+                        note_index: parseInt(noteIndex),
+                        classification: classification,
+                        min_similarity: parseFloat(noteCard.querySelector('.similarity-cutoff').value)
+                    }
+                }
+                : {
+                    url: '/vote-identical',
+                    label: 'identical',
+                    body: {
+                        note_text: voteAllCheckbox.dataset.noteText,
+                        classification: classification
+                    }
                 };
 
-            fetch(endpoint, {
+            // Send any queued votes first so they cannot overwrite the bulk vote
+            VoteQueue.flush()
+            .then(() => fetch(request.url, {
                 method: 'POST',
                 headers: {
                     'Content-Type': 'application/json',
                 },
-                body: JSON.stringify(requestBody)
-            })
-            .then(response => response.json())
+                body: JSON.stringify(request.body)
+            }))
+            .then(response => readJson(response))
             .then(data => {
                 if (data.success) {
-                    if (voteAll) {
-                        // Bulk vote success
-                        showNotification(
-                            `Vote applied to ${data.total_notes} identical notes! (${data.votes_created} new, ${data.votes_updated} updated)`,
-                            'success'
-                        );
-                        // Uncheck the checkbox
-                        voteAllCheckbox.checked = false;
-                    } else {
-                        // Single vote success
-                        try {
-                            // Update vote distribution display
-                            updateVoteDisplay(noteCard, data.distribution, classification);
-
-                            // Update who voted section
-                            if (data.voters) {
-                                updateVotersDisplay(noteCard, data.voters);
-                            }
-
-                            showNotification(
-                                `Vote recorded! Consensus: ${data.consensus.toUpperCase()} at ${Math.round(data.consensus_probability * 100)}%`,
-                                'success'
-                            );
-                        } catch (error) {
-                            console.error('Error updating displays:', error);
-                            showNotification('Vote saved, but error updating display: ' + error.message, 'warning');
-                        }
-                    }
-
-                    // Update button highlighting
-                    noteCard.querySelectorAll('.vote-btn').forEach(btn => {
-                        const btnClass = btn.dataset.classification;
-                        const colorClass = getColorForClassification(btnClass);
-
-                        // Remove all color classes
-                        btn.className = 'btn btn-sm vote-btn';
-
-                        // Add appropriate class
-                        if (btnClass === classification) {
-                            btn.classList.add('btn-' + colorClass);
-                        } else {
-                            btn.classList.add('btn-outline-' + colorClass);
-                        }
-                    });
+                    // Bulk vote success
+                    showNotification(
+                        `Vote applied to ${data.total_notes} ${request.label} notes! (${data.votes_created} new, ${data.votes_updated} updated)`,
+                        'success'
+                    );
+                    // Uncheck the checkboxes
+                    if (voteAllCheckbox) voteAllCheckbox.checked = false;
+                    if (voteSimilarCheckbox) voteSimilarCheckbox.checked = false;
+                    noteCard.dataset.userVote = classification;
+                    highlightVoteButtons(noteCard, classification);
                 } else {
                     showNotification('Error: ' + data.error, 'error');
                 }
             })
             .catch(error => {
                 console.error('Error:', error);
-                showNotification('Network error occurred', 'error');
+                if (error instanceof SessionExpired || error instanceof VoteRejected) {
+                    showNotification('Error: ' + error.message, 'error');
+                } else if (error instanceof QueueNotSent) {
+                    showNotification('Your earlier votes could not be sent yet, so this vote was not applied. Please try again.', 'error');
+                } else {
+                    showNotification('Network error occurred', 'error');
+                }
             })
             .finally(() => {
                 voteStatus.style.display = 'none';
@@ -98,6 +90,14 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     });
 
+    // Resume votes left pending by a previous page or a lost connection
+    VoteQueue.restore();
+
+    // Live vote updates from other classifiers on this record
+    if (typeof BIB_ID !== 'undefined' && window.EventSource) {
+        subscribeToRecordEvents(BIB_ID);
+    }
+
     // Toggle votes visibility
     document.querySelectorAll('.toggle-votes-btn').forEach(button => {
         button.addEventListener('click', function() {
@@ -138,6 +138,276 @@ document.addEventListener('DOMContentLoaded', function() {
     });
 });
 
+// Client-side vote queue.
+// Votes are applied to the page immediately, coalesced per note (the last
+// choice wins), and sent to /vote-batch in batches on a short timer. Failed
+// sends are retried with exponential backoff, and pending votes are kept in
+// localStorage so they survive reloads and dropped connections. An expired
+// session stops the retries; the votes stay stored until the next page load
+// after logging in.
+const VoteQueue = {
+    STORAGE_KEY: 'classificationVote.pendingVotes',
+    FLUSH_DELAY: 400,
+    MAX_BATCH: 200,
+    BASE_BACKOFF: 1000,
+    MAX_BACKOFF: 30000,
+
+    pending: {},
+    timer: null,
+    draining: null,
+    attempts: 0,
+    stopped: false,
+
+    key(bibId, noteIndex) {
+        return bibId + '|' + noteIndex;
+    },
+
+    enqueue(bibId, noteIndex, classification) {
+        this.pending[this.key(bibId, noteIndex)] = {
+            bib_id: bibId,
+            note_index: noteIndex,
+            classification: classification
+        };
+        this.save();
+        this.schedule(this.FLUSH_DELAY);
+    },
+
+    save() {
+        try {
+            localStorage.setItem(this.STORAGE_KEY, JSON.stringify(this.pending));
+        } catch (error) {
+            // Storage full or disabled; the queue still works in memory
+        }
+    },
+
+    restore() {
+        try {
+            const stored = JSON.parse(localStorage.getItem(this.STORAGE_KEY) || '{}');
+            // Votes made on this page take precedence over restored ones
+            this.pending = Object.assign(stored, this.pending);
+        } catch (error) {
+            this.pending = {};
+        }
+
+        // Show restored votes on the current record as pending
+        for (const vote of Object.values(this.pending)) {
+            const noteCard = findNoteCard(vote.bib_id, vote.note_index);
+            if (noteCard) {
+                noteCard.dataset.userVote = vote.classification;
+                highlightVoteButtons(noteCard, vote.classification);
+                noteCard.querySelector('.vote-status').style.display = 'block';
+            }
+        }
+
+        window.addEventListener('online', () => this.schedule(0));
+        window.addEventListener('pagehide', () => this.beacon());
+
+        if (Object.keys(this.pending).length > 0) {
+            this.schedule(0);
+        }
+    },
+
+    schedule(delay) {
+        clearTimeout(this.timer);
+        if (!this.stopped) {
+            // Failures are reported and rescheduled by send()
+            this.timer = setTimeout(() => this.flush().catch(() => {}), delay);
+        }
+    },
+
+    // Send every pending vote. The returned promise resolves once the queue is
+    // empty, and rejects if a batch could not be sent (it is then retried later)
+    flush() {
+        clearTimeout(this.timer);
+        if (!this.draining) {
+            this.draining = this.drain().finally(() => {
+                this.draining = null;
+            });
+        }
+        return this.draining;
+    },
+
+    async drain() {
+        if (this.stopped) {
+            throw new SessionExpired('Your session has expired - please log in again');
+        }
+        while (Object.keys(this.pending).length > 0) {
+            await this.send(Object.values(this.pending).slice(0, this.MAX_BATCH));
+        }
+    },
+
+    send(batch) {
+        return fetch('/vote-batch', {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json',
+            },
+            body: JSON.stringify({ votes: batch })
+        })
+        .then(response => {
+            if (!response.ok && response.status >= 500) {
+                throw new Error('Server error ' + response.status);
+            }
+            return readJson(response).then(data => {
+                if (!response.ok) {
+                    throw new VoteRejected(data.error || response.statusText);
+                }
+                return data;
+            });
+        })
+        .then(data => {
+            this.attempts = 0;
+            this.acknowledge(batch, data);
+        })
+        .catch(error => {
+            if (error instanceof SessionExpired) {
+                // Retrying cannot help until the user logs in again; the votes
+                // stay in localStorage and are sent from the next page
+                this.stopped = true;
+                showNotification(`Your session has expired - log in again to save your ${Object.keys(this.pending).length} pending vote(s)`, 'error');
+                throw error;
+            }
+            if (error instanceof VoteRejected) {
+                // The whole batch was refused; retrying will not help
+                this.attempts = 0;
+                this.drop(batch);
+                showNotification('Error: ' + error.message, 'error');
+                return;
+            }
+            this.attempts += 1;
+            console.error('Vote sync failed, retrying:', error);
+            if (this.attempts === 1) {
+                showNotification('Connection problem - your votes are saved and will be retried', 'warning');
+            }
+            this.schedule(this.backoff());
+            throw new QueueNotSent(error.message);
+        });
+    },
+
+    backoff() {
+        // Exponential backoff with full jitter
+        const ceiling = Math.min(this.MAX_BACKOFF, this.BASE_BACKOFF * Math.pow(2, this.attempts - 1));
+        return Math.random() * ceiling;
+    },
+
+    acknowledge(batch, data) {
+        const sent = batch.filter(vote => !(data.errors || []).some(error => batch[error.index] === vote));
+        this.drop(batch);
+
+        for (const result of data.results || []) {
+            const noteCard = findNoteCard(result.bib_id, result.note_index);
+            if (noteCard && !this.pending[this.key(result.bib_id, result.note_index)]) {
+                updateVoteDisplay(noteCard, result.distribution, noteCard.dataset.userVote);
+                updateVotersDisplay(noteCard, result.voters);
+            }
+        }
+
+        for (const error of data.errors || []) {
+            const vote = batch[error.index];
+            showNotification(`Vote on note ${vote.note_index + 1} of record ${vote.bib_id} was not saved: ${error.error}`, 'error');
+        }
+
+        if (sent.length === 1 && data.results && data.results.length === 1) {
+            const distribution = data.results[0].distribution;
+            showNotification(
+                `Vote recorded! Consensus: ${distribution.consensus.toUpperCase()} at ${Math.round(distribution.consensus_probability * 100)}%`,
+                'success'
+            );
+        } else if (sent.length > 1) {
+            showNotification(`${sent.length} votes recorded!`, 'success');
+        }
+    },
+
+    drop(batch) {
+        // Only remove entries that were not changed again while in flight
+        for (const vote of batch) {
+            const key = this.key(vote.bib_id, vote.note_index);
+            const current = this.pending[key];
+            if (current && current.classification === vote.classification) {
+                delete this.pending[key];
+                const noteCard = findNoteCard(vote.bib_id, vote.note_index);
+                if (noteCard) {
+                    noteCard.querySelector('.vote-status').style.display = 'none';
+                }
+            }
+        }
+        this.save();
+    },
+
+    beacon() {
+        // Best-effort send when leaving the page; entries stay stored until acknowledged
+        const batch = Object.values(this.pending).slice(0, this.MAX_BATCH);
+        if (batch.length > 0 && navigator.sendBeacon) {
+            navigator.sendBeacon('/vote-batch', new Blob([JSON.stringify({ votes: batch })], { type: 'application/json' }));
+        }
+    }
+};
+
+class VoteRejected extends Error {}
+class SessionExpired extends Error {}
+class QueueNotSent extends Error {}
+
+// JSON body of a response. A redirect to the login page (an expired session)
+// or any other non-JSON response rejects instead of looking like success.
+function readJson(response) {
+    if (response.redirected && new URL(response.url).pathname === '/login') {
+        return Promise.reject(new SessionExpired('Your session has expired - please log in again'));
+    }
+    const contentType = response.headers.get('Content-Type') || '';
+    if (!contentType.includes('application/json')) {
+        return Promise.reject(new VoteRejected(`Unexpected response from the server (${response.status})`));
+    }
+    return response.json();
+}
+
+function findNoteCard(bibId, noteIndex) {
+    if (typeof BIB_ID === 'undefined' || String(bibId) !== String(BIB_ID)) {
+        return null;
+    }
+    return document.querySelector(`.note-card[data-note-index="${noteIndex}"]`);
+}
+
+// Highlight the button matching the user's classification
+function highlightVoteButtons(noteCard, classification) {
+    noteCard.querySelectorAll('.vote-btn').forEach(btn => {
+        const btnClass = btn.dataset.classification;
+        const colorClass = getColorForClassification(btnClass);
+
+        // Remove all color classes
+        btn.className = 'btn btn-sm vote-btn';
+
+        // Add appropriate class
+        if (btnClass === classification) {
+            btn.classList.add('btn-' + colorClass);
+        } else {
+            btn.classList.add('btn-outline-' + colorClass);
+        }
+    });
+}
+
+// Apply vote updates pushed by the server for the current record
+function subscribeToRecordEvents(bibId) {
+    const source = new EventSource('/record/' + encodeURIComponent(bibId) + '/events');
+
+    source.addEventListener('vote', function(event) {
+        const data = JSON.parse(event.data);
+        const noteCard = document.querySelector(`.note-card[data-note-index="${data.note_index}"]`);
+        if (!noteCard) {
+            return;
+        }
+
+        try {
+            updateVoteDisplay(noteCard, data.distribution, noteCard.dataset.userVote);
+            updateVotersDisplay(noteCard, data.voters);
+        } catch (error) {
+            console.error('Error applying live vote update:', error);
+        }
+    });
+
+    // Close the stream when leaving the page so the server releases it promptly
+    window.addEventListener('beforeunload', () => source.close());
+}
+
 // Notification system
 function showNotification(message, type = 'info') {
     // Remove existing notifications
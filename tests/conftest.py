@@ -0,0 +1,116 @@
+"""Shared fixtures: an app on a throwaway database, a logged-in client and catalog files."""
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import Config
+
+# Catalog imported by the imported fixture unless a test overrides `records`
+RECORDS = [
+    ('B00000001', 'First record', [('Ms. note on p. 3', 'w'), ('Bookplate of X', 'o')]),
+    ('B00000002', 'Second record', [('Ms. note on p. 4', '')]),
+]
+
+
+def make_config(db_path, **overrides):
+    """Build a Config subclass pointing at db_path with the given overrides"""
+    attrs = {
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'TESTING': True,
+        'VOTE_WRITER_ENABLED': False,  # write votes in the request, not a writer thread
+        'DAWID_SKENE_BACKGROUND_REFIT': False,
+        'IMPORT_BATCH_PAUSE': 0,
+    }
+    attrs.update(overrides)
+    return type('TestConfig', (Config,), attrs)
+
+
+def write_catalog(path, records):
+    """
+    Write a catalog XML file in the import format.
+
+    Args:
+        path: File to write
+        records: List of (bib_id, title, [(note text, type), ...])
+    """
+    from xml.sax.saxutils import escape, quoteattr
+    lines = ["<?xml version='1.0' encoding='utf-8'?>", '<records>']
+    for bib_id, title, notes in records:
+        lines.append(f'  <record bib={quoteattr(bib_id)}>')
+        lines.append(f'    <title>{escape(title)}</title>')
+        for text, note_type in notes:
+            type_attr = f' type={quoteattr(note_type)}' if note_type else ''
+            lines.append(f'    <note{type_attr}>{escape(text)}</note>')
+        lines.append('  </record>')
+    lines.append('</records>')
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('\n'.join(lines) + '\n')
+    return str(path)
+
+
+@pytest.fixture
+def db_path(tmp_path):
+    return tmp_path / 'classification.db'
+
+
+@pytest.fixture
+def app_config():
+    """Config overrides for the app fixture; test modules override this"""
+    return {}
+
+
+@pytest.fixture
+def app(db_path, app_config):
+    from app import create_app
+    from models import db
+    app = create_app(make_config(db_path, **app_config))
+    yield app
+    with app.app_context():
+        storage = app.extensions['storage']
+        writer = app.extensions.get('vote_writer')
+        if writer is not None:
+            writer.stop()
+        for engine in (storage['reader'], db.engine):
+            if engine is not None:
+                engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    """Test client logged in as an admin"""
+    client = app.test_client()
+    client.post('/login', data={'username': 'Admin'})
+    return client
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    """Factory writing a catalog file: catalog(records, name='catalog.xml')"""
+    def make(records, name='catalog.xml'):
+        return write_catalog(tmp_path / name, records)
+    return make
+
+
+@pytest.fixture
+def records():
+    """(bib_id, title, [(note text, type), ...]) of the imported records; parametrize or override to change"""
+    return RECORDS
+
+
+@pytest.fixture
+def imported(app, catalog, records):
+    """ID of the Admin user, after importing `records` with its initial votes"""
+    from models import db, User
+    from utils.xml_parser import import_xml_file
+    with app.app_context():
+        admin = User.query.filter_by(username='Admin').first()
+        if admin is None:
+            admin = User(username='Admin', is_admin=True)
+            db.session.add(admin)
+            db.session.commit()
+        stats = import_xml_file(catalog(records), admin_user_id=admin.id)
+        assert not stats['errors']
+        return admin.id
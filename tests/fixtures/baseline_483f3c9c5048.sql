@@ -0,0 +1,94 @@
+-- A database as the application left it before the first migration:
+-- the tables created by db.create_all() at that version, stamped 483f3c9c5048.
+CREATE TABLE users (
+	id INTEGER NOT NULL,
+	username VARCHAR(50) NOT NULL,
+	created_at DATETIME,
+	is_admin BOOLEAN,
+	PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_users_username ON users (username);
+CREATE TABLE settings (
+	id INTEGER NOT NULL,
+	"key" VARCHAR(50) NOT NULL,
+	value VARCHAR(255) NOT NULL,
+	description TEXT,
+	updated_at DATETIME,
+	PRIMARY KEY (id)
+);
+CREATE UNIQUE INDEX ix_settings_key ON settings ("key");
+CREATE TABLE records (
+	id INTEGER NOT NULL,
+	bib_id VARCHAR(50) NOT NULL,
+	title TEXT NOT NULL,
+	created_at DATETIME,
+	source_user_id INTEGER,
+	source_filename VARCHAR(255),
+	PRIMARY KEY (id),
+	FOREIGN KEY(source_user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_records_source_filename ON records (source_filename);
+CREATE INDEX ix_records_source_user_id ON records (source_user_id);
+CREATE UNIQUE INDEX ix_records_bib_id ON records (bib_id);
+CREATE TABLE notes (
+	id INTEGER NOT NULL,
+	record_id INTEGER NOT NULL,
+	note_index INTEGER NOT NULL,
+	text TEXT NOT NULL,
+	created_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_record_note_index UNIQUE (record_id, note_index),
+	FOREIGN KEY(record_id) REFERENCES records (id)
+);
+CREATE INDEX idx_note_record_index ON notes (record_id, note_index);
+CREATE INDEX ix_notes_record_id ON notes (record_id);
+CREATE TABLE votes (
+	id INTEGER NOT NULL,
+	note_id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	classification VARCHAR(3) NOT NULL,
+	voted_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_user_note_vote UNIQUE (note_id, user_id),
+	FOREIGN KEY(note_id) REFERENCES notes (id),
+	FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX ix_votes_note_id ON votes (note_id);
+CREATE INDEX ix_votes_user_id ON votes (user_id);
+CREATE INDEX idx_vote_note_user ON votes (note_id, user_id);
+CREATE TABLE reviews (
+	id INTEGER NOT NULL,
+	note_id INTEGER NOT NULL,
+	user_id INTEGER NOT NULL,
+	approval VARCHAR(1) NOT NULL,
+	reviewed_at DATETIME,
+	PRIMARY KEY (id),
+	CONSTRAINT unique_user_note_review UNIQUE (note_id, user_id),
+	FOREIGN KEY(note_id) REFERENCES notes (id),
+	FOREIGN KEY(user_id) REFERENCES users (id)
+);
+CREATE INDEX idx_review_note_user ON reviews (note_id, user_id);
+CREATE INDEX ix_reviews_note_id ON reviews (note_id);
+CREATE INDEX ix_reviews_user_id ON reviews (user_id);
+CREATE TABLE alembic_version (version_num VARCHAR(32) NOT NULL PRIMARY KEY);
+INSERT INTO alembic_version VALUES ('483f3c9c5048');
+
+INSERT INTO users (id, username, created_at, is_admin) VALUES
+    (1, 'Admin', '2025-12-01 10:00:00', 1),
+    (2, 'alice', '2025-12-01 10:00:00', 0),
+    (3, 'bob', '2025-12-01 10:00:00', 0);
+INSERT INTO records (id, bib_id, title, created_at, source_user_id, source_filename) VALUES
+    (1, 'B00000001', 'First record', '2025-12-01 10:00:00', 1, 'catalog.xml'),
+    (2, 'B00000002', 'Second record', '2025-12-01 10:00:00', 1, 'catalog.xml');
+INSERT INTO notes (id, record_id, note_index, text, created_at) VALUES
+    (1, 1, 0, 'Ms. note on p. 3', '2025-12-01 10:00:00'),
+    (2, 1, 1, 'Bookplate of X', '2025-12-01 10:00:00'),
+    (3, 2, 0, 'Ms. note on p. 4', '2025-12-01 10:00:00');
+INSERT INTO votes (id, note_id, user_id, classification, voted_at) VALUES
+    (1, 1, 1, 'w', '2025-12-02 10:00:00'),
+    (2, 1, 2, 'w', '2025-12-02 10:00:00'),
+    (3, 1, 3, 'ow', '2025-12-02 10:00:00'),
+    (4, 2, 2, 'o', '2025-12-02 10:00:00'),
+    (5, 3, 3, '?', '2025-12-02 10:00:00');
+INSERT INTO reviews (id, note_id, user_id, approval, reviewed_at) VALUES
+    (1, 1, 1, 'y', '2025-12-03 10:00:00');
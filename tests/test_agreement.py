@@ -0,0 +1,37 @@
+"""Agreement analytics (utils/agreement.py)."""
+from conftest import make_config, write_catalog
+from models import db, Note, User
+from utils.agreement import get_agreement_report
+from utils.data_version import get_data_version
+from utils.vote_writer import save_votes
+from utils.xml_parser import import_xml_file
+
+
+def test_report_cached_per_app(app, imported, tmp_path):
+    from app import create_app
+    other = create_app(make_config(tmp_path / 'other.db'))
+    with other.app_context():
+        admin = User(username='Admin', is_admin=True)
+        db.session.add(admin)
+        db.session.commit()
+        import_xml_file(write_catalog(tmp_path / 'other.xml', [('B00000009', 'Other', [('Stamp', 'a'), ('Seal', 'a'), ('Label', 'o')])]),
+                        admin_user_id=admin.id)
+        other_version = get_data_version('votes')
+        other_report = get_agreement_report()
+
+    with app.app_context():
+        alice = User(username='alice')
+        db.session.add(alice)
+        db.session.commit()
+        save_votes(alice.id, [(Note.query.first().id, 'w')])
+
+        # Both databases are at the same votes version, with different votes
+        assert get_data_version('votes') == other_version
+        report = get_agreement_report()
+        assert report is not other_report
+        assert (report['total_users'], report['rated_notes']) == (2, 1)
+        assert get_agreement_report() is report
+
+    with other.app_context():
+        assert get_agreement_report() is other_report
+        assert (other_report['total_users'], other_report['rated_notes']) == (1, 0)
@@ -0,0 +1,78 @@
+"""Read API (routes/api.py)."""
+import json
+
+import pytest
+
+from routes import api
+
+RECORDS = [(f'B{i:08d}', f'Record {i}', [(f'Ms. note {j} of record {i}', 'w') for j in range(i % 3)])
+           for i in range(7)]
+
+
+def _lines(response):
+    return [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def api_client(client, imported, monkeypatch):
+    # Small query batches, so a page spans several of them
+    monkeypatch.setattr(api, '_BATCH', 2)
+    return client
+
+
+def test_cursor_paging(api_client):
+    pages, url = [], '/api/records?limit=3&fields=bib,note_count'
+    while url:
+        response = api_client.get(url)
+        assert response.status_code == 200
+        assert response.mimetype == 'application/x-ndjson'
+        pages.append(_lines(response))
+        url = None
+        if 'X-Next-After' in response.headers:
+            assert response.headers['X-Next-After'] == pages[-1][-1]['bib']
+            url = response.headers['Link'].split(';')[0].strip('<>')
+
+    assert [len(page) for page in pages] == [3, 3, 1]
+    assert [item for page in pages for item in page] == \
+        [{'bib': bib_id, 'note_count': len(notes)} for bib_id, _, notes in RECORDS]
+
+
+@pytest.mark.parametrize('limit', [7, 10])
+def test_last_page_has_no_cursor(api_client, limit):
+    response = api_client.get(f'/api/records?limit={limit}')
+
+    assert [item['bib'] for item in _lines(response)] == [bib_id for bib_id, _, _ in RECORDS]
+    assert 'X-Next-After' not in response.headers
+    assert 'Link' not in response.headers
+
+
+def test_page_after_cursor(api_client):
+    response = api_client.get('/api/records?after=B00000004&fields=title')
+
+    assert _lines(response) == [{'title': 'Record 5'}, {'title': 'Record 6'}]
+
+
+@pytest.mark.parametrize('query', ['limit=0', 'limit=many', 'limit=10001', 'fields=bib,price'])
+def test_bad_parameters(api_client, query):
+    response = api_client.get(f'/api/records?{query}')
+
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+
+def test_record_notes(api_client):
+    response = api_client.get('/api/records/B00000002/notes?fields=index,distribution')
+
+    lines = _lines(response)
+    assert [line['index'] for line in lines] == [0, 1]
+    assert all(line['distribution']['consensus'] == 'w' for line in lines)
+    assert api_client.get('/api/records/B99999999/notes').status_code == 404
+
+
+def test_requires_login(app, api_client):
+    assert app.test_client().get('/api/records').status_code == 302
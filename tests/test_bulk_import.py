@@ -0,0 +1,88 @@
+"""Parallel multi-file import (utils/bulk_import.py) against import_xml_file."""
+import pytest
+
+from models import db, Note, Record, User, Vote
+from utils.bulk_import import import_xml_files
+from utils.xml_parser import clear_database, import_xml_file
+
+SHARDS = {
+    'first.xml': [
+        ('B00000001', 'First', [('Ms. note on p. 3', 'w'), ('Bookplate of X', 'x')]),
+        ('', 'No bib ID', [('Stamp', 'o')]),
+        ('B00000002', 'Second', [('Ms. note on p. 4', '')]),
+    ],
+    'second.xml': [
+        ('B00000002', 'Second again', [('Ms. note on p. 4', 'w')]),
+        ('B00000003', 'Third', [('Bookplate of Y', 'o'), ('Label', 'bogus')]),
+        ('', 'No bib ID', []),
+        ('B00000003', 'Third again', [('Bookplate of Y', 'o')]),
+        ('B00000004', 'Fourth', [('Ms. note on p. 5', 'a')]),
+    ],
+    'truncated.xml': [(f'B0000001{i}', f'Record {i}', [(f'Ms. note {i}', 'w')]) for i in range(5)],
+}
+
+
+@pytest.fixture
+def app_config():
+    # Small batches, so the truncated shard commits some before its parse error
+    return {'IMPORT_BATCH_SIZE': 2}
+
+
+@pytest.fixture
+def shard_paths(catalog):
+    paths = [catalog(records, name) for name, records in SHARDS.items()]
+    with open(paths[-1], encoding='utf-8') as f:
+        content = f.read()
+    with open(paths[-1], 'w', encoding='utf-8') as f:
+        f.write(content[:content.index('Ms. note 3')])
+    return paths
+
+
+@pytest.fixture
+def admin(app):
+    with app.app_context():
+        user = User(username='Admin', is_admin=True)
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def _contents():
+    """Imported records, notes and votes, without database IDs"""
+    return (
+        sorted(db.session.query(Record.bib_id, Record.title, Record.source_filename)),
+        sorted(db.session.query(Record.bib_id, Note.note_index, Note.text).join(Record)),
+        sorted(db.session.query(Record.bib_id, Note.note_index, Vote.classification)
+               .join(Note, Note.record_id == Record.id).join(Vote)),
+    )
+
+
+def test_shard_stats_match_import_xml_file(app, admin, shard_paths):
+    with app.app_context():
+        bulk = import_xml_files(shard_paths, admin_user_id=admin, workers=1)
+        bulk_contents = _contents()
+
+        clear_database()
+        single = [import_xml_file(path, admin_user_id=admin) for path in shard_paths]
+
+        assert [{key: value for key, value in shard.items() if key not in ('filename', 'source_filename')}
+                for shard in bulk['shards']] == single
+        assert _contents() == bulk_contents
+
+
+def test_shard_stats(app, admin, shard_paths):
+    with app.app_context():
+        stats = import_xml_files(shard_paths, admin_user_id=admin, workers=1)
+
+    first, second, truncated = stats['shards']
+    assert (first['records_created'], first['notes_created'], first['votes_created']) == (2, 3, 1)
+    assert first['errors'] == ['Record without bib ID skipped']
+    # Errors in file order: the skipped record without a bib ID between the two duplicates
+    assert second['errors'] == ['Record B00000002 already exists, skipped',
+                                'Record without bib ID skipped',
+                                'Record B00000003 already exists, skipped']
+    assert (second['records_created'], second['notes_created'], second['votes_created']) == (2, 3, 2)
+    # Only the batch committed before the parse error
+    assert truncated['records_created'] == 2
+    assert len(truncated['errors']) == 1 and truncated['errors'][0].startswith('XML parsing error')
+    assert stats['errors'][0] == 'first.xml: Record without bib ID skipped'
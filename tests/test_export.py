@@ -0,0 +1,79 @@
+"""Full and delta XML exports (utils/xml_exporter.py)."""
+import xml.etree.ElementTree as ET
+
+import pytest
+from sqlalchemy import text
+
+from models import db, ExportCheckpoint, Note, Record, User
+from utils.vote_writer import save_votes
+from utils.xml_exporter import export_to_file, get_checkpoint
+
+RECORDS = [(f'B{i:08d}', f'Record {i}', [(f'Ms. note {j} of record {i}', 'w') for j in range(2)]) for i in range(4)]
+
+
+def _note_id(bib_id, note_index):
+    return Note.query.join(Record).filter(Record.bib_id == bib_id, Note.note_index == note_index).one().id
+
+
+def _parse(path):
+    root = ET.parse(path).getroot()
+    return root, {record.get('bib'): record for record in root.findall('record')}
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def exported(app, imported, tmp_path):
+    """ID of a classifier user, after a full export that recorded a checkpoint"""
+    with app.app_context():
+        alice = User(username='alice')
+        db.session.add(alice)
+        db.session.commit()
+
+        _, records = _parse(export_to_file(str(tmp_path / 'full.xml'), 0.6, checkpoint=True))
+        assert sorted(records) == [bib_id for bib_id, _, _ in RECORDS]
+        return alice.id
+
+
+def test_delta_since_checkpoint(app, tmp_path, exported):
+    with app.app_context():
+        start = get_checkpoint()
+        assert not start.delta and start.records_written == 4 and start.notes_written == 8
+
+        # A new vote that changes the consensus, and a deleted vote, which
+        # only the vote log shows
+        save_votes(exported, [(_note_id('B00000001', 0), 'o')])
+        db.session.execute(text('DELETE FROM votes WHERE note_id = :note_id'), {'note_id': _note_id('B00000002', 1)})
+        db.session.commit()
+
+        root, records = _parse(export_to_file(str(tmp_path / 'delta.xml'), 0.6, since=start.id, checkpoint=True))
+
+        assert root.get('checkpoint') == str(start.id)
+        assert root.get('delta_since')
+        assert sorted(records) == ['B00000001', 'B00000002']
+        # Changed records are written whole; a note under the threshold is listed as removed
+        assert [note.text for note in records['B00000001'].findall('note')] == ['Ms. note 1 of record 1']
+        assert [note.text for note in records['B00000001'].findall('removed')] == ['Ms. note 0 of record 1']
+        assert [note.text for note in records['B00000002'].findall('note')] == ['Ms. note 0 of record 2']
+        assert [note.text for note in records['B00000002'].findall('removed')] == ['Ms. note 1 of record 2']
+
+        delta = get_checkpoint()
+        assert delta.id != start.id and delta.delta
+        assert (delta.records_written, delta.notes_written, delta.notes_removed) == (2, 2, 2)
+        assert delta.vote_seq > start.vote_seq
+
+        # Nothing has changed since the delta's checkpoint
+        _, records = _parse(export_to_file(str(tmp_path / 'empty.xml'), 0.6, since=delta.id))
+        assert records == {}
+
+
+def test_delta_needs_matching_settings(app, tmp_path, exported):
+    with app.app_context():
+        checkpoint_id = ExportCheckpoint.query.one().id
+        with pytest.raises(ValueError, match='same'):
+            export_to_file(str(tmp_path / 'delta.xml'), 0.8, since=checkpoint_id)
+        with pytest.raises(ValueError, match='Unknown export checkpoint'):
+            export_to_file(str(tmp_path / 'delta.xml'), 0.6, since=checkpoint_id + 1)
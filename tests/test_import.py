@@ -0,0 +1,96 @@
+"""XML import and merge re-import (utils/xml_parser.py)."""
+import pytest
+from sqlalchemy import text
+
+from models import db, ExportCheckpoint, Note, Record, User, Vote, VoteSnapshot
+from utils.vote_store import VoteStore
+from utils.vote_writer import save_votes
+from utils.xml_parser import STAT_KEYS, clear_database, import_xml_file
+
+ORIGINAL = [
+    ('B00000001', 'Unchanged record', [('Ms. note on p. 3', 'w'), ('Bookplate of X', 'o')]),
+    ('B00000002', 'Changed record', [('Ms. note on p. 4', 'w'), ('Bookplate of Y', 'o'), ('Stamp', '')]),
+]
+UPDATED = [
+    ORIGINAL[0],
+    ('B00000002', 'Changed record', [('Ms. note on p. 4', 'w'), ('Bookplate of Y, revised', 'a')]),
+    ('B00000003', 'New record', [('Ms. note on p. 5', 'w')]),
+]
+
+
+def _stats(**counts):
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    stats.update(counts, errors=[])
+    return stats
+
+
+def _note(bib_id, note_index):
+    return Note.query.join(Record).filter(Record.bib_id == bib_id, Note.note_index == note_index).one()
+
+
+@pytest.fixture
+def imported(app, catalog):
+    """Admin and classifier user IDs, after importing ORIGINAL with initial votes and one vote per note"""
+    with app.app_context():
+        admin, alice = User(username='Admin', is_admin=True), User(username='alice')
+        db.session.add_all([admin, alice])
+        db.session.commit()
+        stats = import_xml_file(catalog(ORIGINAL), admin_user_id=admin.id)
+        assert stats == _stats(records_created=2, notes_created=5, votes_created=4)
+        save_votes(alice.id, [(note.id, 'w') for note in Note.query])
+        return admin.id, alice.id
+
+
+def test_import_skips_existing_records(app, catalog, imported):
+    with app.app_context():
+        stats = import_xml_file(catalog(UPDATED, 'updated.xml'))
+
+        assert stats['records_created'] == 1
+        assert stats['errors'] == ['Record B00000001 already exists, skipped',
+                                   'Record B00000002 already exists, skipped']
+
+
+def test_merge_stats(app, catalog, imported):
+    admin, alice = imported
+    with app.app_context():
+        unchanged_id = _note('B00000002', 0).id
+
+        stats = import_xml_file(catalog(UPDATED, 'updated.xml'), admin_user_id=admin, merge=True)
+
+        # The revised note loses the admin's and alice's votes and gets a new
+        # initial vote; the dropped note loses alice's vote
+        assert stats == _stats(records_created=1, records_updated=1, records_unchanged=1, notes_created=1,
+                               notes_updated=1, notes_deleted=1, votes_created=2, votes_removed=3)
+        assert [note.text for note in Note.query.join(Record).filter(Record.bib_id == 'B00000002')
+                .order_by(Note.note_index)] == ['Ms. note on p. 4', 'Bookplate of Y, revised']
+        assert {vote.user_id: vote.classification for vote in Vote.query.filter_by(note_id=unchanged_id)} == \
+            {admin: 'w', alice: 'w'}
+        assert [(vote.user_id, vote.classification)
+                for vote in Vote.query.filter_by(note_id=_note('B00000002', 1).id)] == [(admin, 'a')]
+
+        again = import_xml_file(catalog(UPDATED, 'updated.xml'), admin_user_id=admin, merge=True)
+        assert again == _stats(records_unchanged=3)
+
+
+def test_clear_database_drops_vote_history(app, catalog, imported):
+    with app.app_context():
+        store = VoteStore()
+        store.rebuild()
+        store.snapshot()
+        db.session.add(ExportCheckpoint(voted_before=db.func.now(), vote_seq=store.seq, confidence_threshold=0.6,
+                                        strategy='majority'))
+        db.session.commit()
+
+        clear_database()
+        assert Record.query.count() == Note.query.count() == Vote.query.count() == 0
+        assert VoteSnapshot.query.count() == ExportCheckpoint.query.count() == 0
+        assert db.session.execute(text('SELECT count(*) FROM vote_changes')).scalar() == 0
+
+        # Note IDs start over; nothing of the old votes may reach the new notes
+        import_xml_file(catalog(ORIGINAL))
+        store.sync()
+        fresh = VoteStore()
+        fresh.rebuild()
+        for note in Note.query:
+            assert not store.vote_counts(note.id)
+            assert not fresh.vote_counts(note.id)
@@ -0,0 +1,26 @@
+"""Request metrics (utils/metrics.py)."""
+import pytest
+from flask import Flask
+
+from utils import metrics
+
+
+@pytest.mark.parametrize('propagate', [False, True])
+def test_failed_requests_are_counted(propagate):
+    app = Flask(__name__)
+    app.config['PROPAGATE_EXCEPTIONS'] = propagate
+    metrics.init_app(app)
+
+    @app.route('/fail')
+    def fail():
+        raise RuntimeError('failed')
+
+    before = metrics.REQUESTS_TOTAL.get(blueprint='app', endpoint='fail', status=500)
+    try:
+        response = app.test_client().get('/fail')
+    except RuntimeError:
+        assert propagate
+    else:
+        assert response.status_code == 500
+
+    assert metrics.REQUESTS_TOTAL.get(blueprint='app', endpoint='fail', status=500) == before + 1
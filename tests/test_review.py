@@ -0,0 +1,112 @@
+"""Review queue, bulk review and export approval filters (utils/review.py)."""
+import xml.etree.ElementTree as ET
+from datetime import datetime, timedelta
+
+import pytest
+
+from models import db, Note, Review, User
+from utils.review import latest_reviews, review_queue, save_reviews
+from utils.vote_writer import save_votes
+from utils.xml_exporter import export_to_xml
+
+# Untyped notes, so the only votes are the ones the tests cast
+RECORDS = [('B00000001', 'Record', [(f'Ms. note {i}', '') for i in range(5)])]
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def voted(app, imported):
+    """(reviewer ID, classifier IDs, note IDs), after the first classifier voted 'w' on every note"""
+    with app.app_context():
+        classifiers = [User(username=name) for name in ('alice', 'bob', 'carol')]
+        db.session.add_all(classifiers)
+        db.session.commit()
+        note_ids = [note.id for note in Note.query.order_by(Note.id)]
+        save_votes(classifiers[0].id, [(note_id, 'w') for note_id in note_ids])
+        return imported, [user.id for user in classifiers], note_ids
+
+
+def _queued(threshold=0.0):
+    return [note['id'] for note in review_queue(threshold)['notes']]
+
+
+def test_reviewed_consensus_leaves_the_queue_until_it_moves(app, voted):
+    reviewer, (_, bob, carol), note_ids = voted
+    with app.app_context():
+        assert _queued() == note_ids
+
+        assert save_reviews(reviewer, [(note_ids[0], 'w')], 'approve') == 1
+        assert save_reviews(reviewer, [(note_ids[1], 'w')], 'reject') == 1
+        assert _queued() == note_ids[2:]
+
+        # The votes move note 0's consensus away from the approved classification
+        save_votes(bob, [(note_ids[0], 'o')])
+        save_votes(carol, [(note_ids[0], 'o')])
+        assert _queued() == [note_ids[0]] + note_ids[2:]
+
+        # Reviewing the new consensus takes it out again
+        save_reviews(reviewer, [(note_ids[0], 'o')], 'approve')
+        assert _queued() == note_ids[2:]
+        assert latest_reviews([note_ids[0]]) == {note_ids[0]: ('y', 'o')}
+
+
+def test_queue_threshold_and_paging(app, voted):
+    _, (_, bob, _), note_ids = voted
+    with app.app_context():
+        save_votes(bob, [(note_ids[4], 'o')])
+
+        # Note 4 is split 50/50, under the threshold
+        assert _queued(0.6) == note_ids[:4]
+
+        first = review_queue(0.6, per_page=3)
+        assert first['total'] == 4 and first['remaining'] == 4 and first['next_after'] == note_ids[2]
+        second = review_queue(0.6, after=first['next_after'], per_page=3)
+        assert [note['id'] for note in second['notes']] == [note_ids[3]]
+        assert second['remaining'] == 1 and second['next_after'] is None
+
+
+def test_latest_review_wins(app, voted):
+    reviewer, (alice, bob, _), note_ids = voted
+    note_id = note_ids[0]
+    start = datetime(2026, 1, 1)
+    with app.app_context():
+        db.session.add_all([
+            Review(note_id=note_id, user_id=alice, approval='y', classification='w', reviewed_at=start),
+            Review(note_id=note_id, user_id=bob, approval='n', classification='w', reviewed_at=start + timedelta(1)),
+        ])
+        db.session.commit()
+        assert latest_reviews() == {note_id: ('n', 'w')}
+
+        # A newer review from the first reviewer wins, though its row is older
+        Review.query.filter_by(user_id=alice).update({'reviewed_at': start + timedelta(2)})
+        db.session.commit()
+        assert latest_reviews() == {note_id: ('y', 'w')}
+
+        # Reviews at the same time go to the later row
+        db.session.add(Review(note_id=note_id, user_id=reviewer, approval='n', classification='w',
+                              reviewed_at=start + timedelta(2)))
+        db.session.commit()
+        assert latest_reviews([note_id]) == {note_id: ('n', 'w')}
+
+
+@pytest.mark.parametrize('approval, expected', [
+    (None, [0, 1, 2, 3, 4]),
+    ('approved', [0]),
+    ('not_rejected', [0, 2, 3, 4]),
+])
+def test_export_approval_filters(app, voted, approval, expected):
+    reviewer, _, note_ids = voted
+    with app.app_context():
+        save_reviews(reviewer, [(note_ids[0], 'w')], 'approve')
+        save_reviews(reviewer, [(note_ids[1], 'w')], 'reject')
+        # Reviews of a consensus the note no longer has count for neither filter
+        save_reviews(reviewer, [(note_ids[3], 'o')], 'reject')
+        save_reviews(reviewer, [(note_ids[4], 'o')], 'approve')
+
+        root = ET.fromstring(export_to_xml(0.6, approval=approval))
+
+        assert [note.text for note in root.iter('note')] == [f'Ms. note {i}' for i in expected]
@@ -0,0 +1,142 @@
+"""Note leases for classifiers (utils/scheduler.py)."""
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import func, select, update
+
+from models import db, Note, NoteLease, Record, User, Vote
+from utils.scheduler import lease_notes, next_leased_record
+from utils.vote_writer import save_votes
+
+# Untyped notes, so nothing is voted on after the import
+RECORDS = [
+    ('B00000001', 'First record', [('Ms. note on p. 3', ''), ('Bookplate of X', '')]),
+    ('B00000002', 'Second record', [('Ms. note on p. 4', ''), ('Stamp', '')]),
+    ('B00000003', 'Third record', [('Ms. note on p. 5', '')]),
+]
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def users(app, imported):
+    """IDs of three classifiers"""
+    with app.app_context():
+        users = [User(username=name) for name in ('alice', 'bob', 'carol')]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users]
+
+
+def _note_ids():
+    return [note.id for note in Note.query.order_by(Note.id)]
+
+
+def _leases(user_id):
+    return {lease.note_id: lease.expires_at for lease in NoteLease.query.filter_by(user_id=user_id)}
+
+
+def _assert_claims_match():
+    votes = dict(db.session.execute(select(Vote.note_id, func.count()).group_by(Vote.note_id)).all())
+    leases = dict(db.session.execute(select(NoteLease.note_id, func.count()).group_by(NoteLease.note_id)).all())
+    for note in Note.query:
+        assert note.claims == votes.get(note.id, 0) + leases.get(note.id, 0)
+
+
+def test_grant_in_priority_order(app, users):
+    with app.app_context():
+        note_ids = _note_ids()
+        db.session.execute(update(Note).where(Note.id == note_ids[3]).values(priority=2.0))
+        db.session.execute(update(Note).where(Note.id == note_ids[1]).values(priority=1.0))
+        db.session.commit()
+
+        # Notes with a priority first, then the rest in ID order
+        assert lease_notes(users[0], batch_size=3) == [note_ids[3], note_ids[1], note_ids[0]]
+        assert set(_leases(users[0])) == {note_ids[3], note_ids[1], note_ids[0]}
+        _assert_claims_match()
+
+
+def test_active_leases_are_renewed(app, users):
+    with app.app_context():
+        granted = lease_notes(users[0], batch_size=2, ttl=60)
+        before = _leases(users[0])
+
+        assert lease_notes(users[0], batch_size=2, ttl=600) == granted
+        after = _leases(users[0])
+        assert all(after[note_id] > before[note_id] for note_id in granted)
+
+
+def test_target_caps_votes_plus_leases(app, users):
+    alice, bob, carol = users
+    with app.app_context():
+        note_ids = _note_ids()
+        save_votes(carol, [(note_ids[0], 'w')])
+
+        # Target 2: the vote and alice's lease fill the first note
+        assert lease_notes(alice, batch_size=2, target=2) == note_ids[:2]
+        assert lease_notes(bob, batch_size=2, target=2) == note_ids[1:3]
+        assert lease_notes(carol, batch_size=5, target=2) == note_ids[2:]
+        _assert_claims_match()
+
+
+def test_expired_leases_are_swept(app, users):
+    alice, bob, _ = users
+    with app.app_context():
+        note_ids = _note_ids()
+        assert lease_notes(alice, batch_size=len(note_ids), target=1) == note_ids
+        assert lease_notes(bob, batch_size=2, target=1) == []
+
+        db.session.execute(update(NoteLease).values(expires_at=datetime.utcnow() - timedelta(seconds=1)))
+        db.session.commit()
+
+        assert lease_notes(bob, batch_size=2, target=1) == note_ids[:2]
+        assert not _leases(alice)
+        _assert_claims_match()
+
+
+def test_voted_notes_are_skipped(app, users):
+    alice = users[0]
+    with app.app_context():
+        note_ids = _note_ids()
+        save_votes(alice, [(note_ids[0], 'w'), (note_ids[2], 'o')])
+
+        assert lease_notes(alice, batch_size=2) == [note_ids[1], note_ids[3]]
+
+
+def test_vote_releases_lease(app, users):
+    alice = users[0]
+    with app.app_context():
+        granted = lease_notes(alice, batch_size=2)
+
+        save_votes(alice, [(granted[0], 'w')])
+
+        assert set(_leases(alice)) == {granted[1]}
+        _assert_claims_match()
+        # The rest of the batch stays leased; a new one is granted once it is voted on
+        assert lease_notes(alice, batch_size=2) == [granted[1]]
+        save_votes(alice, [(granted[1], 'o')])
+        assert lease_notes(alice, batch_size=2) == _note_ids()[2:4]
+
+
+def test_next_record_skips_leases_on_excluded_record(app, users):
+    alice = users[0]
+    with app.app_context():
+        first = Record.query.filter_by(bib_id='B00000001').one()
+        app.config['LEASE_BATCH_SIZE'] = 2
+
+        # Both leased notes are on the first record
+        assert next_leased_record(alice) == 'B00000001'
+        assert next_leased_record(alice, exclude_record_id=first.id) is None
+
+
+def test_next_unclassified_leaves_record_holding_all_leases(app, imported, client):
+    app.config['LEASE_BATCH_SIZE'] = 2
+    client.post('/login', data={'username': 'alice'})
+
+    response = client.get('/next-unclassified/B00000001')
+
+    assert response.status_code == 302
+    assert response.headers['Location'].endswith('/record/B00000002')
@@ -0,0 +1,94 @@
+"""Startup schema check (utils/schema.py) and the migration path from the first revision."""
+import os
+import sqlite3
+
+import pytest
+from flask_migrate import upgrade
+from sqlalchemy import event
+
+from conftest import make_config
+from utils.scheduler import _create_claim_triggers, register_claim_counts
+from utils.schema import MIGRATIONS_DIR, migration_head
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'baseline_483f3c9c5048.sql')
+
+
+def _load_baseline(path):
+    connection = sqlite3.connect(path)
+    connection.executescript(open(BASELINE, encoding='utf-8').read())
+    connection.close()
+
+
+def _describe(path):
+    """Columns of each table, indexes and triggers of a database file"""
+    connection = sqlite3.connect(path)
+    try:
+        tables = {
+            name: sorted((column[1], column[2].upper(), column[3])
+                         for column in connection.execute(f'PRAGMA table_info("{name}")'))
+            for (name,) in connection.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'table' "
+                "AND name NOT LIKE 'sqlite_%' AND name NOT LIKE 'note_search_%'")
+        }
+        indexes = sorted(connection.execute(
+            "SELECT name, tbl_name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%'"))
+        triggers = sorted(name for (name,) in connection.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'"))
+    finally:
+        connection.close()
+    return tables, indexes, triggers
+
+
+def _revisions(path):
+    connection = sqlite3.connect(path)
+    try:
+        return [row[0] for row in connection.execute('SELECT version_num FROM alembic_version')]
+    finally:
+        connection.close()
+
+
+def test_new_database_is_created_at_head(app, db_path):
+    assert _revisions(db_path) == [migration_head()]
+
+
+def test_outdated_database_is_not_touched(db_path):
+    from app import create_app
+    _load_baseline(db_path)
+    before = _describe(db_path)
+
+    with pytest.raises(RuntimeError, match='flask db upgrade'):
+        create_app(make_config(db_path, MIGRATE_CLI=False))
+
+    assert _describe(db_path) == before
+    assert _revisions(db_path) == ['483f3c9c5048']
+
+
+@pytest.mark.parametrize('damaged', [False, True], ids=['baseline', 'after-create-all'])
+def test_upgrade_from_first_revision(tmp_path, db_path, damaged):
+    from app import create_app
+    from models import db, Review, Vote
+    from utils.vote_store import get_vote_store
+
+    create_app(make_config(tmp_path / 'fresh.db'))
+    _load_baseline(db_path)
+
+    # With the `flask db` commands registered, the app still starts on an old database
+    app = create_app(make_config(db_path))
+    with app.app_context():
+        if damaged:
+            # What startup used to do to an old database: create the newer
+            # tables up front. The claim count triggers came after that startup code
+            event.remove(db.metadata, 'after_create', _create_claim_triggers)
+            db.create_all()
+            register_claim_counts(db.metadata)
+        upgrade(directory=MIGRATIONS_DIR)
+
+        assert _revisions(db_path) == [migration_head()]
+        assert _describe(db_path) == _describe(tmp_path / 'fresh.db')
+
+        votes = {(vote.note_id, vote.user_id): vote.classification for vote in Vote.query}
+        assert votes == {(1, 1): 'w', (1, 2): 'w', (1, 3): 'ow', (2, 2): 'o', (3, 3): '?'}
+        assert [(review.note_id, review.approval) for review in Review.query] == [(1, 'y')]
+
+        store = get_vote_store()
+        assert store.vote_counts(1) == {'w': 2, 'ow': 1}
+        assert store.has_voted(2, 2) and not store.has_voted(3, 2)
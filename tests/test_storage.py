@@ -0,0 +1,85 @@
+"""Read/write engine routing (utils/storage.py)."""
+import gc
+import os
+import weakref
+
+import pytest
+import sqlalchemy as sa
+
+from app import create_app
+from conftest import make_config
+from models import db, Note, User
+from utils import storage
+from utils.vote_writer import save_votes
+
+
+@pytest.fixture
+def queries(app, client, imported):
+    """Count of statements run on each engine while the test makes requests"""
+    with app.app_context():
+        user = User(username='alice')
+        db.session.add(user)
+        db.session.commit()
+        save_votes(user.id, [(note.id, 'o') for note in Note.query])
+
+    counts = {'reader': 0, 'writer': 0}
+    engines = app.extensions['storage']
+    assert engines['reader'] is not None
+
+    def counter(name):
+        def count(*args):
+            counts[name] += 1
+        return count
+
+    for name in counts:
+        sa.event.listen(engines[name], 'before_cursor_execute', counter(name))
+    return counts
+
+
+@pytest.mark.parametrize('path', ['/record/B00000001', '/contentious', '/unknown', '/pending-review',
+                                  '/admin/agreement'])
+def test_get_pages_read_from_reader(client, queries, path):
+    # A vote since the last request, so the page also syncs the vote store
+    client.post('/vote', json={'bib_id': 'B00000001', 'note_index': 1, 'classification': 'w'})
+    queries.update(reader=0, writer=0)
+
+    assert client.get(path).status_code == 200
+    assert queries['reader'] > 0
+    assert queries['writer'] == 0
+
+
+def test_writes_use_writer(client, queries):
+    response = client.post('/vote', json={'bib_id': 'B00000002', 'note_index': 0, 'classification': 'a'})
+
+    assert response.status_code == 200
+    assert queries['writer'] > 0
+
+
+def test_fork_disposes_live_engines(app):
+    with app.app_context():
+        engines = [db.engine, app.extensions['storage']['reader']]
+    assert all(engine in storage._engines for engine in engines)
+    pools = [engine.pool for engine in engines]
+
+    read_fd, write_fd = os.pipe()
+    pid = os.fork()
+    if pid == 0:
+        # Child: every engine has a pool of its own
+        os.write(write_fd, b'1' if all(engine.pool is not pool for engine, pool in zip(engines, pools)) else b'0')
+        os._exit(0)
+    os.close(write_fd)
+    os.waitpid(pid, 0)
+    assert os.read(read_fd, 1) == b'1'
+    os.close(read_fd)
+    assert all(engine.pool is pool for engine, pool in zip(engines, pools))
+
+
+def test_fork_hook_does_not_keep_apps_alive(tmp_path):
+    other = create_app(make_config(tmp_path / 'other.db'))
+    with other.app_context():
+        engines = [weakref.ref(db.engine), weakref.ref(other.extensions['storage']['reader'])]
+    assert all(engine() in storage._engines for engine in engines)
+
+    del other
+    gc.collect()
+    assert all(engine() is None for engine in engines)
@@ -0,0 +1,68 @@
+"""Classification code registry and column type (utils/type_codes.py)."""
+import pytest
+import sqlalchemy as sa
+from sqlalchemy.dialects import sqlite
+from sqlalchemy import select, text
+
+from models import db, Note, Record, User, Vote
+from utils.type_codes import CODES, LETTERS, ClassificationCode, letter_for, load_type_codes, stored_code
+
+
+def test_codes_run_from_zero():
+    assert sorted(CODES.values()) == list(range(len(LETTERS)))
+    assert all(LETTERS[code] == letter for letter, code in CODES.items())
+    assert letter_for(None) is None
+    assert letter_for(len(LETTERS)) is None
+
+
+@pytest.mark.parametrize('yaml_text, message', [
+    ('primary_classes:\n  w: {code: 0}\n  o: {code: 2}\n', 'without repeats'),
+    ('primary_classes:\n  w: {code: 0}\n  o: {code: 0}\n', 'without repeats'),
+    ('primary_classes:\n  w: {name: Work}\n', 'no integer code'),
+])
+def test_load_rejects_bad_codes(tmp_path, yaml_text, message):
+    path = tmp_path / 'type_codes.yaml'
+    path.write_text(yaml_text, encoding='utf-8')
+    with pytest.raises(ValueError, match=message):
+        load_type_codes(str(path))
+
+
+def test_bind_and_result_conversion():
+    column_type = ClassificationCode()
+    dialect = sqlite.dialect()
+
+    assert column_type.process_bind_param('ow', dialect) == CODES['ow']
+    assert column_type.process_bind_param(None, dialect) is None
+    with pytest.raises(ValueError, match='Unknown classification'):
+        column_type.process_bind_param('x', dialect)
+
+    assert column_type.process_result_value(CODES['?'], dialect) == '?'
+    assert column_type.process_result_value(None, dialect) is None
+    # A code written outside the app that the registry does not know
+    assert column_type.process_result_value(len(LETTERS), dialect) is None
+
+
+def test_votes_are_stored_as_codes(app):
+    with app.app_context():
+        user = User(username='alice')
+        record = Record(bib_id='B00000001', title='Record')
+        db.session.add_all([user, record])
+        db.session.flush()
+        note = Note(record_id=record.id, note_index=0, text='Ms. note')
+        db.session.add(note)
+        db.session.flush()
+        db.session.add(Vote(note_id=note.id, user_id=user.id, classification='ow'))
+        db.session.commit()
+
+        assert db.session.execute(text('SELECT classification, typeof(classification) FROM votes')).one() == \
+            (CODES['ow'], 'integer')
+        assert db.session.execute(select(Vote.classification)).scalar() == 'ow'
+        assert db.session.execute(select(stored_code(Vote.classification))).scalar() == CODES['ow']
+        # Letters in filters are bound as codes too
+        assert Vote.query.filter_by(classification='ow').count() == 1
+        assert Vote.query.filter(Vote.classification.in_(['w', 'o'])).count() == 0
+
+        db.session.add(Vote(note_id=note.id, user_id=user.id + 1, classification='x'))
+        with pytest.raises(sa.exc.StatementError, match='Unknown classification'):
+            db.session.flush()
+        db.session.rollback()
@@ -0,0 +1,118 @@
+"""Vote change log replay and snapshots (utils/vote_log.py, utils/vote_store.py)."""
+from datetime import datetime
+
+import numpy as np
+import pytest
+from sqlalchemy import text
+
+from models import db, Note, User, Vote, VoteSnapshot
+from utils.probability import count_votes
+from utils.type_codes import CODES
+from utils.vote_log import LogEntry, decode_snapshot, encode_snapshot
+from utils.vote_store import VoteStore
+from utils.vote_writer import save_votes
+
+# Untyped notes, so the import casts no initial votes
+RECORDS = [(f'B{i:08d}', f'Record {i}', [(f'Ms. note {j} of record {i}', '') for j in range(3)]) for i in range(4)]
+
+
+def _entry(seq, note_id, user_id, classification, previous=None, deleted=False):
+    return LogEntry(seq, note_id, user_id, deleted, CODES.get(classification), CODES.get(previous),
+                    datetime.utcnow())
+
+
+def _assert_matches_votes(store):
+    note_ids = [note.id for note in Note.query]
+    truth = count_votes(note_ids)
+    assert {note_id: store.vote_counts(note_id) for note_id in note_ids} == truth
+    voted = {(vote.user_id, vote.note_id) for vote in Vote.query}
+    for user in User.query:
+        for note_id in note_ids:
+            assert store.has_voted(user.id, note_id) == ((user.id, note_id) in voted)
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def voters(app, imported):
+    """IDs of two users, with votes on the imported notes"""
+    with app.app_context():
+        users = [User(username='alice'), User(username='bob')]
+        db.session.add_all(users)
+        db.session.commit()
+        note_ids = [note.id for note in Note.query.order_by(Note.id)]
+        save_votes(users[0].id, [(note_id, 'w') for note_id in note_ids[:6]])
+        save_votes(users[1].id, [(note_id, 'o') for note_id in note_ids[3:9]])
+        return [user.id for user in users]
+
+
+def test_replay_applies_new_changed_and_deleted_votes():
+    store = VoteStore()
+    store._replay([
+        _entry(1, 5, 1, 'w'),
+        _entry(2, 5, 2, 'w'),
+        _entry(3, 5, 1, 'o', previous='w'),
+        _entry(4, 7, 2, 'ow'),
+        _entry(5, 5, 2, None, previous='w', deleted=True),
+    ])
+
+    assert store.vote_counts(5) == {'o': 1}
+    assert store.vote_counts(7) == {'ow': 1}
+    assert store.vote_counts(6) == {}
+    assert store.has_voted(1, 5)
+    assert not store.has_voted(2, 5)
+    assert store.has_voted(2, 7)
+
+
+def test_snapshot_encoding_round_trip():
+    counts = np.zeros((4, len(CODES)), dtype=np.uint16)
+    counts[1, CODES['w']] = 2
+    counts[3, CODES['?']] = 1
+    user_notes = {1: np.array([1, 3], dtype=np.int32), 2: np.array([1], dtype=np.int32)}
+
+    decoded_counts, decoded_notes = decode_snapshot(encode_snapshot(counts, user_notes))
+
+    assert np.array_equal(decoded_counts, counts)
+    assert {user_id: notes.tolist() for user_id, notes in decoded_notes.items()} == {1: [1, 3], 2: [1]}
+
+
+def test_rebuild_from_snapshot_and_log(app, voters):
+    alice, bob = voters
+    with app.app_context():
+        store = VoteStore()
+        assert store._rebuild()  # no snapshot yet: full scan
+        snapshot_id = store.snapshot()
+        assert db.session.get(VoteSnapshot, snapshot_id).seq == store.seq
+
+        # Changes after the snapshot: a changed vote, a new one and a deleted one
+        note_ids = [note.id for note in Note.query.order_by(Note.id)]
+        save_votes(alice, [(note_ids[0], 'a'), (note_ids[10], 'ao')])
+        db.session.execute(text('DELETE FROM votes WHERE user_id = :user_id AND note_id = :note_id'),
+                           {'user_id': bob, 'note_id': note_ids[4]})
+        db.session.commit()
+
+        fresh = VoteStore()
+        assert not fresh._rebuild()  # snapshot plus the log after it
+        _assert_matches_votes(fresh)
+
+        store.sync()
+        _assert_matches_votes(store)
+        assert fresh.seq == store.seq
+
+
+def test_rebuild_scans_when_log_was_compacted_past_snapshot(app, voters):
+    with app.app_context():
+        store = VoteStore()
+        store.rebuild()
+        store.snapshot()
+        save_votes(voters[0], [(Note.query.order_by(Note.id.desc()).first().id, 'w')])
+        # The entries after the snapshot are gone, so it cannot be replayed
+        db.session.execute(text('DELETE FROM vote_changes'))
+        db.session.commit()
+
+        fresh = VoteStore()
+        assert fresh._rebuild()
+        _assert_matches_votes(fresh)
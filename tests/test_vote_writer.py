@@ -0,0 +1,135 @@
+"""Group-commit vote writer (utils/vote_writer.py)."""
+import sqlite3
+
+import pytest
+import sqlalchemy as sa
+
+from models import db, Note, User
+from utils import vote_writer
+from utils.vote_writer import VoteWriter
+
+# Untyped notes, so nothing is voted on after the import
+RECORDS = [(f'B{i:08d}', f'Record {i}', [(f'Ms. note {j} of record {i}', '') for j in range(2)]) for i in range(3)]
+
+
+@pytest.fixture
+def records():
+    return RECORDS
+
+
+@pytest.fixture
+def app_config():
+    return {'VOTE_WRITER_ENABLED': True}
+
+
+@pytest.fixture
+def voters(app, imported):
+    """IDs of three users and of every note"""
+    with app.app_context():
+        users = [User(username=name) for name in ('alice', 'bob', 'carol')]
+        db.session.add_all(users)
+        db.session.commit()
+        return [user.id for user in users], [note.id for note in Note.query.order_by(Note.id)]
+
+
+@pytest.fixture
+def writer(app):
+    """A writer of its own with a wide batch window, recording the size of each group it commits"""
+    with app.app_context():
+        writer = VoteWriter(db.engine, batch_window=0.2)
+    writer.groups = []
+    commit = writer._commit
+
+    def record(group):
+        writer.groups.append(len(group))
+        commit(group)
+
+    writer._commit = record
+    yield writer
+    writer.stop()
+
+
+def _stored_votes(db_path):
+    """Votes as another connection sees them: (note_id, user_id) -> classification code"""
+    connection = sqlite3.connect(db_path)
+    try:
+        return {(note_id, user_id): code
+                for note_id, user_id, code in connection.execute('SELECT note_id, user_id, classification FROM votes')}
+    finally:
+        connection.close()
+
+
+def test_votes_are_durable_when_the_future_resolves(app, client, imported, voters, db_path):
+    (alice, _, _), note_ids = voters
+    assert app.extensions['vote_writer'] is not None
+
+    response = client.post('/vote', json={'bib_id': 'B00000000', 'note_index': 0, 'classification': 'o'})
+    assert response.status_code == 200
+    assert response.get_json()['consensus'] == 'o'
+
+    with app.app_context():
+        result = vote_writer.save_votes(alice, [(note_ids[0], 'w'), (note_ids[1], 'a')])
+        assert result == {'created': 2, 'updated': 0}
+        assert _stored_votes(db_path) == {(note_ids[0], imported): 1, (note_ids[0], alice): 0, (note_ids[1], alice): 2}
+
+
+def test_group_commit_coalesces_repeated_votes(writer, voters, db_path):
+    (alice, bob, _), note_ids = voters
+    futures = [
+        writer.submit(alice, [(note_ids[0], 'w')]),
+        writer.submit(bob, [(note_ids[0], 'o'), (note_ids[1], 'o')]),
+        writer.submit(alice, [(note_ids[0], 'a'), (note_ids[0], 'ao')]),
+    ]
+
+    results = [future.result(timeout=5) for future in futures]
+
+    assert writer.groups == [3]
+    assert results == [{'created': 1, 'updated': 0}, {'created': 2, 'updated': 0}, {'created': 0, 'updated': 2}]
+    # One vote per (note, user), the one submitted last
+    assert _stored_votes(db_path) == {(note_ids[0], alice): 5, (note_ids[0], bob): 1, (note_ids[1], bob): 1}
+
+
+def test_bad_submission_fails_alone(writer, voters, db_path):
+    (alice, bob, carol), note_ids = voters
+    good = writer.submit(alice, [(note_ids[0], 'w')])
+    bad = writer.submit(bob, [(note_ids[0], 'w'), (note_ids[1], 'x')])
+    also_good = writer.submit(carol, [(note_ids[1], 'o')])
+
+    assert good.result(timeout=5) == {'created': 1, 'updated': 0}
+    assert also_good.result(timeout=5) == {'created': 1, 'updated': 0}
+    with pytest.raises(sa.exc.StatementError, match='Unknown classification'):
+        bad.result(timeout=5)
+    assert writer.groups == [3]
+    assert _stored_votes(db_path) == {(note_ids[0], alice): 0, (note_ids[1], carol): 1}
+
+
+def test_error_reaches_every_future(writer, voters, monkeypatch, db_path):
+    (alice, bob, _), note_ids = voters
+
+    def fail(connection, submissions, prior=1.0):
+        raise sa.exc.OperationalError('INSERT', {}, Exception('disk I/O error'))
+
+    monkeypatch.setattr(vote_writer, 'write_votes', fail)
+    futures = [writer.submit(user_id, [(note_ids[0], 'w')]) for user_id in (alice, bob)]
+    for future in futures:
+        with pytest.raises(sa.exc.OperationalError, match='disk I/O error'):
+            future.result(timeout=5)
+    assert _stored_votes(db_path) == {}
+
+    # The writer thread keeps serving later submissions
+    monkeypatch.undo()
+    assert writer.submit(alice, [(note_ids[0], 'w')]).result(timeout=5) == {'created': 1, 'updated': 0}
+
+
+def test_stop_commits_queued_votes(writer, voters, db_path):
+    (alice, bob, carol), note_ids = voters
+    futures = [writer.submit(user_id, [(note_ids[2], 'w')]) for user_id in (alice, bob, carol)]
+
+    writer.stop()
+
+    assert not writer._thread.is_alive()
+    assert all(future.done() and future.exception() is None for future in futures)
+    assert len(_stored_votes(db_path)) == 3
+
+    # A later submission starts the thread again
+    assert writer.submit(alice, [(note_ids[3], 'o')]).result(timeout=5) == {'created': 1, 'updated': 0}
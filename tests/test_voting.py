@@ -0,0 +1,97 @@
+"""Vote submission endpoints (routes/voting.py)."""
+import json
+
+import pytest
+
+from utils.type_codes import is_classification
+
+BAD_CLASSIFICATIONS = ['x', '', None, 3, ['w'], {'w': 1}]
+
+
+def test_is_classification():
+    assert is_classification('w') and is_classification('?')
+    for value in BAD_CLASSIFICATIONS:
+        assert not is_classification(value)
+
+
+@pytest.mark.parametrize('classification', BAD_CLASSIFICATIONS)
+@pytest.mark.parametrize('path', ['/vote', '/vote-identical', '/vote-similar'])
+def test_invalid_classification(client, imported, path, classification):
+    response = client.post(path, json={'bib_id': 'B00000001', 'note_index': 0, 'note_text': 'Ms. note on p. 3',
+                                       'classification': classification})
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'Invalid classification'}
+
+
+@pytest.mark.parametrize('classification', BAD_CLASSIFICATIONS)
+def test_batch_reports_invalid_classification(client, imported, classification):
+    response = client.post('/vote-batch', json={'votes': [
+        {'bib_id': 'B00000001', 'note_index': 0, 'classification': classification},
+        {'bib_id': 'B00000001', 'note_index': 1, 'classification': 'w'},
+    ]})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['errors'] == [{'index': 0, 'error': 'Invalid classification'}]
+    assert data['saved'] == 1
+
+
+@pytest.mark.parametrize('body', [[1, 2], 'votes', 3, None, {}, {'votes': []}, {'votes': {'bib_id': 'B00000001'}}])
+def test_batch_rejects_malformed_body(client, imported, body):
+    response = client.post('/vote-batch', data=json.dumps(body), content_type='application/json')
+
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'votes must be a non-empty list'}
+
+
+def test_batch_limit(app, client, imported):
+    app.config['VOTE_BATCH_MAX_ITEMS'] = 2
+    vote = {'bib_id': 'B00000001', 'note_index': 0, 'classification': 'w'}
+
+    assert client.post('/vote-batch', json={'votes': [vote] * 2}).status_code == 200
+    response = client.post('/vote-batch', json={'votes': [vote] * 3})
+    assert response.status_code == 400
+    assert response.get_json() == {'error': 'At most 2 votes per batch'}
+
+
+def test_batch_reports_errors_per_item(client, imported):
+    response = client.post('/vote-batch', json={'votes': [
+        {'bib_id': 'B00000001', 'note_index': 0, 'classification': 'o'},
+        'w',
+        {'bib_id': 'B00000001', 'note_index': 'first', 'classification': 'w'},
+        {'note_index': 0, 'classification': 'w'},
+        {'bib_id': 'B99999999', 'note_index': 0, 'classification': 'w'},
+        {'bib_id': 'B00000001', 'note_index': 9, 'classification': 'w'},
+        {'bib_id': 'B00000002', 'note_index': 0, 'classification': 'a'},
+    ]})
+
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['errors'] == [
+        {'index': 1, 'error': 'Invalid vote'},
+        {'index': 2, 'error': 'Invalid note index'},
+        {'index': 3, 'error': 'Record not found'},
+        {'index': 4, 'error': 'Note not found'},
+        {'index': 5, 'error': 'Note not found'},
+    ]
+    assert [(result['bib_id'], result['note_index'], result['classification']) for result in data['results']] == \
+        [('B00000001', 0, 'o'), ('B00000002', 0, 'a')]
+    # The Admin user's initial vote on the first note was changed; the second note had none
+    assert (data['saved'], data['votes_created'], data['votes_updated']) == (2, 1, 1)
+    first = data['results'][0]
+    assert first['distribution']['votes'] == {'o': 1}
+    assert first['voters'] == {'o': ['Admin']}
+
+
+def test_batch_later_items_win(client, imported):
+    response = client.post('/vote-batch', json={'votes': [
+        {'bib_id': 'B00000001', 'note_index': 1, 'classification': 'w'},
+        {'bib_id': 'B00000001', 'note_index': '1', 'classification': 'a'},
+    ]})
+
+    data = response.get_json()
+    assert data['errors'] == []
+    assert [(result['note_index'], result['classification']) for result in data['results']] == [(1, 'a')]
+    assert (data['saved'], data['votes_created'], data['votes_updated']) == (1, 0, 1)
+    assert data['results'][0]['distribution']['votes'] == {'a': 1}
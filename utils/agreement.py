@@ -0,0 +1,300 @@
+"""
+Inter-annotator agreement analytics: Fleiss' kappa (overall and per class),
+pairwise user agreement and each user's agreement with consensus.
+
+All votes are read in one pass into parallel integer arrays, a sparse
+user x note matrix in coordinate form (one entry per vote). Every statistic
+is then computed with array operations, so the cost is a few passes over
+the vote arrays rather than queries per note or per user. Reports are
+cached per app (and so per database) and keyed by the votes data version,
+so they are only recomputed after votes change.
+"""
+import threading
+from datetime import datetime
+from itertools import chain
+
+import numpy as np
+from flask import current_app
+from sqlalchemy import select
+
+from models import db, Vote, User
+from utils.data_version import get_data_version
+from utils.metrics import record_cache_lookup
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import read_connection
+
+NUM_CLASSES = len(CLASSIFICATION_TYPES)
+
+# Most active users included in the pairwise agreement matrix
+MAX_PAIRWISE_USERS = 25
+
+# Rows fetched from SQLite per round trip, and votes per array chunk
+_FETCH_SIZE = 100000
+_CHUNK = 1000000
+
+_extension_lock = threading.Lock()
+
+
+def load_vote_matrix():
+    """
+    Read every vote as a sparse user x note matrix in coordinate form.
+
+    Returns:
+        dict with keys:
+            - note: Dense note index per vote
+            - user: Dense user index per vote
+            - label: Classification code per vote (index into CLASSIFICATION_TYPES)
+            - note_ids: Note ID for each dense note index
+            - user_ids: User ID for each dense user index
+    """
+    # Plain DB-API cursor: building Row objects would dominate the load time
+    with read_connection() as connection:
+        cursor = connection.connection.cursor()
+        try:
+            cursor.execute(f"SELECT note_id, user_id, CASE typeof(classification) WHEN 'integer' "
+                           f"THEN classification ELSE -1 END FROM {Vote.__tablename__}")
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.int64,
+                                          count=3 * len(rows)).reshape(-1, 3))
+        finally:
+            cursor.close()
+
+    data = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int64)
+    data = data[(data[:, 2] >= 0) & (data[:, 2] < NUM_CLASSES)]  # Ignore unknown classification codes
+
+    note_ids, note = np.unique(data[:, 0], return_inverse=True)
+    user_ids, user = np.unique(data[:, 1], return_inverse=True)
+    return {
+        'note': note,
+        'user': user,
+        'label': data[:, 2],
+        'note_ids': note_ids,
+        'user_ids': user_ids,
+    }
+
+
+def class_counts(note, label, num_notes):
+    """Notes x classes matrix of vote counts"""
+    flat = np.bincount(note * NUM_CLASSES + label, minlength=num_notes * NUM_CLASSES)
+    return flat.reshape(num_notes, NUM_CLASSES)
+
+
+def fleiss_kappa(counts):
+    """
+    Fleiss' kappa overall and per class, allowing a varying number of
+    votes per note. Notes with fewer than two votes are ignored.
+
+    Args:
+        counts: Notes x classes matrix of vote counts
+
+    Returns:
+        dict with keys:
+            - kappa: Overall kappa (None if undefined)
+            - observed: Mean observed pairwise agreement
+            - expected: Agreement expected by chance
+            - per_class: Array of per-class kappas (NaN where undefined)
+            - shares: Array of each class's share of the votes
+            - notes: Number of notes with two or more votes
+    """
+    totals = counts.sum(axis=1)
+    rated = totals >= 2
+    counts = counts[rated]
+    totals = totals[rated]
+
+    if not len(totals):
+        return {'kappa': None, 'observed': None, 'expected': None,
+                'per_class': np.full(NUM_CLASSES, np.nan), 'shares': np.zeros(NUM_CLASSES), 'notes': 0}
+
+    pairs = totals * (totals - 1)
+    shares = counts.sum(axis=0) / totals.sum()
+
+    observed = ((counts * (counts - 1)).sum(axis=1) / pairs).mean()
+    expected = (shares ** 2).sum()
+    kappa = (observed - expected) / (1 - expected) if expected < 1 else None
+
+    # Per-class kappa: observed disagreement involving the class relative to chance
+    disagreement = (counts * (totals[:, None] - counts)).sum(axis=0)
+    chance = pairs.sum() * shares * (1 - shares)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        per_class = np.where(chance > 0, 1 - disagreement / chance, np.nan)
+
+    return {'kappa': kappa, 'observed': observed, 'expected': expected,
+            'per_class': per_class, 'shares': shares, 'notes': int(len(totals))}
+
+
+def consensus_agreement(note, user, label, counts, num_users):
+    """
+    How often each user's vote matches the consensus of the other voters
+    on the same note (ties broken in CLASSIFICATION_TYPES order).
+
+    Returns:
+        Tuple of arrays (compared, agreed) indexed by dense user index;
+        compared counts votes on notes that had at least one other vote
+    """
+    compared = np.zeros(num_users)
+    agreed = np.zeros(num_users)
+
+    for start in range(0, len(note), _CHUNK):
+        chunk = slice(start, start + _CHUNK)
+        others = counts[note[chunk]].copy()
+        others[np.arange(len(others)), label[chunk]] -= 1
+        has_others = others.sum(axis=1) > 0
+        agrees = (others.argmax(axis=1) == label[chunk]) & has_others
+
+        compared += np.bincount(user[chunk], weights=has_others, minlength=num_users)
+        agreed += np.bincount(user[chunk], weights=agrees, minlength=num_users)
+
+    return compared, agreed
+
+
+def pairwise_agreement(note, user, label, users):
+    """
+    Agreement between every pair of the given users on notes both voted on.
+
+    Args:
+        note, user, label: Vote arrays from load_vote_matrix()
+        users: Dense user indexes to include
+
+    Returns:
+        Tuple of users x users arrays (co_voted, agreed)
+    """
+    size = len(users)
+    position = np.full(user.max() + 1 if len(user) else 0, -1)
+    position[users] = np.arange(size)
+
+    selected = position[user] >= 0 if len(user) else np.zeros(0, dtype=bool)
+    order = np.argsort(note[selected], kind='stable')
+    note_sel = note[selected][order]
+    user_sel = position[user[selected]][order]
+    label_sel = label[selected][order]
+
+    co_voted = np.zeros(size * size)
+    agreed = np.zeros(size * size)
+    if not len(note_sel):
+        return co_voted.reshape(size, size), agreed.reshape(size, size)
+
+    # Votes per note among the selected users, and where each note's votes start
+    starts = np.flatnonzero(np.r_[True, note_sel[1:] != note_sel[:-1]])
+    lengths = np.diff(np.r_[starts, len(note_sel)])
+
+    # Notes with the same number of voters form a (notes x voters) block
+    for length in np.unique(lengths[lengths >= 2]):
+        index = starts[lengths == length][:, None] + np.arange(length)
+        block_users = user_sel[index]
+        block_labels = label_sel[index]
+        first, second = np.triu_indices(length, k=1)
+        a, b = block_users[:, first].ravel(), block_users[:, second].ravel()
+        same = (block_labels[:, first] == block_labels[:, second]).ravel()
+        for x, y in ((a, b), (b, a)):
+            co_voted += np.bincount(x * size + y, minlength=size * size)
+            agreed += np.bincount(x * size + y, weights=same, minlength=size * size)
+
+    return co_voted.reshape(size, size), agreed.reshape(size, size)
+
+
+def _ratio(numerator, denominator):
+    return float(numerator) / float(denominator) if denominator else None
+
+
+def build_agreement_report():
+    """
+    Compute the full agreement report from the current votes.
+
+    Returns:
+        dict with keys:
+            - total_votes, total_notes, total_users
+            - kappa: Overall Fleiss' kappa (None if undefined)
+            - observed_agreement, expected_agreement
+            - rated_notes: Notes with two or more votes
+            - classes: List of {code, share, kappa}
+            - users: List of {user_id, username, votes, compared, agreement}, least agreeing first
+            - pairwise: {'usernames': [...], 'agreement': [[...]], 'co_voted': [[...]]}
+    """
+    matrix = load_vote_matrix()
+    note, user, label = matrix['note'], matrix['user'], matrix['label']
+    num_notes, num_users = len(matrix['note_ids']), len(matrix['user_ids'])
+
+    counts = class_counts(note, label, num_notes)
+    kappa = fleiss_kappa(counts)
+
+    votes_per_user = np.bincount(user, minlength=num_users)
+    compared, agreed = consensus_agreement(note, user, label, counts, num_users)
+
+    usernames = dict(db.session.execute(select(User.id, User.username)).all())
+    users = [
+        {
+            'user_id': int(user_id),
+            'username': usernames.get(int(user_id), f'user {user_id}'),
+            'votes': int(votes_per_user[i]),
+            'compared': int(compared[i]),
+            'agreement': _ratio(agreed[i], compared[i])
+        }
+        for i, user_id in enumerate(matrix['user_ids'])
+    ]
+    users.sort(key=lambda u: (u['agreement'] is None, u['agreement'] or 0, -u['votes']))
+
+    top = np.argsort(-votes_per_user, kind='stable')[:MAX_PAIRWISE_USERS]
+    co_voted, pair_agreed = pairwise_agreement(note, user, label, top)
+
+    return {
+        'total_votes': int(len(note)),
+        'total_notes': num_notes,
+        'total_users': num_users,
+        'kappa': kappa['kappa'],
+        'observed_agreement': kappa['observed'],
+        'expected_agreement': kappa['expected'],
+        'rated_notes': kappa['notes'],
+        'classes': [
+            {
+                'code': code,
+                'share': float(kappa['shares'][i]),
+                'kappa': None if np.isnan(kappa['per_class'][i]) else float(kappa['per_class'][i])
+            }
+            for i, code in enumerate(CLASSIFICATION_TYPES)
+        ],
+        'users': users,
+        'pairwise': {
+            'usernames': [usernames.get(int(matrix['user_ids'][i]), f'user {matrix["user_ids"][i]}') for i in top],
+            'agreement': [[_ratio(pair_agreed[i, j], co_voted[i, j]) for j in range(len(top))]
+                          for i in range(len(top))],
+            'co_voted': co_voted.astype(int).tolist(),
+        },
+    }
+
+
+def _cache():
+    """The current app's cached report: version counters are per database, so each app has its own"""
+    cache = current_app.extensions.get('agreement')
+    if cache is None:
+        with _extension_lock:
+            cache = current_app.extensions.setdefault('agreement', {
+                'version': None, 'report': None, 'lock': threading.Lock(),
+            })
+    return cache
+
+
+def get_agreement_report():
+    """
+    Agreement report for the current votes, recomputed only when the votes
+    data version has changed since the cached report was built.
+
+    Returns:
+        Report dict as described in build_agreement_report, plus
+        'data_version' and 'computed_at'
+    """
+    version = get_data_version('votes')
+    cache = _cache()
+    with cache['lock']:
+        hit = cache['version'] == version and cache['report'] is not None
+        record_cache_lookup('agreement', hit)
+        if not hit:
+            report = build_agreement_report()
+            report['data_version'] = version
+            report['computed_at'] = datetime.utcnow()
+            cache['version'] = version
+            cache['report'] = report
+        return cache['report']
@@ -0,0 +1,276 @@
+"""
+Parallel import of catalogs delivered as many XML shards.
+
+Shards are parsed and validated in a process pool; each worker turns a file
+into plain rows (bib ID, title, hashes, note texts and classifications), so
+nothing but tuples crosses the process boundary. The calling process is the
+only writer: it takes parsed shards in input order and bulk-inserts each
+batch of IMPORT_BATCH_SIZE records with three Core INSERTs (records, notes,
+initial votes), committing and pausing between batches like
+import_xml_file. Each record keeps the source filename of its shard.
+
+Workers use the spawn start method, so they never inherit the writer's
+SQLite connections or threads (e.g. the vote writer).
+
+    python -m utils.bulk_import [--workers N] [--votes-from USERNAME] PATH [PATH ...]
+
+A PATH may be a directory, which imports every *.xml, *.xml.gz and
+*.xml.zst file in it. Compressed files are decompressed as they are parsed.
+"""
+import multiprocessing
+import os
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from flask import current_app
+from sqlalchemy import insert, select
+
+from models import db, Record, Note, Vote
+from utils.compression import strip_suffix
+from utils.metrics import IMPORT_DURATION, IMPORT_ROWS, IMPORT_ERRORS
+from utils.storage import run_in_transaction
+from utils.xml_parser import CLASSIFICATION_CODES, STAT_KEYS, catalog_filename, content_hash, iter_catalog, \
+    record_content
+
+# Catalog files picked up from a directory (plain, gzip or zstd)
+CATALOG_SUFFIXES = ('.xml', '.xml.gz', '.xml.zst')
+
+# Chunk size for IN (...) queries
+_CHUNK = 400
+
+
+def parse_shard(xml_path, batch_size=500):
+    """
+    Parse and validate one catalog file (runs in a worker process).
+
+    The file is parsed in batches of batch_size <record> elements, as
+    import_xml_file reads it, so a file that is malformed part way keeps
+    the same records: those of the batches completed before the error.
+
+    Returns:
+        dict with keys:
+            - path: The file parsed
+            - source_filename: As import_xml_file would record it
+            - records: List of (bib_id, title, record hash,
+              [(note text, note hash, classification or None), ...]), with
+              the error message (a str) in place of each record skipped, so
+              errors are reported in file order like import_xml_file
+            - errors: List of error messages that ended the parse
+    """
+    shard = {'path': xml_path, 'source_filename': strip_suffix(os.path.basename(xml_path)),
+             'records': [], 'errors': []}
+    try:
+        for root, batch in iter_catalog(xml_path, batch_size):
+            shard['source_filename'] = catalog_filename(root, xml_path)
+            for record_elem in batch:
+                bib_id = record_elem.get('bib')
+                if not bib_id:
+                    shard['records'].append('Record without bib ID skipped')
+                    continue
+                title, notes, record_hash = record_content(record_elem)
+                shard['records'].append((bib_id, title, record_hash, [
+                    (note_text, content_hash(note_text), note_type if note_type in CLASSIFICATION_CODES else None)
+                    for note_text, note_type in notes
+                ]))
+    except ET.ParseError as e:
+        shard['errors'].append(f'XML parsing error: {str(e)}')
+    except Exception as e:
+        shard['errors'].append(f'Import failed: {str(e)}')
+    return shard
+
+
+def _insert_batch(records, source_filename, admin_user_id):
+    """
+    Bulk-insert a batch of parsed records in the current transaction,
+    skipping bib IDs that already exist (the caller commits). Skipped
+    records' error messages are reported in their place.
+
+    Returns:
+        Stats dict in the shape of import_xml_file
+    """
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    stats['errors'] = []
+
+    records_table, notes_table = Record.__table__, Note.__table__
+    bib_ids = [record[0] for record in records if not isinstance(record, str)]
+    existing = set()
+    for start in range(0, len(bib_ids), _CHUNK):
+        existing.update(db.session.execute(
+            select(records_table.c.bib_id).where(records_table.c.bib_id.in_(bib_ids[start:start + _CHUNK]))
+        ).scalars())
+
+    fresh = []
+    for record in records:
+        if isinstance(record, str):
+            stats['errors'].append(record)
+            continue
+        if record[0] in existing:
+            stats['errors'].append(f'Record {record[0]} already exists, skipped')
+            continue
+        existing.add(record[0])
+        fresh.append(record)
+    if not fresh:
+        return stats
+
+    record_ids = db.session.execute(
+        insert(records_table).returning(records_table.c.id, sort_by_parameter_order=True),
+        [{'bib_id': bib_id, 'title': title, 'content_hash': record_hash, 'source_filename': source_filename}
+         for bib_id, title, record_hash, _ in fresh]
+    ).scalars().all()
+    stats['records_created'] = len(record_ids)
+
+    note_rows, note_types = [], []
+    for record_id, (_, _, _, notes) in zip(record_ids, fresh):
+        for note_index, (note_text, note_hash, note_type) in enumerate(notes):
+            note_rows.append({'record_id': record_id, 'note_index': note_index,
+                              'text': note_text, 'content_hash': note_hash})
+            note_types.append(note_type)
+    if not note_rows:
+        return stats
+
+    note_ids = db.session.execute(
+        insert(notes_table).returning(notes_table.c.id, sort_by_parameter_order=True), note_rows
+    ).scalars().all()
+    stats['notes_created'] = len(note_ids)
+
+    if admin_user_id:
+        votes = [{'note_id': note_id, 'user_id': admin_user_id, 'classification': note_type}
+                 for note_id, note_type in zip(note_ids, note_types) if note_type]
+        if votes:
+            db.session.execute(insert(Vote.__table__), votes)
+        stats['votes_created'] = len(votes)
+
+    return stats
+
+
+def _load_shard(shard, admin_user_id, batch_size, pause):
+    """Write one parsed shard in batches; returns its stats"""
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    stats['errors'] = []
+    records = shard['records']
+    for batch_start in range(0, len(records), batch_size):
+        batch = records[batch_start:batch_start + batch_size]
+        batch_stats = run_in_transaction(
+            'import',
+            lambda: _insert_batch(batch, shard['source_filename'], admin_user_id)
+        )
+        for key in STAT_KEYS:
+            stats[key] += batch_stats[key]
+        stats['errors'].extend(batch_stats['errors'])
+        time.sleep(pause)
+    # As in import_xml_file, the error that ended the parse comes after the batches before it
+    stats['errors'].extend(shard['errors'])
+    return stats
+
+
+def expand_paths(paths):
+    """Files to import: the paths given, with directories replaced by the catalog files in them"""
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(os.path.join(path, name) for name in os.listdir(path)
+                                if name.endswith(CATALOG_SUFFIXES)))
+        else:
+            files.append(path)
+    return files
+
+
+def _parsed_shards(paths, workers, batch_size):
+    """Parsed shards in input order, parsing at most 2 * workers files ahead of the writer"""
+    if workers <= 1 or len(paths) <= 1:
+        for path in paths:
+            yield parse_shard(path, batch_size)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        remaining = deque(paths)
+        pending = deque()
+        while remaining or pending:
+            while remaining and len(pending) < 2 * workers:
+                pending.append(pool.submit(parse_shard, remaining.popleft(), batch_size))
+            yield pending.popleft().result()
+
+
+def import_xml_files(paths, admin_user_id=None, workers=None):
+    """
+    Import many catalog files: parse them in parallel, write them from this process.
+
+    Records whose bib ID already exists (in the database or an earlier
+    file) are skipped, as with import_xml_file.
+
+    Args:
+        paths: XML files and/or directories of them
+        admin_user_id: If provided, create initial votes from existing type attributes
+        workers: Parser processes (IMPORT_WORKERS, by default one per CPU)
+
+    Returns:
+        dict with keys:
+            - records_created, notes_created, votes_created: Totals over all files
+            - errors: All error messages, prefixed with their file name
+            - shards: Per file, the stats import_xml_file would report for
+              it, plus filename and source_filename
+    """
+    files = expand_paths(paths)
+    if workers is None:
+        workers = current_app.config.get('IMPORT_WORKERS') or os.cpu_count() or 1
+    batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 500)
+    pause = current_app.config.get('IMPORT_BATCH_PAUSE', 0.05)
+
+    totals = dict.fromkeys(STAT_KEYS, 0)
+    totals['errors'] = []
+    totals['shards'] = []
+    start = time.perf_counter()
+
+    for shard in _parsed_shards(files, workers, batch_size):
+        filename = os.path.basename(shard['path'])
+        stats = _load_shard(shard, admin_user_id, batch_size, pause)
+        for key in STAT_KEYS:
+            totals[key] += stats[key]
+        totals['errors'].extend(f'{filename}: {error}' for error in stats['errors'])
+        totals['shards'].append(dict(stats, filename=filename, source_filename=shard['source_filename']))
+
+        IMPORT_ROWS.inc(stats['records_created'], kind='records')
+        IMPORT_ROWS.inc(stats['notes_created'], kind='notes')
+        IMPORT_ROWS.inc(stats['votes_created'], kind='votes')
+        IMPORT_ERRORS.inc(len(stats['errors']))
+
+    IMPORT_DURATION.observe(time.perf_counter() - start)
+    return totals
+
+
+if __name__ == '__main__':
+    # Import shards from the command line, then cluster and queue the new notes
+    import argparse
+    from app import create_app
+    from models import User
+    from utils.priority import refresh_priorities
+    from utils.similarity import refresh_clusters
+
+    parser = argparse.ArgumentParser(description='Import catalog XML shards in parallel')
+    parser.add_argument('paths', nargs='+', help='XML files (optionally .gz/.zst) or directories of them')
+    parser.add_argument('--workers', type=int, default=None, help='Parser processes (default: one per CPU)')
+    parser.add_argument('--votes-from', metavar='USERNAME',
+                        help='Create initial votes from type attributes as this user')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        admin_user_id = None
+        if args.votes_from:
+            user = User.query.filter_by(username=args.votes_from).first()
+            if user is None:
+                parser.error(f'Unknown user: {args.votes_from}')
+            admin_user_id = user.id
+
+        stats = import_xml_files(args.paths, admin_user_id=admin_user_id, workers=args.workers)
+        for shard in stats['shards']:
+            print(f"{shard['filename']}: {shard['records_created']} records, {shard['notes_created']} notes, "
+                  f"{shard['votes_created']} votes, {len(shard['errors'])} errors")
+        for error in stats['errors'][:20]:
+            print(error)
+        refresh_clusters()
+        refresh_priorities()
+        print(f"Imported {stats['records_created']} records, {stats['notes_created']} notes, "
+              f"{stats['votes_created']} votes from {len(stats['shards'])} files")
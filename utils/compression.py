@@ -0,0 +1,82 @@
+"""
+gzip and zstd compressed catalog files.
+
+Catalogs are read through a decompressing stream, chosen by the file's
+magic bytes rather than its name, and exports are written through a
+compressing one, so the uncompressed document never exists in memory or
+on disk. zstd needs the optional ``zstandard`` package; gzip is always
+available.
+"""
+import gzip
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+COMPRESSIONS = ['gzip', 'zstd']
+
+# File name suffix and leading magic bytes of each format
+SUFFIXES = {'gzip': '.gz', 'zstd': '.zst'}
+_MAGIC = {'gzip': b'\x1f\x8b', 'zstd': b'\x28\xb5\x2f\xfd'}
+
+DEFAULT_LEVELS = {'gzip': 6, 'zstd': 3}
+
+
+def available_compressions():
+    """Compressions usable in this environment"""
+    return [name for name in COMPRESSIONS if name != 'zstd' or zstandard is not None]
+
+
+def _check(compression):
+    if compression not in COMPRESSIONS:
+        raise ValueError(f'Unknown compression: {compression}')
+    if compression == 'zstd' and zstandard is None:
+        raise ValueError('zstd compression needs the zstandard package (pip install zstandard)')
+
+
+def compression_for_name(filename):
+    """Compression implied by a file name's suffix (None for plain files)"""
+    for name, suffix in SUFFIXES.items():
+        if filename.endswith(suffix):
+            return name
+    return None
+
+
+def strip_suffix(filename):
+    """File name without its compression suffix: "dump.xml.gz" -> "dump.xml" """
+    compression = compression_for_name(filename)
+    return filename[:-len(SUFFIXES[compression])] if compression else filename
+
+
+def detect_compression(path):
+    """Compression of a file from its magic bytes (None for plain files)"""
+    with open(path, 'rb') as f:
+        head = f.read(4)
+    for name, magic in _MAGIC.items():
+        if head.startswith(magic):
+            return name
+    return None
+
+
+def open_catalog(path):
+    """Open a catalog for reading, decompressing gzip or zstd as it is read"""
+    compression = detect_compression(path)
+    if compression is None:
+        return open(path, 'rb')
+    _check(compression)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    return zstandard.open(path, 'rb')
+
+
+def open_output(path, compression=None, level=None):
+    """Open a file for binary writing, compressing what is written unless compression is None"""
+    if compression is None:
+        return open(path, 'wb')
+    _check(compression)
+    if level is None:
+        level = DEFAULT_LEVELS[compression]
+    if compression == 'gzip':
+        return gzip.open(path, 'wb', compresslevel=level)
+    return zstandard.open(path, 'wb', cctx=zstandard.ZstdCompressor(level=level))
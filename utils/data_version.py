@@ -0,0 +1,98 @@
+"""
+Database-wide data version counters for cache invalidation.
+
+``data_versions`` holds one counter per tracked table, bumped by triggers on
+every insert, update and delete. Any process can compare the current value
+with the version a cached result was computed at, so caches stay correct
+across workers and for writes made outside the app (imports, scripts).
+
+``vote_changes`` additionally logs every vote write in commit order: the
+(note, user) pair, the classification code it replaced and the one it set
+(NULL for a deleted vote) and when. It is append-only; in-memory copies of the
+votes replay it to catch up instead of reloading (see utils/vote_store.py),
+and it answers point-in-time queries. Entries older than the retained vote
+snapshots are compacted away (see utils/vote_log.py).
+"""
+from sqlalchemy import Integer, event, text
+
+from models import db
+
+# UTC time of a vote change log entry, in the format SQLAlchemy stores DateTime in
+_NOW = "strftime('%Y-%m-%d %H:%M:%f', 'now') || '000'"
+
+VERSION_DDL = [
+    """CREATE TABLE IF NOT EXISTS data_versions (
+        name VARCHAR(50) PRIMARY KEY,
+        version INTEGER NOT NULL DEFAULT 0
+    )""",
+    "INSERT OR IGNORE INTO data_versions (name, version) VALUES ('votes', 0)",
+    """CREATE TRIGGER IF NOT EXISTS votes_version_ai AFTER INSERT ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_version_au AFTER UPDATE ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_version_ad AFTER DELETE ON votes BEGIN
+        UPDATE data_versions SET version = version + 1 WHERE name = 'votes';
+    END""",
+    """CREATE TABLE IF NOT EXISTS vote_changes (
+        seq INTEGER PRIMARY KEY AUTOINCREMENT,
+        note_id INTEGER NOT NULL,
+        user_id INTEGER NOT NULL,
+        deleted BOOLEAN NOT NULL DEFAULT 0,
+        classification SMALLINT,
+        previous SMALLINT,
+        changed_at DATETIME
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS votes_changes_ai AFTER INSERT ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, classification, changed_at)
+        VALUES (new.note_id, new.user_id, new.classification, {_NOW});
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS votes_changes_au AFTER UPDATE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        SELECT old.note_id, old.user_id, 1, old.classification, {_NOW}
+        WHERE old.note_id != new.note_id OR old.user_id != new.user_id;
+        INSERT INTO vote_changes (note_id, user_id, classification, previous, changed_at)
+        SELECT new.note_id, new.user_id, new.classification,
+               CASE WHEN old.note_id = new.note_id AND old.user_id = new.user_id THEN old.classification END, {_NOW};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS votes_changes_ad AFTER DELETE ON votes BEGIN
+        INSERT INTO vote_changes (note_id, user_id, deleted, previous, changed_at)
+        VALUES (old.note_id, old.user_id, 1, old.classification, {_NOW});
+    END""",
+]
+
+
+def ensure_data_versions(connection):
+    """Create the data_versions table and its triggers if missing"""
+    for statement in VERSION_DDL:
+        connection.execute(text(statement))
+
+
+def _create_data_versions(target, connection, **kw):
+    ensure_data_versions(connection)
+
+
+def register_data_versions(metadata):
+    """Create the version counters whenever metadata.create_all() runs"""
+    if not event.contains(metadata, 'after_create', _create_data_versions):
+        event.listen(metadata, 'after_create', _create_data_versions)
+
+
+def get_data_version(name='votes', connection=None):
+    """Current version counter for a tracked table (0 if not tracked)"""
+    # A textual SELECT (.columns()), so the routing session sends it to the reader
+    version = (connection or db.session).execute(
+        text("SELECT version FROM data_versions WHERE name = :name").columns(version=Integer), {'name': name}
+    ).scalar()
+    return version or 0
+
+
+def vote_log_position(connection):
+    """
+    Seq of the newest vote_changes entry ever written (0 if none). Read from
+    sqlite_sequence, so it stays right after compaction empties the log.
+    """
+    return connection.execute(
+        text("SELECT seq FROM sqlite_sequence WHERE name = 'vote_changes'")
+    ).scalar() or 0
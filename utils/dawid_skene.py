@@ -0,0 +1,371 @@
+"""
+Dawid-Skene consensus: expectation-maximization over per-user confusion
+matrices.
+
+Each user u has a confusion matrix confusion[u, true, voted] giving the
+probability that they vote ``voted`` on a note whose true class is ``true``,
+and the classes have prior probabilities. EM alternates between posterior
+class probabilities per note (E-step) and re-estimated confusion matrices
+and priors (M-step), all as array operations over the vote arrays.
+
+Fits are warm-started from the previous fit and persisted to the instance
+folder; each app serves the last persisted fit of its database and reloads
+it when the file changes. Posteriors for individual notes are computed from
+their current votes with the fitted parameters, so new votes are reflected
+immediately. Requests never refit: the parameters are re-estimated by
+``python -m utils.dawid_skene`` (e.g. from cron) or, with
+DAWID_SKENE_BACKGROUND_REFIT, by a background thread started once votes have
+changed and the fit is older than DAWID_SKENE_REFIT_INTERVAL. Until a first
+fit exists, the Dawid-Skene strategy falls back to vote shares.
+"""
+import os
+import threading
+import time
+
+import numpy as np
+from flask import current_app, g, has_request_context
+from sqlalchemy import select
+
+from models import db, Vote
+from utils.data_version import get_data_version
+from utils.probability import CLASSIFICATION_TYPES
+from utils.type_codes import stored_code
+
+NUM_CLASSES = len(CLASSIFICATION_TYPES)
+
+FIT_FILENAME = 'dawid_skene.npz'
+
+
+def _log_normalize(log_values):
+    """Normalize rows of log-probabilities; returns (probabilities, log normalizers)"""
+    peak = log_values.max(axis=1, keepdims=True)
+    values = np.exp(log_values - peak)
+    totals = values.sum(axis=1, keepdims=True)
+    return values / totals, (np.log(totals) + peak).ravel()
+
+
+class _Votes:
+    """Vote arrays sorted by note, with where each note's votes start"""
+
+    def __init__(self, note, user, label, num_notes, num_users):
+        order = np.argsort(note, kind='stable')
+        self.note = note[order]
+        self.user = user[order]
+        self.label = label[order]
+        self.num_notes = num_notes
+        self.num_users = num_users
+        self.starts = np.flatnonzero(np.r_[True, self.note[1:] != self.note[:-1]]) if len(note) else np.zeros(0, int)
+        # Flat index of confusion[user, k, label] for every vote and class k
+        self.cells = (self.user[:, None] * NUM_CLASSES * NUM_CLASSES
+                      + np.arange(NUM_CLASSES)[None, :] * NUM_CLASSES
+                      + self.label[:, None])
+
+    def e_step(self, confusion, priors):
+        """Posterior class probabilities per note and the log-likelihood"""
+        log_confusion = np.log(confusion).ravel()
+        contributions = log_confusion[self.cells]
+        log_posteriors = np.add.reduceat(contributions, self.starts, axis=0) + np.log(priors)
+        posteriors, log_normalizers = _log_normalize(log_posteriors)
+        return posteriors, float(log_normalizers.sum())
+
+    def m_step(self, posteriors, smoothing):
+        """Confusion matrices and priors maximizing the expected likelihood"""
+        weights = posteriors[self.note]
+        confusion = np.bincount(self.cells.ravel(), weights=weights.ravel(),
+                                minlength=self.num_users * NUM_CLASSES * NUM_CLASSES)
+        confusion = confusion.reshape(self.num_users, NUM_CLASSES, NUM_CLASSES) + smoothing
+        confusion /= confusion.sum(axis=2, keepdims=True)
+        priors = (posteriors.sum(axis=0) + smoothing) / (self.num_notes + NUM_CLASSES * smoothing)
+        return confusion, priors
+
+    def majority(self):
+        """Vote shares per note, used as the cold-start posterior"""
+        counts = np.bincount(self.note * NUM_CLASSES + self.label,
+                             minlength=self.num_notes * NUM_CLASSES).reshape(self.num_notes, NUM_CLASSES)
+        return counts / counts.sum(axis=1, keepdims=True)
+
+
+def fit_dawid_skene(note, user, label, num_notes, num_users, confusion=None, priors=None,
+                    max_iter=100, tol=1e-6, smoothing=0.01):
+    """
+    Fit Dawid-Skene by EM.
+
+    Args:
+        note, user, label: Dense note index, user index and class index per vote
+            (every note index below num_notes must have at least one vote)
+        num_notes, num_users: Sizes of the dense indexes
+        confusion, priors: Optional starting parameters (warm start); without
+            them EM starts from the majority-vote shares
+        max_iter: Maximum EM iterations
+        tol: Stop when the log-likelihood per vote improves by less than this
+        smoothing: Dirichlet pseudo-count added to every confusion cell and prior
+
+    Returns:
+        dict with keys: confusion, priors, posteriors, iterations,
+        log_likelihood, converged
+    """
+    votes = _Votes(note, user, label, num_notes, num_users)
+    if not len(note):
+        return {'confusion': np.full((num_users, NUM_CLASSES, NUM_CLASSES), 1.0 / NUM_CLASSES),
+                'priors': np.full(NUM_CLASSES, 1.0 / NUM_CLASSES), 'posteriors': np.zeros((0, NUM_CLASSES)),
+                'iterations': 0, 'log_likelihood': 0.0, 'converged': True}
+
+    if confusion is None or priors is None:
+        confusion, priors = votes.m_step(votes.majority(), smoothing)
+
+    posteriors, log_likelihood = votes.e_step(confusion, priors)
+    converged = False
+    iterations = 0
+    while iterations < max_iter:
+        iterations += 1
+        confusion, priors = votes.m_step(posteriors, smoothing)
+        posteriors, new_log_likelihood = votes.e_step(confusion, priors)
+        improvement = (new_log_likelihood - log_likelihood) / len(note)
+        log_likelihood = new_log_likelihood
+        if abs(improvement) < tol:
+            converged = True
+            break
+
+    return {'confusion': confusion, 'priors': priors, 'posteriors': posteriors,
+            'iterations': iterations, 'log_likelihood': log_likelihood, 'converged': converged}
+
+
+def _warm_start(previous, user_ids):
+    """Starting confusion matrices for user_ids from a previous fit"""
+    if previous is None or not len(previous['user_ids']):
+        return None, None
+    # Users new since the previous fit start from the average user
+    confusion = np.repeat(previous['default_confusion'][None], len(user_ids), axis=0)
+    known = np.isin(user_ids, previous['user_ids'])
+    positions = np.searchsorted(previous['user_ids'], user_ids[known])
+    confusion[known] = previous['confusion'][positions]
+    return confusion, previous['priors']
+
+
+def _fit_path():
+    return os.path.join(current_app.instance_path, FIT_FILENAME)
+
+
+def _database():
+    return db.engine.url.render_as_string(hide_password=True)
+
+
+def _state():
+    """The current app's fit: each app (and so each database) has its own"""
+    return current_app.extensions.setdefault('dawid_skene', {
+        'fit': None, 'mtime': None, 'lock': threading.Lock(), 'thread': None,
+    })
+
+
+def _save_fit(fit):
+    path = _fit_path()
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as f:
+        np.savez(f, database=_database(), **{key: np.asarray(value) for key, value in fit.items()})
+    os.replace(temp_path, path)
+    return os.stat(path).st_mtime
+
+
+def _load_fit():
+    path = _fit_path()
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        fit = {key: data[key] for key in data.files}
+    # Ignore fits of another database sharing the instance folder
+    if str(fit.pop('database', '')) != _database():
+        return None
+    fit['version'] = int(fit['version'])
+    fit['iterations'] = int(fit['iterations'])
+    fit['seconds'] = float(fit['seconds'])
+    return fit
+
+
+def _persisted_fit(state):
+    """The persisted fit, reloaded only when the file has changed since the last load"""
+    try:
+        mtime = os.stat(_fit_path()).st_mtime
+    except OSError:
+        mtime = None
+    if mtime != state['mtime']:
+        state['fit'] = _load_fit() if mtime is not None else None
+        state['mtime'] = mtime
+    return state['fit']
+
+
+def refit():
+    """
+    Re-estimate the model from all current votes, warm-started from the
+    previous fit, and persist it.
+
+    Returns:
+        Fit dict with keys: user_ids, confusion, default_confusion, priors,
+        version, iterations, seconds
+    """
+    from utils.agreement import load_vote_matrix
+
+    state = _state()
+    start = time.perf_counter()
+    version = get_data_version('votes')
+    matrix = load_vote_matrix()
+    with state['lock']:
+        previous = _persisted_fit(state)
+    confusion, priors = _warm_start(previous, matrix['user_ids'])
+
+    config = current_app.config
+    result = fit_dawid_skene(matrix['note'], matrix['user'], matrix['label'],
+                             len(matrix['note_ids']), len(matrix['user_ids']),
+                             confusion=confusion, priors=priors,
+                             max_iter=config.get('DAWID_SKENE_MAX_ITER', 100),
+                             tol=config.get('DAWID_SKENE_TOLERANCE', 1e-6))
+
+    # Vote-weighted average confusion, used for users the fit has not seen
+    votes_per_user = np.bincount(matrix['user'], minlength=len(matrix['user_ids']))
+    if votes_per_user.sum():
+        default_confusion = np.tensordot(votes_per_user, result['confusion'], axes=1) / votes_per_user.sum()
+    else:
+        default_confusion = np.full((NUM_CLASSES, NUM_CLASSES), 1.0 / NUM_CLASSES)
+
+    fit = {
+        'user_ids': matrix['user_ids'],
+        'confusion': result['confusion'],
+        'default_confusion': default_confusion,
+        'priors': result['priors'],
+        'version': version,
+        'iterations': result['iterations'],
+        'seconds': time.perf_counter() - start,
+    }
+    with state['lock']:
+        state['mtime'] = _save_fit(fit)
+        state['fit'] = fit
+    return fit
+
+
+def _claim_refit(interval):
+    """Claim the refit for this process; False if another worker's refit is under way"""
+    path = _fit_path() + '.refit'
+    try:
+        os.close(os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+        return True
+    except FileExistsError:
+        pass
+    try:
+        # A claim left behind by a worker that died mid-refit
+        if time.time() - os.stat(path).st_mtime < max(interval, 60):
+            return False
+        os.utime(path)
+        return True
+    except OSError:
+        return False
+
+
+def _start_background_refit(state, interval):
+    """Refit in a thread of this process unless a refit is already running somewhere"""
+    thread = state['thread']
+    if (thread is not None and thread.is_alive()) or not _claim_refit(interval):
+        return
+    app = current_app._get_current_object()
+    claim = _fit_path() + '.refit'
+
+    def run():
+        try:
+            with app.app_context():
+                fit = refit()
+            app.logger.info('Dawid-Skene refit: %d users, %d iterations, %.2fs',
+                            len(fit['user_ids']), fit['iterations'], fit['seconds'])
+        except Exception:
+            app.logger.exception('Dawid-Skene refit failed')
+        finally:
+            try:
+                os.remove(claim)
+            except OSError:
+                pass
+
+    state['thread'] = threading.Thread(target=run, name='dawid-skene-refit', daemon=True)
+    state['thread'].start()
+
+
+def get_fit():
+    """
+    Last persisted fit of this database (None before the first fit). Never
+    refits in the caller: when votes changed and the fit is older than
+    DAWID_SKENE_REFIT_INTERVAL seconds, a background refit is started if
+    DAWID_SKENE_BACKGROUND_REFIT is set. Checked once per request.
+    """
+    if has_request_context() and 'dawid_skene_fit' in g:
+        return g.dawid_skene_fit
+
+    state = _state()
+    config = current_app.config
+    interval = config.get('DAWID_SKENE_REFIT_INTERVAL') or 0
+    with state['lock']:
+        fit = _persisted_fit(state)
+        if config.get('DAWID_SKENE_BACKGROUND_REFIT'):
+            stale = fit is None or (fit['version'] != get_data_version('votes')
+                                    and time.time() - state['mtime'] >= interval)
+            if stale:
+                _start_background_refit(state, interval)
+
+    if has_request_context():
+        g.dawid_skene_fit = fit
+    return fit
+
+
+def ensure_fit():
+    """The persisted fit, fitting one now only if none exists yet (for exports)"""
+    return get_fit() or refit()
+
+
+def calculate_posteriors(note_ids):
+    """
+    Posterior class probabilities for notes from their current votes.
+
+    Args:
+        note_ids: Iterable of note IDs
+
+    Returns:
+        Dict of note_id -> array of NUM_CLASSES probabilities (CLASSIFICATION_TYPES
+        order), for notes with at least one vote; empty before the first fit,
+        so distributions fall back to vote shares
+    """
+    fit = get_fit()
+    if fit is None:
+        return {}
+    note_ids = list(set(note_ids))
+    log_confusion = np.log(fit['confusion'])
+    log_default = np.log(fit['default_confusion'])
+    log_priors = np.log(fit['priors'])
+
+    log_posteriors = {}
+    for start in range(0, len(note_ids), 500):
+        rows = db.session.execute(
+            select(Vote.note_id, Vote.user_id, stored_code(Vote.classification))
+            .where(Vote.note_id.in_(note_ids[start:start + 500]))
+        ).all()
+        if not rows:
+            continue
+        user_ids = np.array([row[1] for row in rows])
+        positions = np.searchsorted(fit['user_ids'], user_ids).clip(max=max(len(fit['user_ids']) - 1, 0))
+        known = fit['user_ids'][positions] == user_ids if len(fit['user_ids']) else np.zeros(len(rows), bool)
+
+        for (note_id, _, label), position, is_known in zip(rows, positions, known):
+            if not 0 <= label < NUM_CLASSES:
+                continue
+            column = log_confusion[position, :, label] if is_known else log_default[:, label]
+            log_posteriors[note_id] = log_posteriors.get(note_id, log_priors) + column
+
+    if not log_posteriors:
+        return {}
+    ids = list(log_posteriors)
+    posteriors, _ = _log_normalize(np.vstack([log_posteriors[note_id] for note_id in ids]))
+    return dict(zip(ids, posteriors))
+
+
+if __name__ == '__main__':
+    # Re-estimate now (e.g. from cron): python -m utils.dawid_skene
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        fit = refit()
+        print(f"Fitted {len(fit['user_ids'])} users in {fit['iterations']} iterations, {fit['seconds']:.2f}s")
@@ -0,0 +1,172 @@
+"""
+Dirichlet-multinomial posterior for consensus confidence.
+
+With a symmetric Dirichlet prior over the classifications, the posterior
+probability of the consensus class after n_c of n votes follows
+Beta(n_c + alpha, n - n_c + (K - 1) * alpha). Its mean shrinks small
+samples toward uncertainty, and its lower credible bound (a low quantile)
+only gets high once there are enough agreeing votes: one vote out of one is
+no longer "100% confident".
+
+Bounds depend only on (n_c, n), and real notes have few distinct pairs, so
+each pair is computed once in a vectorized pass and kept in a lookup table;
+reading a bound afterwards is a dictionary lookup.
+"""
+import math
+import threading
+
+import numpy as np
+
+from utils.probability import CLASSIFICATION_TYPES
+
+NUM_CLASSES = len(CLASSIFICATION_TYPES)
+
+_TINY = 1e-300
+_EPS = 1e-12
+
+_bounds = {}
+_bounds_lock = threading.Lock()
+
+
+def _lgamma(values):
+    return np.array([math.lgamma(v) for v in values.ravel()]).reshape(values.shape)
+
+
+def _continued_fraction(a, b, x, max_iter=300):
+    """Continued fraction for the regularized incomplete beta function (Lentz)"""
+    qab, qap, qam = a + b, a + 1.0, a - 1.0
+    c = np.ones_like(x)
+    d = 1.0 - qab * x / qap
+    d = 1.0 / np.where(np.abs(d) < _TINY, _TINY, d)
+    h = d.copy()
+    for m in range(1, max_iter + 1):
+        m2 = 2 * m
+        for aa in (m * (b - m) * x / ((qam + m2) * (a + m2)),
+                   -(a + m) * (qab + m) * x / ((a + m2) * (qap + m2))):
+            d = 1.0 + aa * d
+            d = 1.0 / np.where(np.abs(d) < _TINY, _TINY, d)
+            c = 1.0 + aa / c
+            c = np.where(np.abs(c) < _TINY, _TINY, c)
+            delta = d * c
+            h *= delta
+        if np.all(np.abs(delta - 1.0) < _EPS):
+            break
+    return h
+
+
+def beta_cdf(x, a, b):
+    """Regularized incomplete beta function I_x(a, b), elementwise"""
+    x, a, b = np.broadcast_arrays(np.asarray(x, float), np.asarray(a, float), np.asarray(b, float))
+    inner = np.clip(x, _TINY, 1.0 - 1e-16)
+    log_front = (_lgamma(a + b) - _lgamma(a) - _lgamma(b)
+                 + a * np.log(inner) + b * np.log1p(-inner))
+    front = np.exp(log_front)
+
+    # The continued fraction converges quickly below the mean; above it,
+    # evaluate I_{1-x}(b, a) instead and use I_x(a, b) = 1 - I_{1-x}(b, a)
+    direct = inner < (a + 1.0) / (a + b + 2.0)
+    first = np.where(direct, a, b)
+    second = np.where(direct, b, a)
+    value = front * _continued_fraction(first, second, np.where(direct, inner, 1.0 - inner)) / first
+    result = np.where(direct, value, 1.0 - value)
+    return np.where(x <= 0.0, 0.0, np.where(x >= 1.0, 1.0, result))
+
+
+def beta_quantile(q, a, b, iterations=50):
+    """Quantile of Beta(a, b) by bisection on the CDF, elementwise"""
+    a, b = np.broadcast_arrays(np.asarray(a, float), np.asarray(b, float))
+    low = np.zeros_like(a)
+    high = np.ones_like(a)
+    for _ in range(iterations):
+        middle = (low + high) / 2.0
+        below = beta_cdf(middle, a, b) < q
+        low = np.where(below, middle, low)
+        high = np.where(below, high, middle)
+    return (low + high) / 2.0
+
+
+def consensus_bounds(consensus_counts, totals, prior=1.0, quantile=0.05):
+    """
+    Posterior mean and lower credible bound of each note's consensus class.
+
+    Args:
+        consensus_counts: Votes for the consensus class, per note
+        totals: Total votes, per note
+        prior: Total Dirichlet prior concentration, spread evenly over classes
+        quantile: Lower quantile reported as the credible bound (0.05 = one-sided 95%)
+
+    Returns:
+        Tuple of arrays (posterior_mean, lower_bound)
+    """
+    consensus_counts = np.asarray(consensus_counts, dtype=np.int64)
+    totals = np.asarray(totals, dtype=np.int64)
+    alpha = prior / NUM_CLASSES
+
+    means = (consensus_counts + alpha) / (totals + prior)
+
+    pairs, inverse = np.unique(totals << 32 | consensus_counts, return_inverse=True)
+    keys = [(prior, quantile, int(pair) & 0xFFFFFFFF, int(pair) >> 32) for pair in pairs]
+    with _bounds_lock:
+        missing = [i for i, key in enumerate(keys) if key not in _bounds]
+    if missing:
+        hits, total = pairs[missing] & 0xFFFFFFFF, pairs[missing] >> 32
+        computed = beta_quantile(quantile, hits + alpha, total - hits + prior - alpha)
+        with _bounds_lock:
+            for i, value in zip(missing, computed):
+                _bounds[keys[i]] = float(value)
+
+    with _bounds_lock:
+        unique_bounds = np.array([_bounds[key] for key in keys])
+    return means, unique_bounds[inverse.ravel()]
+
+
+def consensus_bound(consensus_count, total, prior=1.0, quantile=0.05):
+    """Posterior mean and lower credible bound for a single note"""
+    key = (prior, quantile, int(consensus_count), int(total))
+    mean = (consensus_count + prior / NUM_CLASSES) / (total + prior)
+    with _bounds_lock:
+        bound = _bounds.get(key)
+    if bound is None:
+        _, bounds = consensus_bounds([consensus_count], [total], prior, quantile)
+        bound = float(bounds[0])
+    return mean, bound
+
+
+def digamma(x):
+    """Digamma function for positive arguments, elementwise"""
+    x = np.array(x, dtype=float)
+    result = np.zeros_like(x)
+    # Recurrence psi(x) = psi(x + 1) - 1/x until the asymptotic series is accurate
+    for _ in range(6):
+        small = x < 6.0
+        result -= np.where(small, 1.0 / x, 0.0)
+        x = np.where(small, x + 1.0, x)
+    inverse_square = 1.0 / (x * x)
+    return result + np.log(x) - 0.5 / x - inverse_square * (
+        1.0 / 12 - inverse_square * (1.0 / 120 - inverse_square / 252))
+
+
+def information_gain(counts, prior=1.0):
+    """
+    Expected information gained about each note's classification
+    probabilities from one more vote, in nats.
+
+    This is the mutual information between the next vote and the
+    probabilities under the Dirichlet posterior: the entropy of the
+    predicted vote minus its expected entropy given the probabilities. It
+    is highest for notes with few votes and, for the same number of votes,
+    for notes whose votes are split.
+
+    Args:
+        counts: Notes x classes matrix of vote counts (CLASSIFICATION_TYPES order)
+        prior: Total Dirichlet prior concentration, spread evenly over classes
+
+    Returns:
+        Array of gains, one per note
+    """
+    alpha = np.asarray(counts, dtype=float) + prior / NUM_CLASSES
+    total = alpha.sum(axis=1)
+    mean = alpha / total[:, None]
+    predicted_entropy = -(mean * np.log(mean)).sum(axis=1)
+    expected_entropy = digamma(total + 1.0) - (mean * digamma(alpha + 1.0)).sum(axis=1)
+    return predicted_entropy - expected_entropy
@@ -0,0 +1,109 @@
+"""
+In-process publish/subscribe fan-out for live vote updates.
+
+Each subscriber gets its own bounded queue. Publishing never blocks: when a
+subscriber falls behind, its oldest event is dropped, since every event
+carries the full current state of a note and later events supersede it.
+Subscribers only see events published in the same process.
+"""
+import json
+import queue
+import threading
+import time
+
+
+class EventBroker:
+    """Fan out events published on a channel to every subscriber queue"""
+
+    def __init__(self, max_queue_size=100):
+        self.max_queue_size = max_queue_size
+        self._channels = {}
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        """Register a new subscriber on a channel and return its queue"""
+        subscriber = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            self._channels.setdefault(channel, set()).add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, channel, subscriber):
+        """Remove a subscriber queue from a channel"""
+        with self._lock:
+            subscribers = self._channels.get(channel)
+            if subscribers:
+                subscribers.discard(subscriber)
+                if not subscribers:
+                    del self._channels[channel]
+
+    def has_subscribers(self, channel):
+        with self._lock:
+            return bool(self._channels.get(channel))
+
+    def publish(self, channel, event, data):
+        """
+        Deliver an event to every subscriber of a channel.
+
+        Returns:
+            Number of subscribers the event was delivered to
+        """
+        with self._lock:
+            subscribers = list(self._channels.get(channel, ()))
+
+        message = (event, data)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                # Drop the oldest event to make room; the newest state wins
+                try:
+                    subscriber.get_nowait()
+                except queue.Empty:
+                    pass
+                try:
+                    subscriber.put_nowait(message)
+                except queue.Full:
+                    pass
+        return len(subscribers)
+
+
+def format_sse(event, data):
+    """Format an event as a Server-Sent Events message"""
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def stream_channel(channel, heartbeat=15, max_age=None):
+    """
+    Generator yielding SSE messages for a channel until the client
+    disconnects or the stream is max_age seconds old. The browser's
+    EventSource then reconnects on its own, so a stream never holds a server
+    worker (or thread) indefinitely.
+
+    Args:
+        channel: Channel name to subscribe to
+        heartbeat: Seconds between keep-alive comments when idle
+        max_age: Seconds before the server ends the stream (None: never)
+    """
+    deadline = time.monotonic() + max_age if max_age else None
+    subscriber = broker.subscribe(channel)
+    try:
+        yield 'retry: 3000\n\n'
+        while True:
+            timeout = heartbeat
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return
+                timeout = min(timeout, remaining)
+            try:
+                event, data = subscriber.get(timeout=timeout)
+            except queue.Empty:
+                yield ': keep-alive\n\n'
+                continue
+            yield format_sse(event, data)
+    finally:
+        broker.unsubscribe(channel, subscriber)
+
+
+# Process-wide broker shared by publishers (vote routes) and SSE streams
+broker = EventBroker()
@@ -0,0 +1,308 @@
+"""
+In-process metrics registry rendered in the Prometheus text exposition format.
+
+Metrics live in module-level objects so any route or utility can record them
+without extra wiring. Each worker process keeps its own registry; a scraper
+should scrape every worker (or sum across them) when running pre-forked.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+# Latency buckets in seconds, tuned for page renders and small JSON writes
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Buckets for long-running jobs such as imports and exports
+JOB_BUCKETS = (0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+
+def _escape(value):
+    """Escape a label value for the text exposition format"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.extend(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    """Base class holding one value (or state) per label combination"""
+    type_name = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f'{self.name} expects labels {self.labelnames}, got {tuple(labels)}')
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def header(self):
+        return [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} {self.type_name}',
+        ]
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f'{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}'
+                for key, value in items]
+
+    def render(self):
+        return self.header() + self.samples()
+
+
+class Counter(_Metric):
+    """Monotonically increasing counter"""
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def get(self, **labels):
+        with self._lock:
+            return self._values.get(self._key(labels), 0)
+
+
+class Gauge(_Metric):
+    """Value that can go up and down"""
+    type_name = 'gauge'
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(_Metric):
+    """Cumulative histogram with fixed upper bounds"""
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float('inf'),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = {'counts': [0] * len(self.buckets), 'sum': 0.0, 'count': 0}
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state['counts'][i] += 1
+                    break
+            state['sum'] += value
+            state['count'] += 1
+
+    @contextmanager
+    def time(self, **labels):
+        """Observe the wall-clock duration of the enclosed block"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        with self._lock:
+            items = sorted((key, dict(state, counts=list(state['counts'])))
+                           for key, state in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state['counts']):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, [('le', _format_value(float(bound)))])
+                lines.append(f'{self.name}_bucket{labels} {cumulative}')
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f'{self.name}_sum{labels} {_format_value(state["sum"])}')
+            lines.append(f'{self.name}_count{labels} {state["count"]}')
+        return lines
+
+
+class Registry:
+    """Ordered collection of metrics rendered together"""
+
+    def __init__(self):
+        self._metrics = []
+        self._collectors = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector):
+        """Register a callable run just before rendering (for derived gauges)"""
+        self._collectors.append(collector)
+
+    def render(self):
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = Registry()
+
+# HTTP
+REQUEST_LATENCY = REGISTRY.register(Histogram(
+    'classification_http_request_duration_seconds',
+    'Request latency by blueprint and endpoint',
+    ('blueprint', 'endpoint', 'method'),
+))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    'classification_http_requests_total',
+    'Requests handled by blueprint, endpoint and status code',
+    ('blueprint', 'endpoint', 'status'),
+))
+
+# Voting
+VOTES_TOTAL = REGISTRY.register(Counter(
+    'classification_votes_total',
+    'Votes written by submission path and whether the vote was created or updated',
+    ('path', 'action'),
+))
+
+# Import / export
+IMPORT_DURATION = REGISTRY.register(Histogram(
+    'classification_import_duration_seconds',
+    'Duration of XML imports',
+    buckets=JOB_BUCKETS,
+))
+IMPORT_ROWS = REGISTRY.register(Counter(
+    'classification_import_rows_total',
+    'Rows created by XML imports',
+    ('kind',),
+))
+IMPORT_ERRORS = REGISTRY.register(Counter(
+    'classification_import_errors_total',
+    'Errors reported by XML imports',
+))
+EXPORT_DURATION = REGISTRY.register(Histogram(
+    'classification_export_duration_seconds',
+    'Duration of XML exports',
+    buckets=JOB_BUCKETS,
+))
+EXPORT_ROWS = REGISTRY.register(Counter(
+    'classification_export_rows_total',
+    'Rows written by XML exports',
+    ('kind',),
+))
+
+# SQLite contention
+SQLITE_BUSY_RETRIES = REGISTRY.register(Counter(
+    'classification_sqlite_busy_retries_total',
+    'Write attempts retried after SQLITE_BUSY / database is locked',
+    ('operation',),
+))
+SQLITE_LOCK_ERRORS = REGISTRY.register(Counter(
+    'classification_sqlite_lock_errors_total',
+    'Writes that failed with SQLITE_BUSY / database is locked',
+    ('operation',),
+))
+
+# Caches
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    'classification_cache_requests_total',
+    'Cache lookups by cache name and result',
+    ('cache', 'result'),
+))
+CACHE_HIT_RATIO = REGISTRY.register(Gauge(
+    'classification_cache_hit_ratio',
+    'Fraction of cache lookups served from the cache',
+    ('cache',),
+))
+
+# Startup
+STARTUP_DURATION = REGISTRY.register(Gauge(
+    'classification_app_startup_seconds',
+    'Time spent in create_app, in total and by phase',
+    ('phase',),
+))
+
+
+def record_cache_lookup(cache, hit):
+    """Count a cache lookup as a hit or a miss"""
+    CACHE_REQUESTS.inc(cache=cache, result='hit' if hit else 'miss')
+
+
+def _update_cache_hit_ratios():
+    with CACHE_REQUESTS._lock:
+        values = dict(CACHE_REQUESTS._values)
+    caches = {cache for cache, _ in values}
+    for cache in caches:
+        hits = values.get((cache, 'hit'), 0)
+        total = hits + values.get((cache, 'miss'), 0)
+        CACHE_HIT_RATIO.set(hits / total if total else 0.0, cache=cache)
+
+
+REGISTRY.add_collector(_update_cache_hit_ratios)
+
+
+def is_lock_error(error):
+    """True if an exception is SQLite reporting a busy or locked database"""
+    message = str(error).lower()
+    return 'database is locked' in message or 'database is busy' in message or 'sqlite_busy' in message
+
+
+def init_app(app):
+    """Time every request and count it by blueprint, endpoint and status"""
+    from flask import g, request
+
+    def record(start, status):
+        blueprint = request.blueprint or 'app'
+        endpoint = request.endpoint or 'unmatched'
+        REQUEST_LATENCY.observe(time.perf_counter() - start,
+                                blueprint=blueprint, endpoint=endpoint, method=request.method)
+        REQUESTS_TOTAL.inc(blueprint=blueprint, endpoint=endpoint, status=status)
+
+    @app.before_request
+    def _start_timer():
+        g._metrics_start = time.perf_counter()
+
+    @app.after_request
+    def _record_request(response):
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            record(start, response.status_code)
+        return response
+
+    @app.teardown_request
+    def _record_failed_request(error):
+        # after_request is skipped when an unhandled exception propagates
+        # (PROPAGATE_EXCEPTIONS, or an error raised by another after_request
+        # hook); the request still failed, so count it as a 500
+        start = g.pop('_metrics_start', None)
+        if start is not None:
+            record(start, 500)
@@ -0,0 +1,195 @@
+"""
+Uncertainty-prioritized queue of notes to classify next.
+
+Every note stores a priority: the expected information gain of one more
+vote (see utils.dirichlet.information_gain), so notes with few or split
+votes come first, weighted up for large near-duplicate clusters, where a
+vote can be applied to the whole cluster with "vote on similar notes".
+
+The priority column is indexed, so the queue is the index itself: a
+user's next note is found by walking it from the top, skipping notes they
+have already voted on, one index seek each. write_votes() updates the
+priorities of the notes it touched in the same transaction, so the queue
+follows every vote in every worker. Imports recompute every priority with
+refresh_priorities(); notes still without one (after a migration, a merge or
+an import outside the app) are filled in a batch at a time from their own
+votes when the queue is used, never with a scan of every vote.
+"""
+import numpy as np
+from sqlalchemy import bindparam, exists, func, select, update
+
+from models import db, Note, Record, Vote
+from utils.dirichlet import information_gain
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import run_in_transaction
+from utils.type_codes import stored_code
+
+# Chunk size for IN (...) queries and bulk updates
+_CHUNK = 400
+
+# Notes without a priority filled in per use of the queue
+_FILL_BATCH = 2000
+
+
+def note_priorities(counts, group_sizes, prior=1.0):
+    """
+    Queue priority per note.
+
+    Args:
+        counts: Notes x classes matrix of vote counts (CLASSIFICATION_TYPES order)
+        group_sizes: Near-duplicate cluster size per note (1 if not clustered)
+        prior: Total Dirichlet prior concentration
+
+    Returns:
+        Array of priorities (higher is classified sooner)
+    """
+    return information_gain(counts, prior) * (1.0 + np.log(np.maximum(group_sizes, 1)))
+
+
+def _write_priorities(connection, note_ids, priorities):
+    notes = Note.__table__
+    connection.execute(
+        update(notes).where(notes.c.id == bindparam('note_id')).values(priority=bindparam('priority')),
+        [{'note_id': int(note_id), 'priority': float(priority)} for note_id, priority in zip(note_ids, priorities)]
+    )
+
+
+def update_priorities(connection, note_ids, prior=1.0):
+    """
+    Recompute the priorities of some notes from their current votes, in the
+    connection's open transaction (called by write_votes after every write).
+
+    Args:
+        connection: SQLAlchemy connection with an open transaction
+        note_ids: Iterable of note IDs
+        prior: Total Dirichlet prior concentration
+    """
+    votes, notes = Vote.__table__, Note.__table__
+    note_ids = list(set(note_ids))
+
+    for start in range(0, len(note_ids), _CHUNK):
+        chunk = note_ids[start:start + _CHUNK]
+        position = {note_id: i for i, note_id in enumerate(chunk)}
+
+        counts = np.zeros((len(chunk), len(CLASSIFICATION_TYPES)))
+        rows = connection.execute(
+            select(votes.c.note_id, stored_code(votes.c.classification), func.count())
+            .where(votes.c.note_id.in_(chunk))
+            .group_by(votes.c.note_id, votes.c.classification)
+        ).all()
+        for note_id, code, count in rows:
+            if 0 <= code < len(CLASSIFICATION_TYPES):
+                counts[position[note_id], code] = count
+
+        clusters = dict(connection.execute(
+            select(notes.c.id, notes.c.cluster_id).where(notes.c.id.in_(chunk))
+        ).all())
+        cluster_ids = {cluster_id for cluster_id in clusters.values() if cluster_id is not None}
+        sizes = dict(connection.execute(
+            select(notes.c.cluster_id, func.count())
+            .where(notes.c.cluster_id.in_(cluster_ids))
+            .group_by(notes.c.cluster_id)
+        ).all()) if cluster_ids else {}
+        group_sizes = np.array([sizes.get(clusters.get(note_id), 1) for note_id in chunk])
+
+        _write_priorities(connection, chunk, note_priorities(counts, group_sizes, prior))
+
+
+def refresh_priorities(only_missing=False, prior=None):
+    """
+    Recompute priorities for all notes in one vectorized pass (e.g. after an
+    import or clustering changed cluster sizes).
+
+    Args:
+        only_missing: Only fill in notes that have no priority yet
+        prior: Total Dirichlet prior concentration (DIRICHLET_PRIOR by default)
+
+    Returns:
+        Number of notes updated
+    """
+    from flask import current_app
+    from utils.agreement import class_counts, load_vote_matrix
+
+    if prior is None:
+        prior = current_app.config.get('DIRICHLET_PRIOR', 1.0)
+
+    query = select(Note.id, Note.cluster_id)
+    if only_missing:
+        query = query.where(Note.priority.is_(None))
+    rows = db.session.execute(query.order_by(Note.id)).all()
+    if not rows:
+        return 0
+    note_ids = np.array([note_id for note_id, _ in rows])
+
+    sizes = dict(db.session.execute(
+        select(Note.cluster_id, func.count()).where(Note.cluster_id.isnot(None)).group_by(Note.cluster_id)
+    ).all())
+    group_sizes = np.array([sizes.get(cluster_id, 1) for _, cluster_id in rows])
+
+    matrix = load_vote_matrix()
+    voted = class_counts(matrix['note'], matrix['label'], len(matrix['note_ids']))
+    counts = np.zeros((len(note_ids), len(CLASSIFICATION_TYPES)))
+    positions = np.searchsorted(matrix['note_ids'], note_ids).clip(max=max(len(matrix['note_ids']) - 1, 0))
+    has_votes = matrix['note_ids'][positions] == note_ids if len(matrix['note_ids']) else np.zeros(len(note_ids), bool)
+    counts[has_votes] = voted[positions[has_votes]]
+
+    priorities = note_priorities(counts, group_sizes, prior)
+    for start in range(0, len(note_ids), 10000):
+        chunk = slice(start, start + 10000)
+        run_in_transaction('priority', lambda: _write_priorities(
+            db.session.connection(), note_ids[chunk], priorities[chunk]))
+    return len(note_ids)
+
+
+def fill_missing_priorities(limit=None, prior=None):
+    """
+    Compute priorities for notes that have none, from those notes' own votes.
+
+    Args:
+        limit: At most this many notes (all of them if None)
+        prior: Total Dirichlet prior concentration (DIRICHLET_PRIOR by default)
+
+    Returns:
+        Number of notes updated
+    """
+    from flask import current_app
+
+    if prior is None:
+        prior = current_app.config.get('DIRICHLET_PRIOR', 1.0)
+
+    query = select(Note.id).where(Note.priority.is_(None)).order_by(Note.id)
+    if limit is not None:
+        query = query.limit(limit)
+    note_ids = db.session.execute(query).scalars().all()
+    if note_ids:
+        run_in_transaction('priority', lambda: update_priorities(db.session.connection(), note_ids, prior))
+    return len(note_ids)
+
+
+def next_record_for_user(user_id, exclude_record_id=None):
+    """
+    Record holding the highest-priority note the user has not voted on.
+
+    Args:
+        user_id: ID of the user
+        exclude_record_id: Skip notes of this record (e.g. the one being viewed)
+
+    Returns:
+        bib_id of the record, or None if the user has voted on every note
+    """
+    fill_missing_priorities(limit=_FILL_BATCH)
+
+    query = select(Record.bib_id).select_from(Note).join(Record, Record.id == Note.record_id)\
+        .where(~exists().where(Vote.note_id == Note.id, Vote.user_id == user_id))
+    if exclude_record_id is not None:
+        query = query.where(Note.record_id != exclude_record_id)
+    return db.session.execute(query.order_by(Note.priority.desc(), Note.id).limit(1)).scalar()
+
+
+if __name__ == '__main__':
+    # Recompute every priority: python -m utils.priority
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        print(f"Updated priorities for {refresh_priorities()} notes")
@@ -1,15 +1,36 @@
 from collections import Counter
-from models import Vote, Setting
 
-# Classification types in priority order for tie-breaking
-CLASSIFICATION_TYPES = ['w', 'o', 'a', 'ow', 'aw', 'ao', '?']
+from flask import current_app
+from sqlalchemy import func, select
 
-def calculate_vote_distribution(note_id):
+from models import db, User, Vote, Setting
+from utils.storage import run_in_transaction
+from utils.type_codes import LETTERS
+
+# Classification types in priority order for tie-breaking (config/type_codes.yaml);
+# a type's position is its stored integer code
+CLASSIFICATION_TYPES = LETTERS
+
+# How consensus is derived from votes:
+#   majority    - most votes wins, probabilities are vote shares
+#   dawid_skene - posterior of a Dawid-Skene model that weighs each user by
+#                 their estimated reliability (see utils/dawid_skene.py)
+CONSENSUS_STRATEGIES = ['majority', 'dawid_skene']
+
+# What the contentious threshold and the export cutoff compare against:
+#   proportion  - consensus_probability (vote share or model posterior)
+#   lower_bound - lower credible bound of the consensus class under a
+#                 Dirichlet-multinomial posterior (see utils/dirichlet.py),
+#                 so notes with few votes are not treated as certain
+CONFIDENCE_MEASURES = ['proportion', 'lower_bound']
+
+def calculate_vote_distribution(note_id, strategy='majority'):
     """
     Calculate vote distribution and consensus for a note.
 
     Args:
         note_id: ID of the note to calculate distribution for
+        strategy: Consensus strategy (one of CONSENSUS_STRATEGIES)
 
     Returns:
         dict with keys:
@@ -18,43 +39,158 @@ def calculate_vote_distribution(note_id):
             - probabilities: Dict of classification -> probability (e.g., {'w': 0.60, 'o': 0.40})
             - consensus: Classification with highest votes (None if no votes)
             - consensus_probability: Probability of consensus classification
-            - is_contentious: True if consensus is below threshold with min votes
+            - posterior_mean: Dirichlet posterior mean of the consensus classification
+            - lower_bound: Dirichlet lower credible bound of the consensus classification
+            - confidence: consensus_probability or lower_bound, per the confidence measure
+            - is_contentious: True if confidence is below threshold with min votes
     """
-    votes = Vote.query.filter_by(note_id=note_id).all()
+    if strategy == 'dawid_skene':
+        return calculate_vote_distributions([note_id], strategy)[note_id]
+
+    # Vote counts from the in-memory store (see utils/vote_store.py)
+    from utils.vote_store import get_vote_store
+    vote_counts = get_vote_store().vote_counts(note_id)
+
+    return build_distribution(vote_counts)
+
+
+def calculate_vote_distributions(note_ids, strategy='majority', counts=None):
+    """
+    Calculate vote distributions for many notes at once.
+
+    Args:
+        note_ids: Iterable of note IDs
+        strategy: Consensus strategy (one of CONSENSUS_STRATEGIES)
+        counts: Dict of note_id -> vote counts (e.g. from count_votes);
+            read from the in-memory vote store if None
 
-    if not votes:
+    Returns:
+        Dict of note_id -> distribution dict (same shape as calculate_vote_distribution)
+    """
+    note_ids = list(set(note_ids))
+    if counts is None:
+        from utils.vote_store import get_vote_store
+        store = get_vote_store()
+        counts = {note_id: store.vote_counts(note_id) for note_id in note_ids}
+    else:
+        counts = {note_id: counts.get(note_id, Counter()) for note_id in note_ids}
+
+    threshold = get_contentious_threshold()
+    min_votes = get_min_votes_for_contentious()
+    measure = get_confidence_measure()
+
+    # Credible bounds for every (count, total) pair in one vectorized pass;
+    # build_distribution then only looks them up
+    from utils.dirichlet import consensus_bounds
+    hits, totals = [], []
+    for vote_counts in counts.values():
+        total = sum(vote_counts.values())
+        for count in [0, *vote_counts.values()]:
+            hits.append(count)
+            totals.append(total)
+    if hits:
+        consensus_bounds(hits, totals, **dirichlet_parameters())
+
+    posteriors = {}
+    if strategy == 'dawid_skene':
+        from utils.dawid_skene import calculate_posteriors
+        posteriors = calculate_posteriors(note_ids)
+
+    return {note_id: build_distribution(vote_counts, threshold, min_votes, posteriors.get(note_id), measure)
+            for note_id, vote_counts in counts.items()}
+
+
+def count_votes(note_ids):
+    """
+    Vote counts for notes straight from the votes table, for processes
+    without a vote store (e.g. export workers).
+
+    Returns:
+        Dict of note_id -> Counter of classification -> count
+    """
+    from models import db
+
+    note_ids = list(set(note_ids))
+    counts = {note_id: Counter() for note_id in note_ids}
+    for start in range(0, len(note_ids), 500):
+        rows = db.session.execute(
+            select(Vote.note_id, Vote.classification, func.count())
+            .where(Vote.note_id.in_(note_ids[start:start + 500]))
+            .group_by(Vote.note_id, Vote.classification)
+        ).all()
+        for note_id, classification, count in rows:
+            if classification in CLASSIFICATION_TYPES:
+                counts[note_id][classification] = count
+    return counts
+
+
+def build_distribution(vote_counts, threshold=None, min_votes=None, posterior=None, measure=None):
+    """
+    Build a distribution dict from classification counts.
+
+    Args:
+        vote_counts: Counter (or dict) of classification -> count
+        threshold: Contentious threshold (read from settings if None)
+        min_votes: Minimum votes before a note can be contentious (read from settings if None)
+        posterior: Optional class probabilities in CLASSIFICATION_TYPES order
+            (e.g. from Dawid-Skene) used instead of vote shares
+        measure: Confidence measure (one of CONFIDENCE_MEASURES, read from settings if None)
+
+    Returns:
+        Distribution dict as described in calculate_vote_distribution
+    """
+    total_votes = sum(vote_counts.values())
+
+    if not total_votes:
         return {
             'votes': {},
             'total': 0,
             'probabilities': {},
             'consensus': None,
             'consensus_probability': 0.0,
+            'posterior_mean': 0.0,
+            'lower_bound': 0.0,
+            'confidence': 0.0,
             'is_contentious': False
         }
 
-    # Count votes by classification
-    vote_counts = Counter([v.classification for v in votes])
-    total_votes = len(votes)
+    if posterior is not None:
+        # Model posterior: every class gets a probability, consensus is the most probable
+        probabilities = {
+            classification: float(posterior[i])
+            for i, classification in enumerate(CLASSIFICATION_TYPES)
+        }
+        consensus = max(CLASSIFICATION_TYPES, key=lambda c: (probabilities[c], -CLASSIFICATION_TYPES.index(c)))
+        consensus_probability = probabilities[consensus]
+    else:
+        # Calculate probabilities
+        probabilities = {
+            classification: count / total_votes
+            for classification, count in vote_counts.items()
+        }
 
-    # Calculate probabilities
-    probabilities = {
-        classification: count / total_votes
-        for classification, count in vote_counts.items()
-    }
+        # Determine consensus (highest vote count, break ties alphabetically by priority)
+        # Sort by count (descending), then by priority order (ascending)
+        sorted_classifications = sorted(
+            vote_counts.items(),
+            key=lambda x: (-x[1], CLASSIFICATION_TYPES.index(x[0]) if x[0] in CLASSIFICATION_TYPES else 999)
+        )
+        consensus = sorted_classifications[0][0]
+        consensus_probability = probabilities[consensus]
 
-    # Determine consensus (highest vote count, break ties alphabetically by priority)
-    # Sort by count (descending), then by priority order (ascending)
-    sorted_classifications = sorted(
-        vote_counts.items(),
-        key=lambda x: (-x[1], CLASSIFICATION_TYPES.index(x[0]) if x[0] in CLASSIFICATION_TYPES else 999)
-    )
-    consensus = sorted_classifications[0][0]
-    consensus_probability = probabilities[consensus]
+    from utils.dirichlet import consensus_bound
+    posterior_mean, lower_bound = consensus_bound(vote_counts.get(consensus, 0), total_votes,
+                                                  **dirichlet_parameters())
 
     # Check if contentious
-    threshold = get_contentious_threshold()
-    min_votes = get_min_votes_for_contentious()
-    is_contentious = (total_votes >= min_votes and consensus_probability < threshold)
+    if threshold is None:
+        threshold = get_contentious_threshold()
+    if min_votes is None:
+        min_votes = get_min_votes_for_contentious()
+    if measure is None:
+        measure = get_confidence_measure()
+    confidence = lower_bound if measure == 'lower_bound' else consensus_probability
+    is_contentious = (total_votes >= min_votes and confidence < threshold)
 
     return {
         'votes': dict(vote_counts),
@@ -62,10 +198,21 @@ def calculate_vote_distribution(note_id):
         'probabilities': probabilities,
         'consensus': consensus,
         'consensus_probability': consensus_probability,
+        'posterior_mean': posterior_mean,
+        'lower_bound': lower_bound,
+        'confidence': confidence,
         'is_contentious': is_contentious
     }
 
 
+def dirichlet_parameters():
+    """Prior concentration and lower quantile for credible bounds, from config"""
+    return {
+        'prior': current_app.config.get('DIRICHLET_PRIOR', 1.0),
+        'quantile': current_app.config.get('DIRICHLET_LOWER_QUANTILE', 0.05),
+    }
+
+
 def get_contentious_threshold():
     """Get contentious threshold from settings table (default 0.70)"""
     setting = Setting.query.filter_by(key='contentious_threshold').first()
@@ -100,18 +247,19 @@ def update_contentious_threshold(new_threshold):
     if not 0 < new_threshold < 1:
         raise ValueError("Threshold must be between 0 and 1")
 
-    setting = Setting.query.filter_by(key='contentious_threshold').first()
-    if not setting:
-        setting = Setting(
-            key='contentious_threshold',
-            value=str(new_threshold),
-            description='Minimum consensus probability to avoid contentious marking'
-        )
-        db.session.add(setting)
-    else:
-        setting.value = str(new_threshold)
+    def update():
+        setting = Setting.query.filter_by(key='contentious_threshold').first()
+        if not setting:
+            setting = Setting(
+                key='contentious_threshold',
+                value=str(new_threshold),
+                description='Minimum consensus probability to avoid contentious marking'
+            )
+            db.session.add(setting)
+        else:
+            setting.value = str(new_threshold)
 
-    db.session.commit()
+    run_in_transaction('settings', update)
 
 
 def update_min_votes_for_contentious(new_min_votes):
@@ -126,18 +274,89 @@ def update_min_votes_for_contentious(new_min_votes):
     if new_min_votes < 1:
         raise ValueError("Minimum votes must be at least 1")
 
-    setting = Setting.query.filter_by(key='min_votes_contentious').first()
-    if not setting:
-        setting = Setting(
-            key='min_votes_contentious',
-            value=str(new_min_votes),
-            description='Minimum number of votes required before marking as contentious'
-        )
-        db.session.add(setting)
-    else:
-        setting.value = str(new_min_votes)
+    def update():
+        setting = Setting.query.filter_by(key='min_votes_contentious').first()
+        if not setting:
+            setting = Setting(
+                key='min_votes_contentious',
+                value=str(new_min_votes),
+                description='Minimum number of votes required before marking as contentious'
+            )
+            db.session.add(setting)
+        else:
+            setting.value = str(new_min_votes)
+
+    run_in_transaction('settings', update)
+
+
+def get_consensus_strategy():
+    """Get the consensus strategy used by exports and filters (default 'majority')"""
+    setting = Setting.query.filter_by(key='consensus_strategy').first()
+    if setting and setting.value in CONSENSUS_STRATEGIES:
+        return setting.value
+    return 'majority'
+
+
+def update_consensus_strategy(strategy):
+    """
+    Update the consensus strategy setting.
+
+    Args:
+        strategy: One of CONSENSUS_STRATEGIES
+    """
+    from models import db
+
+    if strategy not in CONSENSUS_STRATEGIES:
+        raise ValueError(f"Strategy must be one of {', '.join(CONSENSUS_STRATEGIES)}")
+
+    def update():
+        setting = Setting.query.filter_by(key='consensus_strategy').first()
+        if not setting:
+            setting = Setting(
+                key='consensus_strategy',
+                value=strategy,
+                description='How exports and filters derive consensus from votes'
+            )
+            db.session.add(setting)
+        else:
+            setting.value = strategy
+
+    run_in_transaction('settings', update)
+
+
+def get_confidence_measure():
+    """Get the confidence measure used by the contentious test and exports (default 'proportion')"""
+    setting = Setting.query.filter_by(key='confidence_measure').first()
+    if setting and setting.value in CONFIDENCE_MEASURES:
+        return setting.value
+    return 'proportion'
+
+
+def update_confidence_measure(measure):
+    """
+    Update the confidence measure setting.
 
-    db.session.commit()
+    Args:
+        measure: One of CONFIDENCE_MEASURES
+    """
+    from models import db
+
+    if measure not in CONFIDENCE_MEASURES:
+        raise ValueError(f"Confidence measure must be one of {', '.join(CONFIDENCE_MEASURES)}")
+
+    def update():
+        setting = Setting.query.filter_by(key='confidence_measure').first()
+        if not setting:
+            setting = Setting(
+                key='confidence_measure',
+                value=measure,
+                description='What the contentious threshold and export cutoff compare against'
+            )
+            db.session.add(setting)
+        else:
+            setting.value = measure
+
+    run_in_transaction('settings', update)
 
 
 def get_user_vote_for_note(user_id, note_id):
@@ -155,6 +374,46 @@ def get_user_vote_for_note(user_id, note_id):
     return vote.classification if vote else None
 
 
+def get_note_voters(note_id):
+    """
+    Get the usernames of everyone who voted on a note, grouped by classification.
+
+    Args:
+        note_id: ID of the note
+
+    Returns:
+        Dict of classification -> list of usernames
+    """
+    votes = Vote.query.filter_by(note_id=note_id).all()
+    voters = {}
+    for vote in votes:
+        if vote.classification not in voters:
+            voters[vote.classification] = []
+        voters[vote.classification].append(vote.user.username)
+    return voters
+
+
+def get_notes_voters(note_ids):
+    """
+    Voters of several notes in one query (same shape as get_note_voters).
+
+    Returns:
+        Dict of note_id -> dict of classification -> list of usernames
+    """
+    voters = {note_id: {} for note_id in note_ids}
+    if not voters:
+        return voters
+    rows = db.session.execute(
+        select(Vote.note_id, Vote.classification, User.username)
+        .join(User, User.id == Vote.user_id)
+        .where(Vote.note_id.in_(list(voters)))
+        .order_by(Vote.id)
+    ).all()
+    for note_id, classification, username in rows:
+        voters[note_id].setdefault(classification, []).append(username)
+    return voters
+
+
 def format_vote_display(distribution):
     """
     Format vote distribution for UI display.
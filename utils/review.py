@@ -0,0 +1,202 @@
+"""
+Review of consensus classifications before export.
+
+A note waits for review when its consensus clears the export threshold and
+nobody has reviewed that consensus yet: it has no review, or its latest
+review was of a classification the votes have since moved away from.
+Reviewers approve or reject a page of the queue at once with one bulk
+upsert into reviews, and exports can keep only approved notes or leave out
+rejected ones.
+
+The queue is computed for every note at once: consensus and confidence
+come from the in-memory vote counts as numpy arrays, and the latest review
+of each note from one windowed query, so a page costs about the same at
+100,000 notes as at 100.
+"""
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Note, Record, Review
+from utils.probability import CLASSIFICATION_TYPES, calculate_vote_distributions, dirichlet_parameters, \
+    get_confidence_measure, get_consensus_strategy
+from utils.storage import run_in_connection
+from utils.type_codes import CODES
+
+# Review actions and the approval each stores
+APPROVALS = {'approve': 'y', 'reject': 'n'}
+
+# Export filters on approval:
+#   approved     - only notes whose latest review approved their current consensus
+#   not_rejected - every note except those whose latest review rejected it
+APPROVAL_FILTERS = ['approved', 'not_rejected']
+
+
+def latest_reviews(note_ids=None):
+    """
+    Latest review of each reviewed note (of all notes if note_ids is None).
+
+    Returns:
+        Dict of note_id -> (approval, reviewed classification)
+    """
+    def query(where=None):
+        # Rank each note's reviews newest first (ties to the later review) and keep the first
+        ranked = select(Review.note_id, Review.approval, Review.classification,
+                        func.row_number().over(partition_by=Review.note_id,
+                                               order_by=(Review.reviewed_at.desc(), Review.id.desc()))
+                        .label('position'))
+        if where is not None:
+            ranked = ranked.where(where)
+        ranked = ranked.subquery()
+        return select(ranked.c.note_id, ranked.c.approval, ranked.c.classification).where(ranked.c.position == 1)
+
+    if note_ids is None:
+        rows = db.session.execute(query()).all()
+    else:
+        note_ids = list(note_ids)
+        rows = []
+        for start in range(0, len(note_ids), 500):
+            rows.extend(db.session.execute(query(Review.note_id.in_(note_ids[start:start + 500]))).all())
+    return {note_id: (approval, classification) for note_id, approval, classification in rows}
+
+
+def approval_allows(approval_filter, review, consensus):
+    """Whether a note passes an export approval filter, given its latest review and current consensus"""
+    if approval_filter is None:
+        return True
+    current = review is not None and review[1] == consensus
+    if approval_filter == 'approved':
+        return current and review[0] == 'y'
+    return not (current and review[0] == 'n')
+
+
+def consensus_arrays(strategy=None):
+    """
+    Consensus of every voted note.
+
+    Returns:
+        (note IDs, consensus class indices into CLASSIFICATION_TYPES,
+        confidence) as arrays, in note ID order
+    """
+    from utils.vote_store import get_vote_store
+
+    if strategy is None:
+        strategy = get_consensus_strategy()
+    counts = get_vote_store().counts
+    totals = counts.sum(axis=1, dtype=np.int64)
+    note_ids = np.flatnonzero(totals)
+
+    if strategy == 'dawid_skene':
+        distributions = calculate_vote_distributions(note_ids.tolist(), strategy)
+        consensus = np.array([CLASSIFICATION_TYPES.index(distributions[note_id]['consensus'])
+                              for note_id in note_ids.tolist()], dtype=np.int64)
+        confidence = np.array([distributions[note_id]['confidence'] for note_id in note_ids.tolist()])
+        return note_ids, consensus, confidence
+
+    # Majority: ties go to the class listed first, as in build_distribution
+    voted = counts[note_ids]
+    consensus = voted.argmax(axis=1)
+    hits = voted[np.arange(len(note_ids)), consensus].astype(np.int64)
+    totals = totals[note_ids]
+    if get_confidence_measure() == 'lower_bound':
+        from utils.dirichlet import consensus_bounds
+        confidence = consensus_bounds(hits, totals, **dirichlet_parameters())[1]
+    else:
+        confidence = hits / totals
+    return note_ids, consensus, confidence
+
+
+def review_queue(threshold, after=0, per_page=50, strategy=None):
+    """
+    One page of the review queue, in note ID order.
+
+    Args:
+        threshold: Export confidence threshold a consensus must clear
+        after: Cursor: only notes with a higher ID (0 = first page)
+        per_page: Notes per page
+        strategy: Consensus strategy (the consensus_strategy setting if None)
+
+    Returns:
+        dict with keys:
+            - notes: List of note dicts (id, bib, title, index, text, distribution)
+            - total: Notes waiting for review
+            - remaining: Notes after the cursor, this page included
+            - next_after: Cursor of the next page (None on the last page)
+    """
+    if strategy is None:
+        strategy = get_consensus_strategy()
+    note_ids, consensus, confidence = consensus_arrays(strategy)
+    waiting = confidence >= threshold
+
+    # Drop notes whose latest review is of the consensus they have now
+    reviews = latest_reviews()
+    if reviews:
+        size = max(int(note_ids[-1]) + 1 if len(note_ids) else 0, max(reviews) + 1)
+        reviewed = np.full(size, -1, dtype=np.int64)
+        reviewed[np.fromiter(reviews, dtype=np.int64, count=len(reviews))] = np.fromiter(
+            (CODES.get(classification, -1) for _, classification in reviews.values()), dtype=np.int64, count=len(reviews))
+        waiting &= reviewed[note_ids] != consensus
+
+    queue = note_ids[waiting]
+    start = int(np.searchsorted(queue, after, side='right'))
+    page = queue[start:start + per_page].tolist()
+
+    rows = db.session.execute(
+        select(Note.id, Note.note_index, Note.text, Record.bib_id, Record.title)
+        .join(Record, Note.record_id == Record.id)
+        .where(Note.id.in_(page))
+    ).all() if page else []
+    by_id = {row.id: row for row in rows}
+    distributions = calculate_vote_distributions(page, strategy) if page else {}
+
+    notes = [{
+        'id': note_id,
+        'bib': by_id[note_id].bib_id,
+        'title': by_id[note_id].title,
+        'index': by_id[note_id].note_index,
+        'text': by_id[note_id].text,
+        'distribution': distributions[note_id],
+    } for note_id in page if note_id in by_id]
+
+    return {
+        'notes': notes,
+        'total': len(queue),
+        'remaining': len(queue) - start,
+        'next_after': page[-1] if start + per_page < len(queue) else None,
+    }
+
+
+def save_reviews(user_id, reviews, action):
+    """
+    Approve or reject many notes in one upsert (one review per user and note).
+
+    Args:
+        user_id: ID of the reviewer
+        reviews: List of (note_id, classification): the consensus the
+            reviewer was shown for each note
+        action: 'approve' or 'reject'
+
+    Returns:
+        Number of notes reviewed
+    """
+    if action not in APPROVALS:
+        raise ValueError(f'Unknown review action: {action}')
+    now = datetime.utcnow()
+    rows = [{'note_id': note_id, 'user_id': user_id, 'approval': APPROVALS[action],
+             'classification': classification, 'reviewed_at': now}
+            for note_id, classification in reviews]
+    if not rows:
+        return 0
+
+    reviews_table = Review.__table__
+    statement = sqlite_insert(reviews_table)
+    statement = statement.on_conflict_do_update(
+        index_elements=[reviews_table.c.note_id, reviews_table.c.user_id],
+        set_={'approval': statement.excluded.approval,
+              'classification': statement.excluded.classification,
+              'reviewed_at': statement.excluded.reviewed_at},
+    )
+    run_in_connection('review', lambda connection: connection.execute(statement, rows))
+    return len(rows)
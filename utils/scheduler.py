@@ -0,0 +1,210 @@
+"""
+Redundancy-aware assignment of notes to classifiers.
+
+Instead of every classifier walking the same queue, each one leases a
+small batch of notes for LEASE_TTL seconds. A note is only leased while its
+votes plus active leases are below TARGET_VOTES_PER_NOTE, so concurrent
+classifiers spread out over different notes, and notes a user already
+voted on are never leased to them. Candidates are taken in queue priority
+order (see utils/priority.py).
+
+Leases live in the note_leases table, keyed by (note_id, user_id) with an
+index on expiry: renewing and releasing a lease are index lookups. A vote
+releases the voter's lease on that note (see write_votes), and expired
+leases are swept whenever a batch is granted.
+
+Triggers keep notes.claims at the note's votes plus leases, and
+idx_note_claims orders notes by (claims, priority). A grant reads the best
+batch_size notes at each claim count below the target straight from that
+index and keeps the best of them, so it never walks past notes that are
+already at the target.
+"""
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import delete, event, exists, func, select, text, tuple_
+
+from models import db, Note, NoteLease, Record, User, Vote
+from utils.storage import run_in_transaction
+
+
+# Triggers keeping notes.claims = votes + leases on the note
+CLAIM_DDL = [
+    """CREATE TRIGGER IF NOT EXISTS votes_claims_ai AFTER INSERT ON votes BEGIN
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_claims_au AFTER UPDATE OF note_id ON votes
+    WHEN old.note_id != new.note_id BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS votes_claims_ad AFTER DELETE ON votes BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_leases_claims_ai AFTER INSERT ON note_leases BEGIN
+        UPDATE notes SET claims = claims + 1 WHERE id = new.note_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_leases_claims_ad AFTER DELETE ON note_leases BEGIN
+        UPDATE notes SET claims = claims - 1 WHERE id = old.note_id;
+    END""",
+]
+
+
+def _create_claim_triggers(target, connection, **kw):
+    for statement in CLAIM_DDL:
+        connection.execute(text(statement))
+
+
+def register_claim_counts(metadata):
+    """Create the claim count triggers whenever metadata.create_all() runs"""
+    if not event.contains(metadata, 'after_create', _create_claim_triggers):
+        event.listen(metadata, 'after_create', _create_claim_triggers)
+
+
+def _config(key, default):
+    return current_app.config.get(key, default)
+
+
+def release_leases(connection, pairs):
+    """
+    Drop leases that votes have fulfilled, in the connection's open transaction.
+
+    Args:
+        connection: SQLAlchemy connection with an open transaction
+        pairs: Iterable of (note_id, user_id)
+    """
+    leases = NoteLease.__table__
+    pairs = list(pairs)
+    for start in range(0, len(pairs), 400):
+        connection.execute(
+            delete(leases).where(tuple_(leases.c.note_id, leases.c.user_id).in_(pairs[start:start + 400]))
+        )
+
+
+def _active_leases(user_id, now):
+    """Note IDs leased to the user and not voted on yet, best first"""
+    return db.session.execute(
+        select(NoteLease.note_id)
+        .join(Note, Note.id == NoteLease.note_id)
+        .where(NoteLease.user_id == user_id, NoteLease.expires_at > now,
+               ~exists().where(Vote.note_id == NoteLease.note_id, Vote.user_id == user_id))
+        .order_by(Note.priority.desc(), Note.id)
+    ).scalars().all()
+
+
+def lease_notes(user_id, batch_size=None, ttl=None, target=None):
+    """
+    The user's leased notes, granting a new batch when none are left.
+
+    Active leases are renewed, so a classifier working through a batch
+    keeps it.
+
+    Args:
+        user_id: ID of the user
+        batch_size: Notes per batch (LEASE_BATCH_SIZE by default)
+        ttl: Lease lifetime in seconds (LEASE_TTL by default)
+        target: Votes wanted per note (TARGET_VOTES_PER_NOTE by default)
+
+    Returns:
+        List of leased note IDs in priority order (empty when every note
+        the user has not voted on already has enough votes and leases)
+    """
+    batch_size = batch_size or _config('LEASE_BATCH_SIZE', 20)
+    ttl = ttl or _config('LEASE_TTL', 600)
+    target = target or _config('TARGET_VOTES_PER_NOTE', 3)
+
+    def grant():
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=ttl)
+        db.session.execute(delete(NoteLease).where(NoteLease.expires_at <= now))
+
+        note_ids = _active_leases(user_id, now)
+        if note_ids:
+            db.session.execute(
+                NoteLease.__table__.update()
+                .where(NoteLease.user_id == user_id, NoteLease.note_id.in_(note_ids))
+                .values(expires_at=expires_at)
+            )
+            return note_ids
+
+        # Drop fulfilled leases the user still holds, then fill a new batch
+        # with the best open notes: the best batch_size at each claim count
+        # below the target, each an ordered walk of idx_note_claims
+        db.session.execute(delete(NoteLease).where(NoteLease.user_id == user_id))
+        candidates = []
+        for claims in range(target):
+            candidates.extend(db.session.execute(
+                select(Note.id, Note.priority)
+                .where(Note.claims == claims,
+                       ~exists().where(Vote.note_id == Note.id, Vote.user_id == user_id))
+                .order_by(Note.priority.desc(), Note.id)
+                .limit(batch_size)
+            ).all())
+        # Same order as ORDER BY priority DESC, id (NULL priorities last)
+        candidates.sort(key=lambda note: (note.priority is None, -(note.priority or 0), note.id))
+        note_ids = [note.id for note in candidates[:batch_size]]
+        if note_ids:
+            db.session.execute(
+                NoteLease.__table__.insert(),
+                [{'note_id': note_id, 'user_id': user_id, 'expires_at': expires_at} for note_id in note_ids]
+            )
+        return note_ids
+
+    return run_in_transaction('lease', grant)
+
+
+def next_leased_record(user_id, exclude_record_id=None):
+    """
+    Record holding the user's best leased note, leasing a batch if needed.
+
+    Args:
+        user_id: ID of the user
+        exclude_record_id: Only consider notes of other records (e.g. the one being viewed)
+
+    Returns:
+        bib_id of the record, or None if nothing can be leased or every
+        leased note is on the excluded record
+    """
+    note_ids = lease_notes(user_id)
+    if not note_ids:
+        return None
+
+    records = {note_id: (record_id, bib_id) for note_id, record_id, bib_id in db.session.execute(
+        select(Note.id, Note.record_id, Record.bib_id).join(Record, Record.id == Note.record_id)
+        .where(Note.id.in_(note_ids))
+    ).all()}
+    # Leases stay until they are voted on or expire, so returning the
+    # excluded record would keep the user on it; the caller falls back to
+    # the unleased queue instead
+    other = [note_id for note_id in note_ids if records[note_id][0] != exclude_record_id]
+    return records[other[0]][1] if other else None
+
+
+def get_lease_stats():
+    """
+    Current lease state for the admin dashboard.
+
+    Returns:
+        dict with keys: active_leases, users (list of {username, leases,
+        expires_at}), target_votes, notes_at_target, ttl
+    """
+    now = datetime.utcnow()
+    target = _config('TARGET_VOTES_PER_NOTE', 3)
+
+    users = db.session.execute(
+        select(User.username, func.count(NoteLease.note_id), func.max(NoteLease.expires_at))
+        .join(NoteLease, NoteLease.user_id == User.id)
+        .where(NoteLease.expires_at > now)
+        .group_by(User.id)
+        .order_by(func.count(NoteLease.note_id).desc())
+    ).all()
+
+    voted = select(Vote.note_id).group_by(Vote.note_id).having(func.count() >= target).subquery()
+    return {
+        'active_leases': sum(count for _, count, _ in users),
+        'users': [{'username': username, 'leases': count, 'expires_at': expires_at}
+                  for username, count, expires_at in users],
+        'target_votes': target,
+        'notes_at_target': db.session.execute(select(func.count()).select_from(voted)).scalar(),
+        'ttl': _config('LEASE_TTL', 600),
+    }
@@ -0,0 +1,107 @@
+"""
+Schema setup at application startup.
+
+db.create_all() inspects every table on each start, and every worker of a
+pre-forking server repeats it. A database stamped with the newest Alembic
+revision is known to have the full schema (migrations also create the
+search index and data version triggers), so startup skips create_all()
+for it. The head revision is read straight from the migration scripts'
+``revision`` / ``down_revision`` lines, so the check does not import
+Alembic.
+
+A database created from scratch by create_all() is stamped with the head,
+so later starts take the fast path and ``flask db upgrade`` works on it.
+Anything else (a database at an older revision, or one with tables but no
+revision) is left alone: create_all() would create the tables of later
+migrations, which then fail on them, and cannot add columns to existing
+tables anyway. Such a database has to be brought to the head with
+``flask db upgrade`` first.
+"""
+import os
+import re
+
+import sqlalchemy as sa
+
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'migrations')
+
+_REVISION_LINE = re.compile(r"""^(revision|down_revision)\s*=\s*(?:'([^']*)'|"([^"]*)"|None)\s*$""", re.M)
+
+
+def migration_head(directory=MIGRATIONS_DIR):
+    """
+    Head revision of the migration scripts.
+
+    Returns:
+        Revision ID, or None if there is no single head (no scripts, a merge
+        point, or a script this parser does not understand)
+    """
+    versions = os.path.join(directory, 'versions')
+    try:
+        names = os.listdir(versions)
+    except OSError:
+        return None
+
+    revisions, parents = set(), set()
+    for name in names:
+        if not name.endswith('.py'):
+            continue
+        with open(os.path.join(versions, name), encoding='utf-8') as f:
+            found = {key: single or double for key, single, double in _REVISION_LINE.findall(f.read())}
+        if not found.get('revision') or 'down_revision' not in found:
+            return None
+        revisions.add(found['revision'])
+        if found['down_revision']:
+            parents.add(found['down_revision'])
+
+    heads = revisions - parents
+    return heads.pop() if len(heads) == 1 else None
+
+
+def database_revisions(connection):
+    """Revisions stamped in alembic_version, or None if the table does not exist"""
+    if not sa.inspect(connection).has_table('alembic_version'):
+        return None
+    return connection.execute(sa.text('SELECT version_num FROM alembic_version')).scalars().all()
+
+
+def _stamp(connection, revision):
+    connection.execute(sa.text(
+        'CREATE TABLE IF NOT EXISTS alembic_version ('
+        'version_num VARCHAR(32) NOT NULL, '
+        'CONSTRAINT alembic_version_pkc PRIMARY KEY (version_num))'
+    ))
+    connection.execute(sa.text(
+        'INSERT INTO alembic_version (version_num) '
+        'SELECT :revision WHERE NOT EXISTS (SELECT 1 FROM alembic_version)'
+    ), {'revision': revision})
+
+
+def ensure_schema(db, directory=MIGRATIONS_DIR):
+    """
+    Create the tables of an empty database and stamp it with the migration head.
+    Must run inside an app context.
+
+    Returns:
+        'current' if the database is at the head, 'created' if it was empty and
+        has been created and stamped, 'outdated' if it needs ``flask db
+        upgrade`` (it is not touched), or 'updated' if the migration head is
+        unknown and create_all() ran on an existing database
+    """
+    head = migration_head(directory)
+    with db.engine.connect() as connection:
+        stamped = database_revisions(connection)
+        empty = not sa.inspect(connection).get_table_names()
+
+    if head is not None and stamped == [head]:
+        return 'current'
+
+    if head is None:
+        # No migration scripts to compare against: create what is missing
+        db.create_all()
+        return 'created' if empty else 'updated'
+    if empty:
+        db.create_all()
+        with db.engine.begin() as connection:
+            _stamp(connection, head)
+        return 'created'
+    return 'outdated'
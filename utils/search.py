@@ -0,0 +1,234 @@
+"""
+Full-text search over note text and record titles using SQLite FTS5.
+
+The ``note_search`` virtual table holds one row per note (rowid = notes.id)
+with the note text and its record's title. Triggers on ``notes`` and
+``records`` keep it in sync with every insert, update and delete, so imports
+and any other write path need no extra work.
+"""
+import re
+
+from markupsafe import Markup, escape
+from sqlalchemy import event, or_, text
+
+from models import db, Record, Note
+from utils.probability import calculate_vote_distributions
+
+SEARCH_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS note_search USING fts5(
+        text, title, tokenize = 'unicode61 remove_diacritics 2'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS note_search_ai AFTER INSERT ON notes BEGIN
+        INSERT INTO note_search (rowid, text, title)
+        SELECT new.id, new.text, records.title FROM records WHERE records.id = new.record_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_search_au AFTER UPDATE OF text, record_id ON notes BEGIN
+        DELETE FROM note_search WHERE rowid = old.id;
+        INSERT INTO note_search (rowid, text, title)
+        SELECT new.id, new.text, records.title FROM records WHERE records.id = new.record_id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_search_ad AFTER DELETE ON notes BEGIN
+        DELETE FROM note_search WHERE rowid = old.id;
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS note_search_title_au AFTER UPDATE OF title ON records BEGIN
+        UPDATE note_search SET title = new.title
+        WHERE rowid IN (SELECT id FROM notes WHERE record_id = new.id);
+    END""",
+]
+
+BACKFILL_SQL = """
+    INSERT INTO note_search (rowid, text, title)
+    SELECT notes.id, notes.text, records.title
+    FROM notes JOIN records ON records.id = notes.record_id
+"""
+
+# Markers placed around matches by snippet(); replaced after HTML escaping
+_MARK_START = '\x02'
+_MARK_END = '\x03'
+
+# Hits scanned when filtering by consensus or contentious status
+MAX_FILTERED_HITS = 10000
+
+
+def ensure_search_index(connection):
+    """
+    Create the FTS5 table and its sync triggers if missing, backfilling
+    existing notes when the table is new.
+
+    Returns:
+        True if FTS5 is available, False otherwise
+    """
+    exists = connection.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_search'"
+    )).first() is not None
+
+    try:
+        for statement in SEARCH_DDL:
+            connection.execute(text(statement))
+    except Exception:
+        # SQLite built without FTS5; search falls back to LIKE
+        return False
+
+    if not exists:
+        connection.execute(text(BACKFILL_SQL))
+    return True
+
+
+def _create_search_index(target, connection, **kw):
+    ensure_search_index(connection)
+
+
+def register_search_index(metadata):
+    """Create the search index whenever metadata.create_all() runs"""
+    if not event.contains(metadata, 'after_create', _create_search_index):
+        event.listen(metadata, 'after_create', _create_search_index)
+
+
+def search_index_available():
+    """True if the note_search table exists in the current database"""
+    return db.session.execute(text(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'note_search'"
+    )).first() is not None
+
+
+def build_match_query(query):
+    """
+    Turn free text into a safe FTS5 MATCH expression.
+
+    Each word becomes a quoted term (all terms must match). A trailing *
+    on a word keeps prefix matching, e.g. "water*".
+    """
+    terms = []
+    for word in re.findall(r'[\w*]+', query, flags=re.UNICODE):
+        prefix = word.endswith('*')
+        word = word.strip('*')
+        if word:
+            terms.append(f'"{word}"' + ('*' if prefix else ''))
+    return ' '.join(terms)
+
+
+def _highlight(snippet):
+    """Escape a snippet and turn the match markers into <mark> tags"""
+    escaped = str(escape(snippet))
+    return Markup(escaped.replace(_MARK_START, '<mark>').replace(_MARK_END, '</mark>'))
+
+
+def _ranked_note_ids(match, limit=None, offset=0):
+    sql = "SELECT rowid FROM note_search WHERE note_search MATCH :match ORDER BY bm25(note_search, 1.0, 0.5)"
+    params = {'match': match}
+    if limit is not None:
+        sql += " LIMIT :limit OFFSET :offset"
+        params.update(limit=limit, offset=offset)
+    return [row[0] for row in db.session.execute(text(sql), params)]
+
+
+def _like_note_ids(query, limit=None, offset=0):
+    # Fallback without FTS5: unranked substring match on text or title
+    pattern = f'%{query}%'
+    q = db.session.query(Note.id).join(Record)\
+                  .filter(or_(Note.text.ilike(pattern), Record.title.ilike(pattern)))\
+                  .order_by(Record.bib_id, Note.note_index)
+    if limit is not None:
+        q = q.limit(limit).offset(offset)
+    return [row[0] for row in q.all()]
+
+
+def _snippets(note_ids, match):
+    if not match or not note_ids:
+        return {}
+    rows = db.session.execute(text(
+        f"SELECT rowid, snippet(note_search, 0, '{_MARK_START}', '{_MARK_END}', '…', 24) "
+        f"FROM note_search WHERE note_search MATCH :match AND rowid IN ({','.join(str(int(i)) for i in note_ids)})"
+    ), {'match': match})
+    return {note_id: _highlight(snippet) for note_id, snippet in rows}
+
+
+def search_notes(query, page=1, per_page=50, consensus=None, contentious=None, strategy='majority'):
+    """
+    Ranked, paginated full-text search over note text and record titles.
+
+    Args:
+        query: Free-text query
+        page: 1-based page number
+        per_page: Hits per page
+        consensus: Optional classification to require as the current consensus
+            ('none' matches notes without votes)
+        contentious: Optional bool to require contentious / non-contentious notes
+        strategy: Consensus strategy used for distributions and filters
+
+    Returns:
+        dict with keys:
+            - hits: List of hit dicts (bib, title, index, text, snippet, distribution)
+            - total: Total matching notes (after filters)
+            - page, per_page, pages
+            - truncated: True if filtering stopped after MAX_FILTERED_HITS hits
+    """
+    page = max(1, page)
+    offset = (page - 1) * per_page
+    use_fts = search_index_available()
+    match = build_match_query(query) if use_fts else None
+    truncated = False
+
+    if use_fts and not match:
+        return {'hits': [], 'total': 0, 'page': page, 'per_page': per_page, 'pages': 0, 'truncated': False}
+
+    find = (lambda **kw: _ranked_note_ids(match, **kw)) if use_fts else (lambda **kw: _like_note_ids(query, **kw))
+
+    if consensus is None and contentious is None:
+        page_ids = find(limit=per_page, offset=offset)
+        if use_fts:
+            total = db.session.execute(
+                text("SELECT count(*) FROM note_search WHERE note_search MATCH :match"), {'match': match}
+            ).scalar()
+        else:
+            total = len(find())
+        distributions = calculate_vote_distributions(page_ids, strategy)
+    else:
+        # Filter on consensus in rank order, computing distributions in chunks
+        candidate_ids = find(limit=MAX_FILTERED_HITS)
+        truncated = len(candidate_ids) == MAX_FILTERED_HITS
+        matching = []
+        distributions = {}
+        for start in range(0, len(candidate_ids), 500):
+            chunk = candidate_ids[start:start + 500]
+            chunk_distributions = calculate_vote_distributions(chunk, strategy)
+            for note_id in chunk:
+                distribution = chunk_distributions[note_id]
+                if consensus is not None and (distribution['consensus'] or 'none') != consensus:
+                    continue
+                if contentious is not None and distribution['is_contentious'] != contentious:
+                    continue
+                matching.append(note_id)
+                distributions[note_id] = distribution
+        total = len(matching)
+        page_ids = matching[offset:offset + per_page]
+
+    rows = db.session.query(Note.id, Note.note_index, Note.text, Record.bib_id, Record.title)\
+                     .join(Record)\
+                     .filter(Note.id.in_(page_ids))\
+                     .all() if page_ids else []
+    by_id = {row[0]: row for row in rows}
+    snippets = _snippets(page_ids, match)
+
+    hits = []
+    for note_id in page_ids:
+        if note_id not in by_id:
+            continue
+        _, note_index, note_text, bib_id, title = by_id[note_id]
+        hits.append({
+            'bib': bib_id,
+            'title': title,
+            'index': note_index,
+            'text': note_text,
+            'snippet': snippets.get(note_id) or note_text[:150] + ('...' if len(note_text) > 150 else ''),
+            'distribution': distributions[note_id]
+        })
+
+    return {
+        'hits': hits,
+        'total': total,
+        'page': page,
+        'per_page': per_page,
+        'pages': (total + per_page - 1) // per_page,
+        'truncated': truncated
+    }
@@ -15,6 +15,18 @@ def seed_default_settings():
             'value': '3',
             'description': 'Minimum number of votes required before marking a note as contentious. '
                           'Notes with fewer votes will not be marked as contentious.'
+        },
+        {
+            'key': 'consensus_strategy',
+            'value': 'majority',
+            'description': 'How exports and filters derive consensus from votes: '
+                          'majority (most votes) or dawid_skene (weighted by estimated classifier reliability).'
+        },
+        {
+            'key': 'confidence_measure',
+            'value': 'proportion',
+            'description': 'What the contentious threshold and export cutoff compare against: '
+                          'proportion (consensus share) or lower_bound (Dirichlet lower credible bound).'
         }
     ]
 
@@ -0,0 +1,382 @@
+"""
+Near-duplicate note clustering with MinHash signatures and LSH banding.
+
+Each note's text is normalized and split into character shingles, and a
+MinHash signature estimates the Jaccard similarity between shingle sets.
+Signatures are cut into bands; notes sharing any band bucket are candidate
+pairs, which are confirmed against the signature similarity and merged with
+union-find. Every clustered note stores its signature and the id of its
+cluster (the smallest note id in it).
+
+New notes have no signature, so refresh_clusters() only processes those and
+can run after every import. rebuild_clusters() starts over from scratch.
+Notes whose text changes are taken out with forget_notes() and clustered
+again like new ones; clusters their old text bridged stay merged until a
+rebuild.
+"""
+import re
+import zlib
+
+import numpy as np
+from sqlalchemy import bindparam, delete, select, update
+
+from models import db, Note, NoteBand
+from utils.storage import run_in_transaction
+
+# Signature layout. Changing any of these requires rebuild_clusters().
+NUM_PERM = 64
+BANDS = 16
+ROWS = NUM_PERM // BANDS
+SHINGLE_SIZE = 4
+_SEED = 20260419
+
+# Universal hashing h(x) = (a * x + b) mod p over 32-bit shingle hashes;
+# a * x + b stays below 2**64, so uint64 arithmetic never overflows
+_PRIME = np.uint64(4294967291)
+_rng = np.random.default_rng(_SEED)
+_A = _rng.integers(1, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+_B = _rng.integers(0, int(_PRIME), size=NUM_PERM, dtype=np.uint64)
+
+# Mixing constants folding a band's rows into one 64-bit bucket key
+_BAND_MIX = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F,
+                      0x165667B19E3779F9, 0xD6E8FEB86659FD93], dtype=np.uint64)[:ROWS]
+
+# Chunk size for IN (...) queries
+_CHUNK = 400
+
+
+def normalize_text(note_text):
+    """Lowercase and reduce punctuation and whitespace to single spaces"""
+    return ' '.join(re.sub(r'[\W_]+', ' ', note_text.lower(), flags=re.UNICODE).split())
+
+
+def shingle_hashes(note_text):
+    """32-bit hashes of the character shingles of a note's normalized text"""
+    normalized = normalize_text(note_text)
+    if len(normalized) <= SHINGLE_SIZE:
+        shingles = {normalized}
+    else:
+        shingles = {normalized[i:i + SHINGLE_SIZE] for i in range(len(normalized) - SHINGLE_SIZE + 1)}
+    return np.fromiter((zlib.crc32(s.encode('utf-8')) for s in shingles), dtype=np.uint64, count=len(shingles))
+
+
+def minhash_signature(note_text):
+    """MinHash signature of a note's text as a uint32 array of NUM_PERM values"""
+    hashes = shingle_hashes(note_text)
+    values = (np.outer(_A, hashes) + _B[:, None]) % _PRIME
+    return values.min(axis=1).astype(np.uint32)
+
+
+def band_buckets(signature):
+    """One signed 64-bit bucket key per band, as stored in note_lsh_bands"""
+    rows = signature.astype(np.uint64).reshape(BANDS, ROWS)
+    return (rows * _BAND_MIX).sum(axis=1, dtype=np.uint64).view(np.int64)
+
+
+def signature_from_bytes(blob):
+    return np.frombuffer(blob, dtype=np.uint32)
+
+
+def estimate_similarity(signature, others):
+    """
+    Estimated Jaccard similarity between one signature and several others.
+
+    Args:
+        signature: Array of NUM_PERM values
+        others: 2-D array with one signature per row
+
+    Returns:
+        Array of similarities in [0, 1]
+    """
+    return (others == signature).mean(axis=1)
+
+
+def _cluster_threshold():
+    from flask import current_app
+    return current_app.config.get('SIMILARITY_CLUSTER_THRESHOLD', 0.7)
+
+
+class _UnionFind:
+    """Disjoint sets of cluster ids whose root is always the smallest id"""
+
+    def __init__(self):
+        self.parent = {}
+
+    def find(self, item):
+        root = item
+        while self.parent.get(root, root) != root:
+            root = self.parent[root]
+        while item != root:
+            next_item = self.parent[item]
+            self.parent[item] = root
+            item = next_item
+        return root
+
+    def union(self, items):
+        roots = {self.find(item) for item in items}
+        root = min(roots)
+        for other in roots:
+            self.parent[other] = root
+        return root
+
+
+def _load_bucket_members(keys):
+    """Map (band, bucket) -> [note_id] for already clustered notes"""
+    by_band = {}
+    for band, bucket in keys:
+        by_band.setdefault(band, []).append(bucket)
+
+    # One band at a time so SQLite can use the (band, bucket) index
+    members = {}
+    for band, band_buckets in by_band.items():
+        for start in range(0, len(band_buckets), _CHUNK):
+            rows = db.session.execute(
+                select(NoteBand.bucket, NoteBand.note_id)
+                .where(NoteBand.band == band, NoteBand.bucket.in_(band_buckets[start:start + _CHUNK]))
+            ).all()
+            for bucket, note_id in rows:
+                members.setdefault((band, bucket), []).append(note_id)
+    return members
+
+
+def _load_signatures(note_ids):
+    """List of (note_id, signature, cluster_id) for already clustered notes"""
+    loaded = []
+    note_ids = list(note_ids)
+    for start in range(0, len(note_ids), _CHUNK):
+        rows = db.session.execute(
+            select(Note.id, Note.minhash, Note.cluster_id)
+            .where(Note.id.in_(note_ids[start:start + _CHUNK]))
+        ).all()
+        loaded.extend((note_id, signature_from_bytes(blob), cluster_id) for note_id, blob, cluster_id in rows)
+    return loaded
+
+
+def _cluster_batch(rows, threshold):
+    """
+    Sign and cluster one batch of unclustered notes in the current transaction.
+
+    A note whose signature equals one already in a bucket is not banded
+    itself: it always lands in that note's buckets and cluster, and skipping
+    it keeps boilerplate from piling thousands of notes into one bucket.
+
+    Args:
+        rows: List of (note_id, text) for notes without a signature
+        threshold: Minimum estimated similarity to join a cluster
+
+    Returns:
+        Number of existing clusters merged into another
+    """
+    signatures = np.vstack([minhash_signature(note_text) for _, note_text in rows])
+    buckets = [[(band, int(bucket)) for band, bucket in enumerate(band_buckets(signature))]
+               for signature in signatures]
+
+    members = _load_bucket_members({key for note_keys in buckets for key in note_keys})
+    existing = _load_signatures({note_id for ids in members.values() for note_id in ids})
+
+    # Every known signature in one matrix, with its cluster label per row
+    matrix = np.empty((len(existing) + len(rows), NUM_PERM), dtype=np.uint32)
+    labels = np.empty(len(existing) + len(rows), dtype=np.int64)
+    row_of = {}
+    for row, (note_id, signature, cluster_id) in enumerate(existing):
+        matrix[row] = signature
+        labels[row] = cluster_id
+        row_of[note_id] = row
+    members = {key: [row_of[note_id] for note_id in ids if note_id in row_of] for key, ids in members.items()}
+
+    clusters = _UnionFind()
+    banded = []
+    for position, (note_id, _) in enumerate(rows):
+        signature = signatures[position]
+        row = len(existing) + position
+        matrix[row] = signature
+
+        roots = {note_id}
+        duplicate = False
+        candidate_rows = [members[key] for key in buckets[position] if members.get(key)]
+        if candidate_rows:
+            candidates = np.unique(np.concatenate(candidate_rows))
+            similarities = estimate_similarity(signature, matrix[candidates])
+            matched = candidates[similarities >= threshold]
+            roots.update(clusters.find(int(label)) for label in np.unique(labels[matched]))
+            duplicate = bool((similarities == 1.0).any())
+
+        labels[row] = clusters.union(roots)
+        if not duplicate:
+            for key in buckets[position]:
+                members.setdefault(key, []).append(row)
+            banded.append(position)
+
+    db.session.execute(
+        update(Note.__table__)
+        .where(Note.__table__.c.id == bindparam('note_id'))
+        .values(minhash=bindparam('minhash'), cluster_id=bindparam('cluster_id')),
+        [{'note_id': note_id, 'minhash': signatures[position].tobytes(),
+          'cluster_id': clusters.find(int(labels[len(existing) + position]))}
+         for position, (note_id, _) in enumerate(rows)]
+    )
+    if banded:
+        db.session.execute(
+            NoteBand.__table__.insert(),
+            [{'note_id': rows[position][0], 'band': band, 'bucket': bucket}
+             for position in banded for band, bucket in buckets[position]]
+        )
+
+    # Relabel existing clusters that a new note bridged into another
+    merged = {cluster_id: clusters.find(cluster_id)
+              for cluster_id in {cluster_id for _, _, cluster_id in existing}
+              if clusters.find(cluster_id) != cluster_id}
+    if merged:
+        db.session.execute(
+            update(Note.__table__)
+            .where(Note.__table__.c.cluster_id == bindparam('old_cluster'))
+            .values(cluster_id=bindparam('new_cluster')),
+            [{'old_cluster': old, 'new_cluster': new} for old, new in merged.items()]
+        )
+    return len(merged)
+
+
+def refresh_clusters(batch_size=1000, threshold=None):
+    """
+    Cluster every note that has no signature yet (e.g. after an import).
+
+    Args:
+        batch_size: Notes signed and committed per transaction
+        threshold: Minimum estimated similarity to join a cluster
+            (SIMILARITY_CLUSTER_THRESHOLD by default)
+
+    Returns:
+        dict with keys: notes_clustered, clusters_merged
+    """
+    if threshold is None:
+        threshold = _cluster_threshold()
+
+    stats = {'notes_clustered': 0, 'clusters_merged': 0}
+    while True:
+        rows = db.session.execute(
+            select(Note.id, Note.text).where(Note.minhash.is_(None)).order_by(Note.id).limit(batch_size)
+        ).all()
+        if not rows:
+            break
+        stats['clusters_merged'] += run_in_transaction('similarity', lambda: _cluster_batch(rows, threshold))
+        stats['notes_clustered'] += len(rows)
+    return stats
+
+
+def forget_notes(note_ids):
+    """
+    Drop the signatures, buckets and cluster labels of notes (e.g. whose text
+    changed or that are about to be deleted) in the current transaction, so
+    refresh_clusters() treats them as new.
+
+    Exact duplicates are not banded themselves and are only found through
+    the note they duplicate, so unbanded members of the affected clusters
+    are forgotten (and clustered again) too. Clusters labelled with a
+    forgotten note's id are relabelled with their smallest remaining
+    member, so a forgotten note cannot inherit its old cluster by id.
+    """
+    notes = Note.__table__
+    note_ids = sorted(set(note_ids))
+    cluster_ids = set()
+    for start in range(0, len(note_ids), _CHUNK):
+        cluster_ids.update(db.session.execute(
+            select(notes.c.cluster_id).where(notes.c.id.in_(note_ids[start:start + _CHUNK]),
+                                             notes.c.cluster_id.isnot(None))
+        ).scalars())
+
+    forgotten = set(note_ids)
+    members = []
+    cluster_ids = sorted(cluster_ids)
+    for start in range(0, len(cluster_ids), _CHUNK):
+        members.extend(db.session.execute(
+            select(notes.c.cluster_id, notes.c.id,
+                   select(NoteBand.note_id).where(NoteBand.note_id == notes.c.id).exists())
+            .where(notes.c.cluster_id.in_(cluster_ids[start:start + _CHUNK]))
+        ).all())
+    forgotten.update(note_id for _, note_id, banded in members if not banded)
+
+    relabel = {}
+    for cluster_id, note_id, _ in members:
+        if note_id not in forgotten and cluster_id in forgotten:
+            relabel[cluster_id] = min(note_id, relabel.get(cluster_id, note_id))
+    if relabel:
+        db.session.execute(
+            update(notes)
+            .where(notes.c.cluster_id == bindparam('old_cluster'))
+            .values(cluster_id=bindparam('new_cluster')),
+            [{'old_cluster': old, 'new_cluster': new} for old, new in relabel.items()]
+        )
+
+    forgotten = sorted(forgotten)
+    for start in range(0, len(forgotten), _CHUNK):
+        chunk = forgotten[start:start + _CHUNK]
+        db.session.execute(delete(NoteBand).where(NoteBand.note_id.in_(chunk)))
+        db.session.execute(update(notes).where(notes.c.id.in_(chunk)).values(minhash=None, cluster_id=None))
+
+
+def rebuild_clusters(batch_size=1000, threshold=None):
+    """Drop every signature and cluster, then cluster all notes again"""
+    def reset():
+        db.session.execute(delete(NoteBand))
+        db.session.execute(update(Note).values(minhash=None, cluster_id=None))
+
+    run_in_transaction('similarity', reset)
+    return refresh_clusters(batch_size, threshold)
+
+
+def count_similar_notes(note_ids):
+    """
+    Size of each note's near-duplicate cluster (including the note itself).
+
+    Args:
+        note_ids: List of note IDs
+
+    Returns:
+        dict mapping note_id to cluster size (0 for notes not clustered yet)
+    """
+    clusters = dict(db.session.execute(
+        select(Note.id, Note.cluster_id).where(Note.id.in_(note_ids))
+    ).all()) if note_ids else {}
+    cluster_ids = {cluster_id for cluster_id in clusters.values() if cluster_id is not None}
+    sizes = dict(db.session.execute(
+        select(Note.cluster_id, db.func.count(Note.id))
+        .where(Note.cluster_id.in_(cluster_ids))
+        .group_by(Note.cluster_id)
+    ).all()) if cluster_ids else {}
+    return {note_id: sizes.get(clusters.get(note_id), 0) for note_id in note_ids}
+
+
+def get_similar_note_ids(note_id, min_similarity):
+    """
+    IDs of notes in the same cluster whose estimated similarity to a note
+    is at least min_similarity (the note itself included).
+
+    Notes not clustered yet fall back to identical-text matching.
+    """
+    note = db.session.get(Note, note_id)
+    if note is None:
+        return []
+    if note.minhash is None or note.cluster_id is None:
+        from utils.probability import get_identical_note_ids
+        return get_identical_note_ids(note.text)
+
+    signature = signature_from_bytes(note.minhash)
+    rows = db.session.execute(
+        select(Note.id, Note.minhash).where(Note.cluster_id == note.cluster_id)
+    ).all()
+    similarities = estimate_similarity(signature, np.vstack([signature_from_bytes(blob) for _, blob in rows]))
+    return [member_id for (member_id, _), similarity in zip(rows, similarities) if similarity >= min_similarity]
+
+
+if __name__ == '__main__':
+    # Offline clustering pass: python -m utils.similarity [--rebuild]
+    import sys
+    from app import create_app
+    app = create_app()
+
+    with app.app_context():
+        if '--rebuild' in sys.argv:
+            stats = rebuild_clusters()
+        else:
+            stats = refresh_clusters()
+        print(f"Clustered {stats['notes_clustered']} notes, merged {stats['clusters_merged']} clusters")
@@ -0,0 +1,279 @@
+"""
+SQLite storage profile: per-connection pragmas, read/write engine routing
+and busy-aware write transactions.
+
+Pragmas are applied through a ``connect`` event on every new pooled
+connection, so they hold for all connections rather than only the first one.
+When enabled, SELECTs issued while handling GET/HEAD requests run on a
+separate read-only engine; everything else (and any read that follows a
+write in the same transaction) runs on the default writer engine.
+
+All writes go through run_in_transaction / run_in_connection, which retry
+on SQLITE_BUSY ("database is locked") with jittered exponential backoff
+until a deadline.
+"""
+import os
+import random
+import time
+import weakref
+from contextlib import contextmanager
+
+import sqlalchemy as sa
+from flask import current_app, has_app_context, has_request_context, request
+from flask_sqlalchemy.session import Session
+
+from utils.metrics import SQLITE_BUSY_RETRIES, SQLITE_LOCK_ERRORS, is_lock_error
+
+# Pragma sets by profile name, applied in order on each new connection
+STORAGE_PROFILES = {
+    # Previous behaviour: WAL only
+    'legacy': {
+        'journal_mode': 'WAL',
+    },
+    # Tuned for many concurrent readers and short interactive writes
+    'balanced': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,       # ms to wait on a lock before SQLITE_BUSY
+        'synchronous': 'NORMAL',    # durable across app crashes in WAL mode
+        'cache_size': -65536,       # 64 MB page cache per connection
+        'mmap_size': 268435456,     # 256 MB memory-mapped reads
+        'temp_store': 'MEMORY',
+    },
+    # As balanced, but fsync on every commit (survives power loss)
+    'durable': {
+        'journal_mode': 'WAL',
+        'busy_timeout': 5000,
+        'synchronous': 'FULL',
+        'cache_size': -65536,
+        'mmap_size': 268435456,
+        'temp_store': 'MEMORY',
+    },
+}
+
+READ_METHODS = ('GET', 'HEAD')
+
+# Engines of every live app, disposed in a forked child (see configure_storage)
+_engines = weakref.WeakSet()
+
+
+def get_pragmas(app):
+    """Resolve the pragma set for the configured profile plus overrides"""
+    profile = app.config.get('STORAGE_PROFILE', 'balanced')
+    if profile not in STORAGE_PROFILES:
+        raise ValueError(f'Unknown storage profile: {profile}')
+    pragmas = dict(STORAGE_PROFILES[profile])
+    pragmas.update(app.config.get('SQLITE_PRAGMAS') or {})
+    return pragmas
+
+
+def _pragma_listener(pragmas):
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+    return apply_pragmas
+
+
+def _is_file_database(engine):
+    return engine.dialect.name == 'sqlite' and engine.url.database not in (None, '', ':memory:')
+
+
+def configure_storage(app, db):
+    """
+    Apply the storage profile to the app's engine and create the reader engine.
+    Must run inside an app context, before the engine hands out connections.
+
+    Returns:
+        dict with 'writer' and 'reader' engines (reader is None when not split)
+    """
+    writer = db.engine
+    storage = {'writer': writer, 'reader': None, 'pragmas': {}}
+    app.extensions['storage'] = storage
+
+    if writer.dialect.name != 'sqlite':
+        return storage
+
+    pragmas = get_pragmas(app)
+    storage['pragmas'] = pragmas
+    sa.event.listen(writer, 'connect', _pragma_listener(pragmas))
+
+    if app.config.get('STORAGE_READ_WRITE_SPLIT') and _is_file_database(writer):
+        reader_pragmas = dict(pragmas, query_only='ON')
+        reader_pragmas.pop('journal_mode', None)  # set by the writer; needs write access
+        reader = sa.create_engine(writer.url, **app.config.get('SQLALCHEMY_ENGINE_OPTIONS', {}))
+        sa.event.listen(reader, 'connect', _pragma_listener(reader_pragmas))
+        storage['reader'] = reader
+
+    # A server that preloads the app forks workers after connections were
+    # opened here; each worker must start with pools of its own
+    _engines.add(writer)
+    if storage['reader'] is not None:
+        _engines.add(storage['reader'])
+
+    return storage
+
+
+def _dispose_after_fork():
+    for engine in list(_engines):
+        engine.dispose(close=False)
+
+
+# One hook for the process (a hook can never be unregistered); the weak set
+# lets the engines of discarded apps go
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_dispose_after_fork)
+
+
+def get_reader_engine():
+    """Reader engine for the current app, or None if reads are not split"""
+    storage = current_app.extensions.get('storage')
+    return storage['reader'] if storage else None
+
+
+@contextmanager
+def read_connection():
+    """
+    Connection of its own for bulk reads, from the reader engine when reads
+    are split. Unlike db.session.connection(), it leaves the session's
+    routing alone: a bind without a clause counts as a write and would pin
+    the rest of a GET request's queries to the writer.
+    """
+    storage = current_app.extensions['storage']
+    with (storage['reader'] or storage['writer']).connect() as connection:
+        yield connection
+
+
+class RoutingSession(Session):
+    """
+    Session that sends SELECTs made during GET/HEAD requests to the reader engine.
+
+    Writes always go to the writer. Once a transaction has written, its later
+    reads stay on the writer so they see the uncommitted changes.
+    """
+
+    def __init__(self, db, **kwargs):
+        super().__init__(db, **kwargs)
+        self._wrote_in_transaction = False
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_request_context() \
+                and request.method in READ_METHODS:
+            reader = get_reader_engine()
+            if reader is not None:
+                if clause is not None and getattr(clause, 'is_select', False) \
+                        and not self._wrote_in_transaction:
+                    return reader
+                self._wrote_in_transaction = True
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+@sa.event.listens_for(RoutingSession, 'after_transaction_end')
+def _reset_routing(session, transaction):
+    if transaction.parent is None:
+        session._wrote_in_transaction = False
+
+
+def _retry_settings(timeout):
+    config = current_app.config if has_app_context() else {}
+    if timeout is None:
+        timeout = config.get('WRITE_RETRY_TIMEOUT', 30)
+    return (timeout,
+            config.get('WRITE_RETRY_BASE_DELAY', 0.02),
+            config.get('WRITE_RETRY_MAX_DELAY', 1.0))
+
+
+def retry_on_busy(operation, work, timeout=None, on_retry=None):
+    """
+    Call work() until it succeeds, retrying SQLITE_BUSY / locked errors.
+
+    Args:
+        operation: Name used to label retry and failure metrics
+        work: Callable performing one complete attempt
+        timeout: Seconds before giving up (WRITE_RETRY_TIMEOUT by default)
+        on_retry: Optional callable run before each retry (e.g. rollback)
+
+    Returns:
+        Whatever work() returns
+    """
+    timeout, base_delay, max_delay = _retry_settings(timeout)
+    deadline = time.monotonic() + timeout
+    attempt = 0
+
+    while True:
+        try:
+            return work()
+        except sa.exc.OperationalError as e:
+            if not is_lock_error(e) or time.monotonic() >= deadline:
+                if is_lock_error(e):
+                    SQLITE_LOCK_ERRORS.inc(operation=operation)
+                raise
+            if on_retry is not None:
+                on_retry()
+            attempt += 1
+            SQLITE_BUSY_RETRIES.inc(operation=operation)
+            # Full jitter keeps competing writers from retrying in lockstep
+            delay = random.uniform(0, min(max_delay, base_delay * 2 ** attempt))
+            time.sleep(min(delay, max(0.0, deadline - time.monotonic())))
+
+
+def run_in_transaction(operation, work, timeout=None):
+    """
+    Run work() against db.session and commit, retrying the whole unit on busy.
+
+    work() must be safe to run again after a rollback (it should re-read
+    anything it depends on rather than reuse objects from a failed attempt).
+    """
+    from models import db
+
+    def attempt():
+        result = work()
+        db.session.commit()
+        return result
+
+    try:
+        return retry_on_busy(operation, attempt, timeout, on_retry=db.session.rollback)
+    except Exception:
+        db.session.rollback()
+        raise
+
+
+def run_in_connection(operation, work, engine=None, timeout=None):
+    """
+    Run work(connection) in its own Core transaction, retrying on busy.
+
+    Args:
+        operation: Name used to label retry and failure metrics
+        work: Callable taking a connection with an open transaction
+        engine: Engine to use (defaults to the app's writer engine)
+        timeout: Seconds before giving up
+    """
+    if engine is None:
+        from models import db
+        engine = db.engine
+
+    def attempt():
+        with engine.begin() as connection:
+            return work(connection)
+
+    return retry_on_busy(operation, attempt, timeout)
+
+
+@contextmanager
+def read_transaction(connection):
+    """
+    Hold one SQLite read transaction on a connection, so every query inside
+    sees the same state of the database even while other connections write.
+    Joins the connection's transaction if one is already open.
+    """
+    dbapi_connection = connection.connection.dbapi_connection
+    if dbapi_connection.in_transaction:
+        yield connection
+        return
+    dbapi_connection.execute('BEGIN')
+    try:
+        yield connection
+    finally:
+        dbapi_connection.commit()
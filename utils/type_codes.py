@@ -0,0 +1,91 @@
+"""
+Classification code registry, loaded once from config/type_codes.yaml.
+
+Every classification has a letter code ('w', 'ow', '?'), used in templates,
+JSON and XML, and a small integer code, stored in votes, reviews and the
+vote_changes log. Integer codes run from 0 without gaps, so bulk code
+indexes count arrays with the stored value directly. The ClassificationCode
+column type converts between the two, so ORM code only sees letters.
+"""
+import os
+from collections import namedtuple
+
+import yaml
+from sqlalchemy import type_coerce
+from sqlalchemy.types import SmallInteger, TypeDecorator
+
+TYPE_CODES_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'config', 'type_codes.yaml')
+
+# Groups of the YAML file, in the order classes are listed
+_GROUPS = ('primary_classes', 'hybrid_classes', 'triage_class')
+
+ClassificationType = namedtuple('ClassificationType', 'letter code name description group')
+
+
+def load_type_codes(path=TYPE_CODES_PATH):
+    """
+    Read the classification schema.
+
+    Returns:
+        List of ClassificationType in code order
+
+    Raises:
+        ValueError: if codes are missing, repeated or leave a gap
+    """
+    with open(path, encoding='utf-8') as f:
+        schema = yaml.safe_load(f)
+
+    types = []
+    for group in _GROUPS:
+        for letter, entry in (schema.get(group) or {}).items():
+            if not isinstance(entry, dict) or not isinstance(entry.get('code'), int):
+                raise ValueError(f'{path}: class {letter!r} has no integer code')
+            types.append(ClassificationType(str(letter), entry['code'], entry.get('name', str(letter)),
+                                            entry.get('description', ''), group))
+    types.sort(key=lambda entry: entry.code)
+    if [entry.code for entry in types] != list(range(len(types))):
+        raise ValueError(f'{path}: class codes must run from 0 to {len(types) - 1} without repeats')
+    if len({entry.letter for entry in types}) != len(types):
+        raise ValueError(f'{path}: class letters must be unique')
+    return types
+
+
+CLASSIFICATIONS = load_type_codes()
+
+# Letter codes in code order (LETTERS[code] is the letter)
+LETTERS = [entry.letter for entry in CLASSIFICATIONS]
+
+# Letter code -> integer code
+CODES = {entry.letter: entry.code for entry in CLASSIFICATIONS}
+
+
+def is_classification(value):
+    """True if value is a known letter code (False for anything else, including non-strings)"""
+    return isinstance(value, str) and value in CODES
+
+
+def letter_for(code):
+    """Letter of an integer code (None for NULL or an unknown code)"""
+    return LETTERS[code] if code is not None and 0 <= code < len(LETTERS) else None
+
+
+def stored_code(column):
+    """Select a ClassificationCode column as its integer code instead of the letter"""
+    return type_coerce(column, SmallInteger)
+
+
+class ClassificationCode(TypeDecorator):
+    """Column stored as an integer classification code and read as its letter"""
+    impl = SmallInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        if value is None:
+            return None
+        try:
+            return CODES[value]
+        except KeyError:
+            raise ValueError(f'Unknown classification: {value!r}') from None
+
+    def process_result_value(self, value, dialect):
+        return letter_for(value)
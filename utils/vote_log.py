@@ -0,0 +1,261 @@
+"""
+Vote history: the append-only vote_changes log, snapshots and compaction.
+
+Every vote write appends an entry to vote_changes (see utils/data_version.py)
+with the classification it replaced, the one it set and when. A snapshot
+stores the vote counts per note and the voted notes per user as of one
+log position, so the in-memory vote store (utils/vote_store.py) starts from
+the latest snapshot and replays only the entries after it instead of
+scanning the votes table. The store saves a new snapshot every
+VOTE_SNAPSHOT_INTERVAL log entries.
+
+Snapshots plus the log also answer point-in-time questions: the vote
+counts, and so the majority consensus, of notes as they stood at any time
+since the oldest retained snapshot. Compaction keeps the newest
+VOTE_SNAPSHOT_KEEP snapshots and deletes the log entries the oldest of them
+already covers, which keeps the log bounded.
+
+    python -m utils.vote_log snapshot | compact | history NOTE_ID | consensus --at TIME NOTE_ID...
+"""
+import io
+from collections import Counter, namedtuple
+from datetime import datetime
+
+import numpy as np
+from sqlalchemy import DateTime, bindparam, delete, func, insert, select, text
+
+from models import VoteSnapshot
+from utils.data_version import vote_log_position
+from utils.probability import CLASSIFICATION_TYPES, calculate_vote_distributions
+from utils.storage import read_connection, read_transaction, run_in_connection
+from utils.type_codes import letter_for
+
+# One vote_changes entry; classification and previous are integer codes
+# (see utils/type_codes.py), classification is None for a deleted vote,
+# previous is None for a new one, changed_at is None for entries written
+# before the log recorded classifications
+LogEntry = namedtuple('LogEntry', 'seq note_id user_id deleted classification previous changed_at')
+
+_ENTRY_QUERY = ('SELECT seq, note_id, user_id, deleted, classification, previous, changed_at '
+                'FROM vote_changes WHERE seq > :after')
+
+
+def encode_snapshot(counts, user_notes):
+    """Serialize a counts array and a dict of user_id -> sorted note IDs"""
+    users = sorted(user_notes)
+    offsets = np.zeros(len(users) + 1, dtype=np.int64)
+    np.cumsum([len(user_notes[user_id]) for user_id in users], out=offsets[1:])
+    notes = (np.concatenate([user_notes[user_id] for user_id in users]) if users
+             else np.zeros(0, dtype=np.int32))
+    buffer = io.BytesIO()
+    np.savez(buffer, counts=counts, users=np.array(users, dtype=np.int32), offsets=offsets,
+             notes=notes.astype(np.int32, copy=False))
+    return buffer.getvalue()
+
+
+def decode_snapshot(data):
+    """Counts array and dict of user_id -> sorted note IDs from encode_snapshot()"""
+    arrays = np.load(io.BytesIO(data), allow_pickle=False)
+    offsets, notes = arrays['offsets'], arrays['notes']
+    user_notes = {int(user_id): notes[offsets[i]:offsets[i + 1]] for i, user_id in enumerate(arrays['users'])}
+    return arrays['counts'], user_notes
+
+
+def latest_snapshot(connection, as_of=None):
+    """Newest snapshot row (taken at or before as_of, if given), or None"""
+    query = select(VoteSnapshot.__table__).order_by(VoteSnapshot.seq.desc()).limit(1)
+    if as_of is not None:
+        query = query.where(VoteSnapshot.as_of <= as_of)
+    return connection.execute(query).first()
+
+
+def log_entries(connection, after, until=None, note_ids=None):
+    """
+    vote_changes entries after seq `after`, oldest first.
+
+    Args:
+        connection: SQLAlchemy connection
+        after: Log position to read from (exclusive)
+        until: Only entries written at or before this time
+        note_ids: Only entries for these notes
+
+    Returns:
+        List of LogEntry
+    """
+    sql = _ENTRY_QUERY
+    params = {'after': after}
+    if until is not None:
+        sql += ' AND changed_at <= :until'
+        params['until'] = until
+
+    def query(sql):
+        query = text(sql).columns(changed_at=DateTime)
+        return query.bindparams(bindparam('until', type_=DateTime)) if until is not None else query
+
+    if note_ids is None:
+        return [LogEntry(*row) for row in connection.execute(query(sql + ' ORDER BY seq'), params)]
+
+    note_ids = list(note_ids)
+    entries = []
+    for start in range(0, len(note_ids), 500):
+        chunk = note_ids[start:start + 500]
+        chunk_params = dict(params, **{f'n{i}': note_id for i, note_id in enumerate(chunk)})
+        placeholders = ', '.join(f':n{i}' for i in range(len(chunk)))
+        entries.extend(LogEntry(*row) for row in connection.execute(
+            query(f'{sql} AND note_id IN ({placeholders})'), chunk_params))
+    entries.sort()
+    return entries
+
+
+def replayable(entries, after, position):
+    """Whether entries (read after seq `after`) are the complete, replayable log up to position"""
+    if not entries:
+        return position == after
+    return entries[0].seq == after + 1 and all(entry.changed_at is not None for entry in entries)
+
+
+def save_snapshot(seq, data, votes, notes, keep=None):
+    """
+    Store a snapshot at log position seq and compact the log, unless one at
+    or past seq exists already (another worker saved it first).
+
+    Returns:
+        The new snapshot's ID, or None if it was not needed
+    """
+    def work(connection):
+        newest = connection.execute(select(func.max(VoteSnapshot.seq))).scalar()
+        if newest is not None and newest >= seq:
+            return None
+        as_of = connection.execute(
+            text('SELECT changed_at FROM vote_changes WHERE seq = :seq').columns(changed_at=DateTime),
+            {'seq': seq}
+        ).scalar()
+        snapshot_id = connection.execute(insert(VoteSnapshot).values(
+            seq=seq, as_of=as_of or datetime.utcnow(), votes=votes, notes=notes, data=data,
+        )).inserted_primary_key[0]
+        if keep:
+            compact_vote_log(connection, keep)
+        return snapshot_id
+
+    return run_in_connection('vote_snapshot', work)
+
+
+def compact_vote_log(connection, keep):
+    """
+    Keep the newest `keep` snapshots and delete older snapshots and every
+    log entry the oldest kept snapshot covers.
+
+    Returns:
+        (snapshots deleted, log entries deleted)
+    """
+    oldest = connection.execute(
+        select(VoteSnapshot.seq).order_by(VoteSnapshot.seq.desc()).limit(1).offset(max(keep, 1) - 1)
+    ).scalar()
+    if oldest is None:
+        return 0, 0
+    snapshots = connection.execute(delete(VoteSnapshot).where(VoteSnapshot.seq < oldest)).rowcount
+    entries = connection.execute(text('DELETE FROM vote_changes WHERE seq <= :seq'), {'seq': oldest}).rowcount
+    return snapshots, entries
+
+
+def counts_at(note_ids, when):
+    """
+    Vote counts of notes as they stood at a point in time: the newest
+    snapshot taken by then plus the log entries written after it up to then.
+
+    Args:
+        note_ids: Iterable of note IDs
+        when: naive UTC datetime
+
+    Returns:
+        Dict of note_id -> Counter of classification -> count
+
+    Raises:
+        ValueError: if the log no longer reaches back to `when`
+    """
+    note_ids = list(set(note_ids))
+    counts = {note_id: Counter() for note_id in note_ids}
+    with read_connection() as connection, read_transaction(connection):
+        snapshot = latest_snapshot(connection, as_of=when)
+        after = snapshot.seq if snapshot is not None else 0
+        oldest = connection.execute(text('SELECT min(seq) FROM vote_changes')).scalar()
+        legacy = connection.execute(text(
+            'SELECT 1 FROM vote_changes WHERE seq > :after AND changed_at IS NULL LIMIT 1'
+        ), {'after': after}).scalar()
+        if legacy or (vote_log_position(connection) > after and (oldest is None or oldest > after + 1)):
+            raise ValueError(f'Vote history before {when} is no longer available')
+
+        if snapshot is not None:
+            snapshot_counts = np.load(io.BytesIO(snapshot.data), allow_pickle=False)['counts']
+            for note_id in note_ids:
+                if note_id < len(snapshot_counts):
+                    row = snapshot_counts[note_id]
+                    counts[note_id].update({CLASSIFICATION_TYPES[i]: int(row[i]) for i in np.flatnonzero(row)})
+
+        for entry in log_entries(connection, after, until=when, note_ids=note_ids):
+            vote_counts = counts[entry.note_id]
+            if letter_for(entry.previous) is not None:
+                vote_counts[letter_for(entry.previous)] -= 1
+            if letter_for(entry.classification) is not None:
+                vote_counts[letter_for(entry.classification)] += 1
+
+    return {note_id: +vote_counts for note_id, vote_counts in counts.items()}
+
+
+def consensus_at(note_ids, when):
+    """
+    Majority vote distributions of notes as they stood at a point in time
+    (same shape as calculate_vote_distributions). Dawid-Skene posteriors
+    depend on every vote at once and are not kept historically.
+    """
+    return calculate_vote_distributions(note_ids, 'majority', counts=counts_at(note_ids, when))
+
+
+def note_history(note_id):
+    """Every retained vote change on a note, oldest first (list of LogEntry)"""
+    with read_connection() as connection:
+        return log_entries(connection, 0, note_ids=[note_id])
+
+
+if __name__ == '__main__':
+    # Snapshot, compact and query the vote log from the command line
+    import argparse
+    from flask import current_app
+    from app import create_app
+    from utils.vote_store import get_vote_store
+
+    parser = argparse.ArgumentParser(description='Vote log snapshots, compaction and history')
+    commands = parser.add_subparsers(dest='command', required=True)
+    commands.add_parser('snapshot', help='Save a snapshot of the current votes and compact the log')
+    commands.add_parser('compact', help='Delete log entries and snapshots older than the retained snapshots')
+    history = commands.add_parser('history', help='Show the retained vote changes on a note')
+    history.add_argument('note_id', type=int)
+    consensus = commands.add_parser('consensus', help='Majority consensus of notes at a point in time')
+    consensus.add_argument('--at', metavar='TIME', type=datetime.fromisoformat, required=True,
+                           help='UTC time, ISO format')
+    consensus.add_argument('note_ids', type=int, nargs='+')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        keep = current_app.config['VOTE_SNAPSHOT_KEEP']
+        if args.command == 'snapshot':
+            store = get_vote_store()
+            snapshot_id = store.snapshot()
+            print(f'Snapshot {snapshot_id} at seq {store.seq}' if snapshot_id else f'Already snapshotted at seq {store.seq}')
+        elif args.command == 'compact':
+            snapshots, entries = run_in_connection('vote_snapshot', lambda connection: compact_vote_log(connection, keep))
+            print(f'Deleted {snapshots} snapshots and {entries} log entries')
+        elif args.command == 'history':
+            for entry in note_history(args.note_id):
+                change = 'deleted' if entry.deleted else \
+                    f'{letter_for(entry.previous) or "-"} -> {letter_for(entry.classification) or "?"}'
+                print(f'{entry.seq}\t{entry.changed_at or "?"}\tuser {entry.user_id}\t{change}')
+        else:
+            try:
+                distributions = consensus_at(args.note_ids, args.at)
+            except ValueError as e:
+                parser.error(str(e))
+            for note_id in args.note_ids:
+                distribution = distributions[note_id]
+                print(f'{note_id}\t{distribution["consensus"] or "-"}\t{distribution["votes"]}')
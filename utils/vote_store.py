@@ -0,0 +1,262 @@
+"""
+Compact in-memory copy of the vote counts, kept in sync with the database.
+
+Per-class vote counts live in one small-integer array indexed by note id,
+and each user's voted notes in a sorted integer array (plus a small set of
+recent additions), so distributions and "has this user voted" checks are
+array lookups instead of queries. The store is built from the latest vote
+snapshot plus the vote_changes entries after it (see utils/vote_log.py),
+or with one streaming scan of the votes table when there is no usable
+snapshot.
+
+The store follows the votes data version (see utils/data_version.py). When
+it changes, whether through this worker's writes or another's, the store
+replays the vote_changes entries past the last one it applied. Only a log
+compacted past that entry makes it rebuild. Every VOTE_SNAPSHOT_INTERVAL
+entries it saves its arrays as a new snapshot.
+"""
+import threading
+from collections import Counter
+from itertools import chain
+
+import numpy as np
+from flask import current_app, g, has_request_context
+
+from models import Vote
+from utils.data_version import get_data_version, vote_log_position
+from utils.probability import CLASSIFICATION_TYPES
+from utils.storage import read_connection, read_transaction
+from utils.vote_log import decode_snapshot, encode_snapshot, latest_snapshot, log_entries, replayable, save_snapshot
+
+NUM_CLASSES = len(CLASSIFICATION_TYPES)
+
+# Rows fetched from SQLite per round trip during a rebuild
+_FETCH_SIZE = 100000
+
+# Recent per-user additions merged into the sorted array beyond this size
+_PENDING_LIMIT = 4096
+
+
+def _known(code):
+    # Stored codes index the count columns; anything else written outside the app is ignored
+    return isinstance(code, int) and 0 <= code < NUM_CLASSES
+
+
+class VoteStore:
+    """Array-backed vote counts per note and voted notes per user"""
+
+    def __init__(self):
+        self.counts = np.zeros((0, NUM_CLASSES), dtype=np.uint16)
+        self.user_notes = {}
+        self.user_pending = {}
+        self.version = None
+        self.seq = 0
+        self.snapshot_seq = 0  # Log position of the newest snapshot seen
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self.version is not None
+
+    def nbytes(self):
+        """Approximate memory held by the store's arrays and sets"""
+        pending = sum(len(notes) for notes in self.user_pending.values()) * 64
+        return self.counts.nbytes + sum(notes.nbytes for notes in self.user_notes.values()) + pending
+
+    def _grow(self, max_note_id):
+        if max_note_id >= len(self.counts):
+            counts = np.zeros((max(max_note_id + 1, len(self.counts) * 2), NUM_CLASSES), dtype=np.uint16)
+            counts[:len(self.counts)] = self.counts
+            self.counts = counts
+
+    def rebuild(self):
+        """Reload from the latest snapshot and the log after it, or with a full scan"""
+        with self._lock:
+            scanned = self._rebuild()
+        self._maybe_snapshot(scanned)
+
+    def _rebuild(self):
+        # One read transaction, so the snapshot, the log entries and the
+        # scan all see the same state of the database
+        with read_connection() as connection, read_transaction(connection):
+            version = get_data_version('votes', connection)
+            position = vote_log_position(connection)
+            snapshot = latest_snapshot(connection)
+            scanned = True
+            if snapshot is not None:
+                self.snapshot_seq = snapshot.seq
+                entries = log_entries(connection, snapshot.seq)
+                if replayable(entries, snapshot.seq, position):
+                    self.counts, self.user_notes = decode_snapshot(snapshot.data)
+                    self.user_pending = {}
+                    self._replay(entries)
+                    scanned = False
+            if scanned:
+                self._scan(connection)
+        self.version = version
+        self.seq = position
+        return scanned
+
+    def _scan(self, connection):
+        cursor = connection.connection.cursor()
+        try:
+            # Stored classification codes are the count array's column indices
+            cursor.execute(f"SELECT note_id, user_id, CASE typeof(classification) WHEN 'integer' "
+                           f"THEN classification ELSE -1 END FROM {Vote.__tablename__}")
+            chunks = []
+            while True:
+                rows = cursor.fetchmany(_FETCH_SIZE)
+                if not rows:
+                    break
+                chunks.append(np.fromiter(chain.from_iterable(rows), dtype=np.int32,
+                                          count=3 * len(rows)).reshape(-1, 3))
+        finally:
+            cursor.close()
+
+        data = np.concatenate(chunks) if chunks else np.empty((0, 3), dtype=np.int32)
+        note, user, label = data[:, 0], data[:, 1], data[:, 2]
+
+        known = (label >= 0) & (label < NUM_CLASSES)
+        size = int(note.max()) + 1 if len(note) else 0
+        counts = np.bincount(note[known].astype(np.int64) * NUM_CLASSES + label[known], minlength=size * NUM_CLASSES)
+        self.counts = counts.reshape(size, NUM_CLASSES).astype(np.uint16)
+
+        order = np.lexsort((note, user))
+        user, note = user[order], note[order]
+        starts = np.flatnonzero(np.r_[True, user[1:] != user[:-1]]) if len(user) else np.zeros(0, int)
+        self.user_notes = {int(user[start]): notes
+                           for start, notes in zip(starts, np.split(note, starts[1:]))}
+        self.user_pending = {}
+
+    def sync(self):
+        """Catch up with votes written since the last sync, by any worker"""
+        with self._lock:
+            scanned = self._sync()
+        self._maybe_snapshot(scanned)
+
+    def _sync(self):
+        if not self.ready:
+            return self._rebuild()
+
+        with read_connection() as connection:
+            version = get_data_version('votes', connection)
+            if version == self.version:
+                return False
+            entries = log_entries(connection, self.seq)
+            position = entries[-1].seq if entries else vote_log_position(connection)
+        if not replayable(entries, self.seq, position):
+            return self._rebuild()
+        self._replay(entries)
+        if entries:
+            self.seq = entries[-1].seq
+        self.version = version
+        return False
+
+    def _replay(self, entries):
+        """Apply vote_changes entries to the counts and voted notes"""
+        if not entries:
+            return
+        self._grow(max(entry.note_id for entry in entries))
+        changes = Counter()
+        for entry in entries:
+            if _known(entry.previous):
+                changes[entry.note_id, entry.previous] -= 1
+            if _known(entry.classification):
+                changes[entry.note_id, entry.classification] += 1
+            if entry.deleted:
+                self._remove_voted(entry.user_id, entry.note_id)
+            elif entry.previous is None:
+                self._add_voted(entry.user_id, entry.note_id)
+        for (note_id, label), change in changes.items():
+            if change:
+                self.counts[note_id, label] = int(self.counts[note_id, label]) + change
+
+    def snapshot(self):
+        """
+        Save the store's arrays as a vote snapshot and compact the log.
+
+        Returns:
+            The snapshot's ID, or None if there already is one at this position
+        """
+        with self._lock:
+            self._merge_pending()
+            seq = self.seq
+            data = encode_snapshot(self.counts, self.user_notes)
+            votes = sum(len(notes) for notes in self.user_notes.values())
+            notes = int(np.count_nonzero(self.counts.any(axis=1)))
+        snapshot_id = save_snapshot(seq, data, votes, notes, keep=current_app.config.get('VOTE_SNAPSHOT_KEEP'))
+        self.snapshot_seq = max(self.snapshot_seq, seq)
+        return snapshot_id
+
+    def _maybe_snapshot(self, scanned=False):
+        # After a full scan, save one right away so later rebuilds (here or
+        # in other workers) start from it
+        interval = current_app.config.get('VOTE_SNAPSHOT_INTERVAL')
+        if not interval:
+            return
+        if (scanned and self.user_notes) or self.seq - self.snapshot_seq >= interval:
+            self.snapshot()
+
+    def _add_voted(self, user_id, note_id):
+        pending = self.user_pending.setdefault(user_id, set())
+        pending.add(note_id)
+        if len(pending) > _PENDING_LIMIT:
+            self._merge_user_pending(user_id)
+
+    def _merge_user_pending(self, user_id):
+        pending = self.user_pending.pop(user_id, set())
+        if pending:
+            merged = np.union1d(self.user_notes.get(user_id, np.zeros(0, np.int32)),
+                                np.fromiter(pending, dtype=np.int32, count=len(pending)))
+            self.user_notes[user_id] = merged.astype(np.int32)
+
+    def _merge_pending(self):
+        for user_id in list(self.user_pending):
+            self._merge_user_pending(user_id)
+
+    def _remove_voted(self, user_id, note_id):
+        self.user_pending.get(user_id, set()).discard(note_id)
+        notes = self.user_notes.get(user_id)
+        if notes is not None:
+            position = np.searchsorted(notes, note_id)
+            if position < len(notes) and notes[position] == note_id:
+                self.user_notes[user_id] = np.delete(notes, position)
+
+    def vote_counts(self, note_id):
+        """Counter of classification -> votes for one note"""
+        if note_id >= len(self.counts):
+            return Counter()
+        row = self.counts[note_id]
+        return Counter({CLASSIFICATION_TYPES[i]: int(row[i]) for i in np.flatnonzero(row)})
+
+    def has_voted(self, user_id, note_id):
+        """Whether the user has voted on the note"""
+        if note_id in self.user_pending.get(user_id, ()):
+            return True
+        notes = self.user_notes.get(user_id)
+        if notes is None or not len(notes):
+            return False
+        position = np.searchsorted(notes, note_id)
+        return position < len(notes) and notes[position] == note_id
+
+
+def get_vote_store():
+    """The app's vote store, synced with the database once per request"""
+    store = current_app.extensions.get('vote_store')
+    if store is None:
+        store = current_app.extensions.setdefault('vote_store', VoteStore())
+
+    if has_request_context():
+        if 'vote_store_synced' not in g:
+            store.sync()
+            g.vote_store_synced = True
+    else:
+        store.sync()
+    return store
+
+
+def init_app(app, preload=True):
+    """Create the app's vote store, built now (inside an app context) if preloading"""
+    store = app.extensions['vote_store'] = VoteStore()
+    if preload and app.config.get('VOTE_STORE_PRELOAD'):
+        store.rebuild()
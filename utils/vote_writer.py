@@ -0,0 +1,236 @@
+"""
+Write-behind vote buffer with a single writer thread and group commit.
+
+Request handlers hand votes to the writer and wait on a future, so a vote
+is durable before the response is sent, exactly as before. The writer
+drains whatever has queued up within a few milliseconds and commits it in
+one transaction, so a burst of votes costs one SQLite write lock instead of
+one per request.
+"""
+import atexit
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, tuple_
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from models import db, Vote
+from utils.metrics import REGISTRY, Histogram, Gauge
+from utils.priority import update_priorities
+from utils.scheduler import release_leases
+from utils.storage import run_in_connection
+
+VOTE_GROUP_SIZE = REGISTRY.register(Histogram(
+    'classification_vote_group_commit_size',
+    'Votes committed per group commit',
+    buckets=(1, 2, 5, 10, 20, 50, 100, 200, 500, 1000),
+))
+VOTE_WRITER_QUEUE = REGISTRY.register(Gauge(
+    'classification_vote_writer_queue_depth',
+    'Vote submissions waiting for the writer thread',
+))
+
+_STOP = object()
+
+
+def write_votes(connection, submissions, prior=1.0):
+    """
+    Upsert the votes of several submissions in the current transaction,
+    update the queue priorities of the voted notes and release the voters'
+    leases on them.
+
+    Args:
+        connection: SQLAlchemy connection with an open transaction
+        submissions: List of (user_id, [(note_id, classification), ...])
+        prior: Total Dirichlet prior concentration used for priorities
+
+    Returns:
+        List of {'created': n, 'updated': n}, one per submission
+    """
+    votes_table = Vote.__table__
+    pairs = {(note_id, user_id) for user_id, votes in submissions for note_id, _ in votes}
+
+    # Which (note, user) pairs already have a vote
+    existing = set()
+    pair_list = list(pairs)
+    for start in range(0, len(pair_list), 400):
+        chunk = pair_list[start:start + 400]
+        existing.update(connection.execute(
+            select(votes_table.c.note_id, votes_table.c.user_id)
+            .where(tuple_(votes_table.c.note_id, votes_table.c.user_id).in_(chunk))
+        ).all())
+
+    now = datetime.utcnow()
+    rows = []
+    results = []
+    for user_id, votes in submissions:
+        counts = {'created': 0, 'updated': 0}
+        for note_id, classification in votes:
+            if (note_id, user_id) in existing:
+                counts['updated'] += 1
+            else:
+                counts['created'] += 1
+                existing.add((note_id, user_id))
+            rows.append({'note_id': note_id, 'user_id': user_id,
+                         'classification': classification, 'voted_at': now})
+        results.append(counts)
+
+    if rows:
+        statement = sqlite_insert(votes_table)
+        statement = statement.on_conflict_do_update(
+            index_elements=[votes_table.c.note_id, votes_table.c.user_id],
+            set_={'classification': statement.excluded.classification,
+                  'voted_at': statement.excluded.voted_at},
+        )
+        connection.execute(statement, rows)
+        update_priorities(connection, {row['note_id'] for row in rows}, prior)
+        release_leases(connection, pairs)
+
+    return results
+
+
+class VoteWriter:
+    """Single background thread that group-commits queued vote submissions"""
+
+    def __init__(self, engine, batch_window=0.005, max_batch=500, retry_timeout=30, prior=1.0):
+        self.engine = engine
+        self.prior = prior
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.retry_timeout = retry_timeout
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_started(self):
+        # Threads do not survive fork; start (again) in whichever process submits
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    self._queue = queue.Queue()
+                    self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='vote-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, user_id, votes):
+        """
+        Queue a user's votes for the next group commit.
+
+        Args:
+            user_id: ID of the voting user
+            votes: List of (note_id, classification)
+
+        Returns:
+            Future resolving to {'created': n, 'updated': n} once committed
+        """
+        self._ensure_started()
+        future = Future()
+        self._queue.put((user_id, list(votes), future))
+        VOTE_WRITER_QUEUE.set(self._queue.qsize())
+        return future
+
+    def stop(self, timeout=5):
+        """Commit anything queued, then stop the writer thread"""
+        if self._thread is not None and self._thread.is_alive():
+            self._queue.put(_STOP)
+            self._thread.join(timeout)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                return
+
+            group = [item]
+            stop = False
+            deadline = time.monotonic() + self.batch_window
+            size = len(item[1])
+            while size < self.max_batch:
+                remaining = deadline - time.monotonic()
+                try:
+                    item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stop = True
+                    break
+                group.append(item)
+                size += len(item[1])
+
+            VOTE_WRITER_QUEUE.set(self._queue.qsize())
+            self._commit(group)
+            if stop:
+                return
+
+    def _commit(self, group):
+        submissions = [(user_id, votes) for user_id, votes, _ in group]
+        try:
+            results = run_in_connection('vote_writer',
+                                        lambda connection: write_votes(connection, submissions, self.prior),
+                                        engine=self.engine, timeout=self.retry_timeout)
+        except Exception:
+            # Fall back to one transaction per submission so one bad vote
+            # cannot fail the rest of the group
+            for user_id, votes, future in group:
+                try:
+                    result = run_in_connection('vote_writer',
+                                               lambda connection: write_votes(connection, [(user_id, votes)], self.prior)[0],
+                                               engine=self.engine, timeout=self.retry_timeout)
+                except Exception as e:
+                    future.set_exception(e)
+                else:
+                    VOTE_GROUP_SIZE.observe(len(votes))
+                    future.set_result(result)
+            return
+
+        VOTE_GROUP_SIZE.observe(sum(len(votes) for _, votes in submissions))
+        for (_, _, future), result in zip(group, results):
+            future.set_result(result)
+
+
+def init_app(app):
+    """Create the app's vote writer if write-behind voting is enabled"""
+    if app.config.get('VOTE_WRITER_ENABLED'):
+        writer = VoteWriter(
+            db.engine,
+            batch_window=app.config.get('VOTE_WRITER_BATCH_WINDOW', 0.005),
+            max_batch=app.config.get('VOTE_WRITER_MAX_BATCH', 500),
+            retry_timeout=app.config.get('WRITE_RETRY_TIMEOUT', 30),
+            prior=app.config.get('DIRICHLET_PRIOR', 1.0),
+        )
+        app.extensions['vote_writer'] = writer
+        atexit.register(writer.stop)
+
+
+def save_votes(user_id, votes):
+    """
+    Durably save a user's votes, through the group-commit writer when enabled.
+
+    Args:
+        user_id: ID of the voting user
+        votes: List of (note_id, classification)
+
+    Returns:
+        {'created': n, 'updated': n}
+    """
+    writer = current_app.extensions.get('vote_writer')
+    if writer is not None:
+        future = writer.submit(user_id, votes)
+        result = future.result(timeout=current_app.config.get('VOTE_WRITER_TIMEOUT', 30))
+    else:
+        prior = current_app.config.get('DIRICHLET_PRIOR', 1.0)
+        result = run_in_connection('vote', lambda connection: write_votes(connection, [(user_id, votes)], prior)[0])
+
+    # Reflect the committed votes in this worker's in-memory counts right away
+    store = current_app.extensions.get('vote_store')
+    if store is not None and store.ready:
+        store.sync()
+    return result
@@ -1,25 +1,186 @@
+"""
+XML export of consensus classifications.
+
+An export is a list of shards, each a bib ID range or the records of one
+source file, written in order between the <records> tags. Shards can be
+generated in a process pool: each worker creates its own app on a
+read-only (query_only) connection, reads vote counts straight from the
+votes table and returns the shard's pretty-printed <record> elements, which
+the caller streams out in shard order. Splitting by bib ID range keeps the
+single-pass record order; splitting by source file groups records by file.
+
+A single shard can be exported on its own, e.g. one source file (found
+through the source_filename index) for a partial refresh:
+
+    python -m utils.xml_exporter OUTPUT [--by bib_id|source_filename] [--workers N]
+                                 [--source-file NAME | --bib-from BIB --bib-to BIB]
+
+An OUTPUT ending in .gz or .zst is compressed as it is written.
+
+Delta exports write only the records whose notes' votes changed since an
+export checkpoint (or a time), with <removed> elements for changed notes
+that fell below the threshold; --checkpoint records a new checkpoint once
+the file is complete:
+
+    python -m utils.xml_exporter full.xml --checkpoint
+    python -m utils.xml_exporter delta.xml --since-checkpoint --checkpoint
+
+--approval approved exports only notes whose reviewed consensus was
+approved, --approval not_rejected leaves out rejected ones (see
+utils/review.py).
+"""
+import multiprocessing
+import os
+import time
 import xml.etree.ElementTree as ET
-from xml.dom import minidom
-from models import Record, Note
-from utils.probability import calculate_vote_distribution
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import select, text
+
+from models import db, Record, Note, Vote, Review, ExportCheckpoint
+from utils.data_version import vote_log_position
+from utils.compression import compression_for_name, open_output
+from utils.storage import run_in_transaction
+from utils.probability import calculate_vote_distributions, count_votes, get_consensus_strategy, get_confidence_measure
+from utils.review import APPROVAL_FILTERS, approval_allows, latest_reviews
+from utils.metrics import EXPORT_DURATION, EXPORT_ROWS
+
+SHARD_KINDS = ['bib_id', 'source_filename']
+
+XML_DECLARATION = b'<?xml version="1.0" encoding="utf-8"?>\n'
+XML_HEADER = XML_DECLARATION + b'<records>\n'
+XML_FOOTER = b'</records>\n'
+
+# Records pretty-printed per DOM round trip within a shard
+_BATCH_SIZE = 500
+
+# App of an export worker process (see _init_worker)
+_worker = {}
 
 
-def export_to_xml(confidence_threshold=0.60, include_stats=True):
+def export_shards(by='bib_id', size=None):
     """
-    Export database to XML with consensus classifications.
+    Split the records into shards, in export order.
 
     Args:
-        confidence_threshold: Only include notes with probability >= threshold
-        include_stats: Add vote_count and consensus_probability attributes
+        by: 'bib_id' for consecutive bib ID ranges, 'source_filename' for
+            one shard per source file (records without one come last)
+        size: Records per bib ID range (EXPORT_SHARD_SIZE by default)
 
     Returns:
-        XML string (bytes)
+        List of shard dicts: {'bib_from': ..., 'bib_to': ...} (bib_to is
+        exclusive, None means unbounded) or {'source_filename': ...}
     """
-    root = ET.Element('records')
+    if by not in SHARD_KINDS:
+        raise ValueError(f'Unknown shard kind: {by}')
+
+    if by == 'source_filename':
+        names = db.session.execute(select(Record.source_filename).distinct()).scalars().all()
+        return [{'source_filename': name}
+                for name in sorted(names, key=lambda name: (name is None, name or ''))]
+
+    if size is None:
+        size = current_app.config.get('EXPORT_SHARD_SIZE', 5000)
+    bib_ids = db.session.execute(select(Record.bib_id).order_by(Record.bib_id)).scalars().all()
+    starts = bib_ids[size::size]
+    bounds = [None, *starts, None]
+    return [{'bib_from': bib_from, 'bib_to': bib_to} for bib_from, bib_to in zip(bounds, bounds[1:])]
+
+
+def _shard_query(shard):
+    query = select(Record.id, Record.bib_id, Record.title).order_by(Record.bib_id)
+    if 'source_filename' in shard:
+        name = shard['source_filename']
+        query = query.where(Record.source_filename.is_(None) if name is None else Record.source_filename == name)
+    if shard.get('bib_from') is not None:
+        query = query.where(Record.bib_id >= shard['bib_from'])
+    if shard.get('bib_to') is not None:
+        query = query.where(Record.bib_id < shard['bib_to'])
+    return query
+
+
+def _records_xml(root):
+    """The pretty-printed children of a <records> element, as minidom writes them"""
+    # Only exports need the DOM pretty-printer; keep it out of app startup
+    from xml.dom import minidom
+
+    if not len(root):
+        return b''
+    pretty = minidom.parseString(ET.tostring(root, encoding='utf-8')).toprettyxml(indent='  ', encoding='utf-8')
+    return pretty[pretty.index(b'<records>\n') + len(b'<records>\n'):pretty.rindex(b'</records>')]
+
 
-    records = Record.query.order_by(Record.bib_id).all()
+def export_shard(shard, confidence_threshold=0.60, include_stats=True, strategy=None, counts_from_store=True,
+                 approval=None):
+    """
+    Generate one shard of the export.
+
+    Args:
+        shard: Shard dict (see export_shards); {} is every record
+        confidence_threshold, include_stats, strategy, approval: As for export_to_xml
+        counts_from_store: Read vote counts from the in-memory vote store
+            (False queries the votes table, as export workers do)
+
+    Returns:
+        (XML bytes of the shard's <record> elements, records written, notes written)
+    """
+    chunks = []
+    records_written = notes_written = 0
+    for chunk, records, notes in _shard_chunks(shard, confidence_threshold, include_stats, strategy,
+                                               counts_from_store, approval):
+        chunks.append(chunk)
+        records_written += records
+        notes_written += notes
+    return b''.join(chunks), records_written, notes_written
+
+
+def _shard_chunks(shard, confidence_threshold, include_stats, strategy, counts_from_store=True, approval=None):
+    """A shard's XML in pieces of up to _BATCH_SIZE records: (bytes, records, notes written) each"""
+    if strategy is None:
+        strategy = get_consensus_strategy()
+
+    records = db.session.execute(_shard_query(shard)).all()
+    for batch_start in range(0, len(records), _BATCH_SIZE):
+        batch = records[batch_start:batch_start + _BATCH_SIZE]
+        body, notes_written, _ = _records_batch_xml(batch, confidence_threshold, include_stats, strategy,
+                                                    counts_from_store, approval=approval)
+        yield body, len(batch), notes_written
+
+
+def _records_batch_xml(batch, confidence_threshold, include_stats, strategy, counts_from_store=True, changed=None,
+                       approval=None):
+    """
+    <record> elements for a batch of (id, bib_id, title) rows.
+
+    Args:
+        changed: Note IDs whose consensus may have changed (delta exports);
+            those below the threshold (or failing the approval filter) are
+            written as <removed> elements
+        approval: Approval filter (one of APPROVAL_FILTERS, None for all notes)
+
+    Returns:
+        (bytes, notes written, notes removed)
+    """
+    lower_bound = get_confidence_measure() == 'lower_bound'
+    notes_written = notes_removed = 0
+    notes = db.session.execute(
+        select(Note.id, Note.record_id, Note.text)
+        .where(Note.record_id.in_([record.id for record in batch]))
+        .order_by(Note.record_id, Note.note_index)
+    ).all()
+    note_ids = [note.id for note in notes]
+    counts = None if counts_from_store else count_votes(note_ids)
+    distributions = calculate_vote_distributions(note_ids, strategy, counts=counts)
+    reviews = latest_reviews(note_ids) if approval is not None else {}
+    notes_by_record = {}
+    for note in notes:
+        notes_by_record.setdefault(note.record_id, []).append(note)
 
-    for record in records:
+    root = ET.Element('records')
+    for record in batch:
         record_elem = ET.SubElement(root, 'record')
         record_elem.set('bib', record.bib_id)
 
@@ -28,48 +189,374 @@ def export_to_xml(confidence_threshold=0.60, include_stats=True):
         title_elem.text = record.title
 
         # Notes
-        notes = Note.query.filter_by(record_id=record.id)\
-                          .order_by(Note.note_index).all()
-
-        for note in notes:
-            distribution = calculate_vote_distribution(note.id)
+        for note in notes_by_record.get(record.id, []):
+            distribution = distributions[note.id]
 
-            # Skip notes below confidence threshold
+            # Skip notes below confidence threshold (or without the required approval)
             if distribution['consensus'] and \
-               distribution['consensus_probability'] >= confidence_threshold:
+               distribution['confidence'] >= confidence_threshold and \
+               approval_allows(approval, reviews.get(note.id), distribution['consensus']):
 
                 note_elem = ET.SubElement(record_elem, 'note')
                 note_elem.text = note.text
                 note_elem.set('type', distribution['consensus'])
+                notes_written += 1
 
                 if include_stats:
                     note_elem.set('consensus_probability',
                                  f"{distribution['consensus_probability']:.2f}")
                     note_elem.set('vote_count', str(distribution['total']))
+                    if lower_bound:
+                        note_elem.set('lower_bound', f"{distribution['lower_bound']:.2f}")
+
+            elif changed is not None and note.id in changed:
+                # Tell the consumer to drop a note it may hold from an earlier export
+                removed_elem = ET.SubElement(record_elem, 'removed')
+                removed_elem.text = note.text
+                notes_removed += 1
+
+    return _records_xml(root), notes_written, notes_removed
+
+
+def _init_worker(config):
+    """Create the worker's app: read-only connections, no vote store or vote writer"""
+    from app import create_app
+    from config import Config
+
+    overrides = dict(config, VOTE_WRITER_ENABLED=False, VOTE_STORE_PRELOAD=False, MIGRATE_CLI=False,
+                     METRICS_ENABLED=False, STORAGE_READ_WRITE_SPLIT=False, DAWID_SKENE_BACKGROUND_REFIT=False,
+                     SQLITE_PRAGMAS=dict(config.get('SQLITE_PRAGMAS') or {}, query_only='ON'))
+    _worker['app'] = create_app(type('ExportWorkerConfig', (Config,), overrides))
+
+
+def _export_shard_in_worker(shard, confidence_threshold, include_stats, strategy, approval=None):
+    with _worker['app'].app_context():
+        return export_shard(shard, confidence_threshold, include_stats, strategy, counts_from_store=False,
+                            approval=approval)
 
-    # Pretty print XML
-    xml_string = ET.tostring(root, encoding='utf-8')
-    dom = minidom.parseString(xml_string)
-    pretty_xml = dom.toprettyxml(indent='  ', encoding='utf-8')
 
-    return pretty_xml
+def _worker_config():
+    """The current app's settings, to recreate it in a worker"""
+    return {key: value for key, value in current_app.config.items() if key.isupper()}
 
 
-def export_to_file(filepath, confidence_threshold=0.60, include_stats=True):
+def _generated_shards(shards, confidence_threshold, include_stats, strategy, workers, approval=None):
     """
-    Export to XML file.
+    (bytes, records, notes written) pieces of the shards in order: whole
+    shards from workers, at most 2 * workers ahead of the consumer, or
+    batches of records when generated in this process
+    """
+    if workers <= 1 or len(shards) <= 1:
+        for shard in shards:
+            yield from _shard_chunks(shard, confidence_threshold, include_stats, strategy, approval=approval)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                             initializer=_init_worker, initargs=(_worker_config(),)) as pool:
+        remaining = deque(shards)
+        pending = deque()
+        while remaining or pending:
+            while remaining and len(pending) < 2 * workers:
+                pending.append(pool.submit(_export_shard_in_worker, remaining.popleft(),
+                                           confidence_threshold, include_stats, strategy, approval))
+            yield pending.popleft().result()
+
+
+def iter_export(confidence_threshold=0.60, include_stats=True, strategy=None, shards=None, workers=1, stats=None,
+                approval=None):
+    """
+    Stream the export as chunks of XML bytes: header, each shard, footer.
+
+    Args:
+        confidence_threshold, include_stats, strategy, approval: As for export_to_xml
+        shards: Shard dicts (see export_shards) in output order; None exports
+            every record as one shard
+        workers: Processes generating shards (None = EXPORT_WORKERS, by
+            default one per CPU; 1 generates them in this process)
+        stats: Optional dict that receives records_written and notes_written
+    """
+    start = time.perf_counter()
+    if strategy is None:
+        strategy = get_consensus_strategy()
+    if shards is None:
+        shards = [{}]
+    if workers is None:
+        workers = current_app.config.get('EXPORT_WORKERS') or os.cpu_count() or 1
+    if strategy == 'dawid_skene':
+        # An export needs a fitted model; fit the first one here if there is
+        # none yet (workers load the saved fit)
+        from utils.dawid_skene import ensure_fit
+        ensure_fit()
+
+    records_written = notes_written = 0
+    yield XML_HEADER
+    for body, records, notes in _generated_shards(shards, confidence_threshold, include_stats, strategy, workers,
+                                                  approval):
+        records_written += records
+        notes_written += notes
+        yield body
+    yield XML_FOOTER
+
+    EXPORT_DURATION.observe(time.perf_counter() - start)
+    EXPORT_ROWS.inc(records_written, kind='records')
+    EXPORT_ROWS.inc(notes_written, kind='notes')
+    if stats is not None:
+        stats.update(records_written=records_written, notes_written=notes_written)
+
+
+def changed_note_ids(since=None, vote_seq=None, reviews=False):
+    """
+    Notes whose votes changed: votes cast at or after `since` (found
+    through idx_vote_voted_at) and, after vote_seq, every vote write or
+    deletion in the vote_changes log. With reviews, notes reviewed at or
+    after `since` too. The log is compacted behind the
+    retained vote snapshots; once it no longer reaches back to vote_seq,
+    only voted_at is used and deleted votes are not seen.
+    """
+    note_ids = set()
+    if since is not None:
+        note_ids.update(db.session.execute(
+            select(Vote.note_id).where(Vote.voted_at >= since)
+        ).scalars())
+        if reviews:
+            note_ids.update(db.session.execute(
+                select(Review.note_id).where(Review.reviewed_at >= since)
+            ).scalars())
+    if vote_seq is not None:
+        oldest = db.session.execute(text('SELECT min(seq) FROM vote_changes')).scalar()
+        if (oldest is None and _vote_log_position() > vote_seq) or (oldest is not None and oldest > vote_seq + 1):
+            current_app.logger.warning('vote_changes log compacted past seq %d; delta export uses voted_at only',
+                                       vote_seq)
+        note_ids.update(db.session.execute(
+            text('SELECT DISTINCT note_id FROM vote_changes WHERE seq > :seq'), {'seq': vote_seq}
+        ).scalars())
+    return note_ids
+
+
+def iter_delta_export(since, confidence_threshold=0.60, include_stats=True, strategy=None, vote_seq=None,
+                      checkpoint_id=None, stats=None, approval=None):
+    """
+    Stream a delta export: only the records holding notes whose votes changed.
+
+    Each such record is written whole (every note that meets the threshold),
+    and its changed notes that no longer meet it are listed as <removed>
+    elements, so a consumer can replace the record and drop those notes.
+
+    Args:
+        since: Only notes with votes cast at or after this time (UTC)
+        confidence_threshold, include_stats, strategy, approval: As for export_to_xml;
+            with an approval filter, notes reviewed since then count as changed
+        vote_seq: Also include notes with vote_changes entries after this seq
+            (catches deleted votes and writes committed late)
+        checkpoint_id: Checkpoint the delta starts from, noted in the output
+        stats: Optional dict that receives records_written, notes_written
+            and notes_removed
+    """
+    start = time.perf_counter()
+    if strategy is None:
+        strategy = get_consensus_strategy()
+
+    changed = changed_note_ids(since, vote_seq, reviews=approval is not None)
+    changed_ids = list(changed)
+    record_ids = set()
+    for chunk_start in range(0, len(changed_ids), _BATCH_SIZE):
+        record_ids.update(db.session.execute(
+            select(Note.record_id).where(Note.id.in_(changed_ids[chunk_start:chunk_start + _BATCH_SIZE]))
+        ).scalars())
+    record_ids = list(record_ids)
+    records = []
+    for chunk_start in range(0, len(record_ids), _BATCH_SIZE):
+        records.extend(db.session.execute(
+            select(Record.id, Record.bib_id, Record.title)
+            .where(Record.id.in_(record_ids[chunk_start:chunk_start + _BATCH_SIZE]))
+        ).all())
+    records.sort(key=lambda record: record.bib_id)
+
+    attributes = f' delta_since="{since.isoformat(timespec="seconds")}"'
+    if checkpoint_id is not None:
+        attributes += f' checkpoint="{checkpoint_id}"'
+    yield XML_DECLARATION + f'<records{attributes}>\n'.encode('utf-8')
+
+    notes_written = notes_removed = 0
+    for batch_start in range(0, len(records), _BATCH_SIZE):
+        body, written, removed = _records_batch_xml(records[batch_start:batch_start + _BATCH_SIZE],
+                                                    confidence_threshold, include_stats, strategy, changed=changed,
+                                                    approval=approval)
+        notes_written += written
+        notes_removed += removed
+        yield body
+    yield XML_FOOTER
+
+    EXPORT_DURATION.observe(time.perf_counter() - start)
+    EXPORT_ROWS.inc(len(records), kind='records')
+    EXPORT_ROWS.inc(notes_written, kind='notes')
+    EXPORT_ROWS.inc(notes_removed, kind='removed')
+    if stats is not None:
+        stats.update(records_written=len(records), notes_written=notes_written, notes_removed=notes_removed)
+
+
+def get_checkpoint(checkpoint_id=None):
+    """An export checkpoint by ID, or the latest one (None if there is none)"""
+    if checkpoint_id is not None:
+        return db.session.get(ExportCheckpoint, checkpoint_id)
+    return ExportCheckpoint.query.order_by(ExportCheckpoint.id.desc()).first()
+
+
+def _vote_log_position():
+    return vote_log_position(db.session)
+
+
+def export_to_xml(confidence_threshold=0.60, include_stats=True, strategy=None, shard=None, approval=None):
+    """
+    Export database to XML with consensus classifications.
+
+    Args:
+        confidence_threshold: Only include notes whose confidence (consensus
+            probability or lower credible bound, per the confidence_measure
+            setting) is >= threshold
+        include_stats: Add vote_count and consensus_probability attributes
+            (and lower_bound when the lower bound is the confidence measure)
+        strategy: Consensus strategy (the consensus_strategy setting if None)
+        shard: Only export this shard, e.g. {'source_filename': 'x.xml'} or
+            {'bib_from': '100', 'bib_to': '200'} (see export_shards)
+        approval: 'approved' for only approved notes, 'not_rejected' to
+            leave out rejected ones, None for every note (see utils/review.py)
+
+    Returns:
+        XML string (bytes)
+    """
+    return b''.join(iter_export(confidence_threshold, include_stats, strategy,
+                                shards=[shard or {}], workers=1, approval=approval))
+
+
+def export_to_file(filepath, confidence_threshold=0.60, include_stats=True, shard_by=None, shard=None,
+                   workers=None, compression=None, since=None, checkpoint=False, approval=None):
+    """
+    Export to XML file, writing shards as they are generated.
 
     Args:
         filepath: Path to save XML file
         confidence_threshold: Only include notes with probability >= threshold
         include_stats: Add vote_count and consensus_probability attributes
+        shard_by: Split into shards generated in parallel: 'bib_id' ranges
+            or 'source_filename' groups (None = one pass in this process)
+        shard: Only export this shard (overrides shard_by)
+        workers: Processes generating shards (EXPORT_WORKERS by default)
+        compression: 'gzip' or 'zstd' to compress the file as it is
+            written (at EXPORT_COMPRESSION_LEVELS), None for plain XML
+        since: Delta export (see iter_delta_export) of the changes since an
+            export checkpoint ID or a UTC datetime; shard_by and shard are
+            ignored. A checkpoint must have the same threshold, strategy and
+            approval filter
+        checkpoint: Record an export checkpoint once the file is written
+        approval: Approval filter, as for export_to_xml
 
     Returns:
         filepath
     """
-    xml_content = export_to_xml(confidence_threshold, include_stats)
+    if approval is not None and approval not in APPROVAL_FILTERS:
+        raise ValueError(f'Unknown approval filter: {approval}')
+    strategy = get_consensus_strategy()
+    # Everything voted (or reviewed) before this point is covered by the export
+    voted_before = datetime.utcnow()
+    vote_seq = _vote_log_position()
+    stats = {}
+
+    if since is not None:
+        if isinstance(since, datetime):
+            chunks = iter_delta_export(since, confidence_threshold, include_stats, strategy, stats=stats,
+                                       approval=approval)
+        else:
+            start = get_checkpoint(since)
+            if start is None:
+                raise ValueError(f'Unknown export checkpoint: {since}')
+            if abs(start.confidence_threshold - confidence_threshold) > 1e-9 or start.strategy != strategy \
+                    or start.approval != approval:
+                raise ValueError(f'Checkpoint {start.id} was exported at threshold {start.confidence_threshold:.2f} '
+                                 f'with {start.strategy} consensus and approval filter {start.approval or "none"}; '
+                                 f'a delta from it must use the same')
+            chunks = iter_delta_export(start.voted_before, confidence_threshold, include_stats, strategy,
+                                       vote_seq=start.vote_seq, checkpoint_id=start.id, stats=stats,
+                                       approval=approval)
+    elif shard is not None:
+        chunks = iter_export(confidence_threshold, include_stats, strategy, [shard], 1, stats, approval)
+    elif shard_by is not None:
+        chunks = iter_export(confidence_threshold, include_stats, strategy, export_shards(shard_by), workers, stats,
+                             approval)
+    else:
+        chunks = iter_export(confidence_threshold, include_stats, strategy, None, 1, stats, approval)
+
+    level = (current_app.config.get('EXPORT_COMPRESSION_LEVELS') or {}).get(compression)
+    with open_output(filepath, compression, level) as f:
+        for chunk in chunks:
+            f.write(chunk)
 
-    with open(filepath, 'wb') as f:
-        f.write(xml_content)
+    # Only a complete file advances the checkpoint
+    if checkpoint:
+        run_in_transaction('export', lambda: db.session.add(ExportCheckpoint(
+            voted_before=voted_before,
+            vote_seq=vote_seq,
+            confidence_threshold=confidence_threshold,
+            strategy=strategy,
+            approval=approval,
+            delta=since is not None,
+            records_written=stats.get('records_written', 0),
+            notes_written=stats.get('notes_written', 0),
+            notes_removed=stats.get('notes_removed', 0),
+        )))
 
     return filepath
+
+
+if __name__ == '__main__':
+    # Export from the command line, whole or one shard
+    import argparse
+    from app import create_app
+
+    parser = argparse.ArgumentParser(description='Export consensus classifications to XML')
+    parser.add_argument('output', help='XML file to write (compressed if it ends in .gz or .zst)')
+    parser.add_argument('--by', choices=SHARD_KINDS, default='bib_id', help='How to split the export into shards')
+    parser.add_argument('--workers', type=int, default=None, help='Shard processes (default: one per CPU)')
+    parser.add_argument('--threshold', type=float, default=None,
+                        help='Confidence threshold (default: DEFAULT_EXPORT_CONFIDENCE)')
+    parser.add_argument('--no-stats', action='store_true', help='Leave out vote statistics')
+    parser.add_argument('--source-file', metavar='NAME', help='Only export records from this source file')
+    parser.add_argument('--bib-from', metavar='BIB', help='Only export bib IDs >= BIB')
+    parser.add_argument('--bib-to', metavar='BIB', help='Only export bib IDs < BIB')
+    parser.add_argument('--since-checkpoint', metavar='ID', nargs='?', const='latest',
+                        help='Delta export of changes since a checkpoint (default: the latest)')
+    parser.add_argument('--since', metavar='TIME', type=datetime.fromisoformat,
+                        help='Delta export of notes voted on since TIME (UTC, ISO format)')
+    parser.add_argument('--checkpoint', action='store_true', help='Record a checkpoint after the export')
+    parser.add_argument('--approval', choices=APPROVAL_FILTERS,
+                        help='Only approved notes, or leave out rejected ones (default: every note)')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        threshold = args.threshold if args.threshold is not None else app.config['DEFAULT_EXPORT_CONFIDENCE']
+        only = None
+        if args.source_file:
+            only = {'source_filename': args.source_file}
+        elif args.bib_from or args.bib_to:
+            only = {'bib_from': args.bib_from, 'bib_to': args.bib_to}
+
+        since = args.since
+        approval = args.approval
+        if args.since_checkpoint:
+            latest = get_checkpoint() if args.since_checkpoint == 'latest' else get_checkpoint(int(args.since_checkpoint))
+            if latest is None:
+                parser.error('No such export checkpoint')
+            since = latest.id
+            if args.threshold is None:
+                threshold = latest.confidence_threshold
+            if args.approval is None:
+                approval = latest.approval
+
+        start = time.perf_counter()
+        export_to_file(args.output, threshold, not args.no_stats, shard_by=args.by, shard=only, workers=args.workers,
+                       compression=compression_for_name(args.output), since=since, checkpoint=args.checkpoint,
+                       approval=approval)
+        print(f'Exported to {args.output} in {time.perf_counter() - start:.1f}s')
+        if args.checkpoint:
+            print(f'Checkpoint {get_checkpoint().id} recorded')
@@ -1,105 +1,147 @@
+import hashlib
+import os
+import time
 import xml.etree.ElementTree as ET
 from models import db, Record, Note, Vote
+from flask import current_app
+from sqlalchemy import bindparam, case, delete, select, text, update
+from utils.metrics import IMPORT_DURATION, IMPORT_ROWS, IMPORT_ERRORS, is_lock_error
+from utils.compression import open_catalog, strip_suffix
+from utils.storage import run_in_transaction
+from utils.type_codes import LETTERS as CLASSIFICATION_CODES
 
-def import_xml_file(xml_path, admin_user_id=None, source_filename=None):
+# Stats counted by imports, besides the list of errors
+STAT_KEYS = ('records_created', 'records_updated', 'records_unchanged',
+             'notes_created', 'notes_updated', 'notes_deleted', 'votes_created', 'votes_removed')
+
+# Chunk size for IN (...) queries
+_CHUNK = 400
+
+
+def content_hash(*parts):
+    """Hex digest identifying imported text (a record's title and note texts, or one note's text)"""
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(part.encode('utf-8'))
+        digest.update(b'\x1f')
+    return digest.hexdigest()
+
+
+def _empty_stats():
+    stats = dict.fromkeys(STAT_KEYS, 0)
+    stats['errors'] = []
+    return stats
+
+
+def record_content(record_elem):
+    """(title, [(note text, type), ...], record hash) of a <record> element"""
+    title_elem = record_elem.find('title')
+    title = title_elem.text if title_elem is not None and title_elem.text else 'No title'
+    notes = [(note_elem.text or '', note_elem.get('type', '')) for note_elem in record_elem.findall('note')]
+    return title, notes, content_hash(title, *(note_text for note_text, _ in notes))
+
+
+def catalog_filename(root, xml_path):
+    """Source filename of a catalog: from the root's path attribute, else the file name"""
+    path_attr = root.get('path', '')
+    if path_attr:
+        # Extract filename from path: "raw/XML/all_raw.xml" -> "all_raw.xml"
+        return path_attr.split('/')[-1]
+    # A compressed dump counts as the catalog inside it: "all_raw.xml.gz" -> "all_raw.xml"
+    return strip_suffix(os.path.basename(xml_path))
+
+
+def iter_catalog(xml_path, batch_size):
+    """
+    Stream a catalog file (plain, gzip or zstd) in batches of <record> elements.
+
+    The file is decompressed and parsed incrementally, and each batch is
+    dropped from the tree once the consumer asks for the next, so memory
+    holds one batch rather than the whole document.
+
+    Yields:
+        (root, records): the <records> element (with its attributes) and a
+        list of up to batch_size <record> elements; an empty catalog yields
+        one empty batch
+    """
+    root, batch, depth, batches = None, [], 0, 0
+    with open_catalog(xml_path) as f:
+        for event, elem in ET.iterparse(f, events=('start', 'end')):
+            if event == 'start':
+                if root is None:
+                    root = elem
+                depth += 1
+                continue
+            depth -= 1
+            if depth == 1 and elem.tag == 'record':
+                batch.append(elem)
+                if len(batch) >= batch_size:
+                    yield root, batch
+                    batches += 1
+                    batch = []
+                    del root[:]
+    if batch or not batches:
+        yield root, batch
+
+
+def import_xml_file(xml_path, admin_user_id=None, source_filename=None, merge=False):
     """
     Import XML file into database.
 
+    Records are committed batch by batch as the file is parsed, so a file
+    that turns out to be malformed part way keeps the batches before the
+    error (importing it again skips or merges them).
+
     Args:
-        xml_path: Path to XML file
+        xml_path: Path to XML file (may be gzip or zstd compressed)
         admin_user_id: If provided, create initial votes from existing type attributes
         source_filename: Optional filename to use (if None, extracted from XML path attribute)
+        merge: Update records that already exist instead of skipping them.
+            Records whose content hash is unchanged are skipped; in changed
+            records only notes whose text changed are rewritten, and their
+            votes and reviews are removed. Votes on unchanged notes are kept.
 
     Returns:
         dict with keys:
             - records_created: Number of records created
+            - records_updated: Number of existing records changed (merge only)
+            - records_unchanged: Number of existing records skipped as unchanged (merge only)
             - notes_created: Number of notes created
+            - notes_updated: Number of notes whose text changed (merge only)
+            - notes_deleted: Number of notes no longer in the file (merge only)
             - votes_created: Number of initial votes created
+            - votes_removed: Number of votes removed with changed notes (merge only)
             - errors: List of error messages
     """
-    stats = {
-        'records_created': 0,
-        'notes_created': 0,
-        'votes_created': 0,
-        'errors': []
-    }
+    stats = _empty_stats()
+    start = time.perf_counter()
 
     try:
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        
-        # Extract filename from path attribute or xml_path
-        if source_filename is None:
-            path_attr = root.get('path', '')
-            if path_attr:
-                # Extract filename from path: "raw/XML/all_raw.xml" -> "all_raw.xml"
-                source_filename = path_attr.split('/')[-1]
-            else:
-                # Fallback: extract from xml_path
-                import os
-                source_filename = os.path.basename(xml_path)
-
-        for record_elem in root.findall('record'):
-            try:
-                bib_id = record_elem.get('bib')
-                if not bib_id:
-                    stats['errors'].append('Record without bib ID skipped')
-                    continue
-
-                # Check if record already exists
-                existing_record = Record.query.filter_by(bib_id=bib_id).first()
-                if existing_record:
-                    stats['errors'].append(f'Record {bib_id} already exists, skipped')
-                    continue
-
-                # Get title
-                title_elem = record_elem.find('title')
-                title_text = title_elem.text if title_elem is not None and title_elem.text else 'No title'
-
-                # Create record with source filename
-                record = Record(bib_id=bib_id, title=title_text, source_filename=source_filename)
-                db.session.add(record)
-                db.session.flush()  # Get record.id
-
-                stats['records_created'] += 1
-
-                # Process notes
-                note_index = 0
-                for note_elem in record_elem.findall('note'):
-                    note_text = note_elem.text or ''
-                    note_type = note_elem.get('type', '')
-
-                    # Create note
-                    note = Note(
-                        record_id=record.id,
-                        note_index=note_index,
-                        text=note_text
-                    )
-                    db.session.add(note)
-                    db.session.flush()  # Get note.id
-
-                    stats['notes_created'] += 1
-
-                    # Create initial vote if type exists and admin_user_id provided
-                    if note_type and note_type.strip() and admin_user_id:
-                        # Validate classification type
-                        if note_type in ['w', 'o', 'a', 'ow', 'aw', 'ao', '?']:
-                            vote = Vote(
-                                note_id=note.id,
-                                user_id=admin_user_id,
-                                classification=note_type
-                            )
-                            db.session.add(vote)
-                            stats['votes_created'] += 1
-
-                    note_index += 1
-
-            except Exception as e:
-                stats['errors'].append(f'Error processing record {bib_id}: {str(e)}')
+        batch_size = current_app.config.get('IMPORT_BATCH_SIZE', 500)
+        pause = current_app.config.get('IMPORT_BATCH_PAUSE', 0.05)
+        import_batch = _merge_records if merge else _import_records
+        wrote = False
+
+        # Commit in batches so the write lock is released regularly, and pause
+        # between batches so interactive votes are not starved by a long import.
+        # The file is parsed as it is read, one batch at a time
+        for root, batch in iter_catalog(xml_path, batch_size):
+            if source_filename is None:
+                source_filename = catalog_filename(root, xml_path)
+            if not batch:
                 continue
 
-        # Commit all changes
-        db.session.commit()
+            # A merge batch of unchanged records wrote nothing, so there is no lock to yield
+            if wrote:
+                time.sleep(pause)
+            batch_stats = run_in_transaction(
+                'import',
+                lambda: import_batch(batch, source_filename, admin_user_id)
+            )
+            for key in STAT_KEYS:
+                stats[key] += batch_stats[key]
+            stats['errors'].extend(batch_stats['errors'])
+            wrote = any(batch_stats[key] for key in STAT_KEYS if key != 'records_unchanged')
 
     except ET.ParseError as e:
         db.session.rollback()
@@ -108,22 +150,259 @@ def import_xml_file(xml_path, admin_user_id=None, source_filename=None):
         db.session.rollback()
         stats['errors'].append(f'Import failed: {str(e)}')
 
+    IMPORT_DURATION.observe(time.perf_counter() - start)
+    IMPORT_ROWS.inc(stats['records_created'], kind='records')
+    IMPORT_ROWS.inc(stats['notes_created'], kind='notes')
+    IMPORT_ROWS.inc(stats['votes_created'], kind='votes')
+    IMPORT_ERRORS.inc(len(stats['errors']))
+
+    return stats
+
+
+def _import_records(record_elems, source_filename, admin_user_id):
+    """
+    Add a batch of <record> elements to the session (the caller commits).
+
+    Returns:
+        Stats dict for this batch, in the same shape as import_xml_file
+    """
+    stats = _empty_stats()
+
+    for record_elem in record_elems:
+        try:
+            bib_id = record_elem.get('bib')
+            if not bib_id:
+                stats['errors'].append('Record without bib ID skipped')
+                continue
+
+            # Check if record already exists
+            existing_record = Record.query.filter_by(bib_id=bib_id).first()
+            if existing_record:
+                stats['errors'].append(f'Record {bib_id} already exists, skipped')
+                continue
+
+            title_text, notes, record_hash = record_content(record_elem)
+
+            # Create record with source filename
+            record = Record(bib_id=bib_id, title=title_text, source_filename=source_filename,
+                            content_hash=record_hash)
+            db.session.add(record)
+            db.session.flush()  # Get record.id
+
+            stats['records_created'] += 1
+
+            # Process notes
+            for note_index, (note_text, note_type) in enumerate(notes):
+                _add_note(record.id, note_index, note_text, note_type, admin_user_id, stats)
+
+        except Exception as e:
+            # Lock contention is retried for the whole batch by the caller
+            if is_lock_error(e):
+                raise
+            stats['errors'].append(f'Error processing record {bib_id}: {str(e)}')
+            continue
+
+    return stats
+
+
+def _add_note(record_id, note_index, note_text, note_type, admin_user_id, stats):
+    """Add a note, and the admin's initial vote from its type attribute if wanted"""
+    note = Note(
+        record_id=record_id,
+        note_index=note_index,
+        text=note_text,
+        content_hash=content_hash(note_text)
+    )
+    db.session.add(note)
+    db.session.flush()  # Get note.id
+
+    stats['notes_created'] += 1
+    _add_initial_vote(note.id, note_type, admin_user_id, stats)
+
+
+def _add_initial_vote(note_id, note_type, admin_user_id, stats):
+    # Create initial vote if type exists and admin_user_id provided
+    if note_type and note_type.strip() and admin_user_id:
+        # Validate classification type
+        if note_type in CLASSIFICATION_CODES:
+            vote = Vote(
+                note_id=note_id,
+                user_id=admin_user_id,
+                classification=note_type
+            )
+            db.session.add(vote)
+            stats['votes_created'] += 1
+
+
+def _merge_records(record_elems, source_filename, admin_user_id):
+    """
+    Merge a batch of <record> elements into the session (the caller commits).
+
+    Existing records are looked up with one query per chunk of bib IDs, and
+    records whose content hash matches are skipped without loading anything
+    else. Records imported before content hashes existed are hashed from
+    the database once and then compared the same way.
+
+    Returns:
+        Stats dict for this batch, in the same shape as import_xml_file
+    """
+    stats = _empty_stats()
+
+    parsed = {}
+    for record_elem in record_elems:
+        bib_id = record_elem.get('bib')
+        if not bib_id:
+            stats['errors'].append('Record without bib ID skipped')
+        elif bib_id in parsed:
+            stats['errors'].append(f'Record {bib_id} appears more than once, skipped')
+        else:
+            parsed[bib_id] = record_elem
+
+    records = Record.__table__
+    bib_ids = list(parsed)
+    existing = {}
+    for start in range(0, len(bib_ids), _CHUNK):
+        existing.update((bib_id, (record_id, record_hash)) for bib_id, record_id, record_hash in db.session.execute(
+            select(records.c.bib_id, records.c.id, records.c.content_hash)
+            .where(records.c.bib_id.in_(bib_ids[start:start + _CHUNK]))
+        ).all())
+
+    new_records = [record_elem for bib_id, record_elem in parsed.items() if bib_id not in existing]
+    if new_records:
+        new_stats = _import_records(new_records, source_filename, admin_user_id)
+        for key in STAT_KEYS:
+            stats[key] += new_stats[key]
+        stats['errors'].extend(new_stats['errors'])
+
+    stored_hashes = _stored_record_hashes([record_id for record_id, record_hash in existing.values()
+                                           if record_hash is None])
+
+    for bib_id, (record_id, record_hash) in existing.items():
+        try:
+            title_text, notes, new_hash = record_content(parsed[bib_id])
+            if record_hash is None:
+                record_hash = stored_hashes[record_id]
+                db.session.execute(update(records).where(records.c.id == record_id)
+                                   .values(content_hash=record_hash))
+            if record_hash == new_hash:
+                stats['records_unchanged'] += 1
+                continue
+
+            _update_record(record_id, title_text, notes, new_hash, source_filename, admin_user_id, stats)
+            stats['records_updated'] += 1
+
+        except Exception as e:
+            # Lock contention is retried for the whole batch by the caller
+            if is_lock_error(e):
+                raise
+            stats['errors'].append(f'Error merging record {bib_id}: {str(e)}')
+
     return stats
 
 
+def _stored_record_hashes(record_ids):
+    """Content hashes computed from the database for records imported without one"""
+    records, notes = Record.__table__, Note.__table__
+    hashes = {}
+    for start in range(0, len(record_ids), _CHUNK):
+        chunk = record_ids[start:start + _CHUNK]
+        titles = dict(db.session.execute(select(records.c.id, records.c.title).where(records.c.id.in_(chunk))).all())
+        texts = {record_id: [] for record_id in chunk}
+        for record_id, note_text in db.session.execute(
+            select(notes.c.record_id, notes.c.text).where(notes.c.record_id.in_(chunk))
+            .order_by(notes.c.record_id, notes.c.note_index)
+        ).all():
+            texts[record_id].append(note_text)
+        hashes.update((record_id, content_hash(titles[record_id], *texts[record_id])) for record_id in chunk)
+    return hashes
+
+
+def _update_record(record_id, title_text, notes, record_hash, source_filename, admin_user_id, stats):
+    """Rewrite the changed notes of an existing record, add new ones and delete missing ones"""
+    from models import Review, NoteLease
+    from utils.similarity import forget_notes
+
+    notes_table = Note.__table__
+    stored = {}
+    for note_id, note_index, note_hash, note_text in db.session.execute(
+        select(notes_table.c.id, notes_table.c.note_index, notes_table.c.content_hash,
+               case((notes_table.c.content_hash.is_(None), notes_table.c.text)))
+        .where(notes_table.c.record_id == record_id)
+    ).all():
+        stored[note_index] = (note_id, note_hash or content_hash(note_text), note_hash is None)
+
+    changed, backfill = [], []
+    for note_index, (note_text, note_type) in enumerate(notes):
+        note_hash = content_hash(note_text)
+        if note_index not in stored:
+            _add_note(record_id, note_index, note_text, note_type, admin_user_id, stats)
+            continue
+        note_id, stored_hash, unhashed = stored[note_index]
+        if stored_hash != note_hash:
+            changed.append({'note_id': note_id, 'text': note_text, 'content_hash': note_hash, 'type': note_type})
+        elif unhashed:
+            backfill.append({'note_id': note_id, 'content_hash': note_hash})
+    removed = [note_id for note_index, (note_id, _, _) in stored.items() if note_index >= len(notes)]
+
+    # Votes, reviews and leases on a changed note were about its old text
+    stale = [row['note_id'] for row in changed] + removed
+    if stale:
+        stats['votes_removed'] += db.session.execute(delete(Vote).where(Vote.note_id.in_(stale))).rowcount
+        db.session.execute(delete(Review).where(Review.note_id.in_(stale)))
+        db.session.execute(delete(NoteLease).where(NoteLease.note_id.in_(stale)))
+        forget_notes(stale)
+    if removed:
+        db.session.execute(delete(Note).where(Note.id.in_(removed)))
+        stats['notes_deleted'] += len(removed)
+
+    if changed:
+        # Clustered and queued again like new notes after the import
+        db.session.execute(
+            update(notes_table).where(notes_table.c.id == bindparam('note_id'))
+            .values(text=bindparam('text'), content_hash=bindparam('content_hash'), priority=None),
+            [{key: row[key] for key in ('note_id', 'text', 'content_hash')} for row in changed]
+        )
+        for row in changed:
+            _add_initial_vote(row['note_id'], row['type'], admin_user_id, stats)
+        stats['notes_updated'] += len(changed)
+    if backfill:
+        db.session.execute(
+            update(notes_table).where(notes_table.c.id == bindparam('note_id'))
+            .values(content_hash=bindparam('content_hash')),
+            backfill
+        )
+
+    db.session.execute(
+        update(Record.__table__).where(Record.__table__.c.id == record_id)
+        .values(title=title_text, content_hash=record_hash, source_filename=source_filename)
+    )
+
+
 def clear_database():
     """
     Clear all data from database (use with caution!).
     Does not delete users or settings.
+
+    The vote history (vote_changes log and snapshots) and the export
+    checkpoints go too: note IDs are reused once the notes are gone, so a
+    replayed snapshot or a delta export would apply old votes to new notes.
+    The log keeps its position, so vote stores rebuild instead of replaying.
     """
-    from models import Review
-    try:
+    from models import ExportCheckpoint, Review, NoteBand, NoteLease, VoteSnapshot
+
+    def clear():
         Vote.query.delete()
+        db.session.execute(text('DELETE FROM vote_changes'))
+        VoteSnapshot.query.delete()
+        ExportCheckpoint.query.delete()
         Review.query.delete()
+        NoteBand.query.delete()
+        NoteLease.query.delete()
         Note.query.delete()
         Record.query.delete()
-        db.session.commit()
+
+    try:
+        run_in_transaction('clear_database', clear)
         return True
     except Exception as e:
-        db.session.rollback()
         raise Exception(f'Failed to clear database: {str(e)}')
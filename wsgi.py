@@ -0,0 +1,24 @@
+"""
+WSGI entry point for pre-forking servers, e.g.
+
+    gunicorn wsgi:app    # settings from gunicorn.conf.py
+
+or, spelled out,
+
+    gunicorn --preload -k gthread -w 4 --threads 32 wsgi:app
+
+Use a threaded (gthread) or async (gevent) worker class: record pages hold
+a Server-Sent Events stream open, which would tie up a whole sync worker.
+
+With --preload the app is created once in the master process: the schema
+check, imports and the in-memory vote counts are done before forking and
+shared by every worker, so worker (re)starts do not redo them.
+"""
+import os
+
+# Server workers do not need the `flask db` migration commands
+os.environ.setdefault('MIGRATE_CLI', '0')
+
+from app import create_app
+
+app = create_app()